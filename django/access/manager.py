@@ -6,6 +6,7 @@
 """
 import logging
 from django.db import models
+from vuedjango.request_cache import request_cached
 from .tools import get_scope_query
 
 logger = logging.getLogger(__name__)
@@ -20,6 +21,22 @@ class PermissionManager:
         self.username = user if isinstance(user, str) else getattr(user, 'username', None)
         if not self.username:
             raise ValueError("A valid username must be provided to PermissionManager.")
+        # 同一管理器内按模型复用数据权限条件，避免重复读取缓存及构建条件
+        self._scope_queries = {}
+
+    def _get_scope_query(self, model):
+        # 同一请求内的多个管理器之间同样复用
+        if model not in self._scope_queries:
+            self._scope_queries[model] = request_cached(
+                'scope_query', (self.username, model._meta.label),
+                lambda: get_scope_query(self.username, model)
+            )
+        return self._scope_queries[model]
+
+    def has_full_access(self, model) -> bool:
+        """数据权限对该模型不做任何过滤"""
+        query_obj = self._get_scope_query(model)
+        return query_obj is not None and not query_obj
 
     def get_queryset(self, model_or_queryset) -> models.QuerySet:
         """
@@ -35,7 +52,7 @@ class PermissionManager:
         else:
             raise TypeError("Input must be a Django Model or QuerySet.")
 
-        query_obj = get_scope_query(self.username, model)
+        query_obj = self._get_scope_query(model)
 
         if query_obj is None:
             return queryset.none()
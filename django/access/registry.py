@@ -10,6 +10,9 @@ logger = logging.getLogger(__name__)
 # 全局注册表，用于存储 app_label -> handler_function 的映射
 INDIRECT_PERMISSION_HANDLERS = {}
 
+# 需要将可见ID集合编译缓存的模型（app_label.model_name）
+COMPILED_SCOPE_MODELS = set()
+
 
 def register_indirect_permission_handler(app_label, handler_func):
     """
@@ -28,3 +31,19 @@ def get_handler(app_label):
     获取注册的间接权限处理器函数。
     """
     return INDIRECT_PERMISSION_HANDLERS.get(app_label)
+
+
+def register_compiled_scope_model(*model_keys):
+    """
+    注册需要编译可见ID集合的模型。
+    编译结果按数据范围内容共享，因此这些模型的间接权限条件不能依赖用户名；
+    授权目标下的数据变化影响可见范围时需调用 access.tools.bump_scope_target_versions。
+    """
+    COMPILED_SCOPE_MODELS.update(model_keys)
+
+
+def is_compiled_scope_model(model_key):
+    """
+    判断指定模型是否编译可见ID集合。
+    """
+    return model_key in COMPILED_SCOPE_MODELS
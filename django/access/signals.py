@@ -2,9 +2,9 @@ import logging
 from django.db.models.signals import post_migrate, post_save,post_delete
 from django.dispatch import receiver
 from mapi.public_services import PublicRoleService,PublicUserService,PublicRbcaService
-from .models import Menu, Button, Permission
+from .models import Menu, Button, Permission, DataScope, PermissionTarget
 from .init_data import INIT_MENU
-from .tools import clear_password_permission_cache
+from .tools import clear_password_permission_cache, bump_scope_rule_version_on_commit
 logger = logging.getLogger(__name__)
 
 
@@ -238,3 +238,13 @@ def clear_cache_on_permission_change(sender, instance, created=None, **kwargs):
             logger.info(f"Cleared password permission cache for user: {username} due to permission change")
         except Exception as e:
             logger.error(f"Failed to clear password permission cache for user {username}: {e}")
+
+
+@receiver([post_save, post_delete], sender=DataScope)
+@receiver([post_save, post_delete], sender=PermissionTarget)
+def bump_scope_version_on_data_scope_change(sender, instance, **kwargs):
+    """
+    数据范围规则或授权目标变化时递增规则版本号，
+    所有用户缓存的数据范围及编译后的可见ID集合随之失效
+    """
+    bump_scope_rule_version_on_commit()
@@ -8,33 +8,103 @@
 4.  封装了与权限相关的缓存读写操作，以提升性能。
 """
 
+import hashlib
+import json
 import logging
+import time
+import uuid
+from array import array
 from collections import defaultdict
 from django.core.cache import cache
+from django.db import transaction
 from django.db.models import Q
 from threading import local
 from mapi.public_services import PublicUserService
+from vuedjango.request_cache import invalidate_request_cache
 from .models import DataScope,Permission
-from .registry import get_handler
+from .registry import get_handler, is_compiled_scope_model
 
 logger = logging.getLogger(__name__)
 
+# 数据范围规则版本号，随 DataScope/PermissionTarget 变化递增
+SCOPE_RULE_VERSION_KEY = 'data_scope_rule_version'
+# 授权目标版本号，目标对象下的可见数据（如授权分组的子分组、分组内实例）变化时递增
+SCOPE_TARGET_VERSION_KEY = 'data_scope_target_version_{model_key}_{object_id}'
+# 编译后可见ID集合的缓存时间
+COMPILED_SCOPE_CACHE_TIMEOUT = 60 * 60
+# 可见ID超过该数量时不再编译，回退为子查询条件，避免生成过长的 IN 列表
+COMPILED_SCOPE_MAX_IDS = 500
+
 # 缓存相关
 
 
+def _new_version():
+    # 以毫秒时间戳作为初始值，版本号被逐出后重新初始化也不会与旧值重复
+    return int(time.time() * 1000)
+
+
+def _get_versions(keys) -> dict:
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _new_version(), timeout=None)
+            versions[key] = cache.get(key)
+    return versions
+
+
+def get_scope_rule_version():
+    """获取数据范围规则版本"""
+    return _get_versions([SCOPE_RULE_VERSION_KEY])[SCOPE_RULE_VERSION_KEY]
+
+
+def _target_version_key(model_key, object_id) -> str:
+    return SCOPE_TARGET_VERSION_KEY.format(model_key=model_key, object_id=object_id)
+
+
+def _bump_version(key):
+    # 当前请求/任务内已缓存的数据权限条件同样失效
+    invalidate_request_cache('scope_query')
+    if cache.add(key, _new_version(), timeout=None):
+        return
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _new_version(), timeout=None)
+
+
+def bump_scope_rule_version():
+    """数据范围规则变化，所有用户的数据范围及编译结果失效"""
+    _bump_version(SCOPE_RULE_VERSION_KEY)
+
+
+def bump_scope_target_versions(model_key, object_ids):
+    """
+    授权目标下的可见数据变化，只有授权了这些目标的数据范围的编译结果失效
+    :param model_key: 目标模型（app_label.model_name）
+    :param object_ids: 目标对象ID
+    """
+    for object_id in {str(i) for i in object_ids}:
+        _bump_version(_target_version_key(model_key, object_id))
+
+
+def bump_scope_rule_version_on_commit():
+    transaction.on_commit(bump_scope_rule_version)
+
+
+def _data_scope_cache_key(username: str) -> str:
+    return f'user_data_scope_{username}_{get_scope_rule_version()}'
+
+
 def get_data_scope_cache(username: str) -> dict:
-    cache_key = f'user_data_scope_{username}'
-    return cache.get(cache_key)
+    return cache.get(_data_scope_cache_key(username))
 
 
 def set_data_scope_cache(username: str, data: dict):
-    cache_key = f'user_data_scope_{username}'
-    cache.set(cache_key, data)
+    cache.set(_data_scope_cache_key(username), data)
 
 
 def clear_data_scope_cache(username: str):
-    cache_key = f'user_data_scope_{username}'
-    cache.delete(cache_key)
+    cache.delete(_data_scope_cache_key(username))
 
 
 def get_password_permission_cache(username: str) -> bool:
@@ -109,6 +179,111 @@ def get_user_data_scope(username: str) -> dict:
     return result
 
 
+def _scope_digest(scope: dict) -> str:
+    """
+    数据范围内容及其授权目标版本的摘要，范围相同的用户共享编译结果
+    只有已注册编译的模型上的授权目标参与版本比较，其他目标变化不影响编译结果
+    """
+    targets = {key: sorted(str(i) for i in ids) for key, ids in scope.get('targets', {}).items()}
+    version_keys = [
+        _target_version_key(key, object_id)
+        for key in sorted(targets) if is_compiled_scope_model(key)
+        for object_id in targets[key]
+    ]
+    versions = _get_versions(version_keys) if version_keys else {}
+    payload = {
+        'scope_type': scope.get('scope_type'),
+        'targets': targets,
+        'versions': [versions[key] for key in version_keys],
+    }
+    return hashlib.md5(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+def _pack_ids(ids) -> tuple:
+    """将可见ID压缩为有序的定长字节数组"""
+    ids = sorted(ids)
+    if all(isinstance(i, uuid.UUID) for i in ids):
+        return 'uuid', b''.join(i.bytes for i in ids)
+    if all(isinstance(i, int) for i in ids):
+        return 'int', array('q', ids).tobytes()
+    return 'list', ids
+
+
+def _unpack_ids(packed) -> list:
+    kind, data = packed
+    if kind == 'uuid':
+        return [uuid.UUID(bytes=data[i:i + 16]) for i in range(0, len(data), 16)]
+    if kind == 'int':
+        values = array('q')
+        values.frombytes(data)
+        return values.tolist()
+    return list(data)
+
+
+def _get_target_query(scope, model, username):
+    """数据范围中的授权目标及间接权限条件（不含 create_user 条件）"""
+    model_key = f"{model._meta.app_label}.{model._meta.model_name}"
+    final_query = Q()
+
+    allowed_ids = scope['targets'].get(model_key)
+    if allowed_ids:
+        final_query |= Q(id__in=allowed_ids)
+
+    # 获取对应app 的模型过滤器
+    indirect_handler = get_handler(model._meta.app_label)
+    if indirect_handler:
+        indirect_query = indirect_handler(scope, model, username)
+        if indirect_query:
+            final_query |= indirect_query
+
+    return final_query
+
+
+def _get_compiled_scope(scope, model, username):
+    """
+    读取或编译数据范围在指定模型上的可见ID集合
+    返回 None 表示不编译（未注册或数量超限），返回 ('empty', None) 表示没有授权条件
+    """
+    model_key = f"{model._meta.app_label}.{model._meta.model_name}"
+    if not is_compiled_scope_model(model_key):
+        return None
+
+    cache_key = f'data_scope_ids_{model_key}_{_scope_digest(scope)}'
+    packed = cache.get(cache_key)
+    if packed is None:
+        target_query = _get_target_query(scope, model, username)
+        if not target_query:
+            packed = ('empty', None)
+        else:
+            ids = list(
+                model._default_manager.filter(target_query)
+                .values_list('pk', flat=True)[:COMPILED_SCOPE_MAX_IDS + 1]
+            )
+            if len(ids) > COMPILED_SCOPE_MAX_IDS:
+                packed = ('overflow', None)
+            else:
+                packed = _pack_ids(ids)
+        cache.set(cache_key, packed, COMPILED_SCOPE_CACHE_TIMEOUT)
+        logger.debug(f'Compiled data scope for {model_key}: {packed[0]}')
+
+    if packed[0] == 'overflow':
+        return None
+    return packed
+
+
+def get_compiled_scope_ids(scope, model, username=None):
+    """
+    获取数据范围在指定模型上编译后的可见ID列表（不含 create_user 条件）
+    返回 None 时调用方应回退为实时查询条件
+    """
+    packed = _get_compiled_scope(scope, model, username)
+    if packed is None:
+        return None
+    if packed[0] == 'empty':
+        return []
+    return _unpack_ids(packed)
+
+
 def get_scope_query(username, model):
     """获取指定用户在指定模型上的数据权限查询条件。"""
     if not username or username == 'anonymous':
@@ -123,25 +298,18 @@ def get_scope_query(username, model):
     if scope_type == 'none':
         return None  # 明确表示无权
 
-    app_label = model._meta.app_label
-    model_name = model._meta.model_name
-    model_key = f"{app_label}.{model_name}"
-
     final_query = Q()
 
-    allowed_ids = scope['targets'].get(model_key)
-    if allowed_ids:
-        final_query |= Q(id__in=allowed_ids)
+    # 已注册编译的模型使用缓存的可见ID集合，否则实时构建条件
+    packed = _get_compiled_scope(scope, model, username)
+    if packed is None:
+        final_query |= _get_target_query(scope, model, username)
+    elif packed[0] != 'empty':
+        final_query |= Q(pk__in=_unpack_ids(packed))
 
     if scope_type == 'self' or scope_type == 'filter':
         if hasattr(model, 'create_user'):
             final_query |= Q(create_user=username)
-    # 获取对应app 的模型过滤器
-    indirect_handler = get_handler(app_label)
-    if indirect_handler:
-        indirect_query = indirect_handler(scope, model, username)
-        if indirect_query:
-            final_query |= indirect_query
 
     return final_query
 
@@ -0,0 +1,257 @@
+"""
+审计日志归档模块
+按自然月将超过保留期的审计日志导出为 gzip 压缩的 JSONL 文件并从在线表中删除，保持 audit_log 表只存放近期数据。
+
+- 保留天数读取系统参数 audit_retention_days（sysConfigParams），不存在时使用 settings.AUDIT_RETENTION_DAYS，0 表示不归档
+- 只归档完整的自然月：早于 (当前时间 - 保留天数) 所在月份第一天的日志
+- 每个归档文件附带对象索引文件（{内容类型ID:对象ID: [行号]}），AuditArchive 表记录文件、条数、时间范围及校验和，
+  离线查询某个对象的历史时只解压包含该对象的文件
+- AuditArchive 同时记录归档日志的序号区间及区间两端的哈希，哈希链校验据此衔接被归档日志隔开的在线日志
+- 文件写入完成后在同一事务中登记索引并删除已导出的日志，失败时删除文件，日志保持在线
+- 被在线回退日志引用的日志留在线上，随引用它的回退日志一起归档
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import uuid
+
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import AuditArchive, AuditLog, FieldAuditDetail
+from .utils import CustomJSONEncoder
+
+logger = logging.getLogger(__name__)
+
+RETENTION_PARAM_NAME = 'audit_retention_days'
+# 每批导出/删除的日志数
+ARCHIVE_BATCH_SIZE = 1000
+
+
+def get_archive_dir() -> str:
+    return getattr(settings, 'AUDIT_ARCHIVE_DIR', os.path.join(settings.BASE_DIR, 'audit_archive'))
+
+
+def get_retention_days() -> int:
+    """审计日志在线保留天数"""
+    from mapi.models import sysConfigParams
+
+    default = getattr(settings, 'AUDIT_RETENTION_DAYS', 365)
+    value = sysConfigParams.objects.filter(param_name=RETENTION_PARAM_NAME).values_list(
+        'param_value', flat=True
+    ).first()
+    if value in (None, ''):
+        return default
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        logger.warning(f'Invalid {RETENTION_PARAM_NAME}: {value}, using default {default}')
+        return default
+
+
+def _month_start(value: datetime) -> datetime:
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _next_month(value: datetime) -> datetime:
+    return _month_start(value.replace(day=28) + timedelta(days=4))
+
+
+def get_archive_cutoff(retention_days: int, now=None) -> datetime:
+    """早于该时间的日志可以归档"""
+    now = now or timezone.now()
+    return _month_start(now - timedelta(days=retention_days))
+
+
+def serialize_log(log: AuditLog) -> dict:
+    return {
+        'id': str(log.id),
+        'content_type_id': log.content_type_id,
+        'content_type': f'{log.content_type.app_label}.{log.content_type.model}',
+        'object_id': log.object_id,
+        'action': log.action,
+        'changed_fields': log.changed_fields,
+        'operator': log.operator,
+        'operator_ip': log.operator_ip,
+        'request_id': log.request_id,
+        'correlation_id': log.correlation_id,
+        'is_reverted': log.is_reverted,
+        'reverted_from_id': str(log.reverted_from_id) if log.reverted_from_id else None,
+        'timestamp': log.timestamp.isoformat(),
+        'comment': log.comment,
+        'sequence': log.sequence,
+        'prev_hash': log.prev_hash,
+        'integrity_hash': log.integrity_hash,
+        'details': [
+            {
+                'field_id': detail.field_id,
+                'name': detail.name,
+                'verbose_name': detail.verbose_name,
+                'old_value': detail.old_value,
+                'new_value': detail.new_value,
+                'field_definition_changed': detail.field_definition_changed,
+                'old_field_definition': detail.old_field_definition,
+                'new_field_definition': detail.new_field_definition,
+            } for detail in log.details.all()
+        ],
+    }
+
+
+def _object_key(content_type_id, object_id) -> str:
+    return f'{content_type_id}:{object_id}'
+
+
+def _sequence_ranges(links) -> list:
+    """
+    将归档日志按序号合并为连续区间
+    :param links: [(序号, prev_hash, integrity_hash)]
+    :return: [[首序号, 首条 prev_hash, 末序号, 末条 integrity_hash]]
+    """
+    ranges = []
+    for sequence, prev_hash, integrity_hash in sorted(links):
+        if ranges and ranges[-1][2] + 1 == sequence:
+            ranges[-1][2:] = [sequence, integrity_hash]
+        else:
+            ranges.append([sequence, prev_hash, sequence, integrity_hash])
+    return ranges
+
+
+def _iter_month_logs(log_ids):
+    for offset in range(0, len(log_ids), ARCHIVE_BATCH_SIZE):
+        chunk = log_ids[offset:offset + ARCHIVE_BATCH_SIZE]
+        logs = AuditLog.objects.filter(id__in=chunk).select_related('content_type').prefetch_related('details')
+        logs_by_id = {log.id: log for log in logs}
+        for log_id in chunk:
+            if log_id in logs_by_id:
+                yield logs_by_id[log_id]
+
+
+def archive_month(month: datetime, archive_dir=None, dry_run=False) -> dict:
+    """归档一个自然月内的审计日志，返回归档结果"""
+    start = _month_start(month)
+    end = _next_month(start)
+    label = start.strftime('%Y-%m')
+    log_ids = list(
+        AuditLog.objects.filter(timestamp__gte=start, timestamp__lt=end)
+        .order_by('timestamp', 'id').values_list('id', flat=True)
+    )
+    # 仍被在线回退日志引用的日志暂不归档，避免修改已入哈希链的回退日志
+    referenced = set(
+        AuditLog.objects.filter(reverted_from_id__isnull=False)
+        .exclude(timestamp__gte=start, timestamp__lt=end)
+        .filter(reverted_from_id__in=log_ids).values_list('reverted_from_id', flat=True)
+    ) if log_ids else set()
+    log_ids = [log_id for log_id in log_ids if log_id not in referenced]
+    result = {'month': label, 'count': len(log_ids), 'file': None}
+    if not log_ids or dry_run:
+        return result
+
+    archive_dir = archive_dir or get_archive_dir()
+    os.makedirs(archive_dir, exist_ok=True)
+    base_name = f'audit-{label}-{uuid.uuid4().hex[:8]}'
+    file_name = f'{base_name}.jsonl.gz'
+    index_file_name = f'{base_name}.idx.json'
+    file_path = os.path.join(archive_dir, file_name)
+    index_path = os.path.join(archive_dir, index_file_name)
+
+    index = {}
+    links = []
+    first_timestamp = last_timestamp = None
+    try:
+        with gzip.open(file_path + '.tmp', 'wt', encoding='utf-8') as output:
+            for line_no, log in enumerate(_iter_month_logs(log_ids)):
+                output.write(json.dumps(serialize_log(log), cls=CustomJSONEncoder, ensure_ascii=False))
+                output.write('\n')
+                index.setdefault(_object_key(log.content_type_id, log.object_id), []).append(line_no)
+                first_timestamp = first_timestamp or log.timestamp
+                last_timestamp = log.timestamp
+                # 未分配序号的历史日志不在链中
+                if log.sequence is not None:
+                    links.append((log.sequence, log.prev_hash, log.integrity_hash))
+        os.replace(file_path + '.tmp', file_path)
+        with open(index_path, 'w', encoding='utf-8') as output:
+            json.dump(index, output)
+
+        checksum = hashlib.sha256()
+        with open(file_path, 'rb') as archived:
+            for block in iter(lambda: archived.read(1024 * 1024), b''):
+                checksum.update(block)
+
+        sequence_ranges = _sequence_ranges(links)
+        with transaction.atomic():
+            AuditArchive.objects.create(
+                month=label,
+                file_name=file_name,
+                index_file_name=index_file_name,
+                record_count=len(log_ids),
+                first_timestamp=first_timestamp,
+                last_timestamp=last_timestamp,
+                first_sequence=sequence_ranges[0][0] if sequence_ranges else None,
+                last_sequence=sequence_ranges[-1][2] if sequence_ranges else None,
+                sequence_ranges=sequence_ranges,
+                checksum=checksum.hexdigest(),
+            )
+            for offset in range(0, len(log_ids), ARCHIVE_BATCH_SIZE):
+                chunk = log_ids[offset:offset + ARCHIVE_BATCH_SIZE]
+                FieldAuditDetail.objects.filter(audit_log_id__in=chunk).delete()
+                AuditLog.objects.filter(id__in=chunk).delete()
+    except Exception:
+        for path in (file_path + '.tmp', file_path, index_path):
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+
+    logger.info(f'Archived {len(log_ids)} audit logs of {label} to {file_path}')
+    result['file'] = file_name
+    return result
+
+
+def archive_expired_logs(retention_days=None, archive_dir=None, dry_run=False, now=None) -> list:
+    """归档所有超过保留期的审计日志，按月份返回归档结果"""
+    if retention_days is None:
+        retention_days = get_retention_days()
+    if retention_days <= 0:
+        logger.info('Audit log archiving is disabled')
+        return []
+
+    cutoff = get_archive_cutoff(retention_days, now=now)
+    months = AuditLog.objects.filter(timestamp__lt=cutoff).datetimes('timestamp', 'month')
+    return [archive_month(month, archive_dir=archive_dir, dry_run=dry_run) for month in months]
+
+
+def iter_archived_logs(content_type_id, object_id, since=None, until=None, archive_dir=None):
+    """按时间顺序读取某个对象已归档的审计日志"""
+    archive_dir = archive_dir or get_archive_dir()
+    key = _object_key(content_type_id, object_id)
+    archives = AuditArchive.objects.all()
+    if since:
+        archives = archives.filter(last_timestamp__gte=since)
+    if until:
+        archives = archives.filter(first_timestamp__lte=until)
+
+    for archive in archives.order_by('first_timestamp'):
+        try:
+            with open(os.path.join(archive_dir, archive.index_file_name), encoding='utf-8') as index_file:
+                lines = set(json.load(index_file).get(key, ()))
+        except OSError as e:
+            logger.warning(f'Failed to read audit archive index {archive.index_file_name}: {e}')
+            continue
+        if not lines:
+            continue
+
+        with gzip.open(os.path.join(archive_dir, archive.file_name), 'rt', encoding='utf-8') as archived:
+            for line_no, line in enumerate(archived):
+                if line_no not in lines:
+                    continue
+                record = json.loads(line)
+                timestamp = parse_datetime(record['timestamp'])
+                if (since and timestamp < since) or (until and timestamp > until):
+                    continue
+                yield record
@@ -29,7 +29,10 @@ def audit_context(**kwargs):
     """
     一个健壮的上下文管理器，用于安全地设置和恢复审计上下文。
     这是修改上下文的唯一推荐方式。
+    范围内提交的审计记录先进入缓冲区，在最外层上下文结束时统一提交给写入器。
     """
+    from .writer import audit_buffer
+
     # 获取当前上下文，并用传入的参数进行更新
     current_context = audit_context_var.get()
     new_context = {**current_context, **kwargs}
@@ -37,7 +40,8 @@ def audit_context(**kwargs):
     # 设置新值并保存 token
     token: Token = audit_context_var.set(new_context)
     try:
-        yield
+        with audit_buffer():
+            yield
     finally:
         # 无论如何，最终都会使用 token 恢复到之前的状态
         audit_context_var.reset(token)
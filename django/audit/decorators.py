@@ -26,6 +26,8 @@ def register_audit(**kwargs):
     - field_resolvers: Dict[str, Callable] - 字段解析器映射，用于动态解析某些字段的值
     - m2m_fields: List[str] - 指定需要审计的ManyToMany字段列表
     - is_field_aware: bool - 指示模型是否为动态字段感知模型（仅用于CMDB实例）
+    - dynamic_value_resolver: Callable - 动态字段值解析器，审计明细保存解析后的展示值
+    - dynamic_value_masker: Callable - 动态字段展示值的脱敏函数，无密码查看权限时使用
     - restorer: Callable - 自定义的回退函数
     - locker: Callable - 自定义的数据库加锁函数
     """
@@ -0,0 +1,237 @@
+"""
+审计日志完整性模块
+审计日志按写入顺序组成 SHA-256 哈希链，篡改、删除任一条日志都会使链断开。
+
+- 写入器在写入事务中锁定链头（AuditChainHead），为每条日志分配连续序号，
+  integrity_hash = calc_integrity(上一条日志的 integrity_hash, 规范化的日志内容)
+- 校验时每条日志只依赖自身保存的 prev_hash，可按序号切分为多个区块在进程池中并行计算，
+  区块之间及与上一区块末行的衔接由主进程检查
+- 校验通过后为涉及的每个分区（自然月）更新检查点，下次从最后一个检查点之后增量校验；full=True 时从头校验
+- 未分配序号的历史日志不在链中，不参与校验
+- 已归档的日志从在线表删除后留下的序号空缺不视为断链：按 AuditArchive 记录的归档区间跳过空缺，
+  并用区间两端的哈希衔接空缺两侧的在线日志
+"""
+
+import logging
+
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import AuditArchive, AuditChainHead, AuditCheckpoint, AuditLog
+from .utils import calc_integrity
+
+logger = logging.getLogger(__name__)
+
+VERIFY_CHUNK_SIZE = 5000
+VERIFY_RESULT_KEY = 'audit_integrity_result'
+# 单次校验最多返回的问题数
+MAX_REPORTED_ISSUES = 100
+
+
+def _ip_field():
+    return AuditLog._meta.get_field('operator_ip')
+
+
+def integrity_payload(log, details) -> dict:
+    """参与哈希计算的日志内容，写入与校验时必须一致"""
+    return {
+        'id': str(log.id),
+        'sequence': log.sequence,
+        'content_type_id': log.content_type_id,
+        'object_id': str(log.object_id),
+        'action': log.action,
+        'changed_fields': log.changed_fields,
+        'operator': log.operator or '',
+        # IPv6 地址写入数据库时会被规范化
+        'operator_ip': _ip_field().get_prep_value(log.operator_ip) or None,
+        'request_id': log.request_id or '',
+        'correlation_id': log.correlation_id or '',
+        'is_reverted': bool(log.is_reverted),
+        'reverted_from_id': str(log.reverted_from_id) if log.reverted_from_id else None,
+        'timestamp': log.timestamp.isoformat(),
+        'comment': log.comment or '',
+        'details': sorted(
+            [detail.name, detail.verbose_name or '', detail.old_value, detail.new_value]
+            for detail in details
+        ),
+    }
+
+
+def chain_logs(logs, details_by_log):
+    """
+    为待写入的日志分配序号并计算哈希，需在写入事务中调用
+    :param details_by_log: {日志ID: [FieldAuditDetail]}
+    """
+    if not logs:
+        return
+    head, _ = AuditChainHead.objects.select_for_update().get_or_create(pk=1)
+    for log in logs:
+        head.last_sequence += 1
+        log.sequence = head.last_sequence
+        log.prev_hash = head.last_hash
+        log.integrity_hash = calc_integrity(log.prev_hash, integrity_payload(log, details_by_log.get(log.id, ())))
+        head.last_hash = log.integrity_hash
+    head.save(update_fields=['last_sequence', 'last_hash'])
+
+
+def _verify_chunk(rows, archived=None):
+    """
+    校验一个区块内每条日志的哈希及区块内部的衔接
+    :param rows: [(序号, 日志ID, prev_hash, integrity_hash, payload)]
+    :param archived: 已归档的序号区间，见 _load_archived_ranges
+    """
+    issues = []
+    previous = None
+    for sequence, log_id, prev_hash, integrity_hash, payload in rows:
+        if previous is not None:
+            issues.extend(_check_link(previous, sequence, log_id, prev_hash, archived))
+        if calc_integrity(prev_hash, payload) != integrity_hash:
+            issues.append({'sequence': sequence, 'log_id': log_id, 'type': 'tampered'})
+        previous = (sequence, integrity_hash)
+    return issues
+
+
+def _load_archived_ranges() -> dict:
+    """已归档的序号区间 {首序号: (首条 prev_hash, 末序号, 末条 integrity_hash)}"""
+    archived = {}
+    for ranges in AuditArchive.objects.exclude(first_sequence__isnull=True).values_list('sequence_ranges', flat=True):
+        for first_sequence, first_prev_hash, last_sequence, last_hash in ranges:
+            archived[first_sequence] = (first_prev_hash, last_sequence, last_hash)
+    return archived
+
+
+def _skip_archived(previous, archived, until=None):
+    """
+    从 previous 开始经相邻的归档区间向后衔接，直到序号 until 之前
+    :return: (衔接后的 (序号, 哈希), 衔接失败时的问题)
+    """
+    previous_sequence, previous_hash = previous
+    while archived and previous_sequence + 1 in archived and (until is None or until > previous_sequence + 1):
+        first_prev_hash, last_sequence, last_hash = archived[previous_sequence + 1]
+        if first_prev_hash != previous_hash:
+            return previous, {'sequence': previous_sequence + 1, 'log_id': None, 'type': 'broken_link'}
+        previous_sequence, previous_hash = last_sequence, last_hash
+    return (previous_sequence, previous_hash), None
+
+
+def _check_link(previous, sequence, log_id, prev_hash, archived=None):
+    # 空缺由已归档的日志组成时，经归档区间衔接到当前日志
+    (previous_sequence, previous_hash), issue = _skip_archived(previous, archived, until=sequence)
+    if issue:
+        return [issue]
+    if sequence != previous_sequence + 1:
+        return [{'sequence': sequence, 'log_id': log_id, 'type': 'gap', 'expected': previous_sequence + 1}]
+    if prev_hash != previous_hash:
+        return [{'sequence': sequence, 'log_id': log_id, 'type': 'broken_link'}]
+    return []
+
+
+def _iter_chunks(start_sequence, end_sequence, chunk_size):
+    last = start_sequence
+    while True:
+        logs = list(
+            AuditLog.objects.filter(sequence__gt=last, sequence__lte=end_sequence)
+            .order_by('sequence').prefetch_related('details')[:chunk_size]
+        )
+        if not logs:
+            return
+        yield logs
+        last = logs[-1].sequence
+
+
+def verify_chain(full=False, workers=1, chunk_size=VERIFY_CHUNK_SIZE) -> dict:
+    """
+    校验审计哈希链
+    :param full: 从头校验，否则从最后一个检查点之后开始
+    :param workers: 计算哈希的进程数，1 表示在当前进程中计算
+    """
+    head = AuditChainHead.objects.filter(pk=1).first()
+    head_sequence = head.last_sequence if head else 0
+
+    checkpoint = None if full else AuditCheckpoint.objects.order_by('-sequence').first()
+    # 没有检查点时从链首（序号 0、空哈希）开始衔接，链首的日志被删除或已归档同样可以识别
+    previous = (checkpoint.sequence, checkpoint.chain_hash) if checkpoint else (0, '')
+    start_sequence = checkpoint.sequence if checkpoint else 0
+
+    archived = _load_archived_ranges()
+    issues = []
+    verified = 0
+    partitions = {}
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    pending = []
+
+    def collect(future_or_result):
+        issues.extend(future_or_result.result() if executor else future_or_result)
+
+    try:
+        for logs in _iter_chunks(start_sequence, head_sequence, chunk_size):
+            rows = [
+                (log.sequence, str(log.id), log.prev_hash, log.integrity_hash,
+                 integrity_payload(log, log.details.all()))
+                for log in logs
+            ]
+            first = rows[0]
+            issues.extend(_check_link(previous, first[0], first[1], first[2], archived))
+            previous = (rows[-1][0], rows[-1][3])
+            for log in logs:
+                partitions[log.timestamp.strftime('%Y-%m')] = (log.sequence, log.integrity_hash)
+            verified += len(rows)
+
+            if executor is None:
+                collect(_verify_chunk(rows, archived))
+                continue
+            pending.append(executor.submit(_verify_chunk, rows, archived))
+            # 限制在途区块数，避免一次性加载全部数据
+            while len(pending) >= workers * 2:
+                collect(pending.pop(0))
+        for future in pending:
+            collect(future)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    # 链尾的日志已归档时衔接到归档区间末尾
+    previous, issue = _skip_archived(previous, archived)
+    if issue:
+        issues.append(issue)
+    last_sequence = previous[0]
+    if head_sequence and last_sequence < head_sequence:
+        issues.append({'sequence': last_sequence + 1, 'log_id': None, 'type': 'truncated', 'expected': head_sequence})
+    elif head and last_sequence == head_sequence and previous[1] != head.last_hash:
+        issues.append({'sequence': last_sequence, 'log_id': None, 'type': 'head_mismatch'})
+
+    issues.sort(key=lambda issue: issue['sequence'])
+    first_issue = issues[0]['sequence'] if issues else None
+    for partition, (sequence, chain_hash) in partitions.items():
+        if first_issue is None or sequence < first_issue:
+            AuditCheckpoint.objects.update_or_create(
+                partition=partition, defaults={'sequence': sequence, 'chain_hash': chain_hash}
+            )
+
+    result = {
+        'valid': not issues,
+        'verified': verified,
+        'start_sequence': start_sequence,
+        'end_sequence': last_sequence,
+        'issues': issues[:MAX_REPORTED_ISSUES],
+        'issue_count': len(issues),
+        'verified_at': timezone.now().isoformat(),
+    }
+    cache.set(VERIFY_RESULT_KEY, result, timeout=None)
+    if issues:
+        logger.error(f'Audit chain verification found {len(issues)} issues, first at sequence {first_issue}')
+    else:
+        logger.info(f'Audit chain verified {verified} logs up to sequence {last_sequence}')
+    return result
+
+
+def get_integrity_status() -> dict:
+    """最近一次校验结果及各分区检查点"""
+    return {
+        'last_result': cache.get(VERIFY_RESULT_KEY),
+        'checkpoints': list(
+            AuditCheckpoint.objects.order_by('sequence').values('partition', 'sequence', 'chain_hash', 'verified_at')
+        ),
+    }
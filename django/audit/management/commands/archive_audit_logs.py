@@ -0,0 +1,50 @@
+"""
+归档超过保留期的审计日志
+
+示例：
+    python manage.py archive_audit_logs
+    python manage.py archive_audit_logs --retention-days 180 --dry-run
+    python manage.py archive_audit_logs --history model_instance <实例ID>
+"""
+
+import json
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+
+from audit.archive import archive_expired_logs, get_retention_days, iter_archived_logs
+from audit.registry import registry
+
+
+class Command(BaseCommand):
+    help = '按月将超过保留期的审计日志导出为压缩文件并从在线表中删除，或查询对象的已归档历史'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-days', type=int, help='保留天数，默认读取系统参数 audit_retention_days')
+        parser.add_argument('--dry-run', action='store_true', help='只统计待归档的日志')
+        parser.add_argument('--history', nargs=2, metavar=('TARGET_TYPE', 'OBJECT_ID'),
+                            help='以 JSONL 输出对象的已归档审计日志')
+
+    def handle(self, *args, **options):
+        if options['history']:
+            public_name, object_id = options['history']
+            model = registry.get_model_by_public_name(public_name)
+            if model is None:
+                raise CommandError(f'Invalid target type: {public_name}')
+            content_type = ContentType.objects.get_for_model(model)
+            for record in iter_archived_logs(content_type.id, object_id):
+                self.stdout.write(json.dumps(record, ensure_ascii=False))
+            return
+
+        retention_days = options['retention_days']
+        if retention_days is None:
+            retention_days = get_retention_days()
+        results = archive_expired_logs(retention_days=retention_days, dry_run=options['dry_run'])
+        if not results:
+            self.stdout.write(f'No audit logs older than {retention_days} days to archive')
+            return
+        for result in results:
+            if options['dry_run']:
+                self.stdout.write(f"{result['month']}: {result['count']} logs to archive")
+            else:
+                self.stdout.write(self.style.SUCCESS(f"{result['month']}: archived {result['count']} logs to {result['file']}"))
@@ -0,0 +1,28 @@
+"""
+重新写入死信队列中的审计记录
+
+示例：
+    python manage.py replay_audit_dead_letters
+    python manage.py replay_audit_dead_letters --batch-size 100
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from audit.writer import AUDIT_WRITE_BATCH_SIZE, replay_dead_letters
+
+
+class Command(BaseCommand):
+    help = '重新写入写入失败后转入死信队列的审计记录，仍无法写入的记录保留在死信队列中'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=AUDIT_WRITE_BATCH_SIZE, help='每批写入的记录数')
+
+    def handle(self, *args, **options):
+        result = replay_dead_letters(batch_size=options['batch_size'])
+        if result is None:
+            raise CommandError('Audit queue is being flushed by another worker, try again later')
+        if result['failed']:
+            raise CommandError(
+                f"Replayed {result['replayed']} audit records, {result['failed']} remain in the dead letter queue"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Replayed {result['replayed']} audit records"))
@@ -0,0 +1,33 @@
+"""
+校验审计日志哈希链
+
+示例：
+    python manage.py verify_audit_chain
+    python manage.py verify_audit_chain --full --workers 8
+"""
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from audit.integrity import VERIFY_CHUNK_SIZE, verify_chain
+
+
+class Command(BaseCommand):
+    help = '从最后一个检查点开始增量校验审计日志哈希链，--full 时从头校验'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='忽略检查点，从头校验')
+        parser.add_argument('--workers', type=int, default=1, help='并行计算哈希的进程数')
+        parser.add_argument('--chunk-size', type=int, default=VERIFY_CHUNK_SIZE, help='每个区块的日志数')
+
+    def handle(self, *args, **options):
+        result = verify_chain(full=options['full'], workers=options['workers'], chunk_size=options['chunk_size'])
+        if result['valid']:
+            self.stdout.write(self.style.SUCCESS(
+                f"Verified {result['verified']} logs, sequence {result['start_sequence']} -> {result['end_sequence']}"
+            ))
+            return
+        for issue in result['issues']:
+            self.stdout.write(json.dumps(issue))
+        raise CommandError(f"Audit chain verification failed with {result['issue_count']} issues")
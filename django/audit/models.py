@@ -1,5 +1,6 @@
 import uuid
 from django.db import models
+from django.utils import timezone
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
 
@@ -39,14 +40,24 @@ class AuditLog(models.Model):
         related_name='revert_logs'    
     )
 
-    timestamp = models.DateTimeField(auto_now_add=True, db_index=True)
+    # 变更发生的时间，异步写入时由写入器按记录赋值
+    timestamp = models.DateTimeField(default=timezone.now, editable=False, db_index=True)
     comment = models.TextField(blank=True)
 
+    # 哈希链：写入器按写入顺序分配序号，integrity_hash = sha256(prev_hash + 规范化的日志内容)
+    sequence = models.BigIntegerField(null=True, blank=True, unique=True, editable=False)
+    prev_hash = models.CharField(max_length=64, blank=True, editable=False)
+    integrity_hash = models.CharField(max_length=64, blank=True, editable=False)
+
     class Meta:
         db_table = 'audit_log'
         managed = True
         app_label = 'cmdb'
         ordering = ['-timestamp']
+        indexes = [
+            # 按对象查询时间线及重建时间点状态
+            models.Index(fields=['content_type', 'object_id', 'timestamp'], name='idx_audit_object_timeline'),
+        ]
 
 
 class FieldAuditDetail(models.Model):
@@ -72,3 +83,57 @@ class FieldAuditDetail(models.Model):
         db_table = 'audit_field_detail'
         managed = True
         app_label = 'cmdb'
+
+
+class AuditArchive(models.Model):
+    """已归档的审计日志文件索引，每个文件对应一个自然月内过期的审计日志"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    # 归档月份，如 2024-01
+    month = models.CharField(max_length=7, db_index=True)
+    # 相对于归档目录的文件名
+    file_name = models.CharField(max_length=255, unique=True)
+    index_file_name = models.CharField(max_length=255)
+    record_count = models.PositiveIntegerField(default=0)
+    first_timestamp = models.DateTimeField(null=True, blank=True)
+    last_timestamp = models.DateTimeField(null=True, blank=True)
+    # 归档日志在哈希链中的序号范围，及其中连续区间 [[首序号, 首条 prev_hash, 末序号, 末条 integrity_hash]]，
+    # 校验哈希链时据此跳过已归档的序号
+    first_sequence = models.BigIntegerField(null=True, blank=True)
+    last_sequence = models.BigIntegerField(null=True, blank=True)
+    sequence_ranges = models.JSONField(default=list, blank=True)
+    checksum = models.CharField(max_length=64)
+    create_time = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'audit_archive'
+        managed = True
+        app_label = 'cmdb'
+        ordering = ['month', 'create_time']
+
+
+class AuditChainHead(models.Model):
+    """审计哈希链的链头，写入器加行锁后分配序号，保证链按写入顺序连续"""
+    id = models.PositiveSmallIntegerField(primary_key=True, default=1)
+    last_sequence = models.BigIntegerField(default=0)
+    last_hash = models.CharField(max_length=64, blank=True)
+
+    class Meta:
+        db_table = 'audit_chain_head'
+        managed = True
+        app_label = 'cmdb'
+
+
+class AuditCheckpoint(models.Model):
+    """已校验的哈希链检查点，每个分区（自然月）记录已校验的最后一条日志的序号及哈希"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    # 分区月份，如 2024-01
+    partition = models.CharField(max_length=7, unique=True)
+    sequence = models.BigIntegerField(db_index=True)
+    chain_hash = models.CharField(max_length=64)
+    verified_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'audit_checkpoint'
+        managed = True
+        app_label = 'cmdb'
+        ordering = ['sequence']
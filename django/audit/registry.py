@@ -98,6 +98,10 @@ class AuditRegistry:
         """获取模型的动态值解析器配置"""
         return self.config(model).get('dynamic_value_resolver')
 
+    def get_dynamic_value_masker(self, model: Type[models.Model]) -> callable:
+        """获取模型的动态值脱敏函数，用于向无权限用户展示敏感字段（如密码）"""
+        return self._get_callable(model, 'dynamic_value_masker')
+
     def get_m2m_fields_to_audit(self):
         """获取所有注册的多对多字段审计配置"""
         return self._m2m_fields_to_audit
@@ -110,5 +114,13 @@ class AuditRegistry:
         """获取模型的锁定函数"""
         return self._get_callable(model, 'locker')
 
+    def get_batch_restorer(self, model: Type[models.Model]) -> callable:
+        """获取模型的批量回退函数，未配置时按对象逐个回退"""
+        return self._get_callable(model, 'batch_restorer')
+
+    def get_batch_locker(self, model: Type[models.Model]) -> callable:
+        """获取模型的批量锁定函数"""
+        return self._get_callable(model, 'batch_locker')
+
 
 registry = AuditRegistry()
@@ -6,6 +6,7 @@
 """
 
 import logging
+from collections import defaultdict
 from django.apps import apps
 from django.db import transaction, connection
 from django.db.models import Max, Q
@@ -13,6 +14,7 @@ from rest_framework.exceptions import ValidationError
 from .models import AuditLog
 from .context import get_audit_context, audit_context
 from .registry import registry
+from .writer import ensure_flushed
 
 logger = logging.getLogger(__name__)
 
@@ -22,44 +24,84 @@ class AuditConflict(Exception):
 
 
 class RollbackManager:
-    def __init__(self, correlation_id, request=None):
+    """
+    按关联ID回退一批更新操作
+    - 模型注册了批量还原器和批量锁定器时，在一个事务中按主键顺序一次锁定全部实例，
+      由批量还原器根据预取的日志明细在内存中计算目标状态并批量写入
+    - 未注册批量还原器的模型按对象逐个回退
+    """
+
+    def __init__(self, correlation_id, request=None, batch=True):
         self.correlation_id = correlation_id
         self.request = request
+        self.batch = batch
 
-    def execute(self):
-        if not self.correlation_id:
-            raise ValidationError("Correlation_id is required for rollback.")
+    @property
+    def request_user(self):
+        return getattr(self.request, 'username', None)
 
-        logs_to_process = list(
+    def _load_logs(self):
+        return list(
             AuditLog.objects.filter(
                 correlation_id=self.correlation_id,
                 action=AuditLog.Action.UPDATE
             )
             .select_related('content_type')
             .prefetch_related('details')
-            .order_by('content_type_id', 'object_id', '-timestamp')
+            .order_by('content_type_id', 'object_id', 'timestamp')
         )
 
-        if not logs_to_process:
-            raise ValidationError("No update logs found for the given correlation_id.")
+    def find_conflicts(self) -> list:
+        """查找在批次最新更新之后又被其他操作更新过的对象"""
+        batch_latest = {
+            (item['content_type_id'], item['object_id']): item['latest_ts']
+            for item in AuditLog.objects.filter(
+                correlation_id=self.correlation_id,
+                action=AuditLog.Action.UPDATE
+            ).values('content_type_id', 'object_id').annotate(latest_ts=Max('timestamp'))
+        }
+        if not batch_latest:
+            return []
 
-        # 预检测是否存在更新时间晚于批次中最新更新时间的实例
-        latest_timestamps_in_batch = AuditLog.objects.filter(
-            correlation_id=self.correlation_id,
-            action=AuditLog.Action.UPDATE
-        ).values('content_type_id', 'object_id').annotate(
+        newer = AuditLog.objects.filter(
+            content_type_id__in={key[0] for key in batch_latest},
+            object_id__in={key[1] for key in batch_latest},
+        ).exclude(correlation_id=self.correlation_id).values('content_type_id', 'object_id').annotate(
             latest_ts=Max('timestamp')
         )
+        conflicts = []
+        for item in newer:
+            key = (item['content_type_id'], item['object_id'])
+            if key in batch_latest and item['latest_ts'] > batch_latest[key]:
+                conflicts.append({
+                    'content_type_id': key[0],
+                    'object_id': key[1],
+                    'latest_timestamp': item['latest_ts'],
+                })
+        return sorted(conflicts, key=lambda item: (item['content_type_id'], item['object_id']))
+
+    def execute(self, dry_run=False):
+        if not self.correlation_id:
+            raise ValidationError("Correlation_id is required for rollback.")
 
-        conflict_query = Q()
-        for item in latest_timestamps_in_batch:
-            conflict_query |= Q(
-                content_type_id=item['content_type_id'],
-                object_id=item['object_id'],
-                timestamp__gt=item['latest_ts']
-            )
+        # 异步写入的审计记录落库后才能完整检测冲突
+        if not ensure_flushed():
+            raise AuditConflict("Audit records are still being written, please retry later.")
+
+        logs_to_process = self._load_logs()
 
-        if conflict_query and AuditLog.objects.filter(conflict_query).exists():
+        if not logs_to_process:
+            raise ValidationError("No update logs found for the given correlation_id.")
+
+        # 预检测是否存在更新时间晚于批次中最新更新时间的实例
+        conflicts = self.find_conflicts()
+        if dry_run:
+            return {
+                'logs': len(logs_to_process),
+                'objects': len({(log.content_type_id, log.object_id) for log in logs_to_process}),
+                'conflicts': conflicts,
+            }
+        if conflicts:
             raise AuditConflict("Cannot rollback due to newer updates existing for some objects.")
 
         result = {
@@ -67,14 +109,62 @@ class RollbackManager:
             'failure': []
         }
 
-        for original_log in reversed(logs_to_process):
-            model_class = original_log.content_type.model_class()
-            restorer = registry.get_restorer(model_class)
-            locker = registry.get_locker(model_class)
-            if not restorer or not locker:
-                logger.warning(f"No restorer or locker registered for {model_class.__name__}. Skipping.")
-                continue
+        logs_by_model = defaultdict(list)
+        for log in logs_to_process:
+            logs_by_model[log.content_type.model_class()].append(log)
+
+        for model_class, logs in logs_by_model.items():
+            batch_restorer = registry.get_batch_restorer(model_class) if self.batch else None
+            batch_locker = registry.get_batch_locker(model_class) if self.batch else None
+            if batch_restorer and batch_locker:
+                self._execute_batch(model_class, logs, batch_restorer, batch_locker, result)
+            else:
+                self._execute_per_object(model_class, logs, result)
+
+        return result
+
+    def _execute_batch(self, model_class, logs, batch_restorer, batch_locker, result):
+        logs_by_object = defaultdict(list)
+        for log in logs:
+            logs_by_object[log.object_id].append(log)
+
+        def fail(object_id, reason):
+            result["failure"].extend(
+                {"log_id": str(log.id), "reason": reason} for log in logs_by_object[object_id]
+            )
 
+        try:
+            with transaction.atomic():
+                instances = batch_locker(list(logs_by_object), nowait=True)
+                with audit_context(is_rollback=True):
+                    failures = batch_restorer(
+                        instances={object_id: instances[object_id] for object_id in logs_by_object
+                                   if object_id in instances},
+                        logs_by_object=logs_by_object,
+                        request_user=self.request_user
+                    )
+        except Exception as exc:
+            logger.exception("Batch rollback failed for %s: %s", model_class.__name__, exc)
+            for object_id in logs_by_object:
+                fail(object_id, "An unknown error occurred during rollback.")
+            return
+
+        for object_id, object_logs in logs_by_object.items():
+            if object_id not in instances:
+                fail(object_id, "Instance does not exist.")
+            elif object_id in failures:
+                fail(object_id, failures[object_id])
+            else:
+                result["success"].extend(str(log.id) for log in object_logs)
+
+    def _execute_per_object(self, model_class, logs, result):
+        restorer = registry.get_restorer(model_class)
+        locker = registry.get_locker(model_class)
+        if not restorer or not locker:
+            logger.warning(f"No restorer or locker registered for {model_class.__name__}. Skipping.")
+            return
+
+        for original_log in logs:
             try:
                 with transaction.atomic():
                     # 锁定对应实例
@@ -88,7 +178,7 @@ class RollbackManager:
                             instance=instance,
                             snapshot=snapshot,
                             field_details=field_details,
-                            request_user=self.request.username
+                            request_user=self.request_user
                         )
 
                 result["success"].append(str(original_log.id))
@@ -102,5 +192,3 @@ class RollbackManager:
                 logger.exception("Rollback failed for log %s: %s", original_log.id, exc)
                 result["failure"].append({"log_id": str(original_log.id),
                                          "reason": "An unknown error occurred during rollback."})
-
-        return result
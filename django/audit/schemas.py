@@ -29,4 +29,20 @@ audit_log_schema = extend_schema_view(
         summary='导出审计日志',
         tags=['审计日志'],
     ),
+    integrity=extend_schema(
+        summary='审计日志完整性校验',
+        description='GET 返回最近一次哈希链校验结果及各分区检查点；POST 发起异步增量校验，传 full=true 时从头校验',
+        tags=['审计日志'],
+    ),
+    timeline=extend_schema(
+        summary='获取对象变更时间线',
+        description='按时间顺序以游标分页返回对象的审计日志及字段明细，可用 since/until 限定时间范围',
+        tags=['审计日志'],
+        responses={200: AuditLogSerializer(many=True)},
+    ),
+    state=extend_schema(
+        summary='获取对象在指定时间点的状态',
+        description='从最近的快照（创建日志或当前状态）开始折叠字段变更，重建对象在 at 时刻的静态字段和动态字段',
+        tags=['审计日志'],
+    ),
 )
@@ -2,19 +2,17 @@
 审计信号模块
 
 该模块定义了Django模型的信号处理器，用于捕获模型实例的创建、更新和删除操作，并记录相应的审计日志。
+信号处理器只生成审计记录，在事务提交后交给写入器（writer.py）批量写入。
 需要特殊处理的审计信号需要在此模块内实现对应的审计逻辑
 """
 
 import logging
-from django.db import transaction
 from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
 from django.dispatch import receiver
-from django.forms.models import model_to_dict
-from django.utils import timezone
 from .registry import registry
-from .models import AuditLog, FieldAuditDetail
+from .models import AuditLog
 from .context import get_audit_context
-from .utils import clean_for_json
+from .writer import defer_dynamic_changes, enqueue_on_commit, make_merge_record, make_record
 from .snapshots import (
     get_dynamic_field_snapshot,
     get_prefetched_snapshot,
@@ -122,31 +120,32 @@ def capture_old_state(sender, instance, **kwargs):
 @receiver(post_save)
 def log_changes(sender, instance, created, **kwargs):
     """
-    在模型保存后，注册一个在事务提交后才执行的审计任务。
+    在模型保存后，按保存前快照与内存中的实例状态生成审计记录，事务提交后交给写入器。
+    字段感知模型的动态字段在实例保存后才写入，由写入器在提交时批量读取新值并比较。
     """
     if not registry.is_registered(sender):
         return
 
-    context_snapshot = get_audit_context()
-    # logger.debug(f"Context snapshot captured: {context_snapshot}")
-
-    # new_static_snapshot = get_static_field_snapshot(instance)
+    context = get_audit_context()
+    action = 'CREATE' if created else 'UPDATE'
 
     old_static_snapshot = getattr(instance, '_old_instance_snapshot', {})
     old_dynamic_snapshot = getattr(instance, '_old_dynamic_fields_snapshot', {})
-
-    def delayed_process(context=context_snapshot):
-        # logger.debug(f"Context for delayed process: {context}")
-        action = 'CREATE' if created else 'UPDATE'
-        final_instance = None
-        try:
-            final_instance = sender.objects.get(pk=instance.pk)
-        except sender.DoesNotExist:
-            return
-
-        new_static_snapshot = get_static_field_snapshot(final_instance)
-        new_dynamic_snapshot = get_dynamic_field_snapshot(final_instance)
-
+    new_static_snapshot = get_static_field_snapshot(instance)
+
+    if created:
+        static_changes = {
+            key: [None, get_field_value_snapshot(val)]
+            for key, val in new_static_snapshot.items()
+        }
+
+        # ModelInstance创建记录初始分组信息/单独适配
+        if hasattr(instance, '_initial_groups'):
+            group_field_name = 'groups'
+            group_values = getattr(instance, '_initial_groups', [])
+            static_changes[group_field_name] = [None, group_values]
+            delattr(instance, '_initial_groups')
+    else:
         static_changes = {}
         all_static_keys = old_static_snapshot.keys() | new_static_snapshot.keys()
         for key in all_static_keys:
@@ -157,97 +156,24 @@ def log_changes(sender, instance, created, **kwargs):
                     get_field_value_snapshot(old_val),
                     get_field_value_snapshot(new_val)
                 ]
-        logger.info(f'Static changes prepared for {instance} {action.lower()}: {static_changes}')
+    logger.debug(f'Static changes prepared for {instance} {action.lower()}: {static_changes}')
 
-        resolver = registry.get_dynamic_value_resolver(sender)
-        dynamic_changes = []
-        all_dynamic_keys = old_dynamic_snapshot.keys() | new_dynamic_snapshot.keys()
-        for key in all_dynamic_keys:
-            old_field_data = old_dynamic_snapshot.get(key, {})
-            new_field_data = new_dynamic_snapshot.get(key, {})
-            old_val = old_field_data.get('value')
-            new_val = new_field_data.get('value')
-
-            if old_val != new_val:
-                logger.debug(f'{old_val} {new_val}')
-                if resolver:
-                    model_field = new_field_data.get('model_field') or old_field_data.get('model_field')
-                    if model_field:
-                        old_val = resolver(model_field, old_val)
-                        new_val = resolver(model_field, new_val)
-                        logger.debug(f'{old_val} {new_val}')
-                        if old_val == new_val:
-                            logger.debug(f'No changes found for {model_field.name}. Skipped.')
-                            continue
-                dynamic_changes.append({
-                    'name': key,
-                    'verbose_name': new_field_data.get('verbose_name') or old_field_data.get('verbose_name', ''),
-                    'old_value': old_val,
-                    'new_value': new_val,
-                })
+    field_aware = registry.is_field_aware(sender)
+    if not created and not field_aware and not static_changes:
+        return
 
-        if created:
-            static_changes = {
-                key: [None, get_field_value_snapshot(val)]
-                for key, val in new_static_snapshot.items()
-            }
-
-            # ModelInstance创建记录初始分组信息/单独适配
-            if hasattr(instance, '_initial_groups'):
-                group_field_name = 'groups'
-                group_values = getattr(instance, '_initial_groups', [])
-                static_changes[group_field_name] = [None, group_values]
-                delattr(instance, '_initial_groups')
-
-            dynamic_changes = [{
-                'name': key,
-                'verbose_name': data.get('verbose_name', ''),
-                'old_value': None,
-                'new_value': resolver(data.get('model_field'), data.get('value')) if resolver and data.get('model_field') else data.get('value')
-            } for key, data in new_dynamic_snapshot.items()]
-
-        if not created and not static_changes and not dynamic_changes:
-            return
-
-        # 不记录 ModelFields 仅 order 字段的变更
-        if not created and sender.__name__ == 'ModelFields' and \
-                static_changes.keys() == {'order'} and not dynamic_changes:
-            return
-
-        comment = context.get("comment") or build_audit_comment(action, instance)
-        logger.debug(f'{static_changes}, {dynamic_changes}, {comment}')
-
-        is_rollback = context.get("is_rollback", False)
-        reverted_from = context.get("reverted_from", None)
-        if is_rollback:
-            comment = f"[回退操作] {comment}"
-
-        log = AuditLog.objects.create(
-            content_object=instance,
-            action=action,
-            changed_fields=clean_for_json(static_changes),
-            operator=context.get('operator', ''),
-            operator_ip=context.get('operator_ip', None),
-            request_id=context.get('request_id', ''),
-            correlation_id=context.get('correlation_id', ''),
-            is_reverted=is_rollback,
-            reverted_from=reverted_from,
-            comment=comment
-        )
+    # 不记录 ModelFields 仅 order 字段的变更
+    if not created and sender.__name__ == 'ModelFields' and static_changes.keys() == {'order'}:
+        return
 
-        if dynamic_changes:
-            details_to_create = [
-                FieldAuditDetail(
-                    audit_log=log,
-                    name=change['name'],
-                    verbose_name=change['verbose_name'],
-                    old_value=str(change['old_value']) if change['old_value'] is not None else None,
-                    new_value=str(change['new_value']) if change['new_value'] is not None else None,
-                ) for change in dynamic_changes
-            ]
-            FieldAuditDetail.objects.bulk_create(details_to_create)
+    comment = context.get("comment") or build_audit_comment(action, instance)
+    if context.get("is_rollback", False):
+        comment = f"[回退操作] {comment}"
 
-    transaction.on_commit(delayed_process)
+    record = make_record(instance, action, static_changes, context=context, comment=comment)
+    if field_aware:
+        defer_dynamic_changes(record, instance, old_dynamic_snapshot, created)
+    enqueue_on_commit([record])
 
 
 @receiver(post_delete)
@@ -263,7 +189,7 @@ def log_deletion(sender, instance, **kwargs):
     resolver = registry.get_dynamic_value_resolver(sender)
 
     static_changes = {key: [get_field_value_snapshot(val), None] for key, val in static_snapshot.items()}
-    logger.info(f'Static changes prepared for {instance} deletion: {static_changes}')
+    logger.debug(f'Static changes prepared for {instance} deletion: {static_changes}')
 
     dynamic_changes = []
     for key, data in dynamic_snapshot.items():
@@ -279,29 +205,9 @@ def log_deletion(sender, instance, **kwargs):
         })
 
     comment = context.get("comment") or build_audit_comment("DELETE", instance)
-
-    log = AuditLog.objects.create(
-        content_object=instance,
-        action='DELETE',
-        changed_fields=clean_for_json(static_changes),
-        operator=context.get('operator', ''),
-        operator_ip=context.get('operator_ip', None),
-        request_id=context.get('request_id', ''),
-        correlation_id=context.get('correlation_id', ''),
-        comment=comment
-    )
-
-    if dynamic_changes:
-        details_to_create = [
-            FieldAuditDetail(
-                audit_log=log,
-                name=change['name'],
-                verbose_name=change['verbose_name'],
-                old_value=str(change['old_value']) if change['old_value'] is not None else None,
-                new_value=None,
-            ) for change in dynamic_changes
-        ]
-        FieldAuditDetail.objects.bulk_create(details_to_create)
+    enqueue_on_commit([
+        make_record(instance, 'DELETE', static_changes, dynamic_changes, context=context, comment=comment)
+    ])
 
 
 @receiver(instance_group_relations_audit)
@@ -311,24 +217,14 @@ def log_instance_group_relation_audit(sender, instance, old_groups, new_groups,
 
     context = get_audit_context()
 
-    def delayed_audit_log(context=context):
-        old_groups_str = '，'.join(f"{group['label']}" for group in old_groups) if old_groups else None
-        new_groups_str = '，'.join(f"{group['label']}" for group in new_groups) if new_groups else None
-        comment = f"更新了模型实例 <{instance.instance_name}> 的分组关联关系：<{old_groups_str}> → <{new_groups_str}>"
-        AuditLog.objects.create(
-            content_object=instance,
-            action=AuditLog.Action.UPDATE,
-            changed_fields={
-                'groups': [old_groups, new_groups]
-            },
-            operator=context.get('operator', ''),
-            operator_ip=context.get('operator_ip', None),
-            request_id=context.get('request_id', ''),
-            correlation_id=context.get('correlation_id', ''),
-            comment=comment
+    old_groups_str = '，'.join(f"{group['label']}" for group in old_groups) if old_groups else None
+    new_groups_str = '，'.join(f"{group['label']}" for group in new_groups) if new_groups else None
+    comment = f"更新了模型实例 <{instance.instance_name}> 的分组关联关系：<{old_groups_str}> → <{new_groups_str}>"
+    enqueue_on_commit([
+        make_record(
+            instance, AuditLog.Action.UPDATE, {'groups': [old_groups, new_groups]}, context=context, comment=comment
         )
-
-    transaction.on_commit(delayed_audit_log)
+    ])
 
 
 @receiver(instance_bulk_update_audit)
@@ -336,7 +232,7 @@ def log_instance_bulk_update_audit(sender, snapshots_list, **kwargs):
     if not snapshots_list:
         return
 
-    context_snapshot = get_audit_context()
+    context = get_audit_context()
 
     first_instance_class = snapshots_list[0]['instance'].__class__
     if not registry.is_registered(first_instance_class):
@@ -344,93 +240,67 @@ def log_instance_bulk_update_audit(sender, snapshots_list, **kwargs):
 
     resolver = registry.get_dynamic_value_resolver(first_instance_class)
 
-    def delayed_process(context=context_snapshot):
-        logs_with_details = []
-
-        for info in snapshots_list:
-            logger.info(f'{info}')
-            instance = info['instance']
-            old_snapshot = info['old_snapshot']
-            new_snapshot = info['new_snapshot']
-            update_fields = info.get('update_fields', [])
+    # 批量更新中大量实例通常写入相同的值，按 (字段, 值) 缓存解析结果避免重复查询
+    resolved_cache = {}
 
-            dynamic_changes = []
+    def resolve(model_field, value):
+        key = (model_field.pk, value)
+        if key not in resolved_cache:
+            resolved_cache[key] = resolver(model_field, value)
+        return resolved_cache[key]
 
-            all_keys = set(old_snapshot.keys()) | set(new_snapshot.keys())
+    records = []
+    for info in snapshots_list:
+        instance = info['instance']
+        old_snapshot = info['old_snapshot']
+        new_snapshot = info['new_snapshot']
+        update_fields = info.get('update_fields', [])
 
-            for field_name in all_keys:
-                if field_name not in update_fields:
-                    continue
-
-                old_field_data = old_snapshot.get(field_name, {})
-                new_field_data = new_snapshot.get(field_name, {})
-                old_val = old_field_data.get('value')
-                new_val = new_field_data.get('value')
-
-                if old_val != new_val:
-                    model_field = new_field_data.get('model_field') or old_field_data.get('model_field')
-                    if resolver and model_field:
-                        old_val = resolver(model_field, old_val)
-                        new_val = resolver(model_field, new_val)
+        dynamic_changes = []
 
-                    dynamic_changes.append({
-                        'name': field_name,
-                        'verbose_name': new_field_data.get('verbose_name') or old_field_data.get('verbose_name', ''),
-                        'old_value': old_val,
-                        'new_value': new_val,
-                    })
+        all_keys = set(old_snapshot.keys()) | set(new_snapshot.keys())
 
-            if not dynamic_changes:
+        for field_name in all_keys:
+            if field_name not in update_fields:
                 continue
 
-            comment = context.get("comment") or build_audit_comment('UPDATE', instance)
-
-            log = AuditLog(
-                content_object=instance,
-                action='UPDATE',
-                changed_fields={},
-                operator=context.get('operator', ''),
-                operator_ip=context.get('operator_ip', None),
-                request_id=context.get('request_id', ''),
-                correlation_id=context.get('correlation_id', ''),
-                comment=comment
-            )
-
-            details = []
-
-            for change in dynamic_changes:
-                details.append(FieldAuditDetail(
-                    name=change['name'],
-                    verbose_name=change['verbose_name'],
-                    old_value=str(change['old_value']) if change['old_value'] is not None else None,
-                    new_value=str(change['new_value']) if change['new_value'] is not None else None,
-                ))
+            old_field_data = old_snapshot.get(field_name, {})
+            new_field_data = new_snapshot.get(field_name, {})
+            old_val = old_field_data.get('value')
+            new_val = new_field_data.get('value')
 
-            logs_with_details.append((log, details))
+            if old_val != new_val:
+                model_field = new_field_data.get('model_field') or old_field_data.get('model_field')
+                if resolver and model_field:
+                    old_val = resolve(model_field, old_val)
+                    new_val = resolve(model_field, new_val)
 
-        all_logs_to_create = [item[0] for item in logs_with_details]
-        if not all_logs_to_create:
-            return
+                dynamic_changes.append({
+                    'name': field_name,
+                    'verbose_name': new_field_data.get('verbose_name') or old_field_data.get('verbose_name', ''),
+                    'old_value': old_val,
+                    'new_value': new_val,
+                })
 
-        AuditLog.objects.bulk_create(all_logs_to_create)
+        # 可选：随批量更新一并变更的静态字段，如按模板重新生成的实例名称
+        static_changes = info.get('static_changes') or {}
 
-        all_details_to_create = []
-        for log, details in logs_with_details:
-            for detail in details:
-                detail.audit_log_id = log.id
-            all_details_to_create.extend(details)
+        if not dynamic_changes and not static_changes:
+            continue
 
-        if all_details_to_create:
-            FieldAuditDetail.objects.bulk_create(all_details_to_create)
+        comment = context.get("comment") or build_audit_comment('UPDATE', instance)
+        # 批量回退时每个实例回退的原始日志不同
+        record_context = {**context, 'reverted_from': info['reverted_from']} if info.get('reverted_from') else context
+        records.append(make_record(instance, 'UPDATE', static_changes, dynamic_changes, context=record_context, comment=comment))
 
-    transaction.on_commit(delayed_process)
+    enqueue_on_commit(records)
 
 
 @receiver(m2m_changed)
 def log_generic_m2m_changes(sender, instance, action, reverse, model, pk_set, **kwargs):
     """
     M2M字段变化处理器。
-    在相关M2M关系发生变化时，查找对应的注册字段，并将变更合并到主审计日志中。
+    在相关M2M关系发生变化时，查找对应的注册字段，生成合并记录，由写入器合并到主审计日志中。
     """
     # 不处理反向关系，且在关系添加/删除/清空之后
     if reverse or action not in ["post_add", "post_remove", "post_clear"]:
@@ -439,8 +309,7 @@ def log_generic_m2m_changes(sender, instance, action, reverse, model, pk_set, **
     if not registry.is_registered(instance.__class__):
         return
 
-    context_snapshot = get_audit_context()
-    correlation_id = context_snapshot.get('correlation_id')
+    correlation_id = get_audit_context().get('correlation_id')
 
     if not correlation_id:
         logger.warning(f"M2M change for {instance} occurred outside of a request context. Skipping merge.")
@@ -462,43 +331,21 @@ def log_generic_m2m_changes(sender, instance, action, reverse, model, pk_set, **
             f"No resolver configured for M2M field '{field_name}' on model {instance.__class__.__name__}. Skipping merge.")
         return
 
-    def delayed_merge(context=context_snapshot):
-        try:
-            manager = getattr(instance, field_name)
-            instance_id = instance.pk
-            main_log = AuditLog.objects.get(
-                correlation_id=correlation_id,
-                object_id=str(instance_id),
-                content_type__model=instance.__class__.__name__.lower()
-            )
-
-            new_value_snapshot = resolver(manager.all())
-
-            old_value_snapshot = main_log.changed_fields.get(field_name, [None, None])[0]
-            if old_value_snapshot is None and action != 'post_clear':
-                old_value_snapshot = []
-
-            if main_log.changed_fields is None:
-                main_log.changed_fields = {}
-
-            main_log.changed_fields[field_name] = [old_value_snapshot, new_value_snapshot]
-
-            main_log.save(update_fields=['changed_fields', 'timestamp'])
-            logger.debug(f"Merged M2M change for field '{field_name}' into AuditLog {main_log.id}")
-
-        except AuditLog.DoesNotExist:
-            logger.warning(
-                f"Could not find main AuditLog with correlation_id {correlation_id} to merge M2M changes. It might not have been created yet.")
-        except Exception as e:
-            logger.error(f"Failed to merge M2M audit changes: {e}", exc_info=True)
+    try:
+        new_value_snapshot = resolver(getattr(instance, field_name).all())
+    except Exception as e:
+        logger.error(f"Failed to resolve M2M audit changes: {e}", exc_info=True)
+        return
 
-    transaction.on_commit(delayed_merge)
+    enqueue_on_commit([
+        make_merge_record(instance, correlation_id, field_name, new_value_snapshot, cleared=action == 'post_clear')
+    ])
 
 
 @receiver(bulk_creation_audit)
 def log_bulk_creation(sender, instances, **kwargs):
     context = get_audit_context()
-    logs_to_create = []
+    records = []
 
     for instance in instances:
         static_snapshot = get_static_field_snapshot(instance)
@@ -507,18 +354,9 @@ def log_bulk_creation(sender, instances, **kwargs):
         for field, value in static_snapshot.items():
             static_changes[field] = [None, value]
 
-        logs_to_create.append(
-            AuditLog(
-                content_object=instance,
-                action=AuditLog.Action.CREATE,
-                changed_fields=clean_for_json(static_changes),
-                operator=context.get('operator', ''),
-                operator_ip=context.get('operator_ip', ''),
-                request_id=context.get('request_id', ''),
-                correlation_id=context.get('correlation_id', ''),
-                comment=build_audit_comment('CREATE', instance)
-            )
-        )
+        records.append(make_record(
+            instance, AuditLog.Action.CREATE, static_changes,
+            context=context, comment=build_audit_comment('CREATE', instance)
+        ))
 
-    if logs_to_create:
-        AuditLog.objects.bulk_create(logs_to_create)
+    enqueue_on_commit(records)
@@ -0,0 +1,48 @@
+"""
+审计异步任务模块
+消费审计写入队列，批量写入审计日志；重放死信队列中的审计记录；按保留策略归档过期的审计日志；校验审计哈希链。
+"""
+
+import logging
+
+from celery import shared_task
+from django.core.cache import cache
+
+from .archive import archive_expired_logs
+from .integrity import verify_chain
+from .writer import AUDIT_FLUSH_SCHEDULED_KEY, flush_queue, get_flush_delay, get_queue_length, replay_dead_letters
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def flush_audit_records():
+    """批量写入队列中的审计记录，未处理完时继续排队"""
+    # 先清除排队标记，写入期间新提交的记录会重新排队一个任务
+    cache.delete(AUDIT_FLUSH_SCHEDULED_KEY)
+    written = flush_queue()
+    logger.info(f'Flushed {written} audit records')
+
+    if get_queue_length() and cache.add(AUDIT_FLUSH_SCHEDULED_KEY, 1, timeout=get_flush_delay() + 60):
+        flush_audit_records.apply_async(countdown=get_flush_delay())
+    return written
+
+
+@shared_task
+def replay_audit_dead_letters():
+    """重新写入死信队列中的审计记录"""
+    return replay_dead_letters()
+
+
+@shared_task
+def archive_expired_audit_logs():
+    """按保留策略归档过期的审计日志"""
+    results = archive_expired_logs()
+    return [{'month': result['month'], 'count': result['count']} for result in results]
+
+
+@shared_task
+def verify_audit_chain(full=False, workers=1):
+    """从最后一个检查点开始增量校验审计哈希链"""
+    result = verify_chain(full=full, workers=workers)
+    return {'valid': result['valid'], 'verified': result['verified'], 'issue_count': result['issue_count']}
@@ -1,12 +1,15 @@
 import logging
 from rest_framework import viewsets, pagination
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
 from rest_framework.filters import SearchFilter
 from django_filters.rest_framework import DjangoFilterBackend
 from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.db.models import Count, Q, Case, When, Value, CharField
 from django.db import transaction
+from django.utils.dateparse import parse_datetime
 
 from .models import AuditLog
 from .serializers import AuditLogSerializer
@@ -16,15 +19,31 @@ from .restoration import RollbackManager, AuditConflict
 from .mixins import AuditContextMixin
 from .context import audit_context
 from .registry import registry
+from .integrity import get_integrity_status
+from .timeline import TIMELINE_ORDERING, get_object_timeline, reconstruct_state
+from .tasks import verify_audit_chain
+from .writer import ensure_flushed
+from vuedjango.pagination import KeysetPagination
+from access.manager import PermissionManager
+from access.tools import has_password_permission
 
 
 
 logger = logging.getLogger(__name__)
 
-class AuditLogPagination(pagination.PageNumberPagination):
+class AuditLogPagination(KeysetPagination):
     page_size = 20
     page_size_query_param = 'page_size'
     max_page_size = 100
+    keyset_ordering = ('-timestamp', '-id')
+
+class AuditTimelinePagination(KeysetPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    keyset_ordering = TIMELINE_ORDERING
+    keyset_only = True
+
 
 class CustomAuditSearchFilter(SearchFilter):
     def get_search_fields(self, view, request):
@@ -32,6 +51,9 @@ class CustomAuditSearchFilter(SearchFilter):
         return search_fields + ['action_display']
 
     def filter_queryset(self, request, queryset, view):
+        # 没有搜索条件时不添加注解，避免逐行计算
+        if not self.get_search_terms(request):
+            return queryset
         annotated_queryset = queryset.annotate(
             action_display=Case(
                 When(action='CREATE', then=Value('创建')),
@@ -61,6 +83,77 @@ class AuditLogViewSet(AuditContextMixin, viewsets.ReadOnlyModelViewSet):
     ordering_fields = ['timestamp', 'operator', 'operator_ip','action']
     ordering = ['-timestamp']
         
+    def _get_target(self, request):
+        """解析 target_type、object_id 参数，对象可以已被删除"""
+        public_name = request.query_params.get('target_type')
+        obj_id = request.query_params.get('object_id')
+        if not public_name or not obj_id:
+            raise ValidationError({"Error": "Parameter target_type and object_id are required."})
+        target_model = registry.get_model_by_public_name(public_name)
+        if not target_model:
+            raise ValidationError({"Error": f"Invalid target type: '{public_name}'."})
+        try:
+            target_model._meta.pk.to_python(obj_id)
+        except DjangoValidationError:
+            raise ValidationError({"Error": f"Invalid object_id: '{obj_id}'."})
+        return target_model, obj_id
+
+    def _get_visible_queryset(self, request, target_model, obj_id):
+        """
+        校验对象在用户的数据范围内，返回可见对象的查询集
+        对象已删除时无法按当前数据判断其归属，仅数据权限不做过滤的用户可以查看
+        """
+        pm = PermissionManager(request.user)
+        visible = pm.get_queryset(target_model)
+        if visible.filter(pk=obj_id).exists():
+            return visible
+        if target_model._default_manager.filter(pk=obj_id).exists() or not pm.has_full_access(target_model):
+            raise NotFound({"Error": "Object not found."})
+        return visible
+
+    def _parse_time_param(self, request, name, required=False):
+        value = request.query_params.get(name)
+        if not value:
+            if required:
+                raise ValidationError({"Error": f"Parameter {name} is required."})
+            return None
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise ValidationError({"Error": f"Invalid datetime for {name}: '{value}'."})
+        return parsed
+
+    @action(detail=False, methods=['get'])
+    def timeline(self, request):
+        """对象的变更时间线，按时间顺序游标分页"""
+        target_model, obj_id = self._get_target(request)
+        self._get_visible_queryset(request, target_model, obj_id)
+        # 异步写入的审计记录先落库，避免时间线缺少刚提交的变更
+        ensure_flushed()
+        queryset = get_object_timeline(
+            ContentType.objects.get_for_model(target_model),
+            obj_id,
+            since=self._parse_time_param(request, 'since'),
+            until=self._parse_time_param(request, 'until'),
+        )
+        paginator = AuditTimelinePagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['get'])
+    def state(self, request):
+        """对象在时间点 at 的状态"""
+        target_model, obj_id = self._get_target(request)
+        at = self._parse_time_param(request, 'at', required=True)
+        visible = self._get_visible_queryset(request, target_model, obj_id)
+        ensure_flushed()
+        state = reconstruct_state(
+            target_model, obj_id, at, queryset=visible, masked=not has_password_permission(request.user)
+        )
+        if state is None:
+            return Response({"Error": "No audit snapshot available for the object."}, status=404)
+        return Response({'object_id': obj_id, 'at': at, **state})
+
     @action(detail=False, methods=['get'])
     def history(self, request):
         public_name = request.query_params.get('target_type')
@@ -113,6 +206,9 @@ class AuditLogViewSet(AuditContextMixin, viewsets.ReadOnlyModelViewSet):
             relation_ids = [str(relation_id) for relation_id in relation_ids]
             combined_query |= Q(content_type=relation_ct, object_id__in=relation_ids)
 
+        # 异步写入的审计记录先落库，避免历史缺少刚提交的变更
+        ensure_flushed()
+
         # 排除系统初始化审计信息
         if not include_init:
             combined_query &= ~Q(correlation_id='migrate_cmdb_init')
@@ -128,6 +224,17 @@ class AuditLogViewSet(AuditContextMixin, viewsets.ReadOnlyModelViewSet):
         serializer = self.get_serializer(final_query, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['get', 'post'])
+    def integrity(self, request):
+        """GET 返回最近一次哈希链校验结果及检查点；POST 发起增量校验（full=true 时从头校验）"""
+        if request.method == 'GET':
+            return Response(get_integrity_status())
+
+        full = str(request.data.get('full', 'false')).lower() == 'true'
+        task = verify_audit_chain.apply_async(kwargs={'full': full})
+        logger.info(f"Request user {request.username} started audit chain verification, full={full}")
+        return Response({'task_id': task.id, 'status': 'pending'}, status=202)
+
     @action(detail=False, methods=['post'])
     def rollback(self, request):
         correlation_id = request.data.get('correlation_id')
@@ -136,11 +243,16 @@ class AuditLogViewSet(AuditContextMixin, viewsets.ReadOnlyModelViewSet):
         if not correlation_id:
             return Response({"Error": "Parameter correlation_id is required."}, status=400)
 
-        rollback_manager = RollbackManager(correlation_id, request=request)
+        dry_run = str(request.data.get('dry_run', 'false')).lower() == 'true'
+        # mode=per_object 时按对象逐个回退
+        batch = request.data.get('mode', 'batch') != 'per_object'
+        rollback_manager = RollbackManager(correlation_id, request=request, batch=batch)
         
         try:
-            result = rollback_manager.execute()
+            result = rollback_manager.execute(dry_run=dry_run)
             return Response({"state": result}, status=200)
+        except ValidationError as ve:
+            return Response({"Error": ve.detail}, status=400)
         except AuditConflict as ac:
             logger.warning(f"Audit conflict during rollback for correlation_id {correlation_id}: {ac}")
             return Response({"Error": str(ac)}, status=409)
@@ -0,0 +1,572 @@
+"""
+审计写入模块
+信号处理器只生成精简的变更记录（已完成差异比较的字段），由写入器批量落库，不再在请求线程中逐条写入。
+
+- 记录在业务事务提交后进入缓冲区：处于缓冲范围（audit_context）内时在范围结束时统一提交，否则立即提交；
+  字段感知模型（实例）的动态字段新值在提交缓冲区时按模型一次查询取得并完成比较
+- 异步模式（AUDIT_WRITER_MODE = 'async'）：记录写入 Redis 队列，由 Celery 任务 flush_audit_records
+  按批 bulk_create；队列长度超过 AUDIT_QUEUE_MAX_LENGTH 或 Redis 不可用时在当前线程同步写入（背压），不丢弃记录
+  - 取出的批次先原子地移入处理中列表，写入事务提交后才从处理中列表删除；同一时间只有一个写入方持有写入锁，
+    持锁后先将处理中列表中遗留的记录（写入方中途退出）移回队列，已写入的记录按ID跳过
+  - 依赖审计日志完整性的读取（回滚冲突检测、对象历史）先调用 ensure_flushed 在限定时间内同步写入队列中的记录
+  - 写入失败的批次转入死信队列，排查后通过 replay_audit_dead_letters 命令或同名任务重新写入
+- 同步模式（AUDIT_WRITER_MODE = 'sync'，测试环境使用）：提交时直接批量写入
+- 多对多字段的变更以合并记录排在主记录之后，写入前并入同批次的主记录
+- 写入时为每条日志分配序号并计算哈希链（见 integrity.py）
+"""
+
+import json
+import logging
+import time
+import uuid
+
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .integrity import chain_logs
+from .models import AuditLog, FieldAuditDetail
+from .registry import registry
+from .utils import clean_for_json
+
+logger = logging.getLogger(__name__)
+
+AUDIT_QUEUE_KEY = 'audit:records'
+AUDIT_DEAD_LETTER_KEY = 'audit:records:failed'
+AUDIT_FLUSH_SCHEDULED_KEY = 'audit_flush_scheduled'
+AUDIT_FLUSH_LOCK_KEY = 'audit_flush_lock'
+# 写入锁的超时时间，写入方异常退出后锁自动释放
+AUDIT_FLUSH_LOCK_TIMEOUT = 10 * 60
+# ensure_flushed 等待其他写入方释放写入锁的最长时间（秒）
+AUDIT_FLUSH_WAIT_TIMEOUT = 5
+# 每批写入的记录数
+AUDIT_WRITE_BATCH_SIZE = 500
+# 单次任务最多处理的批数，剩余记录由下一次任务处理
+AUDIT_FLUSH_MAX_BATCHES = 100
+
+
+def get_writer_mode() -> str:
+    return getattr(settings, 'AUDIT_WRITER_MODE', 'async')
+
+
+def get_queue_max_length() -> int:
+    return getattr(settings, 'AUDIT_QUEUE_MAX_LENGTH', 100000)
+
+
+def get_flush_delay() -> int:
+    return getattr(settings, 'AUDIT_FLUSH_DELAY', 1)
+
+
+# ---- 记录 ----
+
+def _format_details(changes) -> list:
+    return [{
+        'name': change['name'],
+        'verbose_name': change.get('verbose_name') or '',
+        'old_value': str(change['old_value']) if change.get('old_value') is not None else None,
+        'new_value': str(change['new_value']) if change.get('new_value') is not None else None,
+    } for change in changes]
+
+
+def make_record(instance, action, changed_fields, details=None, context=None, comment='', timestamp=None) -> dict:
+    """
+    构建审计记录
+    :param details: [{'name', 'verbose_name', 'old_value', 'new_value'}]
+    """
+    context = context or {}
+    reverted_from = context.get('reverted_from')
+    return {
+        'type': 'log',
+        'id': str(uuid.uuid4()),
+        'content_type_id': ContentType.objects.get_for_model(instance).id,
+        'object_id': str(instance.pk),
+        'action': action,
+        'changed_fields': clean_for_json(changed_fields or {}),
+        'details': _format_details(details or []),
+        'operator': context.get('operator') or '',
+        'operator_ip': context.get('operator_ip') or None,
+        'request_id': context.get('request_id') or '',
+        'correlation_id': context.get('correlation_id') or '',
+        'is_reverted': bool(context.get('is_rollback', False)),
+        'reverted_from_id': str(getattr(reverted_from, 'pk', reverted_from)) if reverted_from else None,
+        'comment': comment or '',
+        'timestamp': (timestamp or timezone.now()).isoformat(),
+    }
+
+
+def make_merge_record(instance, correlation_id, field_name, new_value, cleared=False) -> dict:
+    """多对多字段变更合并到同一关联ID的主记录"""
+    return {
+        'type': 'merge',
+        'content_type_id': ContentType.objects.get_for_model(instance).id,
+        'object_id': str(instance.pk),
+        'correlation_id': correlation_id,
+        'field_name': field_name,
+        'new_value': clean_for_json({'value': new_value})['value'],
+        'cleared': cleared,
+        'timestamp': timezone.now().isoformat(),
+    }
+
+
+def defer_dynamic_changes(record, instance, old_snapshot, created):
+    """
+    动态字段在实例保存后才写入，新值在提交缓冲区时统一读取
+    更新操作若静态、动态字段均无变化则不写入
+    """
+    record['_dynamic'] = {
+        'model': instance.__class__,
+        'pk': instance.pk,
+        'old': old_snapshot or {},
+        'created': created,
+    }
+    return record
+
+
+def _load_dynamic_snapshots(model, pks) -> dict:
+    """批量读取字段感知模型的动态字段快照 {pk: {字段名: {'value', 'verbose_name', 'model_field'}}}"""
+    relation = model._meta.get_field('field_values')
+    values = relation.related_model.objects.filter(
+        **{f'{relation.field.name}__in': list(pks)}
+    ).select_related('model_fields')
+    snapshots = defaultdict(dict)
+    for fv in values:
+        snapshots[str(getattr(fv, relation.field.attname))][fv.model_fields.name] = {
+            'value': fv.data,
+            'verbose_name': fv.model_fields.verbose_name,
+            'model_field': fv.model_fields,
+        }
+    return snapshots
+
+
+def diff_dynamic_snapshots(model, old_snapshot, new_snapshot, created=False) -> list:
+    """比较动态字段快照，返回变更明细"""
+    resolver = registry.get_dynamic_value_resolver(model)
+    if created:
+        return [{
+            'name': key,
+            'verbose_name': data.get('verbose_name', ''),
+            'old_value': None,
+            'new_value': resolver(data['model_field'], data.get('value'))
+            if resolver and data.get('model_field') else data.get('value'),
+        } for key, data in new_snapshot.items()]
+
+    changes = []
+    for key in old_snapshot.keys() | new_snapshot.keys():
+        old_field_data = old_snapshot.get(key, {})
+        new_field_data = new_snapshot.get(key, {})
+        old_val = old_field_data.get('value')
+        new_val = new_field_data.get('value')
+        if old_val == new_val:
+            continue
+        model_field = new_field_data.get('model_field') or old_field_data.get('model_field')
+        if resolver and model_field:
+            old_val = resolver(model_field, old_val)
+            new_val = resolver(model_field, new_val)
+            if old_val == new_val:
+                continue
+        changes.append({
+            'name': key,
+            'verbose_name': new_field_data.get('verbose_name') or old_field_data.get('verbose_name', ''),
+            'old_value': old_val,
+            'new_value': new_val,
+        })
+    return changes
+
+
+def _resolve_dynamic_changes(records) -> list:
+    pending = defaultdict(list)
+    for record in records:
+        if '_dynamic' in record:
+            pending[record['_dynamic']['model']].append(record)
+
+    for model, model_records in pending.items():
+        snapshots = _load_dynamic_snapshots(model, {r['_dynamic']['pk'] for r in model_records})
+        for record in model_records:
+            dynamic = record['_dynamic']
+            changes = diff_dynamic_snapshots(
+                model, dynamic['old'], snapshots.get(str(dynamic['pk']), {}), dynamic['created']
+            )
+            record['details'] = _format_details(changes)
+
+    resolved = []
+    for record in records:
+        dynamic = record.pop('_dynamic', None)
+        if dynamic and not dynamic['created'] and not record['changed_fields'] and not record['details']:
+            continue
+        resolved.append(record)
+    return resolved
+
+
+# ---- 缓冲 ----
+
+_buffer_var: ContextVar = ContextVar('audit_buffer', default=None)
+
+
+@contextmanager
+def audit_buffer():
+    """在代码块内缓冲已提交的审计记录，结束时统一提交；已处于缓冲范围内时沿用外层"""
+    if _buffer_var.get() is not None:
+        yield
+        return
+    token = _buffer_var.set([])
+    try:
+        yield
+    finally:
+        records = _buffer_var.get()
+        _buffer_var.reset(token)
+        if records:
+            submit(records)
+
+
+def enqueue(records):
+    """提交已提交事务中的审计记录"""
+    records = list(records)
+    if not records:
+        return
+    buffer = _buffer_var.get()
+    if buffer is not None:
+        buffer.extend(records)
+    else:
+        submit(records)
+
+
+def enqueue_on_commit(records):
+    records = list(records)
+    if records:
+        transaction.on_commit(lambda: enqueue(records))
+
+
+# ---- 队列 ----
+
+class RedisAuditQueue:
+    """
+    Redis 列表实现的审计记录队列，左进右出
+    取出的记录移入处理中列表，确认写入后删除，未确认的记录可通过 recover 移回队列
+    """
+
+    # 将处理中列表的记录按原顺序移回队列右端（优先取出），分段 RPUSH 避免超出 Lua 栈限制
+    RECOVER_SCRIPT = """
+    local items = redis.call('LRANGE', KEYS[1], 0, -1)
+    for i = 1, #items, 1000 do
+        redis.call('RPUSH', KEYS[2], unpack(items, i, math.min(i + 999, #items)))
+    end
+    redis.call('DEL', KEYS[1])
+    return #items
+    """
+
+    def __init__(self, key=AUDIT_QUEUE_KEY):
+        from django_redis import get_redis_connection
+        self.key = key
+        self.processing_key = f'{key}:processing'
+        self.client = get_redis_connection('default')
+
+    def __len__(self):
+        return self.client.llen(self.key)
+
+    def pending_count(self) -> int:
+        """队列及处理中列表的记录总数"""
+        pipe = self.client.pipeline(transaction=False)
+        pipe.llen(self.key)
+        pipe.llen(self.processing_key)
+        return sum(pipe.execute())
+
+    def push(self, payloads):
+        self.client.lpush(self.key, *payloads)
+
+    def pop_batch(self, size) -> list:
+        """按入队顺序取出至多 size 条记录，同时移入处理中列表"""
+        pipe = self.client.pipeline(transaction=True)
+        for _ in range(size):
+            pipe.rpoplpush(self.key, self.processing_key)
+        return [payload for payload in pipe.execute() if payload is not None]
+
+    def ack(self, payloads):
+        """批次已写入，从处理中列表删除"""
+        pipe = self.client.pipeline(transaction=True)
+        for payload in payloads:
+            pipe.lrem(self.processing_key, 1, payload)
+        pipe.execute()
+
+    def recover(self) -> int:
+        """将处理中列表遗留的记录移回队列，返回记录数；调用方需持有写入锁"""
+        return self.client.eval(self.RECOVER_SCRIPT, 2, self.processing_key, self.key)
+
+
+def get_audit_queue(key=AUDIT_QUEUE_KEY):
+    return RedisAuditQueue(key)
+
+
+def get_queue_length() -> int:
+    return len(get_audit_queue())
+
+
+def submit(records):
+    """按写入模式提交审计记录"""
+    try:
+        records = _resolve_dynamic_changes(records)
+    except Exception as e:
+        logger.error(f'Failed to resolve dynamic audit changes: {e}', exc_info=True)
+        for record in records:
+            record.pop('_dynamic', None)
+    if not records:
+        return
+
+    if get_writer_mode() != 'async':
+        write_records(records)
+        return
+
+    try:
+        queue = get_audit_queue()
+        if len(queue) + len(records) > get_queue_max_length():
+            logger.warning(f'Audit queue is full, writing {len(records)} records synchronously')
+            write_records(records)
+            return
+        queue.push([json.dumps(record) for record in records])
+    except Exception as e:
+        logger.warning(f'Audit queue unavailable ({e}), writing {len(records)} records synchronously')
+        write_records(records)
+        return
+    _schedule_flush()
+
+
+def _schedule_flush():
+    from django.core.cache import cache
+    from .tasks import flush_audit_records
+    # 同一时间只排队一个写入任务
+    if cache.add(AUDIT_FLUSH_SCHEDULED_KEY, 1, timeout=get_flush_delay() + 60):
+        flush_audit_records.apply_async(countdown=get_flush_delay())
+
+
+# ---- 写入 ----
+
+def write_records(records):
+    """
+    批量写入审计记录
+    合并记录并入同批次的主记录后再计算哈希；主记录已在之前的批次写入时，为避免修改已入链的日志，单独记录一条更新日志
+    """
+    merges = [record for record in records if record.get('type') == 'merge']
+    records = [record for record in records if record.get('type') != 'merge']
+    late_merges = _fold_merges(records, merges)
+
+    logs = []
+    details_by_log = {}
+    for record in records:
+        log = AuditLog(
+            id=uuid.UUID(record['id']),
+            content_type_id=record['content_type_id'],
+            object_id=record['object_id'],
+            action=record['action'],
+            changed_fields=record['changed_fields'],
+            operator=record['operator'],
+            operator_ip=record['operator_ip'],
+            request_id=record['request_id'],
+            correlation_id=record['correlation_id'],
+            is_reverted=record['is_reverted'],
+            reverted_from_id=record['reverted_from_id'],
+            comment=record['comment'],
+            timestamp=parse_datetime(record['timestamp']),
+        )
+        logs.append(log)
+        details_by_log[log.id] = [FieldAuditDetail(audit_log_id=log.id, **detail) for detail in record['details']]
+
+    with transaction.atomic():
+        for merge in late_merges:
+            log = _build_merge_log(merge)
+            if log is not None:
+                logs.append(log)
+        chain_logs(logs, details_by_log)
+        if logs:
+            AuditLog.objects.bulk_create(logs, batch_size=AUDIT_WRITE_BATCH_SIZE)
+        details = [detail for log_details in details_by_log.values() for detail in log_details]
+        if details:
+            FieldAuditDetail.objects.bulk_create(details, batch_size=AUDIT_WRITE_BATCH_SIZE)
+
+
+def _merge_value(changed_fields, merge):
+    old_value = (changed_fields or {}).get(merge['field_name'], [None, None])[0]
+    if old_value is None and not merge['cleared']:
+        old_value = []
+    return [old_value, merge['new_value']]
+
+
+def _fold_merges(records, merges) -> list:
+    """将合并记录并入同批次中最后一条匹配的主记录，返回未找到主记录的合并记录"""
+    main_records = {}
+    for record in records:
+        main_records[(record['correlation_id'], record['object_id'], record['content_type_id'])] = record
+
+    late_merges = []
+    for merge in merges:
+        main_record = main_records.get((merge['correlation_id'], merge['object_id'], merge['content_type_id']))
+        if main_record is None:
+            late_merges.append(merge)
+            continue
+        main_record['changed_fields'][merge['field_name']] = _merge_value(main_record['changed_fields'], merge)
+        logger.debug(f"Merged M2M change for field '{merge['field_name']}' into AuditLog {main_record['id']}")
+    return late_merges
+
+
+def _build_merge_log(merge):
+    main_log = AuditLog.objects.filter(
+        correlation_id=merge['correlation_id'],
+        object_id=merge['object_id'],
+        content_type_id=merge['content_type_id'],
+    ).order_by('-timestamp').first()
+    if main_log is None:
+        logger.warning(
+            f"Could not find main AuditLog with correlation_id {merge['correlation_id']} to merge M2M changes.")
+        return None
+
+    return AuditLog(
+        content_type_id=main_log.content_type_id,
+        object_id=main_log.object_id,
+        action=AuditLog.Action.UPDATE,
+        changed_fields={merge['field_name']: _merge_value(main_log.changed_fields, merge)},
+        operator=main_log.operator,
+        operator_ip=main_log.operator_ip,
+        request_id=main_log.request_id,
+        correlation_id=main_log.correlation_id,
+        is_reverted=main_log.is_reverted,
+        reverted_from_id=main_log.reverted_from_id,
+        comment=main_log.comment,
+        timestamp=parse_datetime(merge['timestamp']),
+    )
+
+
+def _filter_written(records) -> list:
+    """跳过已写入的日志记录（写入后未及确认即退出的批次）"""
+    ids = [record['id'] for record in records if record.get('type') != 'merge']
+    written = {str(pk) for pk in AuditLog.objects.filter(id__in=ids).values_list('id', flat=True)}
+    if not written:
+        return records
+    logger.warning(f'Skipping {len(written)} audit records that were already written')
+    return [record for record in records if record.get('id') not in written]
+
+
+def _flush_locked(queue, batch_size, max_batches=None, deadline=None) -> int:
+    """
+    持有写入锁时从队列按批取出并写入；写入失败的批次转入死信队列
+    :param deadline: time.monotonic() 截止时间，按上一批的耗时预估，来不及写完下一批时停止
+    """
+    recovered = queue.recover()
+    if recovered:
+        logger.warning(f'Recovered {recovered} unacknowledged audit records')
+
+    written = 0
+    batches = 0
+    batch_seconds = 0
+    while max_batches is None or batches < max_batches:
+        started = time.monotonic()
+        if deadline is not None and started + batch_seconds >= deadline:
+            break
+        payloads = queue.pop_batch(batch_size)
+        if not payloads:
+            break
+        batches += 1
+        try:
+            records = _filter_written([json.loads(payload) for payload in payloads])
+            write_records(records)
+            written += len(records)
+        except Exception as e:
+            logger.error(f'Failed to write {len(payloads)} audit records: {e}', exc_info=True)
+            get_audit_queue(AUDIT_DEAD_LETTER_KEY).push(payloads)
+        queue.ack(payloads)
+        batch_seconds = time.monotonic() - started
+    return written
+
+
+def flush_queue(batch_size=AUDIT_WRITE_BATCH_SIZE, max_batches=AUDIT_FLUSH_MAX_BATCHES) -> int:
+    """从队列中按批取出并写入，返回写入的记录数；其他写入方持有写入锁时直接返回"""
+    from django.core.cache import cache
+    if not cache.add(AUDIT_FLUSH_LOCK_KEY, 1, timeout=AUDIT_FLUSH_LOCK_TIMEOUT):
+        logger.info('Audit queue is being flushed by another worker')
+        return 0
+    try:
+        return _flush_locked(get_audit_queue(), batch_size, max_batches)
+    finally:
+        cache.delete(AUDIT_FLUSH_LOCK_KEY)
+
+
+def ensure_flushed(timeout=AUDIT_FLUSH_WAIT_TIMEOUT) -> bool:
+    """
+    同步写入队列中已提交的审计记录，其他写入方正在写入时等待其完成
+    :return: 队列及处理中列表均已写入时返回 True；超时或 Redis 不可用时返回 False
+    """
+    if get_writer_mode() != 'async':
+        return True
+
+    from django.core.cache import cache
+    deadline = time.monotonic() + timeout
+    try:
+        queue = get_audit_queue()
+        while queue.pending_count():
+            if time.monotonic() >= deadline:
+                logger.warning('Timed out waiting for the audit queue to be flushed')
+                return False
+            if cache.add(AUDIT_FLUSH_LOCK_KEY, 1, timeout=AUDIT_FLUSH_LOCK_TIMEOUT):
+                try:
+                    _flush_locked(queue, AUDIT_WRITE_BATCH_SIZE, deadline=deadline)
+                finally:
+                    cache.delete(AUDIT_FLUSH_LOCK_KEY)
+                continue
+            time.sleep(0.1)
+    except Exception as e:
+        logger.warning(f'Failed to flush audit queue: {e}')
+        return False
+    return True
+
+
+def _write_payloads(payloads) -> list:
+    """写入一批死信记录，批次失败时逐条写入，返回仍无法写入的记录"""
+    try:
+        write_records(_filter_written([json.loads(payload) for payload in payloads]))
+        return []
+    except Exception as e:
+        logger.warning(f'Failed to replay {len(payloads)} audit records as a batch, retrying one by one: {e}')
+
+    failed = []
+    for payload in payloads:
+        try:
+            write_records(_filter_written([json.loads(payload)]))
+        except Exception as e:
+            logger.error(f'Failed to replay audit record: {e}', exc_info=True)
+            failed.append(payload)
+    return failed
+
+
+def replay_dead_letters(batch_size=AUDIT_WRITE_BATCH_SIZE):
+    """
+    重新写入死信队列中的审计记录，仍无法写入的记录放回死信队列，待排查后再次重放
+    :return: {'replayed', 'failed'}；其他写入方持有写入锁时返回 None
+    """
+    from django.core.cache import cache
+    if not cache.add(AUDIT_FLUSH_LOCK_KEY, 1, timeout=AUDIT_FLUSH_LOCK_TIMEOUT):
+        logger.info('Audit queue is being flushed by another worker')
+        return None
+    try:
+        dead_letters = get_audit_queue(AUDIT_DEAD_LETTER_KEY)
+        dead_letters.recover()
+        # 只处理开始时已有的记录，放回的失败记录不在本次重放
+        remaining = len(dead_letters)
+        replayed = failed = 0
+        while remaining > 0:
+            payloads = dead_letters.pop_batch(min(batch_size, remaining))
+            if not payloads:
+                break
+            remaining -= len(payloads)
+            failed_payloads = _write_payloads(payloads)
+            if failed_payloads:
+                dead_letters.push(failed_payloads)
+            dead_letters.ack(payloads)
+            replayed += len(payloads) - len(failed_payloads)
+            failed += len(failed_payloads)
+    finally:
+        cache.delete(AUDIT_FLUSH_LOCK_KEY)
+    logger.info(f'Replayed {replayed} dead-lettered audit records, {failed} failed')
+    return {'replayed': replayed, 'failed': failed}
@@ -223,3 +223,8 @@ class FieldMapping:
             }
         ]
     }
+
+
+# ModelFieldMeta (model_fields_id, data) 复合索引，TEXT 列只索引前缀
+FIELD_META_DATA_INDEX = 'idx_meta_field_data'
+FIELD_META_DATA_INDEX_PREFIX = 191
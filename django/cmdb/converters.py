@@ -5,15 +5,49 @@ CMDB字段转换器模块
 
 import json
 from abc import ABC, abstractmethod
-from .constants import FieldType
+from datetime import date, datetime
+from django.utils import timezone
+from .constants import FieldType, DateTimeFormats
 from .utils import password_handler
 
 # import logging
 # logger = logging.getLogger(__name__)
 
+# ModelFieldMeta 上的类型化影子列，与 data 同步写入，用于数值/日期/布尔的范围与等值索引查询
+TYPED_VALUE_COLUMNS = ('num_value', 'dt_value', 'bool_value')
+
+
+def _to_naive(value: datetime) -> datetime:
+    """带时区的时间转换为本地时区的 naive 时间，USE_TZ=False 时数据库不接受带时区的值"""
+    if timezone.is_aware(value):
+        return timezone.make_naive(value)
+    return value
+
+
+def parse_datetime_value(value):
+    """按系统支持的日期/日期时间格式解析，无法解析时返回 None"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        return _to_naive(value)
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    value = str(value).strip()
+    for fmt in DateTimeFormats.DATETIME_FORMATS + DateTimeFormats.DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    try:
+        return _to_naive(datetime.fromisoformat(value))
+    except ValueError:
+        return None
+
 
 class FieldMetaConverter(ABC):
     """字段转换器基类"""
+    # 该类型对应的类型化影子列，None 表示仅保存在 data 中
+    typed_column = None
     @abstractmethod
     def to_internal(self, value, **kwargs):
         """转换为内部存储格式"""
@@ -26,6 +60,10 @@ class FieldMetaConverter(ABC):
         """转换为外部表示格式"""
         return value
 
+    def to_typed(self, value):
+        """将内部存储值转换为影子列的值，无法转换时返回 None"""
+        return None
+
 
 class PasswordConverter(FieldMetaConverter):
     """密码字段转换器"""
@@ -129,6 +167,7 @@ class ModelRefConverter(FieldMetaConverter):
 
 class BooleanConverter(FieldMetaConverter):
     """布尔字段转换器"""
+    typed_column = 'bool_value'
 
     def to_internal(self, value, **kwargs):
         if value is None:
@@ -150,9 +189,18 @@ class BooleanConverter(FieldMetaConverter):
             return None
         return bool(value)
 
+    def to_typed(self, value):
+        if value is None or value == "":
+            return None
+        try:
+            return self.to_internal(value)
+        except ValueError:
+            return None
+
 
 class IntegerConverter(FieldMetaConverter):
     """整数字段转换器"""
+    typed_column = 'num_value'
 
     def to_internal(self, value, **kwargs):
         if value is None:
@@ -167,9 +215,18 @@ class IntegerConverter(FieldMetaConverter):
             return None
         return int(value)
 
+    def to_typed(self, value):
+        if value is None or value == "":
+            return None
+        try:
+            return int(float(value))
+        except (ValueError, TypeError):
+            return None
+
 
 class FloatConverter(FieldMetaConverter):
     """浮点字段转换器"""
+    typed_column = 'num_value'
 
     def to_internal(self, value, **kwargs):
         if value is None:
@@ -184,6 +241,14 @@ class FloatConverter(FieldMetaConverter):
             return None
         return float(value)
 
+    def to_typed(self, value):
+        if value is None or value == "":
+            return None
+        try:
+            return float(value)
+        except (ValueError, TypeError):
+            return None
+
 
 class JsonConverter(FieldMetaConverter):
     """JSON字段转换器"""
@@ -220,6 +285,14 @@ class StringConverter(FieldMetaConverter):
         return super().to_representation(value, **kwargs)
 
 
+class DateTimeConverter(StringConverter):
+    """日期/日期时间字段转换器，data 中保留原始字符串，影子列保存解析后的时间"""
+    typed_column = 'dt_value'
+
+    def to_typed(self, value):
+        return parse_datetime_value(value)
+
+
 class ConverterFactory:
     """转换器工厂类"""
 
@@ -243,6 +316,20 @@ class ConverterFactory:
             FieldType.INTEGER: IntegerConverter,
             FieldType.FLOAT: FloatConverter,
             FieldType.JSON: JsonConverter,
-            FieldType.STRING: StringConverter
+            FieldType.STRING: StringConverter,
+            FieldType.DATE: DateTimeConverter,
+            FieldType.DATETIME: DateTimeConverter,
         }
         return converters.get(field_type, StringConverter)
+
+    @classmethod
+    def get_typed_values(cls, field_type, value) -> dict:
+        """
+        计算 ModelFieldMeta 全部影子列的值，与该类型无关的列置空，
+        以便字段值更新（或类型变更后回填）时清除旧值
+        """
+        typed_values = dict.fromkeys(TYPED_VALUE_COLUMNS)
+        converter = cls.get_converter(field_type)
+        if converter.typed_column:
+            typed_values[converter.typed_column] = converter.to_typed(value)
+        return typed_values
@@ -4,7 +4,11 @@ CMDB Excel 处理模块
 """
 
 
+import csv
+from itertools import zip_longest
+
 from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, PatternFill, Protection, Alignment
 from openpyxl.worksheet.datavalidation import DataValidation
 from openpyxl.utils import get_column_letter
@@ -173,12 +177,7 @@ class ExcelHandler:
                 constraints.append("关联模型")
 
         # 添加验证规则约束说明
-        if field.validation_rule:
-            rule = field.validation_rule
-            if rule.type == ValidationType.RANGE:
-                constraints.append(f"数值范围: {rule.rule.replace(',', ' ~ ')}")
-            elif rule.type == ValidationType.REGEX:
-                constraints.append(f"正则规则: {rule.rule}")
+        constraints.extend(cls._validation_rule_notes(field))
 
         cell = template_sheet[f'{col_letter}3']
         cell.value = "\r\n".join(constraints) if constraints else ""
@@ -195,6 +194,39 @@ class ExcelHandler:
 
         return current_enum_col
 
+    @staticmethod
+    def _validation_rule_notes(field):
+        """字段验证规则的约束说明"""
+        rule = field.validation_rule
+        if not rule:
+            return []
+        if rule.type == ValidationType.RANGE:
+            return [f"数值范围: {rule.rule.replace(',', ' ~ ')}"]
+        if rule.type == ValidationType.REGEX:
+            return [f"正则规则: {rule.rule}"]
+        return []
+
+    @staticmethod
+    def _build_enum_validation(field, val_col_letter, count):
+        """构建引用枚举表显示值列的数据验证，无可选值时禁止输入"""
+        if count > 0:
+            return DataValidation(
+                type='list',
+                formula1=f'=枚举类型可选值!${val_col_letter}$3:${val_col_letter}${count + 2}',
+                allow_blank=not field.required,
+                showErrorMessage=True,
+                errorTitle='输入错误',
+                error='请从列表中选择一个值'
+            )
+        return DataValidation(
+            type='custom',
+            formula1='FALSE',
+            allow_blank=not field.required,
+            showErrorMessage=True,
+            errorTitle='输入错误',
+            error='该字段暂无可选值'
+        )
+
     @classmethod
     def _write_enum_to_sheet(cls, enum_sheet, field, data_dict, current_enum_col, template_sheet, col_letter, is_ref=False):
         """
@@ -236,24 +268,7 @@ class ExcelHandler:
         enum_sheet.column_dimensions[val_col_letter].width = 20
 
         # 设置数据验证（使用显示值列）
-        if len(data_dict) > 0:
-            dv = DataValidation(
-                type='list',
-                formula1=f'=枚举类型可选值!${val_col_letter}$3:${val_col_letter}${len(data_dict) + 2}',
-                allow_blank=not field.required,
-                showErrorMessage=True,
-                errorTitle='输入错误',
-                error='请从列表中选择一个值'
-            )
-        else:
-            dv = DataValidation(
-                type='custom',
-                formula1='FALSE',
-                allow_blank=not field.required,
-                showErrorMessage=True,
-                errorTitle='输入错误',
-                error='该字段暂无可选值'
-            )
+        dv = cls._build_enum_validation(field, val_col_letter, len(data_dict))
         template_sheet.add_data_validation(dv)
         dv.add(f'{col_letter}4:{col_letter}1048576')
 
@@ -418,83 +433,115 @@ class ExcelHandler:
             return None
         return cell.value
 
-    def load_data(self, file_path, model_id):
-        """从Excel导入实例数据"""
-        results = {
-            'status': 'pending',
-            'instances': [],
-            'headers': [],
-            'header_rows': [],
-            'errors': [],
-            'results': {
-                'total': 0,
-                'valid': 0,
-                'invalid': 0
-            }
-        }
+    def _open_import_workbook(self, file_path, model_id):
+        """以只读流式方式打开导入文件，并校验模板格式及所属模型"""
+        wb = load_workbook(file_path, read_only=True, data_only=True)
         try:
-            # 加载Excel文件
-            wb = load_workbook(file_path, data_only=True)
             self.validate_template(wb)
-
-            data_sheet = wb['配置数据']
-            # enum_sheet = wb['枚举类型可选值']
             validate_sheet = wb['校验表']
             accepted_model_id = validate_sheet['A1'].value
             if model_id != accepted_model_id:
                 logger.warning(
                     f'Accepted model id: {accepted_model_id} is not the same as current model id: {model_id}')
                 raise ValueError(f'Attempting to import incompatible model data.')
+        except Exception:
+            wb.close()
+            raise
+        return wb
 
+    def read_import_header(self, file_path, model_id):
+        """
+        读取导入文件的表头信息，不加载数据行
+        :return: {'headers', 'header_rows', 'field_mapping': {列序号: 字段名}, 'estimated_rows'}
+        """
+        wb = self._open_import_workbook(file_path, model_id)
+        try:
+            data_sheet = wb['配置数据']
             # 保存前三行表头
-            for row in range(1, 4):
-                header_row = []
-                for col in range(1, data_sheet.max_column + 1):
-                    cell = data_sheet.cell(row=row, column=col)
-                    header_row.append(cell.value)
-                results['header_rows'].append(header_row)
-
-            # 获取字段映射
-            field_mapping = {}
-            for col in range(3, data_sheet.max_column + 1):
-                column_letter = get_column_letter(col)
-                field_cell = data_sheet[f'{column_letter}1']
+            header_rows = [
+                list(row) for row in data_sheet.iter_rows(min_row=1, max_row=3, values_only=True)
+            ]
 
-                if not field_cell.value:
+            # 获取字段映射，前两列为 instance_name / using_template
+            field_mapping = {}
+            headers = []
+            first_row = header_rows[0] if header_rows else []
+            for col_index in range(2, len(first_row)):
+                value = first_row[col_index]
+                if not value:
                     continue
-
                 # 解析字段名格式：name\nverbose_name
                 try:
-                    field_name = field_cell.value.split('\n')[0].strip()
+                    field_name = value.split('\n')[0].strip()
                     if field_name:
-                        field_mapping[column_letter] = field_name
-                    results['headers'].append(field_name)
+                        field_mapping[col_index] = field_name
+                    headers.append(field_name)
                 except (AttributeError, IndexError):
-                    logger.warning(f"Invalid field name format in column {column_letter}")
+                    logger.warning(f"Invalid field name format in column {get_column_letter(col_index + 1)}")
                     continue
 
-            # 读取数据行
-            for row in range(4, data_sheet.max_row + 1):
-                try:
-                    row_data = {}
-                    for col_letter, field_name in field_mapping.items():
-                        cell = data_sheet[f'{col_letter}{row}']
-                        if cell.value is not None:
-                            row_data[field_name] = cell.value
-
-                    if row_data:
-                        results['results']['total'] += 1
-                        instance_data = {
-                            'instance_name': data_sheet[f'A{row}'].value,
-                            'using_template': data_sheet[f'B{row}'].value,
-                            'fields': row_data
-                        }
-                        results['instances'].append(instance_data)
-                        results['results']['valid'] += 1
-
-                except Exception as e:
-                    results['results']['invalid'] += 1
-                    results['errors'].append(f"Load data failed at row {row}: {str(e)}")
+            return {
+                'headers': headers,
+                'header_rows': header_rows,
+                'field_mapping': field_mapping,
+                # 只读模式下 max_row 取自文件的 dimension 记录，仅用于进度估算
+                'estimated_rows': max((data_sheet.max_row or 0) - 3, 0),
+            }
+        finally:
+            wb.close()
+
+    def iter_data_chunks(self, file_path, model_id, field_mapping, chunk_size=500):
+        """
+        流式读取数据行，每 chunk_size 行产出一批实例数据，内存占用与文件大小无关
+        """
+        wb = self._open_import_workbook(file_path, model_id)
+        try:
+            data_sheet = wb['配置数据']
+            chunk = []
+            for row in data_sheet.iter_rows(min_row=4, values_only=True):
+                row_data = {}
+                for col_index, field_name in field_mapping.items():
+                    value = row[col_index] if col_index < len(row) else None
+                    if value is not None:
+                        row_data[field_name] = value
+                if not row_data:
+                    continue
+                chunk.append({
+                    'instance_name': row[0] if len(row) > 0 else None,
+                    'using_template': row[1] if len(row) > 1 else None,
+                    'fields': row_data
+                })
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+        finally:
+            wb.close()
+
+    def load_data(self, file_path, model_id):
+        """从Excel导入实例数据"""
+        results = {
+            'status': 'pending',
+            'instances': [],
+            'headers': [],
+            'header_rows': [],
+            'errors': [],
+            'results': {
+                'total': 0,
+                'valid': 0,
+                'invalid': 0
+            }
+        }
+        try:
+            header = self.read_import_header(file_path, model_id)
+            results['headers'] = header['headers']
+            results['header_rows'] = header['header_rows']
+
+            for chunk in self.iter_data_chunks(file_path, model_id, header['field_mapping']):
+                results['instances'].extend(chunk)
+                results['results']['total'] += len(chunk)
+                results['results']['valid'] += len(chunk)
 
             results['status'] = 'success'
             return results
@@ -659,3 +706,182 @@ class ExcelHandler:
         cls._finalize_workbook(template_sheet, enum_sheet, validate_sheet)
 
         return wb
+
+    @classmethod
+    def write_data_export(cls, output, model_id, fields, rows, enum_data=None, ref_data=None):
+        """
+        以 write_only 模式流式生成带数据的导出文件，格式与导入模板一致。
+        数据行逐行写出，不在内存中保留整个工作簿。
+
+        :param output: 文件路径或二进制文件对象
+        :param fields: 字段配置列表
+        :param rows: 实例数据迭代器 [{'instance_name': ..., 'fields': {...}}]
+        :param enum_data: 枚举数据 {field_name: {key: label}}，为 None 时从字段规则获取
+        :param ref_data: 引用数据 {field_name: {instance_id: instance_name}}
+        :return: 写入的数据行数
+        """
+        enum_data = enum_data or {}
+        ref_data = ref_data or {}
+
+        wb = Workbook(write_only=True)
+        template_sheet = wb.create_sheet("配置数据")
+        enum_sheet = wb.create_sheet("枚举类型可选值")
+        validate_sheet = wb.create_sheet("校验表")
+
+        def header_cell(value, bold=False, required=False):
+            cell = WriteOnlyCell(template_sheet, value=value)
+            cell.alignment = cls.CENTER_ALIGNMENT
+            if bold:
+                cell.font = cls.HEADER_FONT
+            if required:
+                cell.fill = cls.REQUIRED_FILL
+            return cell
+
+        header_rows = [
+            [
+                header_cell("instance_name\r\n实例唯一标识", bold=True, required=True),
+                header_cell("using_template\r\n是否使用模板自动重命名唯一标识", bold=True),
+            ],
+            [header_cell("string\r\n字符串"), header_cell("boolean\r\n布尔值")],
+            [header_cell("必填"), header_cell("不填写默认为TRUE，默认值不会覆盖已经配置的标识")],
+        ]
+        template_sheet.column_dimensions['A'].width = 18
+        template_sheet.column_dimensions['B'].width = 20
+        template_sheet.data_validations.append(DataValidation(
+            type='custom',
+            formula1='AND(LEN(A4)>0,COUNTIF(A4:A1048576,A4)=1)',
+            showErrorMessage=True,
+            errorTitle='输入错误',
+            error='实例名称不能为空且不能重复',
+            sqref='A4:A1048576'
+        ))
+        template_sheet.data_validations.append(DataValidation(
+            type='list',
+            formula1='"TRUE,FALSE"',
+            allow_blank=True,
+            showErrorMessage=True,
+            errorTitle='输入错误',
+            error='该字段只能输入 TRUE 或 FALSE',
+            sqref='B4:B1048576'
+        ))
+
+        # 枚举/引用可选值按列排布，收集后在枚举表中逐行写出
+        enum_columns = []
+        current_enum_col = 1
+        for col, field in enumerate(fields, 3):
+            col_letter = get_column_letter(col)
+            field_verbose_type = FieldMapping.FIELD_TYPES.get(field.type, field.type)
+            constraints = ["必填"] if field.required else []
+
+            dv = None
+            if field.type == FieldType.BOOLEAN:
+                dv = DataValidation(
+                    type='list',
+                    formula1='"TRUE,FALSE"',
+                    allow_blank=not field.required,
+                    showErrorMessage=True,
+                    errorTitle='输入错误',
+                    error='该字段只能输入 TRUE 或 FALSE'
+                )
+            elif field.type in (FieldType.ENUM, FieldType.MODEL_REF):
+                is_ref = field.type == FieldType.MODEL_REF
+                data_dict = ref_data.get(field.name) if is_ref else enum_data.get(field.name)
+                if data_dict is None and not is_ref and field.validation_rule:
+                    data_dict = json.loads(field.validation_rule.rule)
+                if data_dict:
+                    val_col_letter = get_column_letter(current_enum_col + 1)
+                    enum_columns.append((field, data_dict, is_ref))
+                    dv = cls._build_enum_validation(field, val_col_letter, len(data_dict))
+                    current_enum_col += 2
+                    constraints.append("关联模型" if is_ref else "枚举值")
+            if dv is not None:
+                dv.add(f'{col_letter}4:{col_letter}1048576')
+                template_sheet.data_validations.append(dv)
+
+            constraints.extend(cls._validation_rule_notes(field))
+
+            header_rows[0].append(header_cell(
+                f"{field.name}\r\n{field.verbose_name}", bold=True, required=field.required
+            ))
+            header_rows[1].append(header_cell(f"{field.type}\r\n{field_verbose_type}"))
+            header_rows[2].append(header_cell("\r\n".join(constraints) if constraints else ""))
+
+            column = template_sheet.column_dimensions[col_letter]
+            column.width = 20
+            number_format = FieldMapping.TYPE_EXCEL_FORMATS.get(field.type)
+            if number_format:
+                column.number_format = number_format
+
+        # write_only 模式下行列样式须在写入数据前设置
+        template_sheet.freeze_panes = 'A4'
+        template_sheet.row_dimensions[1].height = 45
+        template_sheet.row_dimensions[2].height = 30
+        template_sheet.row_dimensions[3].height = 45
+        for header_row in header_rows:
+            template_sheet.append(header_row)
+
+        count = 0
+        for instance_data in rows:
+            fields_values = instance_data.get('fields', {})
+            template_sheet.append(
+                [instance_data.get('instance_name'), None] + [fields_values.get(field.name) for field in fields]
+            )
+            count += 1
+
+        cls._write_enum_columns(enum_sheet, enum_columns)
+        validate_sheet.append([model_id])
+
+        # 锁定枚举表和校验表
+        enum_sheet.protection.enable()
+        enum_sheet.protection.set_password('123456')
+        validate_sheet.protection.enable()
+        validate_sheet.protection.set_password('123456')
+        wb.calculation.calcMode = 'auto'
+
+        wb.save(output)
+        return count
+
+    @classmethod
+    def _write_enum_columns(cls, enum_sheet, enum_columns):
+        """write_only 模式下按行写出枚举表，每个字段占用两列（填写值/对应内容）"""
+        enum_sheet.row_dimensions[1].height = 30
+        titles, labels = [], []
+        for index, (field, _, is_ref) in enumerate(enum_columns):
+            key_col_letter = get_column_letter(index * 2 + 1)
+            val_col_letter = get_column_letter(index * 2 + 2)
+            enum_sheet.merged_cells.add(f'{key_col_letter}1:{val_col_letter}1')
+            enum_sheet.column_dimensions[key_col_letter].width = 15
+            enum_sheet.column_dimensions[val_col_letter].width = 20
+
+            title = WriteOnlyCell(enum_sheet, value=f'{field.name}\r\n{field.verbose_name}')
+            title.font = cls.HEADER_FONT
+            title.alignment = cls.CENTER_ALIGNMENT
+            titles.extend([title, None])
+            labels.extend(['ID(勿填)', '实例名称'] if is_ref else ['填写值', '对应内容'])
+
+        if not enum_columns:
+            return
+        enum_sheet.append(titles)
+        enum_sheet.append(labels)
+        items = [iter(data_dict.items()) for _, data_dict, _ in enum_columns]
+        for row in zip_longest(*items, fillvalue=(None, None)):
+            enum_sheet.append([value for pair in row for value in pair])
+
+    @staticmethod
+    def write_csv_export(output, fields, rows):
+        """
+        流式生成 CSV 导出文件，首行为字段名
+
+        :param output: 文本文件对象
+        :return: 写入的数据行数
+        """
+        writer = csv.writer(output)
+        writer.writerow(['instance_name'] + [field.name for field in fields])
+        count = 0
+        for instance_data in rows:
+            fields_values = instance_data.get('fields', {})
+            writer.writerow(
+                [instance_data.get('instance_name')] + [fields_values.get(field.name) for field in fields]
+            )
+            count += 1
+        return count
@@ -1,9 +1,15 @@
+import logging
 from weakref import proxy
 from django_filters import rest_framework as filters
-from django.db.models import Q
-from django.db.models.functions import Cast
+from django.db.models import Q, Exists, OuterRef
+from django.db.models.functions import Cast, Left
+from rest_framework.exceptions import ValidationError
+from .constants import FieldType, FIELD_META_DATA_INDEX_PREFIX
+from .converters import ConverterFactory
 from .models import *
 
+logger = logging.getLogger(__name__)
+
 
 class ModelGroupsFilter(filters.FilterSet):
     name = filters.CharFilter(field_name='name', lookup_expr='icontains')
@@ -199,25 +205,15 @@ class ModelInstanceFilter(filters.FilterSet):
     update_time_before = filters.DateTimeFilter(field_name='update_time', lookup_expr='lte')
 
     def filter_model_instance_group(self, queryset, name, value):
-
-        def get_all_child_groups(group):
-            """递归获取所有子分组ID"""
-            group_ids = [group.id]
-            children = ModelInstanceGroup.objects.filter(parent=group)
-            for child in children:
-                group_ids.extend(get_all_child_groups(child))
-            return group_ids
-
+        """按分组（含所有子分组）过滤实例"""
         if value:
-            try:
-                group = ModelInstanceGroup.objects.get(id=value)
-                all_groups = get_all_child_groups(group)
-                instance_ids = ModelInstanceGroupRelation.objects.filter(
-                    group__in=all_groups
-                ).values_list('instance_id', flat=True)
-                return queryset.filter(id__in=instance_ids)
-            except ModelInstanceGroup.DoesNotExist:
-                return queryset.none()
+            group_ids = ModelInstanceGroupClosure.objects.descendants_of(
+                [value], include_self=True
+            ).values('descendant_id')
+            instance_ids = ModelInstanceGroupRelation.objects.filter(
+                group_id__in=group_ids
+            ).values_list('instance_id', flat=True)
+            return queryset.filter(id__in=instance_ids)
         return queryset
 
     class Meta:
@@ -234,6 +230,150 @@ class ModelInstanceFilter(filters.FilterSet):
         ]
 
 
+class InstanceFieldFilter:
+    """
+    实例动态字段过滤引擎
+    每个 field=expression 条件编译为一个按 model_fields_id 限定的 ModelFieldMeta EXISTS 子查询，
+    多个条件按预估选择性由高到低依次 AND 到实例查询集上，使每个条件都能命中 (model_fields_id, data) 索引。
+    gt/gte/lt/lte/between 比较条件作用于字段类型对应的影子列（num_value/dt_value/bool_value），
+    无影子列的字符类型按 data 字符串比较。
+    """
+
+    # 预估选择性排序，数值越小越先应用
+    SELECTIVITY_RANK = {
+        'eq': 0,
+        'in': 1,
+        'between': 2,
+        'null': 3,
+        'gt': 4,
+        'gte': 4,
+        'lt': 4,
+        'lte': 4,
+        'like': 5,
+        'regex': 6,
+    }
+    NEGATED_RANK_OFFSET = 10
+
+    def __init__(self, meta_queryset, fields_by_name: dict, field_types: dict = None):
+        """
+        :param meta_queryset: 用户可见的 ModelFieldMeta 查询集
+        :param fields_by_name: {field_name: [field_id, ...]}，未指定模型时同名字段可能对应多个ID
+        :param field_types: {field_id: field_type}，比较条件据此选择影子列
+        """
+        self.meta_queryset = meta_queryset
+        self.fields_by_name = fields_by_name
+        self.field_types = field_types or {}
+
+    @classmethod
+    def for_model(cls, meta_queryset, fields_queryset, model_id=None):
+        if model_id:
+            fields_queryset = fields_queryset.filter(model_id=model_id)
+        fields_by_name = {}
+        field_types = {}
+        for field_id, name, field_type in fields_queryset.values_list('id', 'name', 'type'):
+            fields_by_name.setdefault(name, []).append(field_id)
+            field_types[field_id] = field_type
+        return cls(meta_queryset, fields_by_name, field_types)
+
+    def _rank(self, expression):
+        rank = self.SELECTIVITY_RANK.get(expression.op, len(self.SELECTIVITY_RANK))
+        if expression.op == 'in':
+            # IN 列表越长选择性越低
+            rank += min(len(expression.values), 100) / 1000
+        if expression.negated:
+            rank += self.NEGATED_RANK_OFFSET
+        return rank
+
+    @staticmethod
+    def _data_lookup(expression) -> Q:
+        if expression.op == 'null':
+            return Q(data__isnull=False)
+        if expression.op == 'like':
+            return Q(data__icontains=expression.value)
+        if expression.op == 'in':
+            return Q(data__in=expression.values) & Q(
+                data_prefix__in={value[:FIELD_META_DATA_INDEX_PREFIX] for value in expression.values}
+            )
+        if expression.op == 'regex':
+            return Q(data__regex=expression.value)
+        # 附加的前缀条件与 PostgreSQL 上的 left(data, N) 表达式索引匹配，对结果没有影响
+        return Q(data=expression.value) & Q(data_prefix=expression.value[:FIELD_META_DATA_INDEX_PREFIX])
+
+    @staticmethod
+    def _range_lookup(column, field_type, field_name, expression) -> Q:
+        """将比较条件的操作数转换为影子列类型后生成查询条件"""
+        if expression.op == 'between' and len(expression.values) != 2:
+            raise ValidationError({field_name: 'between requires two values: between:<min>,<max>'})
+
+        operands = []
+        for raw in expression.values:
+            if column == 'data':
+                operands.append(raw)
+                continue
+            # num_value 为浮点列，整数字段的比较边界同样按浮点数解析
+            converter_type = FieldType.FLOAT if column == 'num_value' else field_type
+            value = ConverterFactory.get_converter(converter_type).to_typed(raw)
+            if value is None:
+                raise ValidationError({field_name: f'Invalid {field_type} value for {expression.op}: {raw}'})
+            operands.append(value)
+
+        if expression.op == 'between':
+            return Q(**{f'{column}__range': (operands[0], operands[1])})
+        return Q(**{f'{column}__{expression.op}': operands[0]})
+
+    def _field_lookup(self, field_name, field_ids, expression) -> Q:
+        if not expression.is_range:
+            return Q(model_fields_id__in=field_ids) & self._data_lookup(expression)
+
+        # 同名字段可能分属不同模型且类型不同，按影子列分组后合并
+        ids_by_column = {}
+        for field_id in field_ids:
+            field_type = self.field_types.get(field_id)
+            column = ConverterFactory.get_converter(field_type).typed_column or 'data'
+            ids_by_column.setdefault((column, field_type), []).append(field_id)
+
+        lookup = Q()
+        for (column, field_type), ids in ids_by_column.items():
+            lookup |= Q(model_fields_id__in=ids) & self._range_lookup(column, field_type, field_name, expression)
+        return lookup
+
+    def compile(self, expressions: dict) -> list:
+        """
+        :param expressions: {field_name: FilterExpression}
+        :return: 按选择性排序的 [(field_name, Exists 表达式, 是否取反)]
+        """
+        compiled = []
+        for field_name, expression in expressions.items():
+            field_ids = self.fields_by_name.get(field_name)
+            if not field_ids:
+                logger.warning(f"Field not found for dynamic filter: {field_name}")
+                continue
+
+            subquery = self.meta_queryset.alias(
+                data_prefix=Left('data', FIELD_META_DATA_INDEX_PREFIX)
+            ).filter(
+                self._field_lookup(field_name, field_ids, expression),
+                model_instance_id=OuterRef('pk'),
+            )
+            # null 判断等价于"不存在非空值"，其余取反条件等价于"不存在匹配值"
+            exclude = expression.negated != (expression.op == 'null')
+            compiled.append((self._rank(expression), field_name, Exists(subquery), exclude))
+
+        compiled.sort(key=lambda item: item[0])
+        return [(field_name, exists, exclude) for _, field_name, exists, exclude in compiled]
+
+    def apply(self, queryset, expressions: dict):
+        unknown = [field_name for field_name in expressions if not self.fields_by_name.get(field_name)]
+        if unknown:
+            # 不存在或无权限的字段不能被忽略，否则过滤条件会放宽为全部实例
+            logger.warning(f"Field not found for dynamic filter: {', '.join(unknown)}")
+            return queryset.none()
+        for field_name, exists, exclude in self.compile(expressions):
+            queryset = queryset.filter(~exists if exclude else exists)
+            logger.debug(f"Applied dynamic filter on field {field_name}, exclude={exclude}")
+        return queryset
+
+
 class ModelInstanceBasicFilter(filters.FilterSet):
     model = filters.UUIDFilter(field_name='model')
     instance_name = filters.CharFilter(field_name='instance_name', lookup_expr='icontains')
@@ -0,0 +1,140 @@
+"""
+CMDB分组实例计数模块
+根据实例分组关系的变更增量维护 ModelInstanceGroupCounter，分组树无需每次请求重新统计。
+
+- 直接计数：关系新增/删除时对所在分组 +1/-1
+- 汇总计数（分组及子分组下去重后的实例数）：按实例比较变更前后所覆盖的祖先集合，
+  只有新覆盖或不再覆盖的祖先才 +1/-1，同一实例位于同一祖先下的多个分组时不会重复计数
+- 批量删除（含实例、分组的级联删除）时，关系在 pre_delete 阶段登记为待删除，
+  逐条处理 post_delete 时仍视为存在，保证同一实例的多条关系一起删除时祖先只减一次；
+  分组的闭包行可能先于关系被级联删除，祖先集合同样在 pre_delete 阶段记录
+- 计数偏差可通过 reconcile_group_counters 命令校正
+"""
+
+import logging
+import threading
+
+from collections import defaultdict
+
+from .models import (
+    ModelInstanceGroup,
+    ModelInstanceGroupClosure,
+    ModelInstanceGroupCounter,
+    ModelInstanceGroupRelation,
+)
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+def _pending_deletes() -> dict:
+    """当前线程中已 pre_delete 但尚未处理 post_delete 的关系 {关系ID: (实例ID, 分组ID)}"""
+    if not hasattr(_local, 'pending'):
+        _local.pending = {}
+        _local.ancestors = {}
+    return _local.pending
+
+
+def _ancestor_map(group_ids) -> dict:
+    """分组（含自身）的祖先集合"""
+    ancestors = defaultdict(set)
+    for descendant_id, ancestor_id in ModelInstanceGroupClosure.objects.ancestors_of(
+        list(group_ids), include_self=True
+    ).values_list('descendant_id', 'ancestor_id'):
+        ancestors[str(descendant_id)].add(str(ancestor_id))
+    return ancestors
+
+
+def capture_relation_delete(relation):
+    """关系删除前登记，并记录所在分组的祖先集合"""
+    pending = _pending_deletes()
+    pending[relation.pk] = (str(relation.instance_id), str(relation.group_id))
+    if str(relation.group_id) not in _local.ancestors:
+        _local.ancestors.update(_ancestor_map([relation.group_id]))
+
+
+def relation_deleted(relation):
+    """关系删除后更新计数"""
+    pending = _pending_deletes()
+    pending.pop(relation.pk, None)
+    apply_membership_changes({relation.instance_id: ([relation.group_id], [])})
+    if not pending:
+        _local.ancestors = {}
+
+
+def relation_saved(relation, created, old_group_id=None):
+    """关系新建或变更分组后更新计数"""
+    if created:
+        apply_membership_changes({relation.instance_id: ([], [relation.group_id])})
+    elif old_group_id is not None and str(old_group_id) != str(relation.group_id):
+        apply_membership_changes({relation.instance_id: ([old_group_id], [relation.group_id])})
+
+
+def apply_membership_changes(changes):
+    """
+    按实例分组关系的变更更新计数，调用时数据库已是变更后的状态
+    :param changes: {实例ID: (移除的分组ID列表, 新增的分组ID列表)}
+    """
+    changes = {
+        str(instance_id): ({str(g) for g in removed}, {str(g) for g in added})
+        for instance_id, (removed, added) in changes.items() if removed or added
+    }
+    if not changes:
+        return
+
+    # 变更后实例所在的分组，待删除的关系仍视为存在
+    after = defaultdict(set)
+    for instance_id, group_id in ModelInstanceGroupRelation.objects.filter(
+        instance_id__in=list(changes)
+    ).values_list('instance_id', 'group_id'):
+        after[str(instance_id)].add(str(group_id))
+    for instance_id, group_id in _pending_deletes().values():
+        if instance_id in changes:
+            after[instance_id].add(group_id)
+
+    before = {}
+    group_ids = set()
+    for instance_id, (removed, added) in changes.items():
+        before[instance_id] = (after[instance_id] - added) | removed
+        group_ids |= before[instance_id] | after[instance_id]
+
+    ancestors = _ancestor_map(group_ids)
+    for group_id, group_ancestors in getattr(_local, 'ancestors', {}).items():
+        ancestors.setdefault(group_id, group_ancestors)
+
+    deltas = defaultdict(lambda: [0, 0])
+    for instance_id, (removed, added) in changes.items():
+        for group_id in removed:
+            deltas[group_id][0] -= 1
+        for group_id in added:
+            deltas[group_id][0] += 1
+
+        covered_before = set().union(*(ancestors.get(g, ()) for g in before[instance_id]))
+        covered_after = set().union(*(ancestors.get(g, ()) for g in after[instance_id]))
+        for group_id in covered_after - covered_before:
+            deltas[group_id][1] += 1
+        for group_id in covered_before - covered_after:
+            deltas[group_id][1] -= 1
+
+    ModelInstanceGroupCounter.objects.apply_deltas({
+        group_id: tuple(delta) for group_id, delta in deltas.items()
+    })
+
+
+def relations_created(relations):
+    """批量创建关系（bulk_create 不触发信号）后更新计数"""
+    changes = defaultdict(lambda: ([], []))
+    for relation in relations:
+        changes[relation.instance_id][1].append(relation.group_id)
+    apply_membership_changes(changes)
+
+
+def reconcile_group_counters(model_id=None) -> int:
+    """按当前关联关系重新统计分组计数，返回分组数"""
+    groups = ModelInstanceGroup.objects.all()
+    if model_id:
+        groups = groups.filter(model_id=model_id)
+    counts = ModelInstanceGroupCounter.objects.recount(groups.values_list('id', flat=True))
+    logger.info(f'Reconciled instance counters for {len(counts)} groups')
+    return len(counts)
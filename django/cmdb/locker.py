@@ -20,3 +20,24 @@ def lock_model_instance_for_update(object_id, nowait=False):
     instance = ModelInstance.objects.select_for_update(nowait=nowait).get(pk=object_id)
     list(ModelFieldMeta.objects.filter(model_instance_id=object_id).select_for_update(nowait=nowait))
     return instance
+
+
+def lock_model_instances_for_update(object_ids, nowait=False) -> dict:
+    """
+    批量锁定实例及其字段值，按主键排序加锁，避免并发批量回退时死锁
+    :return: {object_id: ModelInstance}，不存在的实例不在结果中
+    """
+    object_ids = sorted({str(object_id) for object_id in object_ids})
+    if not object_ids:
+        return {}
+    queryset = ModelInstance.objects.select_related('model').filter(pk__in=object_ids).order_by('id')
+    if 'postgresql' in connection.settings_dict['ENGINE']:
+        queryset = queryset.select_for_update(of=('self',), nowait=nowait)
+    else:
+        queryset = queryset.select_for_update(nowait=nowait)
+    instances = {str(instance.id): instance for instance in queryset}
+    list(
+        ModelFieldMeta.objects.filter(model_instance_id__in=object_ids)
+        .order_by('model_instance_id', 'id').select_for_update(nowait=nowait).values_list('id', flat=True)
+    )
+    return instances
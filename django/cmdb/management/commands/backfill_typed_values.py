@@ -0,0 +1,51 @@
+"""
+回填 ModelFieldMeta 的类型化影子列（num_value / dt_value / bool_value）
+
+示例：
+    python manage.py backfill_typed_values
+    python manage.py backfill_typed_values hosts switches --batch-size 5000
+"""
+
+from cacheops import invalidate_model
+from django.core.management.base import BaseCommand, CommandError
+
+from cmdb.converters import ConverterFactory
+from cmdb.models import Models, ModelFields, ModelFieldMeta
+
+
+class Command(BaseCommand):
+    help = '按字段类型回填实例字段值的数值/日期/布尔影子列，用于范围过滤'
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', help='模型名称或ID，为空时处理全部模型')
+        parser.add_argument('--batch-size', type=int, default=2000, help='每批更新的记录数')
+
+    def _resolve_models(self, identifiers):
+        models = []
+        for identifier in identifiers:
+            model = Models.objects.filter(name=identifier).first()
+            if model is None:
+                try:
+                    model = Models.objects.filter(id=identifier).first()
+                except Exception:
+                    model = None
+            if model is None:
+                raise CommandError(f'Model not found: {identifier}')
+            models.append(model)
+        return models
+
+    def handle(self, *args, **options):
+        fields = ModelFields.objects.select_related('model').order_by('model__name', 'order')
+        if options['models']:
+            fields = fields.filter(model__in=self._resolve_models(options['models']))
+
+        total = 0
+        for field in fields:
+            if not ConverterFactory.get_converter(field.type).typed_column:
+                continue
+            updated = ModelFieldMeta.objects.refresh_typed_values(field, batch_size=options['batch_size'])
+            total += updated
+            self.stdout.write(f'{field.model.name}.{field.name} ({field.type}): {updated} updated')
+
+        invalidate_model(ModelFieldMeta)
+        self.stdout.write(self.style.SUCCESS(f'Backfilled typed values for {total} field values'))
@@ -0,0 +1,47 @@
+"""
+重建实例分组闭包表
+
+示例：
+    python manage.py rebuild_group_closure hosts switches
+    python manage.py rebuild_group_closure --all
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cmdb.models import Models, ModelInstanceGroupClosure
+
+
+class Command(BaseCommand):
+    help = '按分组的父子关系重建实例分组闭包表'
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', help='模型名称或ID')
+        parser.add_argument('--all', action='store_true', help='重建所有模型的分组')
+
+    def _resolve_models(self, identifiers):
+        models = []
+        for identifier in identifiers:
+            model = Models.objects.filter(name=identifier).first()
+            if model is None:
+                try:
+                    model = Models.objects.filter(id=identifier).first()
+                except Exception:
+                    model = None
+            if model is None:
+                raise CommandError(f'Model not found: {identifier}')
+            models.append(model)
+        return models
+
+    def handle(self, *args, **options):
+        if options['all']:
+            total = ModelInstanceGroupClosure.objects.rebuild()
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt group closure: {total} rows'))
+            return
+
+        models = self._resolve_models(options['models'])
+        if not models:
+            raise CommandError('No model specified, use model names or --all')
+
+        for model in models:
+            total = ModelInstanceGroupClosure.objects.rebuild(model_id=model.id)
+            self.stdout.write(self.style.SUCCESS(f'{model.name}: {total} closure rows'))
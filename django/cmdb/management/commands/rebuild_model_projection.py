@@ -0,0 +1,57 @@
+"""
+重建模型宽表投影
+
+示例：
+    python manage.py rebuild_model_projection hosts switches
+    python manage.py rebuild_model_projection --stale
+    python manage.py rebuild_model_projection hosts --drop
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cmdb.models import Models, ModelProjection
+from cmdb.projection import rebuild_projection, drop_projection
+
+
+class Command(BaseCommand):
+    help = '为指定模型启用并重建宽表投影，或删除已有投影'
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', help='模型名称或ID')
+        parser.add_argument('--all', action='store_true', help='重建所有已启用宽表的模型')
+        parser.add_argument('--stale', action='store_true', help='仅重建结构已过期的宽表')
+        parser.add_argument('--drop', action='store_true', help='删除指定模型的宽表并停用投影')
+
+    def _resolve_models(self, identifiers):
+        models = []
+        for identifier in identifiers:
+            model = Models.objects.filter(name=identifier).first()
+            if model is None:
+                try:
+                    model = Models.objects.filter(id=identifier).first()
+                except Exception:
+                    model = None
+            if model is None:
+                raise CommandError(f'Model not found: {identifier}')
+            models.append(model)
+        return models
+
+    def handle(self, *args, **options):
+        models = self._resolve_models(options['models'])
+
+        if options['all'] or options['stale']:
+            projections = ModelProjection.objects.select_related('model')
+            if options['stale']:
+                projections = projections.filter(stale=True)
+            models.extend(p.model for p in projections if p.model not in models)
+
+        if not models:
+            raise CommandError('No model specified, use model names or --all/--stale')
+
+        for model in models:
+            if options['drop']:
+                dropped = drop_projection(model)
+                self.stdout.write(f'{model.name}: {"dropped" if dropped else "no projection"}')
+                continue
+            total = rebuild_projection(model)
+            self.stdout.write(self.style.SUCCESS(f'{model.name}: rebuilt projection with {total} instances'))
@@ -0,0 +1,47 @@
+"""
+重建全局搜索索引
+
+示例：
+    python manage.py rebuild_search_index hosts switches
+    python manage.py rebuild_search_index --all
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cmdb.models import Models
+from cmdb.search_index import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = '按当前的实例名称及字段值重建指定模型的全局搜索索引'
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', help='模型名称或ID')
+        parser.add_argument('--all', action='store_true', help='重建所有模型')
+
+    def _resolve_models(self, identifiers):
+        models = []
+        for identifier in identifiers:
+            model = Models.objects.filter(name=identifier).first()
+            if model is None:
+                try:
+                    model = Models.objects.filter(id=identifier).first()
+                except Exception:
+                    model = None
+            if model is None:
+                raise CommandError(f'Model not found: {identifier}')
+            models.append(model)
+        return models
+
+    def handle(self, *args, **options):
+        models = self._resolve_models(options['models'])
+
+        if options['all']:
+            models.extend(m for m in Models.objects.order_by('name') if m not in models)
+
+        if not models:
+            raise CommandError('No model specified, use model names or --all')
+
+        for model in models:
+            total = rebuild_search_index(model)
+            self.stdout.write(self.style.SUCCESS(f'{model.name}: indexed {total} instances'))
@@ -0,0 +1,48 @@
+"""
+校正实例分组计数
+
+示例：
+    python manage.py reconcile_group_counters hosts switches
+    python manage.py reconcile_group_counters --all
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cmdb.group_counters import reconcile_group_counters
+from cmdb.models import Models
+
+
+class Command(BaseCommand):
+    help = '按当前的实例分组关系重新统计各分组的直接及汇总实例数'
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', help='模型名称或ID')
+        parser.add_argument('--all', action='store_true', help='校正所有模型的分组')
+
+    def _resolve_models(self, identifiers):
+        models = []
+        for identifier in identifiers:
+            model = Models.objects.filter(name=identifier).first()
+            if model is None:
+                try:
+                    model = Models.objects.filter(id=identifier).first()
+                except Exception:
+                    model = None
+            if model is None:
+                raise CommandError(f'Model not found: {identifier}')
+            models.append(model)
+        return models
+
+    def handle(self, *args, **options):
+        if options['all']:
+            total = reconcile_group_counters()
+            self.stdout.write(self.style.SUCCESS(f'Reconciled {total} groups'))
+            return
+
+        models = self._resolve_models(options['models'])
+        if not models:
+            raise CommandError('No model specified, use model names or --all')
+
+        for model in models:
+            total = reconcile_group_counters(model_id=model.id)
+            self.stdout.write(self.style.SUCCESS(f'{model.name}: reconciled {total} groups'))
@@ -9,9 +9,11 @@ import json
 import logging
 import time
 from django.db.models import Q
-from django.db import models
+from django.db import connections, models, transaction
+from vuedjango.request_cache import request_cached_many
 
 from .constants import FieldType
+from .schema_cache import schema_cached
 
 logger = logging.getLogger(__name__)
 # 模型models的方法管理器
@@ -76,8 +78,11 @@ class ModelFieldsManager(models.Manager):
         return {str(field.id): field for field in queryset}
 
     def get_all_fields_for_model(self, model_id):
-        fields = self.filter(model_id=model_id).select_related('validation_rule')
-        return {f.name: f for f in fields}
+        """模型全部字段 {字段名: ModelFields}，由进程内定义缓存提供，调用方不得修改"""
+        def load():
+            fields = self.filter(model_id=model_id).select_related('validation_rule')
+            return {f.name: f for f in fields}
+        return schema_cached('field_configs', str(model_id), load)
 
     def get_required_field_names(self, model_id):
         return list(self.filter(model_id=model_id, required=True).values_list('name', flat=True))
@@ -149,6 +154,57 @@ class ModelFieldMetaManager(models.Manager):
             queryset = queryset.filter(model_fields__name__in=field_names)
         return {meta.model_fields.name: meta.data for meta in queryset}
 
+    def refresh_typed_values(self, field, batch_size=2000):
+        """
+        按字段类型重新计算该字段全部取值的类型化影子列（num_value/dt_value/bool_value），
+        仅更新发生变化的记录，返回更新条数
+        """
+        from .converters import ConverterFactory, TYPED_VALUE_COLUMNS
+
+        updated = 0
+        batch = []
+        queryset = self.filter(model_fields_id=field.id).only('id', 'data', *TYPED_VALUE_COLUMNS)
+        for meta in queryset.iterator(chunk_size=batch_size):
+            typed_values = ConverterFactory.get_typed_values(field.type, meta.data)
+            if all(getattr(meta, column) == value for column, value in typed_values.items()):
+                continue
+            for column, value in typed_values.items():
+                setattr(meta, column, value)
+            batch.append(meta)
+            if len(batch) >= batch_size:
+                self.bulk_update(batch, TYPED_VALUE_COLUMNS)
+                updated += len(batch)
+                batch = []
+        if batch:
+            self.bulk_update(batch, TYPED_VALUE_COLUMNS)
+            updated += len(batch)
+        return updated
+
+
+class ModelProjectionManager(models.Manager):
+
+    def get_active_projection(self, model_id):
+        """获取指定模型可用的宽表投影，未启用或结构已过期时返回 None"""
+        if not model_id:
+            return None
+        return self.filter(model_id=model_id, enabled=True, stale=False).first()
+
+    def mark_stale(self, model_id, field_id=None):
+        """
+        将模型的宽表投影标记为过期
+        :param field_id: 仅当该字段已在投影列中时才标记，为空则无条件标记
+        """
+        projection = self.filter(model_id=model_id, stale=False).first()
+        if not projection:
+            return False
+        if field_id is not None:
+            projected_ids = {col.get('field_id') for col in projection.columns or []}
+            if str(field_id) not in projected_ids:
+                return False
+        self.filter(pk=projection.pk).update(stale=True)
+        logger.info(f"Projection {projection.table_name} of model {model_id} marked as stale")
+        return True
+
 
 class UniqueConstraintManager(models.Manager):
 
@@ -164,9 +220,10 @@ class UniqueConstraintManager(models.Manager):
 
     def get_constraints_for_model(self, model):
         """
-        获取指定模型的所有唯一约束
+        获取指定模型的所有唯一约束（列表），由进程内定义缓存提供
         """
-        return self.filter(model=model).all()
+        model_id = getattr(model, 'pk', model)
+        return schema_cached('unique_constraints', str(model_id), lambda: list(self.filter(model_id=model_id)))
 
 
 class ModelInstanceManager(models.Manager):
@@ -195,9 +252,11 @@ class ModelInstanceManager(models.Manager):
         if not instance_ids:
             return {}
 
-        instances = self.filter(id__in=instance_ids).values('id', 'instance_name')
+        def load(missing_ids):
+            instances = self.filter(id__in=missing_ids).values('id', 'instance_name')
+            return {str(inst['id']): inst['instance_name'] for inst in instances}
 
-        return {str(inst['id']): inst['instance_name'] for inst in instances}
+        return request_cached_many('ref_names', [str(i) for i in instance_ids], load)
 
     def get_existing_instances_by_names(self, model_id, instance_names: list) -> dict:
         instances = self.filter(model_id=model_id, instance_name__in=instance_names)
@@ -207,42 +266,6 @@ class ModelInstanceManager(models.Manager):
         instances = self.filter(instance_name__in=instance_names).values('id', 'instance_name')
         return {item['instance_name']: str(item['id']) for item in instances}
 
-    def check_uniqueness(self, model, field_values: dict, instance_to_exclude=None) -> list:
-        if not field_values:
-            return []
-
-        from .models import ModelFieldMeta
-
-        matching_instances = set()
-        first = True
-
-        for field_name, value in field_values.items():
-            instances_with_field = ModelFieldMeta.objects.filter(
-                model=model,
-                model_fields__name=field_name,
-                data=str(value)
-            ).values_list('model_instance_id', flat=True)
-
-            current_set = set(instances_with_field)
-
-            # 首次迭代，直接赋值
-            if first:
-                matching_instances = current_set
-                first = False
-            # 后续迭代，取交集
-            else:
-                matching_instances.intersection_update(current_set)
-
-            # 如果中途交集为空，可以直接返回
-            if not matching_instances:
-                return []
-
-        # 排除当前实例
-        if instance_to_exclude:
-            matching_instances.discard(instance_to_exclude.id)
-
-        return list(matching_instances)
-
     def generate_instance_name(self, model, field_values: dict) -> str:
         from .models import ModelFields
 
@@ -253,11 +276,10 @@ class ModelInstanceManager(models.Manager):
         MAX_FIELD_VALUE_LENGTH = 30  # 每个字段值的最大长度
         MAX_INSTANCE_NAME_LENGTH = 100  # 实例名称的最大总长度
 
-        template_fields_qs = ModelFields.objects.filter(
-            id__in=template_field_ids
-        ).select_related('validation_rule')
+        template_field_id_set = {str(fid) for fid in template_field_ids}
         field_id_to_info = {
-            str(f.id): f for f in template_fields_qs
+            str(f.id): f for f in ModelFields.objects.get_all_fields_for_model(str(model.id)).values()
+            if str(f.id) in template_field_id_set
         }
 
         ref_instance_ids = []
@@ -336,12 +358,12 @@ class ModelInstanceGroupManager(models.Manager):
 
     def get_all_children_ids(self, group_ids, model_id=None) -> set:
         """
-        获取指定ID列表的所有子分组ID（递归，广度优先）
+        获取指定ID列表的所有子分组ID（基于闭包表，单条查询）
         供权限处理器等批量查询使用
 
         Args:
             group_ids: 分组ID列表
-            model_id: 可选，指定模型ID以限定查询范围，提升性能
+            model_id: 可选，指定模型ID以限定查询范围
         """
         if not group_ids:
             return set()
@@ -352,40 +374,12 @@ class ModelInstanceGroupManager(models.Manager):
         else:
             target_ids = {str(gid) for gid in group_ids}
 
-        # 一次性查询所有分组的父子关系
-        queryset = self.all()
+        closure = self.model._meta.get_field('descendant_links').related_model
+        queryset = closure.objects.descendants_of(target_ids)
         if model_id:
-            queryset = queryset.filter(model_id=model_id)
-
-        all_groups = queryset.values_list('id', 'parent_id')
-
-        # 构建父子关系映射: parent_id -> [child_ids]
-        parent_to_children = {}
-        for group_id, parent_id in all_groups:
-            group_id_str = str(group_id)
-            parent_id_str = str(parent_id) if parent_id else None
-            if parent_id_str:
-                if parent_id_str not in parent_to_children:
-                    parent_to_children[parent_id_str] = []
-                parent_to_children[parent_id_str].append(group_id_str)
-
-        # 在内存中广度优先遍历获取所有子节点
-        all_children_ids = set()
-        current_ids = target_ids.copy()
-
-        while current_ids:
-            next_level_ids = set()
-            for parent_id in current_ids:
-                children = parent_to_children.get(parent_id, [])
-                next_level_ids.update(children)
-
-            # 排除已处理的节点，防止死循环
-            new_ids = next_level_ids - all_children_ids
-            if not new_ids:
-                break
+            queryset = queryset.filter(descendant__model_id=model_id)
 
-            all_children_ids.update(new_ids)
-            current_ids = new_ids
+        all_children_ids = {str(gid) for gid in queryset.values_list('descendant_id', flat=True)}
         logger.debug(f'children ids: {all_children_ids}')
 
         return all_children_ids
@@ -423,6 +417,163 @@ class ModelInstanceGroupManager(models.Manager):
         return self.get_all_children_ids(group_ids)
 
 
+class ModelInstanceGroupClosureManager(models.Manager):
+    """
+    分组闭包表管理器
+    每个分组对自身及其所有祖先各保存一行 (ancestor, descendant, depth)，
+    新建、移动分组时以集合语句维护，删除分组时随外键级联删除
+    """
+
+    def descendants_of(self, group_ids, include_self=False):
+        """后代关系行，可直接作为子查询使用"""
+        queryset = self.filter(ancestor_id__in=group_ids)
+        return queryset if include_self else queryset.filter(depth__gt=0)
+
+    def ancestors_of(self, group_ids, include_self=False):
+        """祖先关系行"""
+        queryset = self.filter(descendant_id__in=group_ids)
+        return queryset if include_self else queryset.filter(depth__gt=0)
+
+    def _sql_context(self):
+        connection = connections[self.db]
+        qn = connection.ops.quote_name
+        opts = self.model._meta
+        group_field = opts.get_field('ancestor').target_field
+
+        def param(group_id):
+            return group_field.get_db_prep_value(group_field.to_python(group_id), connection)
+
+        return connection, qn(opts.db_table), param, f'CAST(%s AS {group_field.db_type(connection)})'
+
+    def insert_node(self, group):
+        """新建分组：复制父分组的祖先行并加入自身"""
+        connection, table, param, typed = self._sql_context()
+        sql = f'INSERT INTO {table} (ancestor_id, descendant_id, depth) SELECT {typed}, {typed}, 0'
+        params = [param(group.pk), param(group.pk)]
+        if group.parent_id:
+            sql += (
+                f' UNION ALL SELECT ancestor_id, {typed}, depth + 1 FROM {table} WHERE descendant_id = %s'
+            )
+            params += [param(group.pk), param(group.parent_id)]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+    def move_subtree(self, group):
+        """
+        移动分组：删除子树与原祖先之间的行，再以新父分组的祖先 × 子树插入新行
+        子查询包一层派生表，兼容 MySQL 不允许在 DELETE 中直接引用目标表的限制
+        """
+        connection, table, param, _ = self._sql_context()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {table} '
+                f'WHERE descendant_id IN ('
+                f'SELECT descendant_id FROM (SELECT descendant_id FROM {table} WHERE ancestor_id = %s) AS subtree'
+                f') AND ancestor_id NOT IN ('
+                f'SELECT descendant_id FROM (SELECT descendant_id FROM {table} WHERE ancestor_id = %s) AS subtree_self'
+                f')',
+                [param(group.pk), param(group.pk)]
+            )
+            if group.parent_id:
+                cursor.execute(
+                    f'INSERT INTO {table} (ancestor_id, descendant_id, depth) '
+                    f'SELECT a.ancestor_id, d.descendant_id, a.depth + d.depth + 1 '
+                    f'FROM {table} a CROSS JOIN {table} d '
+                    f'WHERE a.descendant_id = %s AND d.ancestor_id = %s',
+                    [param(group.parent_id), param(group.pk)]
+                )
+
+    def rebuild(self, model_id=None) -> int:
+        """按分组的 parent 关系重建闭包表，返回写入行数"""
+        group_model = self.model._meta.get_field('ancestor').related_model
+        groups = group_model.objects.all()
+        if model_id:
+            groups = groups.filter(model_id=model_id)
+        parents = {group_id: parent_id for group_id, parent_id in groups.values_list('id', 'parent_id')}
+
+        rows = []
+        for group_id in parents:
+            ancestor_id, depth, seen = group_id, 0, set()
+            while ancestor_id is not None and ancestor_id not in seen:
+                seen.add(ancestor_id)
+                rows.append(self.model(ancestor_id=ancestor_id, descendant_id=group_id, depth=depth))
+                ancestor_id, depth = parents.get(ancestor_id), depth + 1
+
+        with transaction.atomic(using=self.db):
+            self.filter(descendant__in=groups).delete()
+            self.bulk_create(rows, batch_size=1000)
+        return len(rows)
+
+
+class ModelInstanceGroupCounterManager(models.Manager):
+    """
+    分组实例计数管理器
+    direct_count 为直接关联到分组的实例数，total_count 为分组及其所有子分组下去重后的实例数
+    """
+
+    def _group_model(self):
+        return self.model._meta.get_field('group').related_model
+
+    def apply_deltas(self, deltas):
+        """
+        按 {分组ID: (直接计数增量, 汇总计数增量)} 更新计数，相同增量的分组合并为一条 UPDATE
+        没有计数行的分组跳过，读取时按需重新统计
+        """
+        by_delta = {}
+        for group_id, delta in deltas.items():
+            if any(delta):
+                by_delta.setdefault(delta, []).append(group_id)
+        for (direct, total), group_ids in by_delta.items():
+            self.filter(group_id__in=group_ids).update(
+                direct_count=models.F('direct_count') + direct,
+                total_count=models.F('total_count') + total
+            )
+
+    def recount(self, group_ids) -> dict:
+        """按当前关联关系重新统计指定分组的计数，返回 {分组ID: (直接计数, 汇总计数)}"""
+        group_ids = list(group_ids)
+        if not group_ids:
+            return {}
+        group_model = self._group_model()
+        closure = group_model._meta.get_field('descendant_links').related_model
+        relation = group_model._meta.get_field('modelinstancegrouprelation').related_model
+
+        group_ids = list(group_model.objects.filter(id__in=group_ids).values_list('id', flat=True))
+        totals = dict(
+            closure.objects.filter(ancestor_id__in=group_ids).values('ancestor_id').annotate(
+                count=models.Count('descendant__modelinstancegrouprelation__instance', distinct=True)
+            ).values_list('ancestor_id', 'count')
+        )
+        directs = dict(
+            relation.objects.filter(group_id__in=group_ids).values('group_id').annotate(
+                count=models.Count('instance', distinct=True)
+            ).values_list('group_id', 'count')
+        )
+        counts = {group_id: (directs.get(group_id, 0), totals.get(group_id, 0)) for group_id in group_ids}
+
+        with transaction.atomic(using=self.db):
+            self.filter(group_id__in=group_ids).delete()
+            self.bulk_create([
+                self.model(group_id=group_id, direct_count=direct, total_count=total)
+                for group_id, (direct, total) in counts.items()
+            ])
+        return counts
+
+    def get_counts(self, group_ids) -> dict:
+        """读取分组计数 {分组ID: (直接计数, 汇总计数)}，缺失的计数行即时统计补齐"""
+        group_ids = set(group_ids)
+        counts = {
+            group_id: (direct, total)
+            for group_id, direct, total in self.filter(group_id__in=group_ids).values_list(
+                'group_id', 'direct_count', 'total_count'
+            )
+        }
+        missing = group_ids - set(counts)
+        if missing:
+            counts.update(self.recount(missing))
+        return counts
+
+
 class RelationDefinitionManager(models.Manager):
     """关系定义管理器"""
 
@@ -486,6 +637,11 @@ class RelationsManager(models.Manager):
         :param direction: 遍历方向
         :return: 关系查询集
         """
+        from .relation_traversal import RelationCteTraversal, supports_recursive_cte
+
+        if supports_recursive_cte(self.db):
+            return RelationCteTraversal(self.db).topology_edges(start_node_ids, depth, direction)
+
         visited_nodes = set(start_node_ids)
         all_relations = []
         current_nodes = set(start_node_ids)
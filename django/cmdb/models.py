@@ -6,13 +6,16 @@ import functools
 from django.db import models
 from django.core.cache import cache
 from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Concat, Substr
 from rest_framework.exceptions import PermissionDenied
 
 from .managers import *
 from .constants import ValidationType
-from .resolver import resolve_model_field_id_list, resolve_dynamic_value, resolve_model
+from .resolver import resolve_model_field_id_list, resolve_dynamic_value, resolve_model, mask_dynamic_value
 from audit.decorators import register_audit
 from audit.snapshots import get_dynamic_field_snapshot
+from .schema_cache import schema_cached
 
 logger = logging.getLogger(__name__)
 
@@ -83,6 +86,14 @@ class Models(models.Model):
             raise PermissionDenied('Cannot delete a built-in model.')
         super().delete(*args, **kwargs)
 
+    @staticmethod
+    def get_instance_name_template(model_id) -> list:
+        """模型的实例名称模板（字段ID列表），由进程内定义缓存提供"""
+        return schema_cached(
+            'instance_name_template', str(model_id),
+            lambda: Models.objects.filter(id=model_id).values_list('instance_name_template', flat=True).first()
+        )
+
 
 @register_audit(
     snapshot_fields={'id', 'name', 'verbose_name'},
@@ -145,8 +156,13 @@ class ValidationRules(models.Model):
     update_user = models.CharField(max_length=20, null=True, blank=True)
 
     @staticmethod
-    # @functools.lru_cache(maxsize=128)  # maxsize 可根据枚举规则的数量调整
     def get_enum_dict(rule_id):
+        """枚举规则的 {键: 显示值}，由进程内定义缓存提供"""
+        return schema_cached('enum_dict', str(rule_id), lambda: ValidationRules._load_enum_dict(rule_id))
+
+    @staticmethod
+    # @functools.lru_cache(maxsize=128)  # maxsize 可根据枚举规则的数量调整
+    def _load_enum_dict(rule_id):
         # logger.debug(
         #     f"LRU Cache MISS for get_enum_dict(rule_id={rule_id})."
         #     f"Executing function body. Cache info: {ValidationRules.get_enum_dict.cache_info()}")
@@ -266,8 +282,11 @@ class UniqueConstraint(models.Model):
     ignore_fields={'update_time', 'create_time', 'create_user', 'update_user'},
     public_name='model_instance',
     dynamic_value_resolver=resolve_dynamic_value,
+    dynamic_value_masker=mask_dynamic_value,
     restorer='cmdb.restorer.restore_model_instance',
-    locker='cmdb.locker.lock_model_instance_for_update'
+    locker='cmdb.locker.lock_model_instance_for_update',
+    batch_restorer='cmdb.restorer.restore_model_instances',
+    batch_locker='cmdb.locker.lock_model_instances_for_update'
 )
 class ModelInstance(models.Model):
 
@@ -300,7 +319,8 @@ class ModelInstance(models.Model):
 
     def generate_name(self, field_values=None):
         """根据模型模板生成实例名称"""
-        if not self.model.instance_name_template:
+        instance_name_template = Models.get_instance_name_template(self.model_id)
+        if not instance_name_template:
             return None
 
         # 如果没有提供字段值，则从数据库获取
@@ -314,7 +334,7 @@ class ModelInstance(models.Model):
                 field_values[meta.model_fields.name] = meta.data
 
         from .utils.name_generator import generate_instance_name
-        return generate_instance_name(field_values, self.model.instance_name_template)
+        return generate_instance_name(field_values, instance_name_template)
 
 
 class ModelFieldMeta(models.Model):
@@ -325,12 +345,78 @@ class ModelFieldMeta(models.Model):
         db_table = 'model_field_meta'
         managed = True
         app_label = 'cmdb'
+        indexes = [
+            # 动态字段过滤的 EXISTS 子查询按 (实例, 字段) 关联
+            models.Index(fields=['model_instance', 'model_fields'], name='idx_meta_instance_field'),
+            # 类型化影子列按字段限定后做范围扫描
+            models.Index(fields=['model_fields', 'num_value'], name='idx_meta_field_num'),
+            models.Index(fields=['model_fields', 'dt_value'], name='idx_meta_field_dt'),
+            models.Index(fields=['model_fields', 'bool_value'], name='idx_meta_field_bool'),
+        ]
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     model = models.ForeignKey('Models', on_delete=models.CASCADE)
     model_instance = models.ForeignKey('ModelInstance', on_delete=models.CASCADE, related_name='field_values')
     model_fields = models.ForeignKey('ModelFields', on_delete=models.CASCADE)
     data = models.TextField(blank=True, null=True)
+    # data 的类型化影子列，由 ConverterFactory.get_typed_values 计算，仅对应类型的字段有值
+    num_value = models.FloatField(blank=True, null=True)
+    dt_value = models.DateTimeField(blank=True, null=True)
+    bool_value = models.BooleanField(blank=True, null=True)
+    create_time = models.DateTimeField(auto_now_add=True)
+    update_time = models.DateTimeField(auto_now=True)
+    create_user = models.CharField(max_length=20, null=True, blank=True)
+    update_user = models.CharField(max_length=20, null=True, blank=True)
+
+
+class SearchToken(models.Model):
+    """
+    全局搜索倒排索引
+    实例名称及字段值（含枚举标签、引用实例名称等显示值）规范化后拆分为 n-gram，一行一个 (文档, token)，
+    field_id 为空的文档表示实例名称。由 cmdb.search_index 增量维护，可通过 rebuild_search_index 命令重建。
+    不使用外键：删除实例时避免级联收集大量 token，由 search_index 按文档直接删除。
+    """
+
+    class Meta:
+        db_table = 'search_token'
+        managed = True
+        app_label = 'cmdb'
+        indexes = [
+            # posting list：按 token 定位后在索引内完成模型过滤及按文档分组求交集，无需回表
+            models.Index(fields=['token', 'model_id', 'instance_id', 'field_id'], name='idx_search_token_posting'),
+            # 按文档删除重建
+            models.Index(fields=['instance_id', 'field_id'], name='idx_search_token_doc'),
+        ]
+
+    id = models.BigAutoField(primary_key=True)
+    # 长度由 search_index.SEARCH_NGRAM_SIZE 决定
+    token = models.CharField(max_length=16)
+    model_id = models.UUIDField()
+    instance_id = models.UUIDField()
+    field_id = models.UUIDField(null=True, blank=True)
+
+
+class ModelProjection(models.Model):
+    """
+    模型宽表投影配置
+    记录启用了宽表（一行一实例、一列一字段）的模型及建表时的列结构，
+    字段增删或类型变更后标记为 stale，需通过 rebuild_model_projection 命令重建。
+    """
+    objects: ModelProjectionManager = ModelProjectionManager()
+
+    class Meta:
+        db_table = 'model_projection'
+        managed = True
+        app_label = 'cmdb'
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    model = models.OneToOneField('Models', on_delete=models.CASCADE, related_name='projection')
+    table_name = models.CharField(max_length=64, unique=True)
+    # 建表时的列结构: [{'field_id': ..., 'name': ..., 'type': ...}, ...]
+    columns = models.JSONField(default=list, blank=True)
+    enabled = models.BooleanField(default=True)
+    stale = models.BooleanField(default=False)
+    build_time = models.DateTimeField(null=True, blank=True)
     create_time = models.DateTimeField(auto_now_add=True)
     update_time = models.DateTimeField(auto_now=True)
     create_user = models.CharField(max_length=20, null=True, blank=True)
@@ -364,15 +450,47 @@ class ModelInstanceGroup(models.Model):
     create_user = models.CharField(max_length=20, null=True, blank=True)
     update_user = models.CharField(max_length=20, null=True, blank=True)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 记录加载时的树位置，保存时据此判断是否需要维护闭包表及子树
+        if {'parent_id', 'path', 'level'} <= set(field_names):
+            instance._loaded_tree_state = (instance.parent_id, instance.path, instance.level)
+        return instance
+
     def save(self, *args, **kwargs):
         skip_signal = kwargs.pop('_skip_signal', False)
+        adding = self._state.adding
+        update_fields = kwargs.get('update_fields')
+        tree_changed = update_fields is None or bool({'parent', 'label', 'path', 'level'} & set(update_fields))
+        old_state = None
+        if not adding and tree_changed:
+            old_state = getattr(self, '_loaded_tree_state', None)
+            if old_state is None:
+                old_state = self.__class__.objects.filter(pk=self.pk).values_list('parent_id', 'path', 'level').first()
         self.path = self.get_path()
 
         if skip_signal:
             self._skip_signal = True
 
-        super().save(*args, **kwargs)
-
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                ModelInstanceGroupClosure.objects.insert_node(self)
+            elif old_state is not None:
+                old_parent_id, old_path, old_level = old_state
+                if old_parent_id != self.parent_id:
+                    ancestors = ModelInstanceGroupClosure.objects.ancestors_of([self.pk])
+                    old_ancestor_ids = set(ancestors.values_list('ancestor_id', flat=True))
+                    ModelInstanceGroupClosure.objects.move_subtree(self)
+                    # 子树的实例从原祖先移到新祖先下，重新统计两侧祖先的计数
+                    ModelInstanceGroupCounter.objects.recount(
+                        old_ancestor_ids | set(ancestors.values_list('ancestor_id', flat=True))
+                    )
+                if old_path != self.path or old_level != self.level:
+                    self.update_child_path(old_path, self.level - old_level)
+
+        self._loaded_tree_state = (self.parent_id, self.path, self.level)
         if hasattr(self, '_skip_signal'):
             delattr(self, '_skip_signal')
 
@@ -381,13 +499,13 @@ class ModelInstanceGroup(models.Model):
             return f'{self.parent.path}/{self.label}'
         return self.label
 
-    def update_child_path(self):
-        """更新子分组的path"""
-        children = self.__class__.objects.filter(parent=self)
-        for child in children:
-            child.path = child.get_path()
-            child.save(update_fields=['path', 'update_time'], _skip_signal=True)
-            child.update_child_path()
+    def update_child_path(self, old_path, level_diff=0):
+        """以一条 UPDATE 替换所有后代分组 path 的前缀，并同步调整层级"""
+        descendants = ModelInstanceGroupClosure.objects.descendants_of([self.pk]).values('descendant_id')
+        updates = {'path': Concat(Value(self.path), Substr('path', len(old_path or '') + 1))}
+        if level_diff:
+            updates['level'] = F('level') + level_diff
+        self.__class__.objects.filter(id__in=descendants).update(**updates)
 
     # @classmethod
     # def clear_group_cache(cls, group):
@@ -417,6 +535,49 @@ class ModelInstanceGroup(models.Model):
     #     logger.info(f'Cache cleared successfully')
 
 
+class ModelInstanceGroupClosure(models.Model):
+    """
+    分组层级闭包表
+    每个分组对自身（depth=0）及其所有祖先各保存一行，后代、祖先查询及子树改写均为单条集合语句。
+    由 ModelInstanceGroup.save 在同一事务内维护，可通过 rebuild_group_closure 命令重建。
+    """
+    objects: ModelInstanceGroupClosureManager = ModelInstanceGroupClosureManager()
+
+    class Meta:
+        db_table = 'model_instance_group_closure'
+        managed = True
+        app_label = 'cmdb'
+        unique_together = ('ancestor', 'descendant')
+        indexes = [
+            models.Index(fields=['descendant', 'depth'], name='idx_group_closure_ancestors'),
+        ]
+
+    id = models.BigAutoField(primary_key=True)
+    ancestor = models.ForeignKey('ModelInstanceGroup', on_delete=models.CASCADE, related_name='descendant_links')
+    descendant = models.ForeignKey('ModelInstanceGroup', on_delete=models.CASCADE, related_name='ancestor_links')
+    depth = models.IntegerField(default=0)
+
+
+class ModelInstanceGroupCounter(models.Model):
+    """
+    分组实例计数
+    由 cmdb.group_counters 根据实例分组关系的变更增量维护，分组移动时重新统计受影响的祖先分组，
+    可通过 reconcile_group_counters 命令校正。
+    """
+    objects: ModelInstanceGroupCounterManager = ModelInstanceGroupCounterManager()
+
+    class Meta:
+        db_table = 'model_instance_group_counter'
+        managed = True
+        app_label = 'cmdb'
+
+    group = models.OneToOneField(
+        'ModelInstanceGroup', on_delete=models.CASCADE, primary_key=True, related_name='counter'
+    )
+    direct_count = models.IntegerField(default=0)
+    total_count = models.IntegerField(default=0)
+
+
 class ModelInstanceGroupRelation(models.Model):
     """实例与分组的关联关系"""
     class Meta:
@@ -6,7 +6,8 @@ CMDB权限处理器模块
 
 from abc import ABC, abstractmethod
 from django.db.models import Q
-from access.registry import register_indirect_permission_handler
+from access.registry import register_indirect_permission_handler, register_compiled_scope_model
+from access.tools import get_compiled_scope_ids
 
 from .models import *
 
@@ -201,17 +202,23 @@ class ModelFieldMetaQueryHandler(BaseQueryHandler):
                     model_field_group_id__in=field_group_ids
                 ).values_list('id', flat=True)
                 query |= Q(model_fields_id__in=fields_in_groups)
+
+            # 复用实例的编译结果（授权实例及授权分组下的实例）
+            visible_instance_ids = get_compiled_scope_ids(scope, ModelInstance, username)
+            if visible_instance_ids is not None:
+                instance_query = Q(model_instance_id__in=visible_instance_ids)
+            else:
                 instance_ids = scope['targets'].get('cmdb.modelinstance')
-            if instance_ids:
-                instance_query |= Q(model_instance_id__in=instance_ids)
+                if instance_ids:
+                    instance_query |= Q(model_instance_id__in=instance_ids)
 
-            instance_group_ids = scope['targets'].get('cmdb.modelinstancegroup')
-            children_ids = ModelInstanceGroup.objects.get_all_children_ids(instance_group_ids)
-            if instance_group_ids:
-                related_instance_ids = ModelInstanceGroupRelation.objects.filter(
-                    group_id__in=set(instance_group_ids) | children_ids
-                ).values_list('instance_id', flat=True)
-                instance_query |= Q(model_instance_id__in=related_instance_ids)
+                instance_group_ids = scope['targets'].get('cmdb.modelinstancegroup')
+                children_ids = ModelInstanceGroup.objects.get_all_children_ids(instance_group_ids)
+                if instance_group_ids:
+                    related_instance_ids = ModelInstanceGroupRelation.objects.filter(
+                        group_id__in=set(instance_group_ids) | children_ids
+                    ).values_list('instance_id', flat=True)
+                    instance_query |= Q(model_instance_id__in=related_instance_ids)
 
             if not query:
                 # 没有字段过滤条件时直接设置为空
@@ -331,27 +338,32 @@ class RelationsQueryHandler(BaseQueryHandler):
         model_name = model._meta.model_name
 
         if model_name == 'relations':
-            # 获取用户有权限的实例ID列表
-            instance_ids = scope['targets'].get('cmdb.modelinstance')
-
-            # 获取用户有权限的实例组及其子组中的实例
-            instance_group_ids = scope['targets'].get('cmdb.modelinstancegroup')
-            group_instance_ids = set()
+            # 优先复用实例的编译结果
+            compiled_instance_ids = get_compiled_scope_ids(scope, ModelInstance, username)
+            if compiled_instance_ids is not None:
+                all_visible_instance_ids = set(compiled_instance_ids)
+            else:
+                # 获取用户有权限的实例ID列表
+                instance_ids = scope['targets'].get('cmdb.modelinstance')
 
-            if instance_group_ids:
-                children_ids = ModelInstanceGroup.objects.get_all_children_ids(instance_group_ids)
-                all_group_ids = set(instance_group_ids) | children_ids
-                group_instance_ids = set(
-                    ModelInstanceGroupRelation.objects.filter(
-                        group_id__in=all_group_ids
-                    ).values_list('instance_id', flat=True)
-                )
+                # 获取用户有权限的实例组及其子组中的实例
+                instance_group_ids = scope['targets'].get('cmdb.modelinstancegroup')
+                group_instance_ids = set()
 
-            # 合并所有可见实例ID
-            all_visible_instance_ids = set()
-            if instance_ids:
-                all_visible_instance_ids.update(instance_ids)
-            all_visible_instance_ids.update(group_instance_ids)
+                if instance_group_ids:
+                    children_ids = ModelInstanceGroup.objects.get_all_children_ids(instance_group_ids)
+                    all_group_ids = set(instance_group_ids) | children_ids
+                    group_instance_ids = set(
+                        ModelInstanceGroupRelation.objects.filter(
+                            group_id__in=all_group_ids
+                        ).values_list('instance_id', flat=True)
+                    )
+
+                # 合并所有可见实例ID
+                all_visible_instance_ids = set()
+                if instance_ids:
+                    all_visible_instance_ids.update(instance_ids)
+                all_visible_instance_ids.update(group_instance_ids)
 
             if all_visible_instance_ids:
                 # 核心逻辑：源或目标任一可见，则关系可见
@@ -408,3 +420,5 @@ def get_cmdb_indirect_query(scope, model, username):
 
 
 register_indirect_permission_handler('cmdb', get_cmdb_indirect_query)
+# 实例及实例分组的可见范围依赖分组拓扑，编译为ID集合缓存
+register_compiled_scope_model('cmdb.modelinstance', 'cmdb.modelinstancegroup')
@@ -0,0 +1,423 @@
+"""
+CMDB宽表投影模块
+为启用宽表的模型维护一张"一行一实例、一列一字段"的物化表，
+列表过滤直接对宽表做单表索引查询，避免在请求时对 ModelFieldMeta 做行转列。
+
+- ModelFieldMeta 仍是唯一的数据源，宽表只是其投影，任何时候都可以通过 rebuild_model_projection 命令重建
+- 写入由 ModelFieldMetaWriter.flush 增量同步
+- 宽表只用于过滤，导出等需要原始值的读取仍读取 ModelFieldMeta
+- 字段增删或类型变更后投影被标记为 stale，此时读取自动回退到 ModelFieldMeta，直到重建完成；
+  重建期间的写入不同步宽表，重建结束时按更新时间补齐
+- 字符类型列宽度为 PROJECTION_CHAR_LENGTH，超长值截断存储，超长的等值过滤条件及字符列上的模糊/正则过滤回退到 ModelFieldMeta
+"""
+
+import uuid
+import logging
+
+from django.apps.registry import Apps
+from django.db import connection, models, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .constants import FieldType
+from .models import Models, ModelFields, ModelFieldMeta, ModelInstance, ModelProjection
+
+logger = logging.getLogger(__name__)
+
+PROJECTION_TABLE_PREFIX = 'model_projection_'
+PROJECTION_COLUMN_PREFIX = 'f_'
+PROJECTION_CHAR_LENGTH = 255
+PROJECTION_BATCH_SIZE = 2000
+
+# 宽表模型注册在独立的 Apps 中，避免污染 cmdb 应用的模型注册表（迁移、ContentType 等）
+_projection_apps = Apps()
+_projection_class_cache = {}
+
+# FieldType 为 str 枚举，其哈希基于成员名，这里使用元组按值比较
+CHAR_COLUMN_TYPES = (
+    FieldType.STRING,
+    FieldType.ENUM,
+    FieldType.MODEL_REF,
+    FieldType.DATE,
+    FieldType.DATETIME,
+)
+
+
+def get_table_name(model_id) -> str:
+    return f'{PROJECTION_TABLE_PREFIX}{uuid.UUID(str(model_id)).hex}'
+
+
+def get_column_name(field_id) -> str:
+    return f'{PROJECTION_COLUMN_PREFIX}{uuid.UUID(str(field_id)).hex}'
+
+
+def _build_column(field_type):
+    if field_type == FieldType.INTEGER:
+        return models.BigIntegerField(null=True, db_index=True)
+    if field_type == FieldType.FLOAT:
+        return models.FloatField(null=True, db_index=True)
+    if field_type == FieldType.BOOLEAN:
+        return models.BooleanField(null=True, db_index=True)
+    if field_type in CHAR_COLUMN_TYPES:
+        return models.CharField(max_length=PROJECTION_CHAR_LENGTH, null=True, db_index=True)
+    # text / json / password 等不参与索引
+    return models.TextField(null=True)
+
+
+def get_projection_class(table_name: str, columns: list):
+    """
+    根据表名及列结构构造（或从缓存获取）宽表对应的非托管模型类
+    """
+    signature = (table_name, tuple((col['field_id'], col['type']) for col in columns))
+    model_class = _projection_class_cache.get(signature)
+    if model_class is not None:
+        return model_class
+
+    class_name = f'Projection{table_name[len(PROJECTION_TABLE_PREFIX):]}'
+    meta = type('Meta', (), {
+        'db_table': table_name,
+        'managed': False,
+        'app_label': 'cmdb',
+        'apps': _projection_apps,
+    })
+    attrs = {
+        '__module__': __name__,
+        'Meta': meta,
+        'instance_id': models.UUIDField(primary_key=True),
+        'update_time': models.DateTimeField(auto_now=True),
+    }
+    for col in columns:
+        attrs[get_column_name(col['field_id'])] = _build_column(col['type'])
+
+    # 列结构变化后同名模型需要重新注册
+    _projection_apps.all_models['cmdb'].pop(class_name.lower(), None)
+    for key in [k for k in _projection_class_cache if k[0] == table_name]:
+        _projection_class_cache.pop(key, None)
+
+    model_class = type(class_name, (models.Model,), attrs)
+    _projection_class_cache[signature] = model_class
+    return model_class
+
+
+def to_column_value(field_type, value):
+    """将 ModelFieldMeta.data 的存储值转换为宽表列值，无法转换时置空"""
+    if value is None or value == '':
+        return None
+    try:
+        if field_type == FieldType.INTEGER:
+            return int(float(value))
+        if field_type == FieldType.FLOAT:
+            return float(value)
+        if field_type == FieldType.BOOLEAN:
+            return str(value).lower() in ('true', '1')
+    except (TypeError, ValueError):
+        logger.debug(f"Cannot convert value {value!r} to projection column of type {field_type}")
+        return None
+    if field_type in CHAR_COLUMN_TYPES:
+        return str(value)[:PROJECTION_CHAR_LENGTH]
+    return str(value)
+
+
+class ProjectionTable:
+    """
+    已启用的宽表投影的运行时表示
+    """
+
+    def __init__(self, projection: ModelProjection):
+        self.projection = projection
+        self.columns = list(projection.columns or [])
+        self.model_class = get_projection_class(projection.table_name, self.columns)
+        self.columns_by_id = {col['field_id']: col for col in self.columns}
+        self.columns_by_name = {col['name']: col for col in self.columns}
+
+    @classmethod
+    def for_model(cls, model_id):
+        projection = ModelProjection.objects.get_active_projection(model_id)
+        if not projection:
+            return None
+        return cls(projection)
+
+    @property
+    def objects(self):
+        return self.model_class._default_manager
+
+    def has_field(self, field_id) -> bool:
+        return str(field_id) in self.columns_by_id
+
+    def sync_instance_values(self, values_by_instance: dict):
+        """
+        增量同步一批实例的字段值，每批一次查询已有行后以 bulk_update / bulk_create 写入
+        :param values_by_instance: {instance_id: {field_id: ModelFieldMeta.data}}
+        """
+        rows = {}
+        for instance_id, values_by_field_id in values_by_instance.items():
+            columns = {}
+            for field_id, value in values_by_field_id.items():
+                col = self.columns_by_id.get(str(field_id))
+                if col:
+                    columns[get_column_name(col['field_id'])] = to_column_value(col['type'], value)
+            if columns:
+                rows[uuid.UUID(str(instance_id))] = columns
+        if not rows:
+            return
+
+        now = timezone.now()
+        instance_ids = list(rows)
+        for offset in range(0, len(instance_ids), PROJECTION_BATCH_SIZE):
+            chunk = instance_ids[offset:offset + PROJECTION_BATCH_SIZE]
+            existing = {row.instance_id: row for row in self.objects.filter(instance_id__in=chunk)}
+            to_update = []
+            to_create = []
+            update_columns = {'update_time'}
+            for instance_id in chunk:
+                columns = rows[instance_id]
+                row = existing.get(instance_id)
+                if row is None:
+                    to_create.append(self.model_class(instance_id=instance_id, update_time=now, **columns))
+                    continue
+                for column, value in columns.items():
+                    setattr(row, column, value)
+                row.update_time = now
+                update_columns.update(columns)
+                to_update.append(row)
+            if to_update:
+                self.objects.bulk_update(to_update, sorted(update_columns))
+            if to_create:
+                self.objects.bulk_create(to_create)
+
+    def delete_instances(self, instance_ids):
+        self.objects.filter(instance_id__in=list(instance_ids)).delete()
+
+    def get_rows(self, instance_ids_qs, field_names=None) -> dict:
+        """
+        批量读取实例的字段值
+        :return: {instance_id: {field_name: value}}
+        """
+        cols = [col for col in self.columns if not field_names or col['name'] in field_names]
+        column_names = [get_column_name(col['field_id']) for col in cols]
+        rows = {}
+        queryset = self.objects.filter(instance_id__in=instance_ids_qs).values_list('instance_id', *column_names)
+        for row in queryset.iterator(chunk_size=PROJECTION_BATCH_SIZE):
+            rows[str(row[0])] = {col['name']: value for col, value in zip(cols, row[1:])}
+        return rows
+
+    def _compile_expression(self, col, expression):
+        """
+        将单个过滤表达式编译为宽表上的 Q 对象
+        返回 (Q, is_null_check)，无法编译时返回 None
+        """
+        column = get_column_name(col['field_id'])
+        field_type = col['type']
+        op = expression.op
+
+        if op == 'null':
+            return Q(**{f'{column}__isnull': False}), True
+
+        if op in ('like', 'regex'):
+            # 字符列按 PROJECTION_CHAR_LENGTH 截断存储，超出部分的匹配会遗漏，只有完整存储的文本列可以直接匹配
+            if field_type not in (FieldType.TEXT, FieldType.JSON):
+                return None
+            lookup = 'icontains' if op == 'like' else 'regex'
+            return Q(**{f'{column}__{lookup}': expression.value}), False
+
+        if expression.is_range and field_type not in (FieldType.INTEGER, FieldType.FLOAT):
+            # 日期列以原始字符串存储，无法直接比较，回退到 ModelFieldMeta 影子列
+            return None
+        if op == 'between' and len(expression.values) != 2:
+            return None
+
+        values = []
+        for raw in expression.values:
+            if field_type in CHAR_COLUMN_TYPES and len(raw) > PROJECTION_CHAR_LENGTH:
+                return None
+            # 比较条件按浮点数解析，整数列上的小数边界由 Django 的整数比较查找负责取整
+            converted = to_column_value(FieldType.FLOAT if expression.is_range else field_type, raw)
+            if converted is None and raw != '':
+                return None
+            values.append(converted)
+
+        if op == 'in':
+            return Q(**{f'{column}__in': values}), False
+        if op == 'between':
+            if None in values:
+                return None
+            return Q(**{f'{column}__range': tuple(values)}), False
+        if expression.is_range:
+            if values[0] is None:
+                return None
+            return Q(**{f'{column}__{op}': values[0]}), False
+        return Q(**{column: values[0]}), False
+
+    def filter_instances(self, queryset, expressions: dict):
+        """
+        在宽表上应用动态字段过滤
+        :param expressions: {field_name: FilterExpression}
+        :return: 过滤后的实例查询集，存在无法编译的条件时返回 None 由调用方回退
+        """
+        row_query = Q()
+        null_checks = []
+        for field_name, expression in expressions.items():
+            col = self.columns_by_name.get(field_name)
+            if not col:
+                return None
+            compiled = self._compile_expression(col, expression)
+            if compiled is None:
+                return None
+            q, is_null_check = compiled
+            if is_null_check:
+                # 无宽表行的实例同样视为空值
+                null_checks.append((q, expression.negated))
+            elif expression.negated:
+                row_query &= ~q
+            else:
+                row_query &= q
+
+        if row_query:
+            queryset = queryset.filter(id__in=self.objects.filter(row_query).values('instance_id'))
+        for q, negated in null_checks:
+            not_null_ids = self.objects.filter(q).values('instance_id')
+            if negated:
+                queryset = queryset.filter(id__in=not_null_ids)
+            else:
+                queryset = queryset.exclude(id__in=not_null_ids)
+        return queryset
+
+
+def get_projection_table(model_id):
+    """获取模型可用的宽表投影，未启用时返回 None"""
+    try:
+        return ProjectionTable.for_model(model_id)
+    except Exception:
+        logger.exception(f"Failed to load projection for model {model_id}")
+        return None
+
+
+def _run_schema_operation(operation):
+    """
+    执行建表/删表操作
+    SQLite 在事务中无法进入 schema_editor 上下文（外键检查无法关闭），
+    而宽表不包含外键，此时直接执行生成的 SQL。
+    """
+    if connection.vendor == 'sqlite' and connection.in_atomic_block:
+        editor = connection.schema_editor(atomic=False)
+        editor.deferred_sql = []
+        operation(editor)
+        for sql in editor.deferred_sql:
+            editor.execute(sql)
+        return
+    with connection.schema_editor() as editor:
+        operation(editor)
+
+
+def _table_exists(table_name) -> bool:
+    with connection.cursor() as cursor:
+        return table_name in connection.introspection.table_names(cursor)
+
+
+def drop_projection_table(table_name: str, columns: list):
+    """删除宽表物理表（不处理投影配置）"""
+    model_class = get_projection_class(table_name, columns or [])
+    if _table_exists(table_name):
+        _run_schema_operation(lambda editor: editor.delete_model(model_class))
+
+
+def drop_projection(model: Models) -> bool:
+    """删除模型的宽表及投影配置"""
+    projection = ModelProjection.objects.filter(model=model).first()
+    if not projection:
+        return False
+    drop_projection_table(projection.table_name, projection.columns)
+    projection.delete()
+    logger.info(f"Dropped projection {projection.table_name} for model {model.name}")
+    return True
+
+
+def _build_rows(model_class, columns_by_id, instance_ids) -> list:
+    """按 ModelFieldMeta 生成一批实例的宽表行"""
+    rows = {inst_id: {} for inst_id in instance_ids}
+    meta_values = ModelFieldMeta.objects.filter(
+        model_instance_id__in=instance_ids
+    ).values_list('model_instance_id', 'model_fields_id', 'data')
+    for inst_id, field_id, data in meta_values:
+        col = columns_by_id.get(str(field_id))
+        if col:
+            rows[inst_id][get_column_name(col['field_id'])] = to_column_value(col['type'], data)
+    return [model_class(instance_id=inst_id, **values) for inst_id, values in rows.items()]
+
+
+def _catch_up(model: Models, model_class, columns_by_id, since) -> int:
+    """
+    重新回填 since 之后新建、实例或字段值有更新的实例，并删除已删除实例的行
+    :return: 重新回填的实例数量
+    """
+    instances = ModelInstance.objects.filter(model=model)
+    changed_ids = list(instances.filter(
+        Q(update_time__gte=since) | Q(id__in=ModelFieldMeta.objects.filter(
+            model=model, update_time__gte=since
+        ).values('model_instance_id'))
+    ).values_list('id', flat=True))
+    manager = model_class._default_manager
+    for start in range(0, len(changed_ids), PROJECTION_BATCH_SIZE):
+        chunk_ids = changed_ids[start:start + PROJECTION_BATCH_SIZE]
+        manager.filter(instance_id__in=chunk_ids).delete()
+        manager.bulk_create(_build_rows(model_class, columns_by_id, chunk_ids), batch_size=PROJECTION_BATCH_SIZE)
+    manager.exclude(instance_id__in=instances.values('id')).delete()
+    if changed_ids:
+        logger.info(f"Caught up {len(changed_ids)} instances changed during projection rebuild of {model.name}")
+    return len(changed_ids)
+
+
+def rebuild_projection(model: Models, username: str = 'system') -> int:
+    """
+    按当前字段定义重建模型的宽表并全量回填
+    回填期间的写入不会同步到宽表，恢复可用时按更新时间补齐回填开始后变更的实例
+    :return: 回填的实例数量
+    """
+    fields = list(ModelFields.objects.filter(model=model).order_by('order'))
+    columns = [
+        {'field_id': str(field.id), 'name': field.name, 'type': field.type}
+        for field in fields
+    ]
+    table_name = get_table_name(model.id)
+
+    started_at = timezone.now()
+    projection = ModelProjection.objects.filter(model=model).first()
+    if projection:
+        # 重建期间读取回退到 ModelFieldMeta
+        ModelProjection.objects.filter(pk=projection.pk).update(stale=True)
+        drop_projection_table(projection.table_name, projection.columns)
+
+    drop_projection_table(table_name, columns)
+    model_class = get_projection_class(table_name, columns)
+    _run_schema_operation(lambda editor: editor.create_model(model_class))
+
+    columns_by_id = {col['field_id']: col for col in columns}
+    instance_ids = list(
+        ModelInstance.objects.filter(model=model).order_by('id').values_list('id', flat=True)
+    )
+    total = 0
+    for start in range(0, len(instance_ids), PROJECTION_BATCH_SIZE):
+        chunk_ids = instance_ids[start:start + PROJECTION_BATCH_SIZE]
+        model_class._default_manager.bulk_create(
+            _build_rows(model_class, columns_by_id, chunk_ids), batch_size=PROJECTION_BATCH_SIZE
+        )
+        total += len(chunk_ids)
+
+    with transaction.atomic():
+        # 回填期间投影处于 stale 状态，写入不会同步到宽表，恢复可用前补齐回填开始后变更的实例
+        _catch_up(model, model_class, columns_by_id, started_at)
+        ModelProjection.objects.update_or_create(
+            model=model,
+            defaults={
+                'table_name': table_name,
+                'columns': columns,
+                'enabled': True,
+                'stale': False,
+                'build_time': timezone.now(),
+                'update_user': username,
+                'create_user': username,
+            }
+        )
+
+    logger.info(f"Rebuilt projection {table_name} for model {model.name}: {total} instances, {len(columns)} columns")
+    return total
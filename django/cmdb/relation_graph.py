@@ -0,0 +1,366 @@
+"""
+CMDB关系拓扑索引模块
+在进程内维护 Relations 的邻接索引，拓扑查询（blast / path / neighbor）在内存中完成遍历，
+只有最终结果中的关系才从数据库读取。
+
+- 实例、关系定义、关系均映射为整数编号，每个关系定义各自维护正向/反向 CSR 数组
+  （只保存存在出边/入边的行，行号有序，按二分查找定位），边编号指向边表
+- 构建后的变更记入增量（新增边的邻接表 + 已删除边集合），增量超过阈值时重建
+- 变更在事务提交后写入缓存中的变更日志（递增序号 + 按序号存放的变更列表），
+  各进程查询前追读自身序号之后的日志；日志缺失或落后过多时整体重建
+- 索引在进程内首次使用时构建，任何时候都可以重建；变更日志写入失败时更换缓存中的索引纪元，
+  各进程发现纪元变化后重建，缓存不可用导致更换失败时在下次查询前重试
+"""
+
+import logging
+import threading
+import uuid
+
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Relations
+
+logger = logging.getLogger(__name__)
+
+RELATION_GRAPH_SEQ_KEY = 'relation_graph_seq'
+RELATION_GRAPH_EPOCH_KEY = 'relation_graph_epoch'
+RELATION_GRAPH_CHANGE_KEY = 'relation_graph_change_{seq}'
+# 变更日志保留时间，进程落后超过该时间需要重建
+RELATION_GRAPH_CHANGE_TIMEOUT = 60 * 60
+# 单次追读的最大日志条数，超过时直接重建
+RELATION_GRAPH_MAX_TAIL = 1000
+# 增量边数超过基线边数的该比例（且不少于 REBUILD_MIN_DELTA）时重建 CSR
+RELATION_GRAPH_REBUILD_RATIO = 0.2
+RELATION_GRAPH_REBUILD_MIN_DELTA = 10000
+RELATION_GRAPH_BUILD_BATCH_SIZE = 5000
+
+DIRECTIONS = ('forward', 'reverse', 'both')
+
+
+def relation_graph_enabled() -> bool:
+    return getattr(settings, 'CMDB_RELATION_GRAPH_INDEX', True)
+
+
+class _CSR:
+    """单个关系定义单方向的压缩邻接数组"""
+
+    __slots__ = ('rows', 'offsets', 'edges')
+
+    def __init__(self, pairs):
+        # pairs: [(节点编号, 边编号)]，按节点编号排序
+        self.rows = array('i')
+        self.offsets = array('i')
+        self.edges = array('i')
+        for node, edge in pairs:
+            if not self.rows or self.rows[-1] != node:
+                self.rows.append(node)
+                self.offsets.append(len(self.edges))
+            self.edges.append(edge)
+        self.offsets.append(len(self.edges))
+
+    def get(self, node):
+        i = bisect_left(self.rows, node)
+        if i < len(self.rows) and self.rows[i] == node:
+            return self.edges[self.offsets[i]:self.offsets[i + 1]]
+        return ()
+
+
+class RelationGraphIndex:
+    """
+    关系邻接索引
+    对外的节点、关系及关系定义均使用字符串ID
+    """
+
+    def __init__(self):
+        self.seq = 0
+        self.epoch = None
+        self.node_index = {}
+        self.node_ids = []
+        self.relation_index = {}
+        self.relation_ids = []
+        self.edge_index = {}
+        self.edge_ids = []
+        self.edge_source = array('i')
+        self.edge_target = array('i')
+        self.edge_relation = array('i')
+        self.base_edge_count = 0
+        self.forward = {}
+        self.reverse = {}
+        # 构建后的增量
+        self.removed = set()
+        self.added_out = defaultdict(list)
+        self.added_in = defaultdict(list)
+
+    # ---- 编号 ----
+
+    def _node(self, node_id) -> int:
+        node_id = str(node_id)
+        index = self.node_index.get(node_id)
+        if index is None:
+            index = self.node_index[node_id] = len(self.node_ids)
+            self.node_ids.append(node_id)
+        return index
+
+    def _relation(self, relation_id) -> int:
+        relation_id = str(relation_id)
+        index = self.relation_index.get(relation_id)
+        if index is None:
+            index = self.relation_index[relation_id] = len(self.relation_ids)
+            self.relation_ids.append(relation_id)
+        return index
+
+    def _append_edge(self, edge_id, source_id, target_id, relation_id) -> int:
+        edge = len(self.edge_ids)
+        self.edge_ids.append(str(edge_id))
+        self.edge_index[str(edge_id)] = edge
+        self.edge_source.append(self._node(source_id))
+        self.edge_target.append(self._node(target_id))
+        self.edge_relation.append(self._relation(relation_id))
+        return edge
+
+    # ---- 构建与增量 ----
+
+    @classmethod
+    def build(cls, seq: int = 0, epoch=None) -> 'RelationGraphIndex':
+        index = cls()
+        index.seq = seq
+        index.epoch = epoch
+        rows = Relations.objects.values_list(
+            'id', 'source_instance_id', 'target_instance_id', 'relation_id'
+        ).order_by().iterator(chunk_size=RELATION_GRAPH_BUILD_BATCH_SIZE)
+        for edge_id, source_id, target_id, relation_id in rows:
+            index._append_edge(edge_id, source_id, target_id, relation_id)
+        index._compact()
+        logger.info(f'Built relation graph index: {len(index.node_ids)} nodes, {len(index.edge_ids)} edges')
+        return index
+
+    def _compact(self):
+        """以当前有效边重建 CSR，清空增量"""
+        if self.removed:
+            live = [edge for edge in range(len(self.edge_ids)) if edge not in self.removed]
+            edge_ids = [self.edge_ids[edge] for edge in live]
+            self.edge_source = array('i', (self.edge_source[edge] for edge in live))
+            self.edge_target = array('i', (self.edge_target[edge] for edge in live))
+            self.edge_relation = array('i', (self.edge_relation[edge] for edge in live))
+            self.edge_ids = edge_ids
+            self.edge_index = {edge_id: edge for edge, edge_id in enumerate(edge_ids)}
+
+        out_pairs = defaultdict(list)
+        in_pairs = defaultdict(list)
+        for edge in range(len(self.edge_ids)):
+            relation = self.edge_relation[edge]
+            out_pairs[relation].append((self.edge_source[edge], edge))
+            in_pairs[relation].append((self.edge_target[edge], edge))
+        self.forward = {relation: _CSR(sorted(pairs)) for relation, pairs in out_pairs.items()}
+        self.reverse = {relation: _CSR(sorted(pairs)) for relation, pairs in in_pairs.items()}
+
+        self.base_edge_count = len(self.edge_ids)
+        self.removed = set()
+        self.added_out = defaultdict(list)
+        self.added_in = defaultdict(list)
+
+    def _remove(self, edge_id):
+        edge = self.edge_index.pop(str(edge_id), None)
+        if edge is not None:
+            self.removed.add(edge)
+
+    def apply(self, changes):
+        """
+        应用变更日志
+        ('upsert', 关系ID, 源实例ID, 目标实例ID, 关系定义ID) / ('remove', 关系ID)，重复应用结果不变
+        """
+        for change in changes:
+            self._remove(change[1])
+            if change[0] != 'upsert':
+                continue
+            _, edge_id, source_id, target_id, relation_id = change
+            edge = self._append_edge(edge_id, source_id, target_id, relation_id)
+            self.added_out[self.edge_source[edge]].append(edge)
+            self.added_in[self.edge_target[edge]].append(edge)
+
+        delta = len(self.edge_ids) - self.base_edge_count + len(self.removed)
+        if delta > max(RELATION_GRAPH_REBUILD_MIN_DELTA, self.base_edge_count * RELATION_GRAPH_REBUILD_RATIO):
+            self._compact()
+
+    # ---- 遍历 ----
+
+    def _incident(self, node, direction, relations=None):
+        """节点在指定方向上的有效边编号"""
+        sources = []
+        if direction in ('forward', 'both'):
+            sources.append((self.forward, self.added_out))
+        if direction in ('reverse', 'both'):
+            sources.append((self.reverse, self.added_in))
+
+        for csr_map, added in sources:
+            for relation, csr in csr_map.items():
+                if relations is None or relation in relations:
+                    for edge in csr.get(node):
+                        if edge not in self.removed:
+                            yield edge
+            for edge in added.get(node, ()):
+                if edge not in self.removed and (relations is None or self.edge_relation[edge] in relations):
+                    yield edge
+
+    def _relation_filter(self, relation_ids):
+        if relation_ids is None:
+            return None
+        return {self.relation_index[str(rid)] for rid in relation_ids if str(rid) in self.relation_index}
+
+    def _expand(self, start_ids, depth, direction, relation_ids=None):
+        """
+        逐层展开：每层收集当前层节点在指定方向上的所有边，边的另一端未访问过的节点进入下一层
+        返回 (关系ID集合, 节点ID集合)
+        """
+        relations = self._relation_filter(relation_ids)
+        node_ids = {str(node_id) for node_id in start_ids}
+        visited = {self.node_index[node_id] for node_id in node_ids if node_id in self.node_index}
+        frontier = set(visited)
+        edges = set()
+
+        for _ in range(depth):
+            if not frontier:
+                break
+            next_frontier = set()
+            for node in frontier:
+                for edge in self._incident(node, direction, relations):
+                    edges.add(edge)
+                    for other in (self.edge_source[edge], self.edge_target[edge]):
+                        if other not in visited:
+                            next_frontier.add(other)
+            visited.update(next_frontier)
+            frontier = next_frontier
+
+        node_ids.update(self.node_ids[node] for node in visited)
+        return {self.edge_ids[edge] for edge in edges}, node_ids
+
+    def blast(self, start_ids, depth, direction='both'):
+        """影响范围：从起始节点按方向展开 depth 层"""
+        return self._expand(start_ids, depth, direction)
+
+    def path(self, start_ids, end_ids, depth):
+        """路径：从起止节点同时双向展开 depth + 1 层"""
+        return self._expand(list(start_ids) + list(end_ids), depth + 1, 'both')
+
+    def neighbor(self, start_ids, direction='both'):
+        """邻居：起始节点的直接关系"""
+        return self._expand(start_ids, 1, direction)
+
+    def successors(self, node_id, relation_ids=None) -> set:
+        """节点的直接后继实例ID"""
+        node = self.node_index.get(str(node_id))
+        if node is None:
+            return set()
+        relations = self._relation_filter(relation_ids)
+        return {self.node_ids[self.edge_target[edge]] for edge in self._incident(node, 'forward', relations)}
+
+
+# ---- 变更日志 ----
+
+def publish_relation_changes(changes):
+    """写入变更日志，各进程在下次查询前追读"""
+    changes = list(changes)
+    if not changes:
+        return
+    try:
+        cache.add(RELATION_GRAPH_SEQ_KEY, 0, timeout=None)
+        seq = cache.incr(RELATION_GRAPH_SEQ_KEY)
+        cache.set(RELATION_GRAPH_CHANGE_KEY.format(seq=seq), changes, RELATION_GRAPH_CHANGE_TIMEOUT)
+    except Exception as e:
+        logger.error(f'Failed to publish relation graph changes, invalidating the index: {e}')
+        invalidate_relation_graph()
+
+
+def publish_relation_changes_on_commit(changes):
+    changes = list(changes)
+    transaction.on_commit(lambda: publish_relation_changes(changes))
+
+
+def relation_upsert(relation) -> tuple:
+    return ('upsert', str(relation.id), str(relation.source_instance_id),
+            str(relation.target_instance_id), str(relation.relation_id))
+
+
+def relation_remove(relation_id) -> tuple:
+    return ('remove', str(relation_id))
+
+
+_graph = None
+_graph_lock = threading.RLock()
+# 索引纪元更换失败，需在下次查询前重试
+_invalidation_pending = False
+
+
+def _current_state() -> tuple:
+    """缓存中的 (变更日志序号, 索引纪元)"""
+    values = cache.get_many([RELATION_GRAPH_SEQ_KEY, RELATION_GRAPH_EPOCH_KEY])
+    return values.get(RELATION_GRAPH_SEQ_KEY) or 0, values.get(RELATION_GRAPH_EPOCH_KEY)
+
+
+def invalidate_relation_graph():
+    """更换索引纪元，使所有进程的索引在下次查询时重建"""
+    global _invalidation_pending
+    reset_relation_graph()
+    try:
+        cache.set(RELATION_GRAPH_EPOCH_KEY, uuid.uuid4().hex, timeout=None)
+        _invalidation_pending = False
+    except Exception as e:
+        _invalidation_pending = True
+        logger.error(f'Failed to invalidate relation graph index, will retry before the next query: {e}')
+
+
+def _sync(index: RelationGraphIndex, seq: int) -> bool:
+    """追读变更日志，返回 False 表示需要重建"""
+    if seq == index.seq:
+        return True
+    if seq < index.seq or seq - index.seq > RELATION_GRAPH_MAX_TAIL:
+        return False
+    keys = [RELATION_GRAPH_CHANGE_KEY.format(seq=s) for s in range(index.seq + 1, seq + 1)]
+    entries = cache.get_many(keys)
+    if len(entries) != len(keys):
+        return False
+    for key in keys:
+        index.apply(entries[key])
+    index.seq = seq
+    return True
+
+
+class _GraphSession:
+    def __enter__(self):
+        global _graph
+        _graph_lock.acquire()
+        try:
+            if _invalidation_pending:
+                invalidate_relation_graph()
+            seq, epoch = _current_state()
+            if _graph is None or _graph.epoch != epoch or not _sync(_graph, seq):
+                _graph = RelationGraphIndex.build(seq, epoch)
+            return _graph
+        except Exception:
+            _graph_lock.release()
+            raise
+
+    def __exit__(self, exc_type, exc, tb):
+        _graph_lock.release()
+
+
+def relation_graph() -> _GraphSession:
+    """
+    获取与变更日志同步后的进程内索引，遍历期间持有锁：
+        with relation_graph() as graph:
+            relation_ids, node_ids = graph.blast(...)
+    """
+    return _GraphSession()
+
+
+def reset_relation_graph():
+    """丢弃进程内索引，下次使用时重建"""
+    global _graph
+    with _graph_lock:
+        _graph = None
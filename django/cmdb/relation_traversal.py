@@ -0,0 +1,159 @@
+"""
+CMDB关系遍历模块（数据库端）
+将拓扑展开（blast / path / neighbor）与环检测表达为单条 WITH RECURSIVE 查询，
+取代逐层、逐节点的 Python BFS 查询。
+
+- 支持：PostgreSQL、SQLite、MySQL 8.0+、MariaDB 10.2+，其余数据库回退到 Python BFS
+- 展开语义与逐层 BFS 一致：walk 记录每个节点的最短层数，层数小于 depth 的节点在指定方向上的关系全部返回
+- UNION 去重保证存在环时遍历终止；MySQL 通过 SET_VAR 提示放宽 cte_max_recursion_depth，深链的环检测不会报错
+"""
+
+import logging
+
+from django.conf import settings
+from django.db import connections, DEFAULT_DB_ALIAS
+
+from .models import Relations
+
+logger = logging.getLogger(__name__)
+
+# MySQL 递归 CTE 允许的最大递归次数
+MYSQL_CTE_MAX_RECURSION_DEPTH = 100000
+
+
+def supports_recursive_cte(using: str = DEFAULT_DB_ALIAS) -> bool:
+    """数据库是否支持递归 CTE，可通过 CMDB_RELATION_CTE = False 强制使用 Python BFS"""
+    if not getattr(settings, 'CMDB_RELATION_CTE', True):
+        return False
+    connection = connections[using]
+    if connection.vendor in ('postgresql', 'sqlite'):
+        return True
+    if connection.vendor == 'mysql':
+        if connection.mysql_is_mariadb:
+            return connection.mysql_version >= (10, 2)
+        return connection.mysql_version >= (8, 0)
+    return False
+
+
+class RelationCteTraversal:
+    """基于递归 CTE 的关系遍历"""
+
+    def __init__(self, using: str = DEFAULT_DB_ALIAS):
+        self.using = using
+        self.connection = connections[using]
+        qn = self.connection.ops.quote_name
+        opts = Relations._meta
+        self.table = qn(opts.db_table)
+        self.id_col = qn(opts.pk.column)
+        self.source_col = qn(opts.get_field('source_instance').column)
+        self.target_col = qn(opts.get_field('target_instance').column)
+        self.relation_col = qn(opts.get_field('relation').column)
+        self.node_field = opts.get_field('source_instance').target_field
+        self.node_type = self.node_field.db_type(self.connection)
+
+    def _node_param(self, node_id):
+        return self.node_field.get_db_prep_value(self.node_field.to_python(node_id), self.connection)
+
+    def _hint(self) -> str:
+        if self.connection.vendor == 'mysql' and not self.connection.mysql_is_mariadb:
+            return f'/*+ SET_VAR(cte_max_recursion_depth = {MYSQL_CTE_MAX_RECURSION_DEPTH}) */ '
+        return ''
+
+    def _seed(self, node_ids, with_depth: bool):
+        depth = ', 0' if with_depth else ''
+        sql = ' UNION '.join(f'SELECT CAST(%s AS {self.node_type}){depth}' for _ in node_ids)
+        return sql, [self._node_param(node_id) for node_id in node_ids]
+
+    def _relation_filter(self, relation_ids, alias='r'):
+        if not relation_ids:
+            return '', []
+        placeholders = ', '.join(['%s'] * len(relation_ids))
+        field = Relations._meta.get_field('relation').target_field
+        params = [field.get_db_prep_value(field.to_python(rid), self.connection) for rid in relation_ids]
+        return f' AND {alias}.{self.relation_col} IN ({placeholders})', params
+
+    def _walk_step(self, direction: str) -> tuple:
+        """递归部分的连接条件及下一节点表达式"""
+        source, target = f'r.{self.source_col}', f'r.{self.target_col}'
+        if direction == 'forward':
+            return f'{source} = w.node_id', target
+        if direction == 'reverse':
+            return f'{target} = w.node_id', source
+        return (
+            f'({source} = w.node_id OR {target} = w.node_id)',
+            f'CASE WHEN {source} = w.node_id THEN {target} ELSE {source} END',
+        )
+
+    def edge_ids_sql(self, start_ids, depth: int, direction: str = 'both', relation_ids=None) -> tuple:
+        """
+        返回从起始节点展开 depth 层所经过关系ID的 SQL 及参数
+        """
+        seed_sql, params = self._seed(start_ids, with_depth=True)
+        join, next_node = self._walk_step(direction)
+        relation_sql, relation_params = self._relation_filter(relation_ids)
+
+        incident = []
+        if direction in ('forward', 'both'):
+            incident.append(f'e.{self.source_col} IN (SELECT node_id FROM walk WHERE depth < %s)')
+        if direction in ('reverse', 'both'):
+            incident.append(f'e.{self.target_col} IN (SELECT node_id FROM walk WHERE depth < %s)')
+        edge_relation_sql, edge_relation_params = self._relation_filter(relation_ids, alias='e')
+
+        sql = (
+            f'WITH RECURSIVE walk(node_id, depth) AS ('
+            f'{seed_sql} '
+            f'UNION '
+            f'SELECT {next_node}, w.depth + 1 FROM {self.table} r JOIN walk w ON {join} '
+            f'WHERE w.depth < %s{relation_sql}'
+            f') '
+            f'SELECT {self._hint()}e.{self.id_col} FROM {self.table} e '
+            f'WHERE ({" OR ".join(incident)}){edge_relation_sql}'
+        )
+        params = (
+            params + [depth - 1] + relation_params
+            + [depth] * len(incident) + edge_relation_params
+        )
+        return sql, params
+
+    def topology_edges(self, start_ids, depth: int, direction: str = 'both', relation_ids=None):
+        """
+        一次查询取得展开范围内的关系，返回 (关系列表, 节点ID集合)
+        """
+        start_ids = [str(node_id) for node_id in start_ids]
+        if not start_ids or depth < 1:
+            return [], set(start_ids)
+
+        sql, params = self.edge_ids_sql(start_ids, depth, direction, relation_ids)
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            edge_ids = [row[0] for row in cursor.fetchall()]
+
+        relations = list(
+            Relations.objects.using(self.using).filter(id__in=edge_ids)
+            .select_related('source_instance', 'target_instance', 'relation')
+        ) if edge_ids else []
+        node_ids = set(start_ids)
+        for rel in relations:
+            node_ids.add(str(rel.source_instance_id))
+            node_ids.add(str(rel.target_instance_id))
+        return relations, node_ids
+
+    def is_reachable(self, source_id, target_id, relation_ids=None) -> bool:
+        """沿关系方向是否存在 source -> target 的路径（一次查询）"""
+        if str(source_id) == str(target_id):
+            return True
+        seed_sql, params = self._seed([source_id], with_depth=False)
+        relation_sql, relation_params = self._relation_filter(relation_ids)
+        sql = (
+            f'WITH RECURSIVE reach(node_id) AS ('
+            f'{seed_sql} '
+            f'UNION '
+            f'SELECT r.{self.target_col} FROM {self.table} r JOIN reach ON r.{self.source_col} = reach.node_id'
+            f'{" WHERE 1 = 1" + relation_sql if relation_sql else ""}'
+            f') '
+            f'SELECT {self._hint()}1 FROM reach WHERE node_id = %s LIMIT 1'
+        )
+        params = params + relation_params + [self._node_param(target_id)]
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchone() is not None
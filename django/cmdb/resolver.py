@@ -97,3 +97,18 @@ def resolve_model(value):
         }
         for model in models
     ]
+
+
+def mask_dynamic_value(value):
+    """
+    审计展示值脱敏：resolve_dynamic_value 解析出的密码值替换为掩码，其他值原样返回
+    """
+    if not isinstance(value, str) or 'password' not in value:
+        return value
+    try:
+        parsed = json.loads(value)
+    except ValueError:
+        return value
+    if isinstance(parsed, dict) and set(parsed) == {'password'}:
+        return json.dumps({'password': '******'})
+    return value
@@ -10,6 +10,7 @@ from .constants import FieldType
 from .utils import password_handler
 from .models import ModelFields, ModelFieldMeta
 from .serializers import ModelInstanceSerializer
+from .services import ModelInstanceService
 
 logger = logging.getLogger(__name__)
 
@@ -65,3 +66,13 @@ def restore_model_instance(instance, snapshot, field_details=None, request_user=
 
     ser.is_valid(raise_exception=True)
     ser.save(update_user=request_user)
+
+
+def restore_model_instances(instances, logs_by_object, request_user=None):
+    """
+    批量恢复模型实例，调用方负责锁定实例并开启事务
+    :param instances: {object_id: ModelInstance}
+    :param logs_by_object: {object_id: [AuditLog]}，按时间升序
+    :return: {object_id: 失败原因}
+    """
+    return ModelInstanceService.bulk_restore_instances(instances, logs_by_object, username=request_user)
@@ -0,0 +1,117 @@
+"""
+CMDB模型定义缓存模块
+模型字段、校验规则、唯一约束、实例名称模板等定义很少变更，但每次实例操作都会读取。
+定义缓存在进程内存中，以缓存（Redis）中单调递增的定义版本号判断是否失效，
+各进程每个请求/任务只需读取一次版本号，而不是逐项查询数据库或 Redis。
+
+- 定义的保存/删除信号（cmdb/signals.py）立即递增版本号，事务提交后再递增一次，
+  其他进程在提交前按旧数据加载的结果同样失效
+- 版本号变化时清空整个进程缓存
+- 当前事务修改过定义时，事务结束前本进程不读写进程缓存，只在请求级缓存中复用，
+  事务回滚后不会残留未提交的定义
+- 缓存的模型对象在进程内共享，调用方不得修改
+"""
+
+import logging
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from vuedjango.request_cache import invalidate_request_cache, request_cached
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION_KEY = 'cmdb_schema_version'
+
+_lock = threading.Lock()
+_version = None
+_store = {}
+
+
+def _new_version():
+    # 以毫秒时间戳作为初始值，版本号被逐出后重新初始化也不会与旧值重复
+    return int(time.time() * 1000)
+
+
+def get_schema_version() -> int:
+    version = cache.get(SCHEMA_VERSION_KEY)
+    if version is None:
+        cache.add(SCHEMA_VERSION_KEY, _new_version(), timeout=None)
+        version = cache.get(SCHEMA_VERSION_KEY)
+    return version
+
+
+def _incr_schema_version():
+    invalidate_request_cache('schema_version')
+    invalidate_request_cache('schema')
+    if cache.add(SCHEMA_VERSION_KEY, _new_version(), timeout=None):
+        return
+    try:
+        cache.incr(SCHEMA_VERSION_KEY)
+    except ValueError:
+        cache.set(SCHEMA_VERSION_KEY, _new_version(), timeout=None)
+
+
+class _CommitBump:
+    """事务提交后递增版本号，执行前表示当前事务修改过定义"""
+
+    def __init__(self):
+        self.done = False
+
+    def __call__(self):
+        self.done = True
+        _incr_schema_version()
+
+
+def bump_schema_version():
+    """模型定义变更，所有进程的定义缓存失效"""
+    connection = transaction.get_connection()
+    if connection.in_atomic_block:
+        bump = _CommitBump()
+        connection.cmdb_schema_bump = bump
+        transaction.on_commit(bump)
+    _incr_schema_version()
+
+
+def _in_dirty_transaction() -> bool:
+    connection = transaction.get_connection()
+    bump = getattr(connection, 'cmdb_schema_bump', None)
+    if bump is None or bump.done:
+        return False
+    # 事务回滚时 on_commit 回调被丢弃
+    if connection.in_atomic_block and any(func is bump for _, func in connection.run_on_commit):
+        return True
+    connection.cmdb_schema_bump = None
+    return False
+
+
+def schema_cached(namespace: str, key, loader):
+    """读取定义缓存，未命中时调用 loader 并缓存结果"""
+    global _version
+    if _in_dirty_transaction():
+        return request_cached('schema', (namespace, key), loader)
+
+    version = request_cached('schema_version', None, get_schema_version)
+    with _lock:
+        if version != _version:
+            _store.clear()
+            _version = version
+        values = _store.setdefault(namespace, {})
+        if key in values:
+            return values[key]
+
+    value = loader()
+    with _lock:
+        if version == _version:
+            _store.setdefault(namespace, {})[key] = value
+    return value
+
+
+def clear_schema_cache():
+    """清空本进程的定义缓存"""
+    global _version
+    with _lock:
+        _store.clear()
+        _version = None
@@ -1112,6 +1112,8 @@ model_fields_schema = extend_schema_view(
                 "limit_fields": [
                     "page",
                     "page_size",
+                    "cursor",
+                    "count",
                     "model",
                     "instance_name",
                     "model_instance_group",
@@ -1590,10 +1592,13 @@ model_instance_schema = extend_schema_view(
             '- 正则匹配：field1=regex:pattern\n'
             '- 空值查询：field1=null\n'
             '- 取反查询：field1=not:value1\n'
+            '- 比较查询（数值/日期字段）：field1=gt:16、gte:16、lt:2024-01-01、lte:2024-01-01\n'
+            '- 区间查询（闭区间）：field1=between:16,64\n'
 
             '### 示例\n'
             '- 精确匹配主机名：/api/v1/cmdb/model_instance/?hostname=web-01\n'
             '- 模糊查询IP：/api/v1/cmdb/model_instance/?ip=like:192.168\n'
+            '- 查询CPU核数不少于16的实例：/api/v1/cmdb/model_instance/?cpu_cores=gte:16\n'
             '- 查询多个状态：/api/v1/cmdb/model_instance/?status=in:active,pending\n'
             '- 排除某个值：/api/v1/cmdb/model_instance/?owner=not:system\n'
         ),
@@ -1852,6 +1857,14 @@ model_instance_schema = extend_schema_view(
                 required=False,
                 description='导出字段列表, 不填默认导出全部',
             ),
+            OpenApiParameter(
+                name='format',
+                type=OpenApiTypes.STR,
+                enum=['xlsx', 'csv'],
+                location=OpenApiParameter.QUERY,
+                required=False,
+                description='导出格式，默认 xlsx',
+            ),
         ],
         examples=[
             OpenApiExample(
@@ -1870,6 +1883,83 @@ model_instance_schema = extend_schema_view(
             )
         ]
     ),
+    export_data_async=extend_schema(
+        responses={
+            200: OpenApiResponse(
+                response=inline_serializer(
+                    name='ExportTaskResult',
+                    fields={
+                        'cache_key': serializers.CharField(
+                            help_text='任务ID'
+                        )
+                    },
+                ),
+                description='导出任务ID',
+                examples=[
+                    OpenApiExample(
+                        name='导出任务ID示例',
+                        value={
+                            'cache_key': 'export_task_cd61bb7e-26b6-4283-9839-9aa93179ad99'
+                        }
+                    )
+                ]
+            )
+        },
+        summary='异步导出模型实例数据',
+        description='参数同导出模型实例数据，通过 export_status 查询进度，完成后使用 file_key 下载',
+        tags=['实例管理'],
+    ),
+    export_status=extend_schema(
+        responses={
+            200: OpenApiResponse(
+                response=inline_serializer(
+                    name='ExportStatus',
+                    fields={
+                        'status': serializers.ChoiceField(
+                            choices=['pending', 'processing', 'completed', 'failed'],
+                            help_text='处理状态'
+                        ),
+                        'total': serializers.IntegerField(help_text='总记录数'),
+                        'progress': serializers.IntegerField(help_text='当前进度'),
+                        'exported': serializers.IntegerField(help_text='已导出数量'),
+                        'errors': serializers.ListField(
+                            child=serializers.CharField(),
+                            help_text='错误信息'
+                        ),
+                        'file_key': serializers.CharField(
+                            allow_null=True,
+                            help_text='导出文件标识'
+                        )
+                    }
+                ),
+                description='导出任务状态',
+            )
+        },
+        summary='获取异步导出状态',
+        tags=['实例管理'],
+        parameters=[
+            OpenApiParameter(
+                name='cache_key',
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                required=True,
+                description='任务ID',
+            ),
+        ]
+    ),
+    download_export=extend_schema(
+        responses=file_response,
+        summary='下载异步导出文件',
+        tags=['实例管理'],
+        examples=[
+            OpenApiExample(
+                name='下载导出文件示例',
+                value={
+                    'file_key': 'export_file_cd61bb7e-26b6-4283-9839-9aa93179ad99'
+                }
+            )
+        ]
+    ),
     export_template=extend_schema(
         responses=file_response,
         summary='导出模型实例模板',
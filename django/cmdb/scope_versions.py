@@ -0,0 +1,86 @@
+"""
+CMDB数据范围编译结果失效模块
+实例及实例分组的可见ID集合按授权目标的版本号缓存（access.tools），这里根据分组拓扑及
+实例分组关系的变更，只递增受影响的授权目标的版本号，其他数据范围的编译结果保持有效。
+
+- 授权分组的可见范围包含其所有子分组及其中的实例，因此分组或关系变化时递增该分组及其所有祖先的版本
+- 授权实例推导出其所在分组，因此关系变化时同时递增实例的版本
+- 版本号在事务提交后递增；分组的闭包行可能随删除级联清理，删除分组时祖先集合在 pre_delete 阶段记录
+"""
+
+import logging
+
+from django.db import transaction
+
+from access.tools import bump_scope_target_versions
+
+from .models import ModelInstanceGroupClosure
+
+logger = logging.getLogger(__name__)
+
+GROUP_TARGET = 'cmdb.modelinstancegroup'
+INSTANCE_TARGET = 'cmdb.modelinstance'
+
+
+def _ancestor_ids(group_ids) -> set:
+    """分组（含自身）及其所有祖先的ID"""
+    if not group_ids:
+        return set()
+    return {
+        str(group_id) for group_id in
+        ModelInstanceGroupClosure.objects.ancestors_of(group_ids, include_self=True)
+        .values_list('ancestor_id', flat=True)
+    }
+
+
+def groups_changed_on_commit(group_ids=(), instance_ids=(), ancestor_ids=()):
+    """
+    事务提交后递增受影响的授权目标版本
+    :param group_ids: 可见范围发生变化的分组，提交后连同其祖先一起递增
+    :param instance_ids: 所在分组发生变化的实例
+    :param ancestor_ids: 已展开的分组ID（如删除前记录的祖先），直接递增
+    """
+    group_ids = {str(group_id) for group_id in group_ids if group_id}
+    instance_ids = {str(instance_id) for instance_id in instance_ids if instance_id}
+    ancestor_ids = {str(group_id) for group_id in ancestor_ids}
+    if not (group_ids or instance_ids or ancestor_ids):
+        return
+
+    def bump():
+        affected_groups = ancestor_ids | group_ids | _ancestor_ids(group_ids)
+        bump_scope_target_versions(GROUP_TARGET, affected_groups)
+        bump_scope_target_versions(INSTANCE_TARGET, instance_ids)
+        logger.debug(
+            f'Bumped data scope versions for {len(affected_groups)} groups and {len(instance_ids)} instances'
+        )
+
+    transaction.on_commit(bump)
+
+
+def relations_changed(relations):
+    """批量创建或删除关系（bulk_create 不触发信号）后使受影响的编译结果失效"""
+    group_ids, instance_ids = set(), set()
+    for relation in relations:
+        group_ids.add(relation.group_id)
+        instance_ids.add(relation.instance_id)
+    groups_changed_on_commit(group_ids, instance_ids)
+
+
+def group_saved(group, created, update_fields=None):
+    """新建分组或分组移动到其他父分组后，原祖先及新祖先的可见范围发生变化"""
+    if created:
+        # 闭包行在 post_save 之后写入，提交时再展开祖先
+        groups_changed_on_commit([group.pk])
+        return
+    if update_fields is not None and 'parent' not in update_fields:
+        return
+    loaded_state = getattr(group, '_loaded_tree_state', None)
+    if loaded_state is not None and loaded_state[0] == group.parent_id:
+        return
+    # post_save 时闭包表尚未改写，此时读取的是移动前的祖先
+    groups_changed_on_commit([group.pk], ancestor_ids=_ancestor_ids([group.pk]))
+
+
+def group_deleting(group):
+    """删除分组前记录其祖先，闭包行随后会被级联删除"""
+    groups_changed_on_commit(ancestor_ids=_ancestor_ids([group.pk]))
@@ -0,0 +1,436 @@
+"""
+CMDB全局搜索索引模块
+将实例名称及字段值拆分为 n-gram 写入 SearchToken 倒排表，搜索时按 posting list 求交集得到候选文档，
+再读取原值校验，取代对 ModelFieldMeta 的 REGEXP / LIKE / FULLTEXT 扫描，不依赖 MySQL 特性。
+
+- 文档：实例名称（field_id 为空）或单个字段值，token 同时来自存储值与显示值（枚举标签、引用实例名称等）
+- 规范化：NFKC + casefold，从每个位置截取长度不超过 SEARCH_NGRAM_SIZE 的片段，
+  末尾不足长度的片段同样保留，短于 n 的查询按 token 前缀命中
+- token 只是必要条件，候选文档一律按原值校验，区分大小写、正则等语义在校验阶段处理
+- 写入在事务提交后增量同步（ModelFieldMetaWriter.flush、实例/字段值保存、枚举规则变更、引用实例改名），
+  同步失败仅记录日志，任何时候都可以通过 rebuild_search_index 命令重建
+- 已删除字段残留的 token 不会命中（查询按字段范围过滤），重建时清理
+"""
+
+import re
+import uuid
+import logging
+import unicodedata
+
+from collections import defaultdict
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Count, Q
+
+from .constants import FieldType
+from .models import Models, ModelFields, ModelFieldMeta, ModelInstance, SearchToken, ValidationRules
+
+try:
+    # Python 3.11+
+    from re import _parser as sre_parse, _constants as sre_constants
+except ImportError:
+    import sre_parse
+    import sre_constants
+
+logger = logging.getLogger(__name__)
+
+SEARCH_NGRAM_SIZE = 3
+# 单个文档参与索引的最大字符数
+SEARCH_INDEX_MAX_LENGTH = 512
+SEARCH_INDEX_BATCH_SIZE = 2000
+# 求交集时最多使用的 token 数，按 posting list 由短到长选取
+SEARCH_QUERY_MAX_TOKENS = 4
+
+
+def normalize_text(value) -> str:
+    if value is None:
+        return ''
+    return unicodedata.normalize('NFKC', str(value)).casefold()
+
+
+def build_tokens(*texts) -> set:
+    """生成文档的 token 集合"""
+    tokens = set()
+    for text in texts:
+        text = normalize_text(text)[:SEARCH_INDEX_MAX_LENGTH]
+        for start in range(len(text)):
+            tokens.add(text[start:start + SEARCH_NGRAM_SIZE])
+    return tokens
+
+
+def build_query_tokens(text) -> set:
+    """子串查询必须命中的完整 n-gram，查询短于 n 时返回空集合"""
+    text = normalize_text(text)
+    return {text[start:start + SEARCH_NGRAM_SIZE] for start in range(len(text) - SEARCH_NGRAM_SIZE + 1)}
+
+
+def extract_regexp_literals(pattern: str) -> list:
+    """
+    提取正则表达式任意匹配都必须包含的字面量片段
+    只展开顺序结构及分组，分支、重复、字符集等结构会截断片段
+    """
+    try:
+        parsed = sre_parse.parse(pattern)
+    except re.error:
+        return []
+
+    literals = []
+    current = []
+
+    def walk(items):
+        for op, av in items:
+            if op == sre_constants.LITERAL:
+                current.append(chr(av))
+            elif op == sre_constants.AT:
+                # 零宽断言不消耗字符，前后的字面量仍然相邻
+                continue
+            elif op == sre_constants.SUBPATTERN:
+                walk(av[-1])
+            elif current:
+                literals.append(''.join(current))
+                current.clear()
+
+    walk(parsed)
+    if current:
+        literals.append(''.join(current))
+    return literals
+
+
+def get_display_value(field: ModelFields, raw_data, enum_dict: dict = None, ref_names: dict = None) -> str:
+    """字段值的显示值：枚举标签、引用实例名称、布尔值中文"""
+    if raw_data is None or raw_data == '':
+        return ''
+    if field.type == FieldType.ENUM:
+        return (enum_dict or {}).get(raw_data, raw_data)
+    if field.type == FieldType.MODEL_REF:
+        return (ref_names or {}).get(str(raw_data), raw_data)
+    if field.type == FieldType.BOOLEAN:
+        return '是' if str(raw_data).lower() in ('true', '1', 'yes') else '否'
+    return str(raw_data)
+
+
+def load_ref_names(values) -> dict:
+    """批量获取引用字段值对应的实例名称，忽略非法ID"""
+    ids = set()
+    for value in values:
+        try:
+            ids.add(uuid.UUID(str(value)))
+        except (TypeError, ValueError):
+            continue
+    if not ids:
+        return {}
+    return {
+        str(inst_id): name
+        for inst_id, name in ModelInstance.objects.filter(id__in=ids).values_list('id', 'instance_name')
+    }
+
+
+def _delete_tokens(**filters) -> int:
+    # 直接执行 DELETE：审计模块监听了所有模型的 post_delete，经 Collector 删除会逐行加载 token
+    queryset = SearchToken.objects.filter(**filters)
+    return queryset._raw_delete(queryset.db)
+
+
+def _chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class SearchIndex:
+    """
+    搜索索引的增量维护
+    按文档读取数据库中的当前值重新生成 token（先删后写），调用方只需给出受影响的文档
+    """
+
+    def __init__(self):
+        self._enum_dicts = {}
+
+    def _get_enum_dict(self, rule_id):
+        if rule_id not in self._enum_dicts:
+            self._enum_dicts[rule_id] = ValidationRules.get_enum_dict(rule_id)
+        return self._enum_dicts[rule_id]
+
+    def field_tokens(self, field: ModelFields, data, ref_names: dict) -> set:
+        if field.type == FieldType.PASSWORD or data is None or data == '':
+            return set()
+        enum_dict = None
+        if field.type == FieldType.ENUM and field.validation_rule_id:
+            enum_dict = self._get_enum_dict(field.validation_rule_id)
+        display = get_display_value(field, data, enum_dict, ref_names)
+        if field.type == FieldType.MODEL_REF:
+            # 引用字段存储的是实例ID，只索引实例名称
+            return build_tokens(display)
+        return build_tokens(data, display)
+
+    def _build_field_tokens(self, rows) -> list:
+        """
+        :param rows: [(model_id, instance_id, ModelFields, data)]
+        """
+        ref_names = load_ref_names(data for _, _, field, data in rows if field.type == FieldType.MODEL_REF)
+        return [
+            SearchToken(token=token, model_id=model_id, instance_id=instance_id, field_id=field.id)
+            for model_id, instance_id, field, data in rows
+            for token in self.field_tokens(field, data, ref_names)
+        ]
+
+    def index_field_values(self, docs) -> int:
+        """
+        重建字段值文档
+        :param docs: [(instance_id, field_id)]
+        :return: 写入的 token 数
+        """
+        docs = {(str(instance_id), str(field_id)) for instance_id, field_id in docs}
+        if not docs:
+            return 0
+        fields_by_id = {
+            str(f.id): f for f in ModelFields.objects.filter(id__in={field_id for _, field_id in docs})
+        }
+        rows = []
+        if fields_by_id:
+            for model_id, instance_id, field_id, data in ModelFieldMeta.objects.filter(
+                model_instance_id__in={instance_id for instance_id, _ in docs},
+                model_fields_id__in=list(fields_by_id),
+            ).values_list('model_id', 'model_instance_id', 'model_fields_id', 'data'):
+                if (str(instance_id), str(field_id)) in docs:
+                    rows.append((model_id, instance_id, fields_by_id[str(field_id)], data))
+        tokens = self._build_field_tokens(rows)
+
+        instances_by_field = defaultdict(list)
+        for instance_id, field_id in docs:
+            instances_by_field[field_id].append(instance_id)
+        with transaction.atomic():
+            for field_id, instance_ids in instances_by_field.items():
+                _delete_tokens(field_id=field_id, instance_id__in=instance_ids)
+            SearchToken.objects.bulk_create(tokens, batch_size=SEARCH_INDEX_BATCH_SIZE)
+        return len(tokens)
+
+    def index_fields(self, field_ids) -> int:
+        """重建指定字段的全部文档，用于枚举标签变更"""
+        total = 0
+        docs = ModelFieldMeta.objects.filter(
+            model_fields_id__in=list(field_ids)
+        ).values_list('model_instance_id', 'model_fields_id')
+        for chunk in _chunked(docs.iterator(chunk_size=SEARCH_INDEX_BATCH_SIZE), SEARCH_INDEX_BATCH_SIZE):
+            total += self.index_field_values(chunk)
+        return total
+
+    def index_instance_names(self, instance_ids, reindex_references: bool = True) -> int:
+        """
+        重建实例名称文档，名称未变化的实例跳过
+        :param reindex_references: 名称变化时同步引用了这些实例的字段值文档（显示值为实例名称）
+        """
+        instance_ids = {str(instance_id) for instance_id in instance_ids}
+        if not instance_ids:
+            return 0
+        names = {
+            str(instance_id): (model_id, name)
+            for instance_id, model_id, name in ModelInstance.objects.filter(
+                id__in=instance_ids
+            ).values_list('id', 'model_id', 'instance_name')
+        }
+        existing = defaultdict(set)
+        for instance_id, token in SearchToken.objects.filter(
+            instance_id__in=instance_ids, field_id__isnull=True
+        ).values_list('instance_id', 'token'):
+            existing[str(instance_id)].add(token)
+
+        changed = {}
+        tokens = []
+        for instance_id in instance_ids:
+            model_id, name = names.get(instance_id, (None, None))
+            new_tokens = build_tokens(name) if model_id else set()
+            if new_tokens == existing[instance_id]:
+                continue
+            changed[instance_id] = model_id
+            tokens.extend(
+                SearchToken(token=token, model_id=model_id, instance_id=instance_id) for token in new_tokens
+            )
+        if not changed:
+            return 0
+
+        with transaction.atomic():
+            _delete_tokens(field_id__isnull=True, instance_id__in=list(changed))
+            SearchToken.objects.bulk_create(tokens, batch_size=SEARCH_INDEX_BATCH_SIZE)
+
+        renamed = {instance_id: model_id for instance_id, model_id in changed.items() if model_id}
+        if reindex_references and renamed:
+            self._index_references(renamed)
+        return len(tokens)
+
+    def _index_references(self, renamed: dict):
+        """
+        :param renamed: {instance_id: model_id}
+        """
+        ref_field_ids = list(ModelFields.objects.filter(
+            type=FieldType.MODEL_REF, ref_model_id__in=set(renamed.values())
+        ).values_list('id', flat=True))
+        if not ref_field_ids:
+            return
+        docs = ModelFieldMeta.objects.filter(
+            model_fields_id__in=ref_field_ids, data__in=list(renamed)
+        ).values_list('model_instance_id', 'model_fields_id')
+        self.index_field_values(docs)
+
+    def delete_instances(self, instance_ids) -> int:
+        instance_ids = [str(instance_id) for instance_id in instance_ids]
+        if not instance_ids:
+            return 0
+        return _delete_tokens(instance_id__in=instance_ids)
+
+    def rebuild_model(self, model: Models) -> int:
+        """
+        全量重建模型的索引，按实例分批先删后写
+        :return: 重建的实例数量
+        """
+        fields_by_id = {str(f.id): f for f in ModelFields.objects.filter(model=model)}
+        instances = ModelInstance.objects.filter(model=model).order_by('id').values_list('id', 'instance_name')
+        total = 0
+        for chunk in _chunked(instances.iterator(chunk_size=SEARCH_INDEX_BATCH_SIZE), SEARCH_INDEX_BATCH_SIZE):
+            instance_ids = [instance_id for instance_id, _ in chunk]
+            tokens = [
+                SearchToken(token=token, model_id=model.id, instance_id=instance_id)
+                for instance_id, name in chunk
+                for token in build_tokens(name)
+            ]
+            rows = [
+                (model.id, instance_id, fields_by_id[str(field_id)], data)
+                for instance_id, field_id, data in ModelFieldMeta.objects.filter(
+                    model_instance_id__in=instance_ids
+                ).values_list('model_instance_id', 'model_fields_id', 'data')
+                if str(field_id) in fields_by_id
+            ]
+            tokens.extend(self._build_field_tokens(rows))
+            with transaction.atomic():
+                _delete_tokens(instance_id__in=instance_ids)
+                SearchToken.objects.bulk_create(tokens, batch_size=SEARCH_INDEX_BATCH_SIZE)
+            total += len(chunk)
+        logger.info(f"Rebuilt search index for model {model.name}: {total} instances")
+        return total
+
+
+def rebuild_search_index(model: Models) -> int:
+    return SearchIndex().rebuild_model(model)
+
+
+def _on_commit(method_name: str, *args):
+    """事务提交后执行索引同步，同步失败不影响业务写入"""
+    def run():
+        try:
+            getattr(SearchIndex(), method_name)(*args)
+        except Exception:
+            logger.exception(f"Failed to sync search index ({method_name})")
+    transaction.on_commit(run)
+
+
+def sync_field_values_on_commit(docs):
+    """
+    :param docs: [(instance_id, field_id)]
+    """
+    docs = [(str(instance_id), str(field_id)) for instance_id, field_id in docs]
+    if docs:
+        _on_commit('index_field_values', docs)
+
+
+def sync_fields_on_commit(field_ids):
+    field_ids = [str(field_id) for field_id in field_ids]
+    if field_ids:
+        _on_commit('index_fields', field_ids)
+
+
+def sync_instance_names_on_commit(instance_ids):
+    instance_ids = [str(instance_id) for instance_id in instance_ids]
+    if instance_ids:
+        _on_commit('index_instance_names', instance_ids)
+
+
+def delete_instances_on_commit(instance_ids):
+    instance_ids = [str(instance_id) for instance_id in instance_ids]
+    if instance_ids:
+        _on_commit('delete_instances', instance_ids)
+
+
+class SearchQueryPlanner:
+    """
+    基于 posting list 求交集得到候选文档
+    - 查询长度不小于 n：统计各 token 的 posting list 长度，选取最短的若干个按文档分组求交集
+    - 查询短于 n：按 token 前缀匹配
+    - 正则：使用必须出现的字面量片段生成 token，不含足够长的字面量时无法使用索引
+    权限以实例子查询关联（semi-join），不再把可见实例ID展开为 IN 列表
+    """
+
+    def __init__(self, instances_qs, model_ids=None, field_ids=None, include_names: bool = True,
+                 limit: int = 5000):
+        """
+        :param instances_qs: 用户可见的实例查询集
+        :param model_ids: 限定模型，为空表示不限
+        :param field_ids: 参与搜索的字段，为空时只搜索实例名称
+        """
+        self.instances_qs = instances_qs
+        self.model_ids = [str(model_id) for model_id in model_ids] if model_ids is not None else None
+        self.field_ids = [str(field_id) for field_id in field_ids or []]
+        self.include_names = include_names
+        self.limit = limit
+
+    def _tokens_qs(self):
+        queryset = SearchToken.objects.all()
+        if self.model_ids is not None:
+            queryset = queryset.filter(model_id__in=self.model_ids)
+        return queryset
+
+    def _scope(self):
+        doc_filter = Q()
+        if self.field_ids:
+            doc_filter |= Q(field_id__in=self.field_ids)
+        if self.include_names:
+            doc_filter |= Q(field_id__isnull=True)
+        if not doc_filter:
+            return SearchToken.objects.none()
+        return self._tokens_qs().filter(doc_filter, instance_id__in=self.instances_qs.values('id'))
+
+    def _select_tokens(self, tokens: set) -> list:
+        """按 posting list 长度由短到长选取 token"""
+        if len(tokens) <= 1:
+            return list(tokens)
+        frequencies = dict(
+            self._tokens_qs().filter(token__in=tokens).values('token').annotate(
+                frequency=Count('id')
+            ).values_list('token', 'frequency')
+        )
+        return sorted(tokens, key=lambda token: (frequencies.get(token, 0), token))[:SEARCH_QUERY_MAX_TOKENS]
+
+    def _intersect(self, tokens: set) -> list:
+        selected = self._select_tokens(tokens)
+        # 数据库排序规则可能把不同的 token 视为相等，命中数按不少于选取数判断，多出的候选由校验阶段排除
+        rows = self._scope().filter(token__in=selected).values('instance_id', 'field_id').annotate(
+            hits=Count('id')
+        ).filter(hits__gte=len(selected)).values_list('instance_id', 'field_id')
+        return list(rows[:self.limit])
+
+    def _prefix(self, prefix: str) -> list:
+        # token 已规范化为小写，使用 istartswith 以便 MySQL 按排序规则走索引范围扫描（startswith 会生成 LIKE BINARY）
+        rows = self._scope().filter(token__istartswith=prefix).values_list('instance_id', 'field_id').distinct()
+        return list(rows[:self.limit])
+
+    def candidates(self, query: str, regexp: bool = False):
+        """
+        :return: [(instance_id, field_id 或 None)]，索引无法约束候选范围时返回 None
+        """
+        if regexp:
+            tokens = set()
+            for literal in extract_regexp_literals(query):
+                tokens |= build_query_tokens(literal)
+            if not tokens:
+                return None
+            return self._intersect(tokens)
+
+        text = normalize_text(query)
+        if not text:
+            return []
+        if len(text) < SEARCH_NGRAM_SIZE:
+            return self._prefix(text)
+        return self._intersect(build_query_tokens(text))
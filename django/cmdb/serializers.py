@@ -8,7 +8,7 @@ from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
 from rest_framework.exceptions import PermissionDenied, ValidationError
 from django.db import transaction
-from django.db.models import F, Q
+from django.db.models import F, Max, Q
 from django.core.cache import cache
 from types import SimpleNamespace
 from cacheops import invalidate_model, invalidate_obj
@@ -1029,7 +1029,7 @@ class BulkUpdateInstanceFieldsSerializer(serializers.Serializer):
         self._model = model
 
         # 加载用户有权限的字段配置
-        allowed_fields = pm.get_queryset(ModelFields).filter(model=model)
+        allowed_fields = ModelFieldsService.get_permitted_fields(pm, model.id)
         self._field_configs = {f.name: f for f in allowed_fields}
 
         errors = {}
@@ -1110,7 +1110,7 @@ class BulkUpdateInstanceFieldsSerializer(serializers.Serializer):
 
         # 获取模型的唯一约束
         constraints = UniqueConstraint.objects.get_constraints_for_model(model)
-        if not constraints.exists():
+        if not constraints:
             return errors
 
         # 获取约束涉及的字段ID
@@ -1214,11 +1214,10 @@ class ModelInstanceGroupSerializer(serializers.ModelSerializer):
         }
 
     def _get_max_child_depth(self, group):
-        """递归获取最大子分组深度"""
-        children = ModelInstanceGroup.objects.filter(parent=group)
-        if not children:
-            return 0
-        return 1 + max(self._get_max_child_depth(child) for child in children)
+        """获取最大子分组深度"""
+        return ModelInstanceGroupClosure.objects.descendants_of([group.id]).aggregate(
+            max_depth=Max('depth')
+        )['max_depth'] or 0
 
     def _validate_parent_change(self, instance, new_parent):
         """验证父分组变更的合法性"""
@@ -1235,56 +1234,17 @@ class ModelInstanceGroupSerializer(serializers.ModelSerializer):
                     f'Maximum resulting level would be {max_future_level}'
                 })
 
-            # 检查是否会导致循环引用
-            parent = new_parent
-            while parent:
-                if parent == instance:
-                    raise serializers.ValidationError({
-                        'parent': 'Cannot set a group as parent that would create a circular reference'
-                    })
-                parent = parent.parent
+            # 检查是否会导致循环引用：新父分组不能是自身或其后代
+            if ModelInstanceGroupClosure.objects.descendants_of(
+                [instance.id], include_self=True
+            ).filter(descendant_id=new_parent.id).exists():
+                raise serializers.ValidationError({
+                    'parent': 'Cannot set a group as parent that would create a circular reference'
+                })
 
             return new_level
         return 1
 
-    def _get_all_descendants(self, group_id):
-        all_descendants = set()
-        to_process = {group_id}
-
-        while to_process:
-            current_id = to_process.pop()
-            children = set(ModelInstanceGroup.objects.filter(
-                parent_id=current_id
-            ).values_list('id', flat=True))
-
-            new_descendants = children - all_descendants
-            to_process.update(new_descendants)
-            all_descendants.update(children)
-
-        return all_descendants - {group_id}
-
-    def _update_descendants_level(self, group_id, level_diff):
-        """更新所有后代分组的层级"""
-        try:
-            # 获取所有后代分组ID
-            descendant_ids = self._get_all_descendants(group_id)
-
-            # 逐个更新每个后代分组
-            for descendant_id in descendant_ids:
-                descendant = ModelInstanceGroup.objects.get(id=descendant_id)
-                descendant.level += level_diff
-                descendant.save(update_fields=['level'])
-
-            if descendant_ids:
-                logger.info(
-                    f"Updated levels for {len(descendant_ids)} descendants "
-                    f"of group {group_id} by {level_diff}"
-                )
-
-        except Exception as e:
-            logger.error(f"Error updating descendant levels: {str(e)}")
-            raise
-
     def validate(self, attrs):
         """验证分组操作"""
         try:
@@ -1442,16 +1402,11 @@ class ModelInstanceGroupSerializer(serializers.ModelSerializer):
                 if 'parent' in validated_data and validated_data['parent'] != instance.parent:
                     groups_to_update.append(validated_data['parent'])
                     groups_to_update.append(instance.parent)
-                    old_level = instance.level
-                    new_level = self._validate_parent_change(instance, validated_data['parent'])
-                    level_diff = new_level - old_level
+                    self._validate_parent_change(instance, validated_data['parent'])
 
+                    # 子分组的 path 及层级由 ModelInstanceGroup.save 基于闭包表一并改写
                     instance = super().update(instance, validated_data)
 
-                    # 更新所有子分组的层级
-                    if level_diff != 0:
-                        self._update_descendants_level(instance.id, level_diff)
-
                     # ModelInstanceGroup.clear_groups_cache(groups_to_update)
 
                     return instance
@@ -4,12 +4,16 @@ CMDB内部服务模块
 """
 
 import re
+import json
+import uuid
 import logging
 import inspect
 import Levenshtein
 import time
 import networkx as nx
 
+from collections import defaultdict, deque
+from itertools import islice
 from dataclasses import dataclass
 from functools import wraps
 from typing import List
@@ -17,7 +21,9 @@ from django.db import transaction
 from django.db.models import QuerySet
 from rest_framework.exceptions import PermissionDenied, ValidationError
 from django.db import connection
-from django.db.models import Exists, OuterRef
+from django.db.models import Count, Exists, OuterRef, Q
+from django.utils import timezone
+from cacheops import invalidate_obj
 
 from audit.context import audit_context
 from mapi.models import UserInfo
@@ -25,17 +31,37 @@ from mapi.system_user import SYSTEM_USER
 from access.manager import PermissionManager
 from access.tools import has_password_permission
 from audit.snapshots import capture_audit_snapshots
+from vuedjango.request_cache import invalidate_request_cache, request_cached
 
 from .validators import FieldValidator
 from .constants import FieldType
 from .utils import password_handler
 from .utils.uuid_tools import UUIDFormatter
 from .models import *
-from .converters import ConverterFactory
+from .converters import ConverterFactory, TYPED_VALUE_COLUMNS
+from .projection import get_projection_table
+from .schema_cache import bump_schema_version
+from .search_index import SearchQueryPlanner, get_display_value, load_ref_names, normalize_text
+from .search_index import sync_field_values_on_commit, sync_instance_names_on_commit
+from .message import instance_bulk_update_audit, bulk_creation_audit
+from .group_counters import relations_created
+from . import scope_versions
+from .relation_graph import relation_graph, relation_graph_enabled
+from .relation_graph import publish_relation_changes_on_commit, relation_upsert
+from .relation_traversal import RelationCteTraversal, supports_recursive_cte
+from .utils.name_generator import get_template_field_info, render_instance_name
 
 
 logger = logging.getLogger(__name__)
 
+FIELD_META_BATCH_SIZE = 1000
+BULK_UPDATE_CHUNK_SIZE = 2000
+EXPORT_CHUNK_SIZE = 2000
+# 按ID批量读取关系时每批的数量
+RELATION_BATCH_SIZE = 1000
+# 链式重命名时实例的临时名称前缀
+RENAME_TEMP_PREFIX = '__renaming_'
+
 # 模型通用的处理方法
 
 
@@ -243,12 +269,24 @@ class ModelFieldGroupsService:
             model_field_group=default_group,
             update_user=username
         )
+        # update() 不触发信号
+        bump_schema_version()
         field_group.delete()
         logger.info(f"Field group deleted successfully: {field_group.name} by {username}")
 
 
 class ModelFieldsService:
 
+    @staticmethod
+    def get_permitted_fields(pm: PermissionManager, model_id) -> list:
+        """
+        用户有权限的模型字段（预加载校验规则），同一请求内的读写上下文、校验及写入共享
+        """
+        return request_cached(
+            'permitted_fields', (pm.username, str(model_id)),
+            lambda: list(pm.get_queryset(ModelFields).filter(model_id=model_id).select_related('validation_rule'))
+        )
+
     @classmethod
     @require_valid_user
     @transaction.atomic
@@ -467,6 +505,292 @@ class ModelFieldPreferenceService:
             f"Field preference for user {preference.create_user} deleted successfully for model: {preference.model.name}")
 
 
+class ModelFieldMetaWriter:
+    """
+    实例字段值批量写入器
+    - 字段定义、枚举字典、引用实例映射在写入器生命周期内只加载一次，可跨实例复用（如 Excel 导入）
+    - add() 仅完成转换并缓存待写入的值，flush() 一次查询已有记录后以 bulk_update / bulk_create 落库，
+      并同步类型化影子列与宽表投影
+    """
+
+    def __init__(self, model: Models, fields_map: dict, username: str, from_excel: bool = False,
+                 deferred: bool = False):
+        """
+        :param fields_map: {field_name: ModelFields}，调用方负责按权限过滤
+        :param from_excel: 是否来自 Excel 导入，默认Excel导入的密码字段为明文，需要双重加密
+        :param deferred: 延迟写入，_save_field_values 不再逐个实例 flush，由调用方在批次结束时统一 flush
+        """
+        self.model = model
+        self.fields_map = fields_map
+        self.username = username
+        self.from_excel = from_excel
+        self.deferred = deferred
+        self._enum_dicts = {}
+        self._instance_maps = {}
+        # {instance_id: (instance, {field_id: storage_value})}
+        self._pending = {}
+
+    @classmethod
+    def for_user(cls, model: Models, username: str, from_excel: bool = False, deferred: bool = False):
+        """仅写入用户有权限的字段"""
+        pm = PermissionManager(username)
+        fields_map = {f.name: f for f in ModelFieldsService.get_permitted_fields(pm, model.id)}
+        return cls(model, fields_map, username, from_excel=from_excel, deferred=deferred)
+
+    @classmethod
+    def for_system(cls, model: Models, from_excel: bool = False, deferred: bool = False):
+        """不经权限过滤，以系统用户写入"""
+        fields_map = {f.name: f for f in ModelFields.objects.filter(model=model)}
+        return cls(model, fields_map, SYSTEM_USER.username, from_excel=from_excel, deferred=deferred)
+
+    def _get_enum_dict(self, rule_id):
+        if rule_id not in self._enum_dicts:
+            self._enum_dicts[rule_id] = ValidationRules.get_enum_dict(rule_id)
+        return self._enum_dicts[rule_id]
+
+    def _get_instance_map(self, ref_model_id):
+        ref_model_id = str(ref_model_id)
+        if ref_model_id not in self._instance_maps:
+            self._instance_maps[ref_model_id] = ModelInstance.objects.get_instance_names_by_models([ref_model_id])
+        return self._instance_maps[ref_model_id]
+
+    def convert(self, field_def: ModelFields, value):
+        """将外部值转换为 ModelFieldMeta.data 的存储值"""
+        extra_vars = {'plain': self.from_excel}
+        if self.from_excel:
+            extra_vars['from_excel'] = True
+        if field_def.type == FieldType.ENUM and field_def.validation_rule_id:
+            extra_vars['enum_dict'] = self._get_enum_dict(field_def.validation_rule_id)
+        elif field_def.type == FieldType.MODEL_REF and field_def.ref_model_id:
+            extra_vars['instance_map'] = self._get_instance_map(field_def.ref_model_id)
+        converter = ConverterFactory.get_converter(field_def.type)
+        return converter.to_internal(value, **extra_vars)
+
+    def add(self, instance: ModelInstance, fields_data: dict) -> dict:
+        """
+        转换并缓存实例的字段值，忽略未知字段/用户不具备权限的字段
+        :return: 本次转换后的存储值 {field_id: storage_value}
+        """
+        if not fields_data:
+            return {}
+        # 全部转换成功后再加入待写入队列，避免转换失败的实例残留部分字段值
+        converted = {}
+        for field_name, value in fields_data.items():
+            field_def = self.fields_map.get(field_name)
+            if not field_def:
+                continue
+            converted[str(field_def.id)] = self.convert(field_def, value)
+        self.add_converted(instance, converted)
+        return converted
+
+    def add_converted(self, instance: ModelInstance, converted: dict):
+        """缓存已转换的存储值 {field_id: storage_value}"""
+        _, values = self._pending.setdefault(str(instance.id), (instance, {}))
+        values.update(converted)
+
+    def mark(self) -> frozenset:
+        """记录当前待写入的实例集合，配合 rollback 在单行处理失败时撤销该行缓存的值"""
+        return frozenset(self._pending)
+
+    def rollback(self, marker: frozenset):
+        """丢弃 mark 之后新加入待写入队列的实例"""
+        for instance_id in [key for key in self._pending if key not in marker]:
+            self._pending.pop(instance_id, None)
+
+    def flush(self) -> int:
+        """
+        将缓存的字段值写入数据库
+        :return: 写入（新建+更新）的记录数
+        """
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, {}
+        fields_by_id = {str(f.id): f for f in self.fields_map.values()}
+        field_ids = {field_id for _, values in pending.values() for field_id in values}
+
+        existing = {
+            (str(meta.model_instance_id), str(meta.model_fields_id)): meta
+            for meta in ModelFieldMeta.objects.filter(
+                model_instance_id__in=list(pending.keys()),
+                model_fields_id__in=list(field_ids),
+            )
+        }
+
+        now = timezone.now()
+        to_create = []
+        to_update = []
+        for instance_id, (instance, values) in pending.items():
+            for field_id, storage_value in values.items():
+                typed_values = ConverterFactory.get_typed_values(fields_by_id[field_id].type, storage_value)
+                meta = existing.get((instance_id, field_id))
+                if meta is None:
+                    to_create.append(ModelFieldMeta(
+                        model=self.model,
+                        model_instance=instance,
+                        model_fields=fields_by_id[field_id],
+                        data=storage_value,
+                        create_user=self.username,
+                        update_user=self.username,
+                        **typed_values
+                    ))
+                    continue
+                # 按旧值失效查询缓存，bulk_update 不会触发 cacheops 的失效逻辑
+                invalidate_obj(meta)
+                meta.data = storage_value
+                for column, value in typed_values.items():
+                    setattr(meta, column, value)
+                # 默认更新时重置创建用户，meta的用户信息不重要
+                meta.create_user = self.username
+                meta.update_user = self.username
+                meta.update_time = now
+                to_update.append(meta)
+
+        if to_update:
+            ModelFieldMeta.objects.bulk_update(
+                to_update,
+                ['data', *TYPED_VALUE_COLUMNS, 'create_user', 'update_user', 'update_time'],
+                batch_size=FIELD_META_BATCH_SIZE,
+            )
+            for meta in to_update:
+                invalidate_obj(meta)
+        if to_create:
+            ModelFieldMeta.objects.bulk_create(to_create, batch_size=FIELD_META_BATCH_SIZE)
+
+        projection = get_projection_table(self.model.id)
+        if projection:
+            projection.sync_instance_values({instance_id: values for instance_id, (_, values) in pending.items()})
+        sync_field_values_on_commit(
+            (instance_id, field_id) for instance_id, (_, values) in pending.items() for field_id in values
+        )
+
+        return len(to_create) + len(to_update)
+
+
+class UniqueConstraintIndex:
+    """
+    唯一性约束索引
+    为一批待校验的数据构建 {约束值组合: {instance_id}} 映射，批次内的数据之间以及与库中已有实例的冲突均在内存中比较：
+    - 每个约束只查询一次 ModelFieldMeta（按批次中出现的候选值过滤），与批次行数、约束字段数无关
+    - 查询经 cacheops 缓存，字段值写入（save / ModelFieldMetaWriter.flush）时按对象失效
+    单实例写入、Excel 导入与批量编辑共用同一套校验逻辑
+    """
+
+    def __init__(self, model: Models, constraints: list, fields_by_id: dict):
+        """
+        :param constraints: 模型的唯一约束列表
+        :param fields_by_id: {field_id: ModelFields}，值的格式化及错误信息使用
+        """
+        self.model = model
+        self.constraints = constraints
+        self.fields_by_id = fields_by_id
+
+    @classmethod
+    def for_model(cls, model: Models):
+        constraints = UniqueConstraint.objects.get_constraints_for_model(model)
+        field_ids = {str(fid) for c in constraints for fid in (c.fields or [])}
+        fields_by_id = {}
+        if field_ids:
+            fields_by_id = {str(f.id): f for f in ModelFields.objects.filter(model=model, id__in=field_ids)}
+        return cls(model, constraints, fields_by_id)
+
+    @property
+    def field_ids(self) -> set:
+        """参与唯一约束的字段ID"""
+        return set(self.fields_by_id.keys())
+
+    def _constraint_field_ids(self, constraint) -> list:
+        return [str(fid) for fid in (constraint.fields or []) if str(fid) in self.fields_by_id]
+
+    def load_stored_values(self, instance_ids) -> dict:
+        """
+        一次查询取出实例在约束字段上的已存储值
+        :return: {instance_id: {field_id: data}}
+        """
+        stored = defaultdict(dict)
+        instance_ids = [str(iid) for iid in instance_ids]
+        if not instance_ids or not self.fields_by_id:
+            return stored
+        for instance_id, field_id, data in ModelFieldMeta.objects.filter(
+            model_instance_id__in=instance_ids,
+            model_fields_id__in=list(self.fields_by_id.keys()),
+        ).values_list('model_instance_id', 'model_fields_id', 'data'):
+            stored[str(instance_id)][str(field_id)] = data
+        return stored
+
+    def _build_constraint_map(self, constraint_ids: list, candidates: dict, exclude_ids: set) -> dict:
+        """
+        一次查询构建单个约束的 {值组合: {instance_id}} 映射，只包含批次中出现的值组合
+        """
+        data_filter = Q(data__in={v for key in candidates for v in key if v is not None})
+        if any(None in key for key in candidates):
+            data_filter |= Q(data__isnull=True)
+
+        matched = defaultdict(dict)
+        for instance_id, field_id, data in ModelFieldMeta.objects.filter(
+            data_filter,
+            model=self.model,
+            model_fields_id__in=constraint_ids,
+        ).exclude(model_instance_id__in=exclude_ids).values_list('model_instance_id', 'model_fields_id', 'data'):
+            matched[str(instance_id)][str(field_id)] = data
+
+        index = defaultdict(set)
+        for instance_id, values in matched.items():
+            if len(values) != len(constraint_ids):
+                continue
+            key = tuple(values[fid] for fid in constraint_ids)
+            if key in candidates:
+                index[key].add(instance_id)
+        return index
+
+    def _conflict_message(self, constraint_ids: list, key: tuple) -> str:
+        field_values_str = ", ".join(
+            f"{self.fields_by_id[fid].name}={v}" for fid, v in zip(constraint_ids, key)
+        )
+        return f'Unique constraint violation: {field_values_str}'
+
+    def check(self, rows: list) -> dict:
+        """
+        校验一批数据
+        - 批次内重复：保留首次出现的行，后续行视为冲突
+        - 与库中已有实例冲突：排除批次中正在更新的实例（其值将被覆盖，由批次内比较负责）
+        :param rows: [(row_key, instance_id 或 None, {field_id: storage_value})]，
+                     值须为完整的最终存储值（更新时由调用方合并已存储的值）
+        :return: {row_key: error_message}
+        """
+        if not self.constraints or not self.fields_by_id or not rows:
+            return {}
+
+        updating_ids = {str(instance_id) for _, instance_id, _ in rows if instance_id is not None}
+        conflicts = {}
+        for constraint in self.constraints:
+            constraint_ids = self._constraint_field_ids(constraint)
+            if not constraint_ids:
+                continue
+
+            candidates = {}
+            for row_key, _, values in rows:
+                if row_key in conflicts:
+                    continue
+                key = tuple(
+                    str(values.get(fid)) if values.get(fid) is not None else None
+                    for fid in constraint_ids
+                )
+                if any(v in (None, '') for v in key) and not constraint.validate_null:
+                    continue
+                if key in candidates:
+                    conflicts[row_key] = self._conflict_message(constraint_ids, key)
+                    continue
+                candidates[key] = row_key
+            if not candidates:
+                continue
+
+            index = self._build_constraint_map(constraint_ids, candidates, updating_ids)
+            for key in index:
+                conflicts[candidates[key]] = self._conflict_message(constraint_ids, key)
+
+        return conflicts
+
+
 class ModelInstanceService:
 
     @staticmethod
@@ -478,11 +802,10 @@ class ModelInstanceService:
         pm = PermissionManager(user)
         context = {}
 
-        ref_field_defs = pm.get_queryset(ModelFields).filter(
-            model=model,
-            type=FieldType.MODEL_REF,
-            name__in=fields_data.keys()
-        )
+        ref_field_defs = [
+            f for f in ModelFieldsService.get_permitted_fields(pm, model.id)
+            if f.type == FieldType.MODEL_REF and f.name in fields_data
+        ]
 
         ref_instance_ids = []
         for field_def in ref_field_defs:
@@ -526,8 +849,7 @@ class ModelInstanceService:
             return context
 
         # 预加载字段配置
-        fields_qs = pm.get_queryset(ModelFields).filter(model_id=model_id).select_related('validation_rule')
-        fields_by_id = {str(f.id): f for f in fields_qs}
+        fields_by_id = {str(f.id): f for f in ModelFieldsService.get_permitted_fields(pm, model_id)}
 
         # 获取字段元数据
         meta_raw = list(pm.get_queryset(ModelFieldMeta).filter(
@@ -631,38 +953,61 @@ class ModelInstanceService:
                     'label_to_key': {v: k for k, v in enum_dict.items()}
                 }
 
+        ModelInstanceService.load_import_chunk_context(context, model, all_instances_data)
+
+        context['unassigned_group'] = ModelInstanceGroup.objects.get_unassigned_group(str(model.id))
+
+        logger.info(
+            f"Built import context for model {model.name}: "
+            f"fields={len(context['field_configs'])}, "
+            f"refs={len(context['ref_instances_by_name'])}, "
+            f"existing={len(context['existing_instances'])}"
+        )
+
+        return context
+
+    @staticmethod
+    def load_import_chunk_context(context: dict, model: Models, instances_data: list, user: UserInfo = None):
+        """
+        按批次加载导入上下文中与数据行相关的部分（引用实例、已存在的实例），
+        分批导入时每批各查询一次，替换上一批的结果
+        指定 user 时，已存在但不在用户数据范围内的实例名称放入 forbidden_instance_names，不参与更新
+        """
         ref_field_names = [
             name for name, cfg in context['field_configs'].items()
             if cfg.type == FieldType.MODEL_REF
         ]
         all_ref_values = set()
-        for instance_data in all_instances_data:
+        for instance_data in instances_data:
             fields = instance_data.get('fields', {})
             for field_name in ref_field_names:
                 value = fields.get(field_name)
                 if value:
                     all_ref_values.add(value)
 
+        context['ref_instances_by_name'] = {}
         if all_ref_values:
             context['ref_instances_by_name'] = ModelInstance.objects.get_ref_instances_by_names(list(all_ref_values))
 
-        existing_names = [d.get('instance_name') for d in all_instances_data if d.get('instance_name')]
+        context['existing_instances'] = {}
+        context['forbidden_instance_names'] = set()
+        existing_names = [d.get('instance_name') for d in instances_data if d.get('instance_name')]
         logger.debug(f'Existing names to check for import: {existing_names}')
         if existing_names:
             context['existing_instances'] = ModelInstance.objects.get_existing_instances_by_names(
                 str(model.id), existing_names
             )
             logger.debug(f'Existing instances found for import: {list(context["existing_instances"].keys())}')
-
-        context['unassigned_group'] = ModelInstanceGroup.objects.get_unassigned_group(str(model.id))
-
-        logger.info(
-            f"Built import context for model {model.name}: "
-            f"fields={len(context['field_configs'])}, "
-            f"refs={len(context['ref_instances_by_name'])}, "
-            f"existing={len(context['existing_instances'])}"
-        )
-
+        if user is not None and context['existing_instances']:
+            visible_names = set(PermissionManager(user).get_queryset(ModelInstance).filter(
+                model=model, instance_name__in=list(context['existing_instances'])
+            ).values_list('instance_name', flat=True))
+            forbidden = set(context['existing_instances']) - visible_names
+            if forbidden:
+                logger.warning(f'Discarding instance names without permission: {", ".join(sorted(forbidden))}')
+                for name in forbidden:
+                    del context['existing_instances'][name]
+                context['forbidden_instance_names'] = forbidden
         return context
 
     @staticmethod
@@ -679,11 +1024,7 @@ class ModelInstanceService:
         _missed_value = object()
         pm = PermissionManager(user)
         all_fields = ModelFields.objects.get_all_fields_for_model(str(model.id))
-        allowed_fields = set(
-            pm.get_queryset(ModelFields)
-            .filter(model=model)
-            .values_list('name', flat=True)
-        )
+        allowed_fields = {f.name for f in ModelFieldsService.get_permitted_fields(pm, model.id)}
 
         for field in all_fields:
             data = fields_data.get(field.name, _missed_value)
@@ -703,17 +1044,21 @@ class ModelInstanceService:
             if field.required and (value is None or value == ""):
                 raise ValidationError(f'Received empty value for required field: {field.name}')
 
+    @staticmethod
+    def _get_import_allowed_fields(model: Models, user: UserInfo, import_context: dict) -> set:
+        """用户可写字段名，同一次导入中只查询一次并缓存在上下文中"""
+        allowed = import_context.get('allowed_fields')
+        if allowed is None:
+            pm = PermissionManager(user)
+            allowed = set(pm.get_queryset(ModelFields).filter(model=model).values_list('name', flat=True))
+            import_context['allowed_fields'] = allowed
+        return allowed
+
     @staticmethod
     def validate_fields_for_import_update(model: Models, input_fields: dict, user: UserInfo, import_context: dict):
         input_fields = input_fields or {}
         field_configs = import_context.get('field_configs', {}) or {}
-
-        pm = PermissionManager(user)
-        allowed = set(
-            pm.get_queryset(ModelFields)
-            .filter(model=model)
-            .values_list('name', flat=True)
-        )
+        allowed = ModelInstanceService._get_import_allowed_fields(model, user, import_context)
 
         # 校验用户是否试图导入无权限字段
         perm_errors = {}
@@ -731,8 +1076,7 @@ class ModelInstanceService:
         field_configs = import_context.get('field_configs', {}) or {}
         required_fields = import_context.get('required_fields', []) or []
 
-        pm = PermissionManager(user)
-        allowed = pm.get_queryset(ModelFields).filter(model=model).values_list('name', flat=True)
+        allowed = ModelInstanceService._get_import_allowed_fields(model, user, import_context)
 
         # 校验用户是否试图导入无权限字段
         perm_errors = {}
@@ -824,6 +1168,7 @@ class ModelInstanceService:
         username = user.username
 
         from_excel = kwargs.get('from_excel', False)
+        field_writer = kwargs.get('field_writer')
 
         fields_data = validated_data.pop('fields', {})
 
@@ -846,7 +1191,7 @@ class ModelInstanceService:
 
         # 处理字段值
         if fields_data:
-            cls._save_field_values(instance, fields_data, username, from_excel=from_excel)
+            cls._save_field_values(instance, fields_data, username, from_excel=from_excel, writer=field_writer)
 
         # 处理实例分组关系
         valid_instance_group_ids = ModelInstanceGroupService.validate_group_ids(model_id, instance_group_ids, user)
@@ -861,6 +1206,8 @@ class ModelInstanceService:
                 ) for gid in valid_instance_group_ids
             ]
             ModelInstanceGroupRelation.objects.bulk_create(relations)
+            relations_created(relations)
+            scope_versions.relations_changed(relations)
 
         logger.info(f"Model instance created: {instance.instance_name} ({instance.id}) by {username}")
         return instance
@@ -875,6 +1222,7 @@ class ModelInstanceService:
         username = user.username
 
         from_excel = kwargs.get('from_excel', False)
+        field_writer = kwargs.get('field_writer')
         fields_data = validated_data.pop('fields', {})
 
         # 更新实例
@@ -895,113 +1243,51 @@ class ModelInstanceService:
 
         # 更新字段值
         if fields_data:
-            cls._save_field_values(instance, fields_data, username, from_excel=from_excel)
+            cls._save_field_values(instance, fields_data, username, from_excel=from_excel, writer=field_writer)
 
         logger.info(f"Model instance updated: {instance.instance_name} ({instance.id}) by {username}")
         return instance
 
     @staticmethod
-    def _save_field_values(instance: ModelInstance, fields_data: dict, username: str, from_excel: bool = False):
+    def _save_field_values(instance: ModelInstance, fields_data: dict, username: str, from_excel: bool = False,
+                           writer: ModelFieldMetaWriter = None):
         """
         保存或更新实例的字段值
         :param from_excel: 是否来自 Excel 导入，默认Excel导入的密码字段为明文，需要双重加密
+        :param writer: 可复用的字段值写入器，批量场景下由调用方创建以共享字段定义及枚举/引用映射
         """
         if not fields_data:
             return
 
-        pm = PermissionManager(username)
-
-        model = instance.model
-        model_fields_map = {
-            f.name: f for f in pm.get_queryset(ModelFields).filter(model=model)
-        }
-
-        extra_vars = {
-            'plain': from_excel
-        }
-
-        for field_name, value in fields_data.items():
-            field_def = model_fields_map.get(field_name)
-            if not field_def:
-                # 忽略未知字段/用户不具备权限的字段
-                continue
-            if from_excel:
-                extra_vars['from_excel'] = True
-                extra_vars['plain'] = True
-            if field_def.type == FieldType.ENUM and field_def.validation_rule:
-                enum_dict = ValidationRules.get_enum_dict(field_def.validation_rule.id)
-                extra_vars['enum_dict'] = enum_dict
-            elif field_def.type == FieldType.MODEL_REF:
-                extra_vars['instance_map'] = ModelInstance.objects.get_instance_names_by_models(
-                    [str(field_def.ref_model.id)])
-
-            # logger.debug(f'Converting value for field {field_name} with value {value} type {type(value)}')
-            # logger.debug(f'Extra vars for conversion: {extra_vars}')
-            converter = ConverterFactory.get_converter(field_def.type)
-            storage_value = converter.to_internal(value, **extra_vars)
-
-            ModelFieldMeta.objects.update_or_create(
-                model_instance=instance,
-                model_fields=field_def,
-                defaults={
-                    'model': model,
-                    'data': storage_value,
-                    'update_user': username,
-                    'create_user': username  # 默认更新时重置创建用户，meta的用户信息不重要
-                }
-            )
+        if writer is None:
+            writer = ModelFieldMetaWriter.for_user(instance.model, username, from_excel=from_excel)
+        writer.add(instance, fields_data)
+        if not writer.deferred:
+            writer.flush()
 
     @staticmethod
-    def backfill_field_values(instance: ModelInstance, fields_data: dict, from_excel: bool = False):
+    def backfill_field_values(instance: ModelInstance, fields_data: dict, from_excel: bool = False,
+                              writer: ModelFieldMetaWriter = None):
         """
         导入并【创建】实例时以系统用户补全未提供字段，调用前必须完成校验
         """
         if not fields_data:
             return
 
-        model = instance.model
-        # 不经权限过滤，直接取字段定义
-        model_fields_map = {
-            f.name: f for f in ModelFields.objects.filter(model=model, name__in=list(fields_data.keys()))
-        }
-
-        extra_vars = {'plain': from_excel}
-
-        for field_name, value in fields_data.items():
-            field_def = model_fields_map.get(field_name)
-            if not field_def:
-                continue
-
-            if from_excel:
-                extra_vars['from_excel'] = True
-                extra_vars['plain'] = True
-
-            if field_def.type == FieldType.ENUM and field_def.validation_rule:
-                extra_vars['enum_dict'] = ValidationRules.get_enum_dict(field_def.validation_rule.id)
-            elif field_def.type == FieldType.MODEL_REF and field_def.ref_model_id:
-                extra_vars['instance_map'] = ModelInstance.objects.get_instance_names_by_models(
-                    [str(field_def.ref_model.id)]
-                )
-
-            converter = ConverterFactory.get_converter(field_def.type)
-            storage_value = converter.to_internal(value, **extra_vars)
-
-            ModelFieldMeta.objects.update_or_create(
-                model_instance=instance,
-                model_fields=field_def,
-                defaults={
-                    'model': model,
-                    'data': storage_value,
-                    'update_user': SYSTEM_USER.username,
-                    'create_user': SYSTEM_USER.username
-                }
-            )
+        if writer is None:
+            writer = ModelFieldMetaWriter.for_system(instance.model, from_excel=from_excel)
+        writer.add(instance, fields_data)
+        if not writer.deferred:
+            writer.flush()
 
     @classmethod
     @require_valid_user
     def bulk_update_instances(cls, instances_qs: QuerySet, validated_fields: dict, user: UserInfo, using_template: bool = False) -> int:
         """
         批量更新实例
+        按 BULK_UPDATE_CHUNK_SIZE 分批处理，每批的查询次数固定，与实例数量无关：
+        一次预取字段值（审计快照与名称生成共用）、一次字段值批量写入、一次实例 bulk_update，
+        审计日志最终通过 instance_bulk_update_audit 信号统一生成
         """
         if not instances_qs.exists():
             return 0
@@ -1009,32 +1295,411 @@ class ModelInstanceService:
         model = instances_qs.first().model
         username = user.username
 
-        updated_count = 0
+        # 所有实例共享字段定义及枚举/引用映射
+        writer = ModelFieldMetaWriter.for_user(model, username)
+        model_fields = {str(f.id): f for f in ModelFields.objects.filter(model=model)}
+        template_field_ids = [str(fid) for fid in (model.instance_name_template or [])]
+        template_field_info = get_template_field_info(template_field_ids)
+        update_fields = [name for name in validated_fields if name in writer.fields_map]
+        snapshot_field_ids = {str(writer.fields_map[name].id) for name in update_fields} | set(template_field_ids)
+
+        context = {
+            'model': model,
+            'writer': writer,
+            'username': username,
+            'using_template': using_template,
+            'model_fields': model_fields,
+            'update_fields': update_fields,
+            'snapshot_field_ids': snapshot_field_ids,
+            'template_field_info': template_field_info,
+            'ref_template_field_ids': [
+                fid for fid in template_field_ids
+                if fid in model_fields and model_fields[fid].type == FieldType.MODEL_REF
+            ],
+        }
 
+        snapshots_list = []
         with transaction.atomic():
             instances = list(instances_qs.select_for_update())
+            cls._validate_bulk_unique_constraints(model, instances, validated_fields, writer)
+            for start in range(0, len(instances), BULK_UPDATE_CHUNK_SIZE):
+                chunk = instances[start:start + BULK_UPDATE_CHUNK_SIZE]
+                snapshots_list.extend(cls._bulk_update_instance_chunk(chunk, validated_fields, context))
+
+            instance_bulk_update_audit.send(sender=ModelInstance, snapshots_list=snapshots_list)
+
+            # 与逐个 save() 时的 post_save 保持一致，通知节点同步
+            from .signals import model_instance_signal
+            for instance in instances:
+                model_instance_signal.send(sender=ModelInstance, instance=instance, action=False)
+
+        logger.info(f"Bulk updated {len(instances)} instances for model {model.name} by {username}")
+        return len(instances)
+
+    @staticmethod
+    def _validate_bulk_unique_constraints(model: Models, instances: list, validated_fields: dict,
+                                          writer: ModelFieldMetaWriter):
+        """
+        批量编辑前整体校验唯一性约束，未修改约束字段时不产生查询以外的开销
+        """
+        index = UniqueConstraintIndex.for_model(model)
+        updated_fields = {
+            str(writer.fields_map[name].id): writer.fields_map[name]
+            for name in validated_fields if name in writer.fields_map
+        }
+        if not index.field_ids & set(updated_fields):
+            return
+
+        converted = {
+            field_id: writer.convert(field_def, validated_fields[field_def.name])
+            for field_id, field_def in updated_fields.items()
+        }
+        stored_values = index.load_stored_values([instance.id for instance in instances])
+        conflicts = index.check([
+            (str(instance.id), instance.id, {**stored_values.get(str(instance.id), {}), **converted})
+            for instance in instances
+        ])
+        if conflicts:
+            raise ValidationError({'unique_constraint': sorted(set(conflicts.values()))})
+
+    @staticmethod
+    def _bulk_update_instance_chunk(instances: list, validated_fields: dict, context: dict) -> list:
+        """
+        批量更新一批实例，返回 instance_bulk_update_audit 所需的快照列表
+        """
+        model = context['model']
+        writer = context['writer']
+        model_fields = context['model_fields']
+        now = timezone.now()
+
+        # 预取审计字段及名称模板字段的旧值
+        old_values = {str(instance.id): {} for instance in instances}
+        meta_rows = ModelFieldMeta.objects.filter(
+            model_instance_id__in=list(old_values.keys()),
+            model_fields_id__in=list(context['snapshot_field_ids'])
+        ).values_list('model_instance_id', 'model_fields_id', 'data')
+        for instance_id, field_id, data in meta_rows:
+            old_values[str(instance_id)][str(field_id)] = data
+
+        new_values = {}
+        for instance in instances:
+            instance_id = str(instance.id)
+            converted = writer.add(instance, validated_fields)
+            new_values[instance_id] = {
+                **old_values[instance_id],
+                **{fid: str(value) if value is not None else None for fid, value in converted.items()}
+            }
+        writer.flush()
+
+        ref_ids = {
+            values[fid] for values in new_values.values()
+            for fid in context['ref_template_field_ids'] if values.get(fid)
+        }
+        ref_instance_names = ModelInstance.objects.get_instance_names_by_instance_ids(list(ref_ids))
+
+        def build_snapshot(values):
+            snapshot = {}
+            for field_name in context['update_fields']:
+                model_field = writer.fields_map[field_name]
+                snapshot[field_name] = {
+                    'value': values.get(str(model_field.id)),
+                    'verbose_name': model_field.verbose_name,
+                    'model_field': model_field,
+                }
+            return snapshot
+
+        snapshots = []
+        for instance in instances:
+            instance_id = str(instance.id)
+            # 按旧值失效查询缓存，bulk_update 不会触发 cacheops 的失效逻辑
+            invalidate_obj(instance)
+            old_static = {'instance_name': instance.instance_name, 'using_template': instance.using_template}
+
+            instance.model = model
+            instance.update_user = context['username']
+            instance.update_time = now
+            if context['using_template'] is not None:
+                instance.using_template = context['using_template']
+
+            if instance.using_template and context['template_field_info']:
+                field_values = {
+                    model_fields[fid].name: value
+                    for fid, value in new_values[instance_id].items() if fid in model_fields
+                }
+                new_name = render_instance_name(field_values, context['template_field_info'], ref_instance_names)
+                if new_name:
+                    instance.instance_name = new_name
+
+            snapshots.append({
+                'instance': instance,
+                'old_snapshot': build_snapshot(old_values[instance_id]),
+                'new_snapshot': build_snapshot(new_values[instance_id]),
+                'update_fields': context['update_fields'],
+                'static_changes': {
+                    key: [old, getattr(instance, key)]
+                    for key, old in old_static.items() if old != getattr(instance, key)
+                },
+            })
+
+        ModelInstance.objects.bulk_update(
+            instances, ['instance_name', 'using_template', 'update_user', 'update_time']
+        )
+        for instance in instances:
+            invalidate_obj(instance)
+        # bulk_update 不触发 post_save，实例名称的搜索索引在此同步
+        sync_instance_names_on_commit(instance.id for instance in instances)
+        return snapshots
+
+    @staticmethod
+    def park_instance_names(instance_ids: list):
+        """
+        将实例暂时改为临时名称，让出原名称供跨批次的重命名环使用，不记录审计；
+        调用方随后以 bulk_rename_instances(original_names=...) 改为最终名称并按原名称记录审计
+        """
+        with transaction.atomic():
+            instances = list(ModelInstance.objects.select_for_update().filter(id__in=instance_ids))
+            for instance in instances:
+                invalidate_obj(instance)
+                instance.instance_name = f'{RENAME_TEMP_PREFIX}{instance.id.hex}'
+            ModelInstance.objects.bulk_update(instances, ['instance_name'])
+
+    @staticmethod
+    def bulk_rename_instances(renames: dict, original_names: dict = None) -> int:
+        """
+        按 {instance_id: new_name} 批量重命名实例，一次 bulk_update 写入，
+        审计日志通过 instance_bulk_update_audit 信号按批生成，调用方负责设置审计上下文。
+        新名称是本批其他实例的旧名称时（A→B 同时 B→C，或互换名称），涉及的实例先改为临时名称
+        再改为最终名称，避免逐行校验的唯一约束 unique_model_instance_name 在中途冲突；
+        依赖其他批次让出名称的实例，调用方需保证其他批次先写入
+        :param original_names: {instance_id: 原名称}，已由 park_instance_names 暂存的实例按原名称记录审计
+        """
+        if not renames:
+            return 0
+        original_names = original_names or {}
+
+        now = timezone.now()
+        snapshots = []
+        with transaction.atomic():
+            instances = list(ModelInstance.objects.select_for_update().filter(id__in=list(renames)))
+            old_names = {instance.instance_name for instance in instances}
+            new_names = set(renames.values())
+            staged = [
+                instance for instance in instances
+                if instance.instance_name in new_names or renames[instance.id] in old_names
+            ]
+            for instance in instances:
+                # 按旧值失效查询缓存，bulk_update 不会触发 cacheops 的失效逻辑
+                invalidate_obj(instance)
+                snapshots.append({
+                    'instance': instance,
+                    'old_snapshot': {},
+                    'new_snapshot': {},
+                    'update_fields': [],
+                    'static_changes': {'instance_name': [
+                        original_names.get(instance.id, instance.instance_name), renames[instance.id]
+                    ]},
+                })
+
+            if staged:
+                for instance in staged:
+                    instance.instance_name = f'{RENAME_TEMP_PREFIX}{instance.id.hex}'
+                ModelInstance.objects.bulk_update(staged, ['instance_name'])
+
+            for instance in instances:
+                instance.instance_name = renames[instance.id]
+                instance.update_time = now
+            ModelInstance.objects.bulk_update(instances, ['instance_name', 'update_time'])
+            for instance in instances:
+                invalidate_obj(instance)
+            invalidate_request_cache('ref_names')
+            sync_instance_names_on_commit(instance.id for instance in instances)
+            instance_bulk_update_audit.send(sender=ModelInstance, snapshots_list=snapshots)
 
-            # 记录审计快照
+            # 与逐个 save() 时的 post_save 保持一致，通知节点同步
+            from .signals import model_instance_signal
             for instance in instances:
-                with capture_audit_snapshots(instance):
-                    cls._save_field_values(instance, validated_fields, username)
+                model_instance_signal.send(sender=ModelInstance, instance=instance, action=False)
+
+        return len(instances)
+
+    @classmethod
+    def bulk_restore_instances(cls, instances: dict, logs_by_object: dict, username: str = None) -> dict:
+        """
+        按审计日志批量回退实例，调用方负责锁定实例、设置回退审计上下文并开启事务
+        每个对象回退到批次中最早一条日志之前的状态，字段值一次批量写入、实例一次 bulk_update，
+        审计日志通过 instance_bulk_update_audit 信号统一生成
+        :param instances: {object_id: ModelInstance}
+        :param logs_by_object: {object_id: [AuditLog]}，按时间升序，已预取 details
+        :return: {object_id: 失败原因}，未列出的对象回退成功
+        """
+        failures = {}
+        by_model = defaultdict(list)
+        for object_id, instance in instances.items():
+            by_model[instance.model_id].append(object_id)
+
+        for object_ids in by_model.values():
+            model = instances[object_ids[0]].model
+            writer = (ModelFieldMetaWriter.for_user(model, username) if username
+                      else ModelFieldMetaWriter.for_system(model))
+            all_fields = {f.name: f for f in ModelFields.objects.filter(model=model).select_related('validation_rule')}
+
+            targets = {}
+            for object_id in object_ids:
+                try:
+                    targets[object_id] = cls._build_restore_target(
+                        logs_by_object[object_id], writer, all_fields
+                    )
+                except ValidationError as exc:
+                    failures[object_id] = exc.detail
+                except ValueError as exc:
+                    failures[object_id] = str(exc)
+            failures.update(cls._validate_restore_targets(model, instances, targets, writer))
+            targets = {object_id: target for object_id, target in targets.items() if object_id not in failures}
+            if targets:
+                cls._apply_restore_targets(model, instances, targets, logs_by_object, writer, username)
+        return failures
+
+    @staticmethod
+    def _parse_audit_value(field_def: ModelFields, value):
+        """将审计明细中的展示值还原为字段的外部值，见 cmdb.resolver.resolve_dynamic_value"""
+        if value is None:
+            return None
+        keys = {FieldType.ENUM: 'key', FieldType.MODEL_REF: 'id', FieldType.PASSWORD: 'password'}
+        key = keys.get(field_def.type)
+        if key is None:
+            return value
+        try:
+            parsed = json.loads(value)
+        except (TypeError, ValueError):
+            return value
+        return parsed.get(key) if isinstance(parsed, dict) else value
 
-                    instance.update_user = username
-                    if using_template is not None:
-                        instance.using_template = using_template
+    @classmethod
+    def _build_restore_target(cls, logs: list, writer: ModelFieldMetaWriter, all_fields: dict) -> dict:
+        """以最早一条日志中的旧值为准，计算对象回退后的静态字段及字段存储值"""
+        static = {}
+        old_values = {}
+        for log in logs:
+            for key in ('instance_name', 'using_template'):
+                value = (log.changed_fields or {}).get(key)
+                if isinstance(value, list):
+                    static.setdefault(key, value[0])
+            for detail in log.details.all():
+                old_values.setdefault(detail.name, detail.old_value)
+
+        fields = {}
+        for name, old_value in old_values.items():
+            if name not in all_fields:
+                # 字段已删除
+                continue
+            field_def = writer.fields_map.get(name)
+            if field_def is None:
+                raise ValidationError(f'No permission to restore field: {name}')
+            fields[str(field_def.id)] = writer.convert(field_def, cls._parse_audit_value(field_def, old_value))
+        return {'static': static, 'fields': fields}
 
-                    should_regenerate_name = using_template if using_template is not None else instance.using_template
+    @staticmethod
+    def _validate_restore_targets(model: Models, instances: dict, targets: dict, writer: ModelFieldMetaWriter) -> dict:
+        """整体校验回退后的唯一约束及实例名称，返回 {object_id: 失败原因}"""
+        failures = {}
+        index = UniqueConstraintIndex.for_model(model)
+        rows = [
+            (object_id, instances[object_id].id, target['fields'])
+            for object_id, target in targets.items() if index.field_ids & set(target['fields'])
+        ]
+        if rows:
+            stored_values = index.load_stored_values([instance_id for _, instance_id, _ in rows])
+            failures.update(index.check([
+                (object_id, instance_id, {**stored_values.get(str(instance_id), {}), **fields})
+                for object_id, instance_id, fields in rows
+            ]))
+
+        names = {
+            object_id: target['static']['instance_name']
+            for object_id, target in targets.items()
+            if target['static'].get('instance_name') and object_id not in failures
+        }
+        if names:
+            taken = set(
+                ModelInstance.objects.filter(model=model, instance_name__in=set(names.values()))
+                .exclude(id__in=[instances[object_id].id for object_id in targets])
+                .values_list('instance_name', flat=True)
+            )
+            # 批次内未回退名称的实例保持当前名称
+            final_names = defaultdict(list)
+            for object_id in targets:
+                final_names[names.get(object_id, instances[object_id].instance_name)].append(object_id)
+            for object_id, name in names.items():
+                if name in taken or len(final_names[name]) > 1:
+                    failures[object_id] = f'Instance name already exists: {name}'
+        return failures
 
-                    if should_regenerate_name and instance.model.instance_name_template:
-                        new_name = instance.generate_name()
-                        if new_name:
-                            instance.instance_name = new_name
+    @staticmethod
+    def _apply_restore_targets(model: Models, instances: dict, targets: dict, logs_by_object: dict,
+                               writer: ModelFieldMetaWriter, username: str):
+        now = timezone.now()
+        fields_by_id = {str(f.id): f for f in writer.fields_map.values()}
+        field_ids = {field_id for target in targets.values() for field_id in target['fields']}
+        old_values = defaultdict(dict)
+        for instance_id, field_id, data in ModelFieldMeta.objects.filter(
+            model_instance_id__in=[instances[object_id].id for object_id in targets],
+            model_fields_id__in=list(field_ids),
+        ).values_list('model_instance_id', 'model_fields_id', 'data'):
+            old_values[str(instance_id)][str(field_id)] = data
+
+        def build_snapshot(values):
+            return {
+                fields_by_id[field_id].name: {
+                    'value': value,
+                    'verbose_name': fields_by_id[field_id].verbose_name,
+                    'model_field': fields_by_id[field_id],
+                } for field_id, value in values.items()
+            }
 
-                    instance.save()
-                    updated_count += 1
+        snapshots = []
+        changed_instances = []
+        for object_id, target in targets.items():
+            instance = instances[object_id]
+            instance_id = str(instance.id)
+            if target['fields']:
+                writer.add_converted(instance, target['fields'])
+
+            # 按旧值失效查询缓存，bulk_update 不会触发 cacheops 的失效逻辑
+            invalidate_obj(instance)
+            static_changes = {}
+            for key, value in target['static'].items():
+                if getattr(instance, key) != value:
+                    static_changes[key] = [getattr(instance, key), value]
+                    setattr(instance, key, value)
+            instance.update_user = username or SYSTEM_USER.username
+            instance.update_time = now
+            changed_instances.append(instance)
+
+            current = old_values[instance_id]
+            snapshots.append({
+                'instance': instance,
+                'old_snapshot': build_snapshot({fid: current.get(fid) for fid in target['fields']}),
+                'new_snapshot': build_snapshot(target['fields']),
+                'update_fields': [fields_by_id[fid].name for fid in target['fields']],
+                'static_changes': static_changes,
+                'reverted_from': logs_by_object[object_id][0],
+            })
 
-        logger.info(f"Bulk updated {updated_count} instances for model {model.name} by {username}")
-        return updated_count
+        writer.flush()
+        ModelInstance.objects.bulk_update(
+            changed_instances, ['instance_name', 'using_template', 'update_user', 'update_time']
+        )
+        for instance in changed_instances:
+            invalidate_obj(instance)
+        invalidate_request_cache('ref_names')
+        sync_instance_names_on_commit(instance.id for instance in changed_instances)
+        instance_bulk_update_audit.send(sender=ModelInstance, snapshots_list=snapshots)
+
+        # 与逐个 save() 时的 post_save 保持一致，通知节点同步
+        from .signals import model_instance_signal
+        for instance in changed_instances:
+            model_instance_signal.send(sender=ModelInstance, instance=instance, action=False)
+        logger.info(f"Restored {len(changed_instances)} instances for model {model.name} by {username}")
 
     @staticmethod
     def _convert_value_for_constraint(field_config, value, from_excel=False, ref_instances=None):
@@ -1058,75 +1723,63 @@ class ModelInstanceService:
     @classmethod
     def validate_unique_constraints(cls, model: Models, fields_data: dict, instance: ModelInstance,
                                     ref_instances: dict = None, from_excel: bool = False):
-        constraints = UniqueConstraint.objects.get_constraints_for_model(model)
-        if not constraints.exists():
+        index = UniqueConstraintIndex.for_model(model)
+        if not index.constraints:
             return
 
-        all_field_ids = set()
-        for constraint in constraints:
-            all_field_ids.update(constraint.fields or [])
-
-        field_map = ModelFields.objects.get_fields_map(str(model.id), all_field_ids)
-        instance_values = {}
+        # 未提供的字段沿用实例已存储的值
+        values = {}
         if instance:
-            instance_values = ModelFieldMeta.objects.get_instance_field_values(str(instance.id), all_field_ids)
+            values = dict(index.load_stored_values([instance.id]).get(str(instance.id), {}))
 
-        for constraint in constraints:
-            constraint_fields = constraint.fields or []
-            normalized_values = {}
-            has_null = False
-
-            for field_id in constraint_fields:
-                field_config = field_map.get(str(field_id))
-                if not field_config:
-                    continue
-
-                field_name = field_config.name
-                raw_value = fields_data.get(field_name)
-                value_from_instance = False
-
-                if raw_value is None and instance_values:
-                    raw_value = instance_values.get(str(field_id))
-                    value_from_instance = raw_value is not None
-
-                if value_from_instance:
-                    storage_value = raw_value
-                else:
-                    storage_value = cls._convert_value_for_constraint(
-                        field_config,
-                        raw_value,
-                        from_excel=from_excel,
-                        ref_instances=ref_instances
-                    )
-
-                normalized_values[field_name] = storage_value
-                if storage_value in (None, ''):
-                    has_null = True
-
-            if not normalized_values:
-                continue
-
-            if has_null and not constraint.validate_null:
-                logger.debug(
-                    "Skipping constraint %s due to null values and validate_null=False",
-                    constraint.id
-                )
+        for field_id, field_config in index.fields_by_id.items():
+            raw_value = fields_data.get(field_config.name)
+            if raw_value is None and field_id in values:
                 continue
-
-            duplicate_ids = ModelInstance.objects.check_uniqueness(
-                model,
-                normalized_values,
-                instance_to_exclude=instance
+            values[field_id] = cls._convert_value_for_constraint(
+                field_config,
+                raw_value,
+                from_excel=from_excel,
+                ref_instances=ref_instances
             )
 
-            if duplicate_ids:
-                field_values_str = ", ".join(f"{k}={v}" for k, v in normalized_values.items())
-                raise ValidationError({
-                    'unique_constraint': f'Unique constraint violation: {field_values_str}'
-                })
+        conflicts = index.check([(0, instance.id if instance else None, values)])
+        if conflicts:
+            raise ValidationError({'unique_constraint': conflicts[0]})
 
         logger.debug("All unique constraints validated for model %s", model.name)
 
+    @staticmethod
+    def find_import_unique_conflicts(model: Models, rows: list, writer: ModelFieldMetaWriter) -> dict:
+        """
+        批量校验一批导入数据的唯一性约束
+        :param rows: [(row_key, existing_instance 或 None, {field_name: value})]，值为写入前的导入值
+        :param writer: 用于将导入值转换为存储值的写入器，保证比较口径与实际写入一致
+        :return: {row_key: error_message}
+        """
+        index = UniqueConstraintIndex.for_model(model)
+        if not index.constraints or not rows:
+            return {}
+
+        # 更新行未提供的字段沿用库中的值
+        stored_values = index.load_stored_values(
+            [instance.id for _, instance, _ in rows if instance is not None]
+        )
+        index_rows = []
+        for row_key, instance, fields_data in rows:
+            values = dict(stored_values.get(str(instance.id), {})) if instance is not None else {}
+            for field_id, field_def in index.fields_by_id.items():
+                if field_def.name not in fields_data:
+                    continue
+                try:
+                    values[field_id] = writer.convert(field_def, fields_data[field_def.name])
+                except Exception:
+                    # 转换失败的值由后续的字段校验报告
+                    values[field_id] = None
+            index_rows.append((row_key, instance.id if instance is not None else None, values))
+
+        return index.check(index_rows)
+
     @staticmethod
     def prepare_instance_name(model: Models, fields_data: dict, instance: ModelInstance = None, is_create: bool = False) -> str:
         """
@@ -1186,21 +1839,14 @@ class ModelInstanceService:
 
         return None
 
-    @classmethod
-    def export_instances_data(cls, model: Models, instances_qs, fields_qs, user: UserInfo, restricted_field_names: list) -> dict:
+    @staticmethod
+    @require_valid_user
+    def prepare_export_context(model: Models, fields_qs, user: UserInfo, restricted_field_names: list = None) -> dict:
         """
-        导出实例数据，返回格式与导入模板一致。
+        准备导出所需的静态数据：导出字段、枚举/引用的显示值映射，整个导出过程只加载一次
 
-        :param model: 模型对象
-        :param instances_qs: 实例查询集
-        :param fields_qs: 字段查询集
-        :param user: 用户对象
-        :param restricted_field_names: 限制导出的字段名列表
-        :return: {'fields': [...], 'instances_data': [...], 'enum_data': {...}, 'ref_data': {...}}
+        :return: {'fields': [...], 'enum_data': {...}, 'ref_data': {...}, 'user': user}
         """
-
-        pm = PermissionManager(user)
-
         if restricted_field_names:
             fields_qs = fields_qs.filter(name__in=restricted_field_names)
 
@@ -1210,18 +1856,6 @@ class ModelInstanceService:
             ).order_by('model_field_group__create_time', 'order')
         )
 
-        if not fields:
-            return {'fields': [], 'instances_data': [], 'enum_data': {}, 'ref_data': {}}
-
-        instance_ids = list(instances_qs.values_list('id', flat=True))
-        field_meta_map = {}
-        meta_qs = pm.get_queryset(ModelFieldMeta).filter(
-            model_instance_id__in=instance_ids
-        ).select_related('model_fields', 'model_fields__validation_rule')
-
-        for meta in meta_qs:
-            field_meta_map.setdefault(str(meta.model_instance_id), {})[meta.model_fields.name] = meta.data
-
         enum_data = {}  # {field_name: {key: label}}
         ref_data = {}   # {field_name: {instance_id: instance_name}}
         ref_model_ids = set()
@@ -1248,55 +1882,116 @@ class ModelInstanceService:
                 if field.type == FieldType.MODEL_REF and field.ref_model:
                     ref_data[field.name] = ref_by_model.get(str(field.ref_model.id), {})
 
-        instances_data = []
-        for instance in instances_qs:
-            instance_id = str(instance.id)
-            field_values = field_meta_map.get(instance_id, {})
+        return {
+            'fields': fields,
+            'enum_data': enum_data,
+            'ref_data': ref_data,
+            'user': user,
+        }
 
-            # 转换字段值为显示格式
-            converted_fields = {}
-            for field in fields:
-                raw_value = field_values.get(field.name)
+    @staticmethod
+    def iter_instance_chunks(instances_qs, chunk_size: int = EXPORT_CHUNK_SIZE):
+        """
+        以游标方式遍历实例查询集，每 chunk_size 个实例产出一批 [(instance_id, instance_name)]
+        """
+        chunk = []
+        for instance_id, instance_name in instances_qs.values_list('id', 'instance_name').iterator(
+            chunk_size=chunk_size
+        ):
+            chunk.append((str(instance_id), instance_name))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
 
-                if raw_value is None:
-                    converted_fields[field.name] = None
-                    continue
+    @staticmethod
+    def _convert_export_value(field: ModelFields, raw_value, export_context: dict):
+        """将存储值转换为导出的显示值"""
+        if raw_value is None:
+            return None
 
-                if field.type == FieldType.ENUM:
-                    # 枚举：key -> label
-                    enum_dict = enum_data.get(field.name, {})
-                    converted_fields[field.name] = enum_dict.get(str(raw_value), raw_value)
-                elif field.type == FieldType.MODEL_REF:
-                    # 引用：id -> instance_name
-                    ref_dict = ref_data.get(field.name, {})
-                    converted_fields[field.name] = ref_dict.get(str(raw_value), raw_value)
-                elif field.type == FieldType.PASSWORD:
-                    # 密码：解密
-                    try:
-                        logger.debug(f"Decrypting password field {field.name} for instance {instance.instance_name}")
-                        logger.debug(f"Raw encrypted value: {raw_value}")
-                        converted_fields[field.name] = password_handler.decrypt_to_plain(raw_value)
-                        logger.debug(f"Decrypted password value: {converted_fields[field.name]}")
-                    except Exception:
-                        converted_fields[field.name] = ''
-                elif field.type == FieldType.BOOLEAN:
-                    # 布尔：转换为 TRUE/FALSE
-                    converted_fields[field.name] = 'TRUE' if raw_value in (True, 'true', 'True', '1', 1) else 'FALSE'
-                else:
-                    converted_fields[field.name] = raw_value
+        if field.type == FieldType.ENUM:
+            # 枚举：key -> label
+            enum_dict = export_context['enum_data'].get(field.name, {})
+            return enum_dict.get(str(raw_value), raw_value)
+        if field.type == FieldType.MODEL_REF:
+            # 引用：id -> instance_name
+            ref_dict = export_context['ref_data'].get(field.name, {})
+            return ref_dict.get(str(raw_value), raw_value)
+        if field.type == FieldType.PASSWORD:
+            # 密码：解密
+            try:
+                return password_handler.decrypt_to_plain(raw_value)
+            except Exception:
+                return ''
+        if field.type == FieldType.BOOLEAN:
+            # 布尔：转换为 TRUE/FALSE
+            return 'TRUE' if raw_value in (True, 'true', 'True', '1', 1) else 'FALSE'
+        return raw_value
 
-            instances_data.append({
-                'instance_name': instance.instance_name,
-                'fields': converted_fields
-            })
+    @classmethod
+    def iter_export_rows(cls, model: Models, instance_chunks, export_context: dict):
+        """
+        按实例分批流式产出导出数据行，每批只查询一次字段值，内存占用与导出总量无关
 
+        :param instance_chunks: 可迭代的实例批次 [(instance_id, instance_name)]，见 iter_instance_chunks
+        :return: 生成器，逐行产出 {'instance_name': ..., 'fields': {...}}
+        """
+        fields = export_context['fields']
+        if not fields:
+            return
+
+        fields_by_id = {str(field.id): field for field in fields}
+        pm = PermissionManager(export_context['user'])
+
+        # 导出始终读取 ModelFieldMeta：宽表中的字符列会被截断、数值列经过类型转换，且不经过数据权限过滤
+        for chunk in instance_chunks:
+            instance_ids = [instance_id for instance_id, _ in chunk]
+            field_meta_map = {}
+            meta_rows = pm.get_queryset(ModelFieldMeta).filter(
+                model_instance_id__in=instance_ids,
+                model_fields_id__in=list(fields_by_id.keys())
+            ).values_list('model_instance_id', 'model_fields_id', 'data')
+            for instance_id, field_id, data in meta_rows:
+                field_meta_map.setdefault(str(instance_id), {})[fields_by_id[str(field_id)].name] = data
+
+            for instance_id, instance_name in chunk:
+                field_values = field_meta_map.get(instance_id, {})
+                yield {
+                    'instance_name': instance_name,
+                    'fields': {
+                        field.name: cls._convert_export_value(field, field_values.get(field.name), export_context)
+                        for field in fields
+                    }
+                }
+
+    @classmethod
+    @require_valid_user
+    def export_instances_data(cls, model: Models, instances_qs, fields_qs, user: UserInfo, restricted_field_names: list) -> dict:
+        """
+        导出实例数据，返回格式与导入模板一致。
+        一次性返回全部数据，大批量导出应使用 iter_export_rows 流式写入文件。
+
+        :param model: 模型对象
+        :param instances_qs: 实例查询集
+        :param fields_qs: 字段查询集
+        :param user: 用户对象
+        :param restricted_field_names: 限制导出的字段名列表
+        :return: {'fields': [...], 'instances_data': [...], 'enum_data': {...}, 'ref_data': {...}}
+        """
+        export_context = cls.prepare_export_context(model, fields_qs, user, restricted_field_names)
+        if not export_context['fields']:
+            return {'fields': [], 'instances_data': [], 'enum_data': {}, 'ref_data': {}}
+
+        instances_data = list(cls.iter_export_rows(model, cls.iter_instance_chunks(instances_qs), export_context))
         logger.info(f"Exported {len(instances_data)} instances for model {model.name}")
 
         return {
-            'fields': fields,
+            'fields': export_context['fields'],
             'instances_data': instances_data,
-            'enum_data': enum_data,
-            'ref_data': ref_data
+            'enum_data': export_context['enum_data'],
+            'ref_data': export_context['ref_data']
         }
 
 
@@ -1400,6 +2095,8 @@ class ModelInstanceGroupService:
                 ) for instance_id in instances_to_move_ids
             ]
             ModelInstanceGroupRelation.objects.bulk_create(relations_to_create)
+            relations_created(relations_to_create)
+            scope_versions.relations_changed(relations_to_create)
             logger.debug(f"Created {len(relations_to_create)} new relations in unassigned pool.")
 
         # 删除所有分组对象
@@ -1514,7 +2211,9 @@ class ModelInstanceGroupService:
         visible_instances_qs = pm.get_queryset(ModelInstance)
 
         # 构建上下文
-        context = cls._prepare_group_tree_context(all_visible_instance_groups, visible_instances_qs)
+        context = cls._prepare_group_tree_context(
+            all_visible_instance_groups, visible_instances_qs, pm.has_full_access(ModelInstance)
+        )
 
         # 组装树结构
         tree_structure = []
@@ -1561,7 +2260,9 @@ class ModelInstanceGroupService:
 
         visible_instances_qs = pm.get_queryset(ModelInstance).filter(model_id=model_id)
 
-        context = cls._prepare_group_tree_context(skeleton_nodes, visible_instances_qs)
+        context = cls._prepare_group_tree_context(
+            skeleton_nodes, visible_instances_qs, pm.has_full_access(ModelInstance)
+        )
 
         absolute_root_node = next((n for n in skeleton_nodes if n.parent_id is None), None)
         if not absolute_root_node:
@@ -1582,79 +2283,50 @@ class ModelInstanceGroupService:
         return children_map
 
     @classmethod
-    def _calculate_instance_counts(cls, nodes, visible_instances_qs: QuerySet) -> dict:
+    def _calculate_instance_counts(cls, nodes, visible_instances_qs: QuerySet, unrestricted: bool = False) -> dict:
         """
         计算每个分组（包含子分组）下的实例数量
+        数据权限不受限时直接读取增量维护的分组计数，否则按可见实例做一次聚合
         :param nodes: 涉及的分组节点列表
         :param visible_instances_qs: 经过权限过滤的实例 QuerySet
+        :param unrestricted: 用户对实例的数据权限是否不受限
         """
-        all_group_ids = {group.id for group in nodes}
-        descendant_map = {}
-
-        # 构建后代映射
-        for group in nodes:
-            descendants = cls._get_all_descendants(group, nodes)
-            descendant_ids = {g.id for g in descendants}
-            descendant_map[group.id] = descendant_ids | {group.id}
-            all_group_ids.update(descendant_ids)
-
-        # 批量查询关联关系
-        relations = ModelInstanceGroupRelation.objects.filter(
-            group_id__in=all_group_ids,
-            instance__in=visible_instances_qs
-        ).values('group_id', 'instance_id').distinct()
-
-        # 内存聚合计算
-        instance_counts = {}
-        for group in nodes:
-            group_and_descendant_ids = descendant_map[group.id]
-            unique_instances = {
-                r['instance_id'] for r in relations if r['group_id'] in group_and_descendant_ids
-            }
-            instance_counts[group.id] = len(unique_instances)
+        group_ids = {group.id for group in nodes}
+        if not group_ids:
+            return {}
 
-        return instance_counts
+        if unrestricted:
+            counts = ModelInstanceGroupCounter.objects.get_counts(group_ids)
+            return {group_id: counts.get(group_id, (0, 0))[1] for group_id in group_ids}
+
+        counts = dict(
+            ModelInstanceGroupClosure.objects.filter(
+                ancestor_id__in=group_ids,
+                descendant__modelinstancegrouprelation__instance__in=visible_instances_qs
+            ).values('ancestor_id').annotate(
+                count=Count('descendant__modelinstancegrouprelation__instance', distinct=True)
+            ).values_list('ancestor_id', 'count')
+        )
+        return {group_id: counts.get(group_id, 0) for group_id in group_ids}
 
     @classmethod
-    def _prepare_group_tree_context(cls, nodes, visible_instances_qs: QuerySet) -> dict:
+    def _prepare_group_tree_context(cls, nodes, visible_instances_qs: QuerySet, unrestricted: bool = False) -> dict:
         """
         准备管理树所需的上下文，聚合 children_map 和 instance_counts。
         """
         return {
             'children_map': cls._build_children_map(nodes),
-            'instance_counts': cls._calculate_instance_counts(nodes, visible_instances_qs)
+            'instance_counts': cls._calculate_instance_counts(nodes, visible_instances_qs, unrestricted)
         }
 
-    @classmethod
-    def _get_all_descendants(cls, group, all_groups):
-        """递归获取后代"""
-        descendants = []
-        children = [g for g in all_groups if g.parent_id == group.id]
-        for child in children:
-            descendants.append(child)
-            descendants.extend(cls._get_all_descendants(child, all_groups))
-        return descendants
-
     @staticmethod
     def _get_all_ancestors(groups_qs):
-        """获取所有祖先节点"""
-        ancestors = set()
-        groups_with_parents = groups_qs.select_related('parent')
-        queue = list(groups_with_parents)
-        processed_ids = {g.id for g in queue}
-
-        while queue:
-            group = queue.pop(0)
-            parent = group.parent
-            if parent and parent.id not in processed_ids:
-                ancestors.add(parent)
-                processed_ids.add(parent.id)
-                try:
-                    full_parent = ModelInstanceGroup.objects.select_related('parent').get(id=parent.id)
-                    queue.append(full_parent)
-                except ModelInstanceGroup.DoesNotExist:
-                    continue
-        return list(ancestors)
+        """获取所有祖先节点（不含传入的分组本身）"""
+        group_ids = set(groups_qs.values_list('id', flat=True))
+        ancestor_ids = set(
+            ModelInstanceGroupClosure.objects.ancestors_of(list(group_ids)).values_list('ancestor_id', flat=True)
+        )
+        return list(ModelInstanceGroup.objects.filter(id__in=ancestor_ids - group_ids).select_related('parent'))
 
     @staticmethod
     @require_valid_user
@@ -1763,51 +2435,33 @@ class ModelInstanceGroupService:
 
 class ModelFieldMetaSearchService:
     """
-    ModelFieldMeta 全文检索服务
-    使用 django-mysql 的 Match 函数实现 MySQL FULLTEXT 搜索
+    全局检索服务
+    基于 SearchToken 倒排索引（见 search_index 模块）求交集得到候选文档，再读取原值校验匹配并计算相似度
     """
 
-    # MySQL ngram 解析器默认 token 大小
-    NGRAM_TOKEN_SIZE = 2
-    # 默认最大返回结果数
+    # 默认最大候选文档数
     MAX_RESULTS = 5000
-    RE_CASE_SENSITIVE = 'c'
-    RE_CASE_INSENSITIVE = 'i'
-    COLLATE_CASE_SENSITIVE = 'utf8mb4_bin'
-    COLLATE_CASE_INSENSITIVE = 'utf8mb4_general_ci'
-
-    @classmethod
-    def _get_regexp_flag(cls, case_sensitive: bool) -> str:
-        """
-        获取正则表达式标志
-        """
-        return cls.RE_CASE_SENSITIVE if case_sensitive else cls.RE_CASE_INSENSITIVE
-
-    @classmethod
-    def _get_collation(cls, case_sensitive: bool) -> str:
-        """
-        获取字符集排序规则
-        """
-        return cls.COLLATE_CASE_SENSITIVE if case_sensitive else cls.COLLATE_CASE_INSENSITIVE
+    # 相关度：完全匹配 / 前缀或后缀匹配 / 包含匹配
+    RELEVANCE_EXACT = 100.0
+    RELEVANCE_AFFIX = 80.0
+    RELEVANCE_CONTAINS = 70.0
 
     @classmethod
     @require_valid_user
     def search(cls, query: str, user: UserInfo, model_ids: list = None, limit: int = 100, threshold: float = 0.0, regexp: bool = False, case_sensitive: bool = False, search_mode: str = 'boolean', quick: bool = False) -> dict:
         """
-        全文检索 ModelFieldMeta
+        全局检索实例名称及字段值
 
         Args:
             query: 搜索关键词
             user: 用户信息
             model_ids: 限定搜索的模型ID列表
             limit: 返回结果数量限制
-            threshold: 相似度阈值（FULLTEXT relevance score）
+            threshold: 相似度阈值
             regexp: 是否启用正则表达式搜索
             case_sensitive: 是否区分大小写
-            search_mode: 搜索模式
-                - 'natural': 自然语言模式
-                - 'boolean': 布尔模式（支持 +, -, *, "" 等操作符）
-                - 'expansion': 查询扩展模式
+            search_mode: 保留参数，兼容原 FULLTEXT 的搜索模式，不影响结果
+            quick: 快速搜索，只匹配实例名称
 
         Returns:
             搜索结果字典
@@ -1815,27 +2469,24 @@ class ModelFieldMetaSearchService:
         if not query or not query.strip():
             return {'results': [], 'total': 0, 'query': query}
 
-        if len(query.strip()) < cls.NGRAM_TOKEN_SIZE:
-            logger.warning(f'Query "{query}" is shorter than ngram token size {cls.NGRAM_TOKEN_SIZE}. Skipping search.')
-            # return {'results': [], 'total': 0, 'query': query}
-
         query = query.strip()
-        pm = PermissionManager(user)
-
+        pattern = None
         if regexp:
             try:
-                re.compile(query)
+                pattern = re.compile(query, 0 if case_sensitive else re.IGNORECASE)
             except re.error as e:
                 logger.warning(f'Invalid regular expression "{query}": {e}. Skipping search.')
                 return {'results': [], 'total': 0, 'query': query, 'error': f'Invalid regular expression: {str(e)}'}
 
+        pm = PermissionManager(user)
+
         # 加载模型列表
         models_qs = pm.get_queryset(Models)
         if model_ids:
             models_qs = models_qs.filter(id__in=model_ids)
         models_map = {str(m.id): m for m in models_qs}
 
-        logger.debug(f'Searching ModelFieldMeta for query="{query}" in models: {list(models_map.keys())}')
+        logger.debug(f'Searching for query="{query}" in models: {list(models_map.keys())}')
         if not models_map:
             logger.debug('No models found for the given model IDs or user permissions.')
             return {'results': [], 'total': 0, 'query': query}
@@ -1845,75 +2496,68 @@ class ModelFieldMetaSearchService:
             model_id__in=models_map.keys()
         ).exclude(
             type=FieldType.PASSWORD
-        ).select_related('validation_rule')
-
+        )
         fields_by_id = {str(f.id): f for f in fields_qs}
 
         if not fields_by_id and not quick:
             return {'results': [], 'total': 0, 'query': query}
 
-        # 加载枚举和引用映射
-        enum_cache, ref_instance_cache = cls._build_conversion_cache(fields_qs)
-
-        if regexp:
-            search_variants = {query}
-        else:
-            # 构建搜索变体
-            search_variants = cls._build_search_variants(
-                query,
-                enum_cache,
-                ref_instance_cache,
-                case_sensitive=case_sensitive
-            )
-        logger.debug(f'Search variants generated: {list(search_variants)[:10]}')
-
-        # 获取候选实例列表
-        instance_ids = list(pm.get_queryset(ModelInstance).filter(
-            model_id__in=models_map.keys()
-        ).values_list('id', flat=True))
-
-        if not instance_ids:
-            return {'results': [], 'total': 0, 'query': query}
-
-        # 搜索实例唯一标识
-        instance_matches = cls._search_instance_names(
-            query=query,
-            search_variants=search_variants,
-            instance_ids=instance_ids,
-            models_map=models_map,
-            regexp=regexp,
-            case_sensitive=case_sensitive
+        # 快速搜索时不匹配字段值
+        search_fields = {} if quick else fields_by_id
+        # 权限以子查询关联，不展开可见实例ID
+        instances_qs = pm.get_queryset(ModelInstance).filter(model_id__in=models_map.keys())
+        planner = SearchQueryPlanner(
+            instances_qs,
+            model_ids=models_map.keys(),
+            field_ids=search_fields.keys(),
+            limit=cls.MAX_RESULTS
         )
-
-        # 搜索字段值，快速搜索时不匹配字段值
-        if fields_by_id and not quick:
-            if regexp:
-                meta_results = cls._execute_field_regexp_search(
-                    pattern=query,
-                    case_sensitive=case_sensitive,
-                    instance_ids=instance_ids,
-                    field_ids=list(fields_by_id.keys())
-                )
-            else:
-                meta_results = cls._execute_field_fulltext_search(
-                    query=query,
-                    search_variants=search_variants,
-                    instance_ids=instance_ids,
-                    field_ids=list(fields_by_id.keys())
-                )
-
-            # 合并字段匹配结果
+        candidates = planner.candidates(query, regexp=regexp)
+
+        if candidates is None:
+            # 正则中不含足够长的字面量，索引无法缩小范围，逐行校验
+            logger.debug(f'Pattern "{query}" has no indexable literal, scanning visible documents.')
+            name_rows = instances_qs.values_list('id', 'instance_name').iterator()
+            meta_rows = []
+            if search_fields:
+                meta_rows = ModelFieldMeta.objects.filter(
+                    model_instance_id__in=instances_qs.values('id'),
+                    model_fields_id__in=list(search_fields)
+                ).exclude(
+                    data__isnull=True
+                ).exclude(
+                    data=''
+                ).values_list('id', 'model_instance_id', 'model_fields_id', 'data').iterator()
+        else:
+            logger.debug(f'Search index returned {len(candidates)} candidate documents.')
+            name_ids = [instance_id for instance_id, field_id in candidates if field_id is None]
+            field_docs = {(str(instance_id), str(field_id)) for instance_id, field_id in candidates if field_id}
+            name_rows = []
+            if name_ids:
+                name_rows = ModelInstance.objects.filter(id__in=name_ids).values_list('id', 'instance_name')
+            meta_rows = []
+            if field_docs:
+                meta_rows = [
+                    row for row in ModelFieldMeta.objects.filter(
+                        model_instance_id__in={instance_id for instance_id, _ in field_docs},
+                        model_fields_id__in={field_id for _, field_id in field_docs}
+                    ).values_list('id', 'model_instance_id', 'model_fields_id', 'data')
+                    if (str(row[1]), str(row[2])) in field_docs
+                ]
+
+        instance_matches = cls._match_instance_names(name_rows, query, pattern, case_sensitive)
+
+        if search_fields:
+            meta_results = cls._match_field_values(meta_rows, search_fields, query, pattern, case_sensitive)
             cls._merge_field_matches(
                 instance_matches=instance_matches,
                 meta_results=meta_results,
-                fields_by_id=fields_by_id,
-                enum_cache=enum_cache,
-                ref_instance_cache=ref_instance_cache,
-                search_variants=search_variants,
+                fields_by_id=search_fields,
+                query=query,
                 threshold=threshold,
                 regexp=regexp
             )
-            logger.debug(f'Found {len(meta_results)} matching ModelFieldMeta entries.')
+            logger.debug(f'Found {len(meta_results)} matching field values.')
 
         # 构建最终结果
         results = cls._build_results(
@@ -1929,391 +2573,121 @@ class ModelFieldMetaSearchService:
             'total': total,
             'query': query,
             'search_mode': search_mode,
-            'variants_used': list(search_variants)[:10]  # 返回部分变体用于调试
         }
 
     @classmethod
-    def _search_instance_names(cls, query: str, search_variants: set, instance_ids: list, models_map: dict, regexp: bool = False, case_sensitive: bool = False) -> dict:
+    def _match_relevance(cls, query: str, pattern, case_sensitive: bool, *targets) -> float:
         """
-        搜索 ModelInstance.instance_name
-        返回初始的 instance_matches 字典
+        按原值校验候选文档，返回相关度，0 表示不匹配
         """
-        instance_matches = {}
-
-        if not instance_ids:
-            return instance_matches
-
-        instance_id_strs = [UUIDFormatter.normalize(uid) for uid in instance_ids]
-        instance_placeholders = ','.join(['%s'] * len(instance_id_strs))
-
-        if regexp:
-            match_type = cls._get_regexp_flag(case_sensitive)
-            sql = f"""
-                SELECT 
-                    id,
-                    instance_name,
-                    model_id,
-                    CASE
-                        WHEN REGEXP_LIKE(instance_name, %s, %s) THEN 80.0
-                        ELSE 0.0
-                    END AS relevance
-                FROM model_instance
-                WHERE id IN ({instance_placeholders})
-                    AND REGEXP_LIKE(instance_name, %s, %s)
-                ORDER BY relevance DESC, LENGTH(instance_name) ASC
-                LIMIT {cls.MAX_RESULTS}
-            """
-
-            params = [
-                query, match_type,  # CASE 语句
-            ] + instance_id_strs + [
-                query, match_type   # WHERE 条件
-            ]
-        else:
-            collation = cls._get_collation(case_sensitive)
-            # 转义 LIKE 特殊字符
-
-            def escape_like(s):
-                return s.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
-
-            exact_query = escape_like(query)
-
-            # 构建变体的 LIKE 条件
-            like_conditions = []
-            like_params = []
-            for variant in search_variants:
-                escaped = escape_like(variant)
-                like_conditions.append(f"instance_name COLLATE {collation} LIKE %s")
-                like_params.append(f'%{escaped}%')
-
-            like_clause = ' OR '.join(like_conditions) if like_conditions else '1=0'
-
-            sql = f"""
-                SELECT 
-                    id,
-                    instance_name,
-                    model_id,
-                    CASE
-                        WHEN instance_name = %s THEN 100.0
-                        WHEN instance_name COLLATE {collation} LIKE %s THEN 80.0
-                        WHEN instance_name COLLATE {collation} LIKE %s THEN 80.0
-                        WHEN instance_name COLLATE {collation} LIKE %s THEN 70.0
-                        ELSE 30.0
-                    END AS relevance
-                FROM model_instance
-                WHERE id IN ({instance_placeholders})
-                    AND ({like_clause})
-                ORDER BY 
-                    CASE WHEN instance_name = %s THEN 0 ELSE 1 END,
-                    relevance DESC,
-                    LENGTH(instance_name) ASC
-                LIMIT {cls.MAX_RESULTS}
-            """
-
-            params = [
-                query,                  # 精确匹配
-                f'{exact_query}%',      # 前缀匹配
-                f'%{exact_query}',      # 后缀匹配
-                f'%{exact_query}%',     # 包含匹配
-            ] + instance_id_strs + like_params + [
-                query  # ORDER BY
-            ]
-
-            from django.db.models import Q
-            qs = ModelInstance.objects.filter(id__in=instance_ids).filter(
-                Q(instance_name__exact=query) |
-                Q(instance_name__contains=query)
-            )
-            logger.debug(f'{qs.count()} instances match the instance_name criteria before SQL execution.')
-
-        try:
-            with connection.cursor() as cursor:
-                cursor.execute(sql, params)
-                logger.debug(f'Executed instance_name search SQL: {connection.queries[-1]["sql"]}')
-                columns = [col[0] for col in cursor.description]
-                raw_results = [dict(zip(columns, row)) for row in cursor.fetchall()]
-
-            results = UUIDFormatter.convert_rows(
-                raw_results,
-                uuid_fields=['id', 'model_id']
-            )
-
-            for row in results:
-                inst_id = row['id']
-                relevance = float(row.get('relevance', 0))
-
-                # 计算分数
-                if regexp:
-                    score = Levenshtein.ratio(query, row['instance_name'])
-                else:
-                    if relevance >= 100:
-                        score = 1.0
-                    elif relevance >= 80:
-                        score = 0.95
-                    elif relevance >= 60:
-                        score = 0.85
-                    else:
-                        score = 0.7
-
-                instance_matches[inst_id] = {
-                    'instance_name': row['instance_name'],
-                    'model_id': row['model_id'],
-                    'matches': [{
-                        'field_name': 'instance_name',
-                        'field_verbose_name': '实例名称',
-                        'field_id': None,
-                        'field_type': 'instance_name',
-                        'value': row['instance_name'],
-                        'display_value': row['instance_name'],
-                        'score': round(score, 3),
-                        'relevance': round(relevance, 3),
-                        'is_exact': relevance >= 100
-                    }],
-                    'max_score': score
-                }
-
-            logger.debug(f'Instance name search returned {len(results)} results')
-        except Exception as e:
-            logger.warning(f'Instance name search failed: {e}')
-            raise Exception(f'Instance name search failed: {str(e)}')
-
-        return instance_matches
+        relevance = 0.0
+        needle = query if case_sensitive else normalize_text(query)
+        for target in targets:
+            if not target:
+                continue
+            if pattern is not None:
+                if pattern.search(target):
+                    relevance = max(relevance, cls.RELEVANCE_AFFIX)
+                continue
+            text = target if case_sensitive else normalize_text(target)
+            if text == needle:
+                return cls.RELEVANCE_EXACT
+            if text.startswith(needle) or text.endswith(needle):
+                relevance = max(relevance, cls.RELEVANCE_AFFIX)
+            elif needle in text:
+                relevance = max(relevance, cls.RELEVANCE_CONTAINS)
+        return relevance
 
     @classmethod
-    def _execute_field_regexp_search(cls, pattern: str, instance_ids: list, field_ids: list, case_sensitive: bool = False) -> list:
-        """
-        使用 MySQL REGEXP_LIKE 执行正则表达式搜索
-
-        Args:
-            pattern: 正则表达式模式
-            instance_ids: 实例 ID 列表
-            field_ids: 字段 ID 列表
-            case_sensitive: 是否区分大小写
+    def _score(cls, relevance: float) -> float:
+        if relevance >= cls.RELEVANCE_EXACT:
+            return 1.0
+        if relevance >= cls.RELEVANCE_AFFIX:
+            return 0.95
+        return 0.85
 
-        Returns:
-            匹配结果列表
+    @classmethod
+    def _match_instance_names(cls, rows, query: str, pattern, case_sensitive: bool) -> dict:
         """
-        if not instance_ids or not field_ids:
-            return []
-
-        instance_id_strs = [UUIDFormatter.normalize(uid) for uid in instance_ids]
-        field_id_strs = [UUIDFormatter.normalize(uid) for uid in field_ids]
-
-        instance_placeholders = ','.join(['%s'] * len(instance_id_strs))
-        field_placeholders = ','.join(['%s'] * len(field_id_strs))
-
-        match_type = cls._get_regexp_flag(case_sensitive)
-
-        sql = f"""
-            SELECT 
-                id,
-                model_instance_id,
-                model_fields_id,
-                `data`,
-                80.0 AS relevance,
-                0 AS is_exact_match
-            FROM model_field_meta
-            WHERE model_instance_id IN ({instance_placeholders})
-                AND model_fields_id IN ({field_placeholders})
-                AND `data` IS NOT NULL
-                AND `data` <> ''
-                AND REGEXP_LIKE(`data`, %s, %s)
-            ORDER BY LENGTH(`data`) ASC
-            LIMIT {cls.MAX_RESULTS}
+        校验实例名称，返回初始的 instance_matches 字典
+        :param rows: [(instance_id, instance_name)]
         """
+        instance_matches = {}
+        for instance_id, instance_name in rows:
+            relevance = cls._match_relevance(query, pattern, case_sensitive, instance_name)
+            if not relevance:
+                continue
+            if pattern is not None:
+                score = Levenshtein.ratio(query, instance_name)
+            else:
+                score = cls._score(relevance)
+
+            instance_matches[str(instance_id)] = {
+                'matches': [{
+                    'field_name': 'instance_name',
+                    'field_verbose_name': '实例名称',
+                    'field_id': None,
+                    'field_type': 'instance_name',
+                    'value': instance_name,
+                    'display_value': instance_name,
+                    'score': round(score, 3),
+                    'relevance': round(relevance, 3),
+                    'is_exact': relevance >= cls.RELEVANCE_EXACT
+                }],
+                'max_score': score
+            }
+            if len(instance_matches) >= cls.MAX_RESULTS:
+                break
 
-        params = instance_id_strs + field_id_strs + [pattern, match_type]
-
-        try:
-            with connection.cursor() as cursor:
-                cursor.execute(sql, params)
-                logger.debug(f'Executed REGEXP_LIKE search SQL: {connection.queries[-1]["sql"]}')
-                columns = [col[0] for col in cursor.description]
-                raw_results = [dict(zip(columns, row)) for row in cursor.fetchall()]
-
-            results = UUIDFormatter.convert_rows(
-                raw_results,
-                uuid_fields=['id', 'model_instance_id', 'model_fields_id']
-            )
-            logger.debug(f'REGEXP_LIKE search returned {len(results)} results (case_sensitive={case_sensitive})')
-            return results
-        except Exception as e:
-            logger.warning(f'Error occurred during REGEXP_LIKE search: {e}')
-            raise Exception(f'REGEXP_LIKE search failed: {str(e)}')
+        logger.debug(f'Instance name search returned {len(instance_matches)} results')
+        return instance_matches
 
     @classmethod
-    def _execute_field_fulltext_search(cls, query: str, search_variants: set, instance_ids: list, field_ids: list, search_mode: str = 'boolean', threshold: float = 0.0) -> list:
+    def _match_field_values(cls, rows, fields_by_id: dict, query: str, pattern, case_sensitive: bool) -> list:
         """
-        使用原生 SQL 执行 MySQL FULLTEXT 搜索
-        结合精确匹配提升相关性
+        校验字段值，存储值与显示值（枚举标签、引用实例名称）任一匹配即命中
+        :param rows: [(meta_id, instance_id, field_id, data)]
         """
-        if not instance_ids or not field_ids:
-            return []
-
-        collation = cls._get_collation(case_sensitive=False)
-
-        # 构建布尔模式查询字符串
-        if search_mode == 'boolean':
-            boolean_terms = []
-            for variant in search_variants:
-                safe_variant = (
-                    variant
-                    .replace('\\', '')  # 移除已有的转义
-                    .replace('+', '')
-                    .replace('-', '')
-                    .replace('*', '')
-                    .replace('(', '')
-                    .replace(')', '')
-                    .replace('"', '')
-                    .replace('@', '')
-                    .replace('<', '')
-                    .replace('>', '')
-                    .replace('~', '')
-                ).strip()
-                if safe_variant:
-                    # 不使用 * 后缀，避免过度匹配
-                    boolean_terms.append(f'"{safe_variant}"')  # 使用短语匹配
-            search_query = ' '.join(boolean_terms)
-            match_mode = 'IN BOOLEAN MODE'
-        elif search_mode == 'expansion':
-            search_query = query
-            match_mode = 'WITH QUERY EXPANSION'
-        else:  # natural
-            search_query = query
-            match_mode = 'IN NATURAL LANGUAGE MODE'
-
-        if not search_query.strip():
-            return []
-
-        instance_id_strs = [UUIDFormatter.normalize(uid) for uid in instance_ids]
-        field_id_strs = [UUIDFormatter.normalize(uid) for uid in field_ids]
-
-        instance_placeholders = ','.join(['%s'] * len(instance_id_strs))
-        field_placeholders = ','.join(['%s'] * len(field_id_strs))
-
-        # 转义原始查询用于 LIKE 精确匹配
-        exact_query = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
-
-        # 构建变体的 LIKE 条件用于模糊匹配
-        like_conditions = []
-        like_params = []
-        for variant in search_variants:
-            like_conditions.append(f"`data` COLLATE {collation} LIKE %s")
-            like_params.append(f'%{variant}%')
-
-        like_clause = ' OR '.join(like_conditions) if like_conditions else '1=0'
-
-        sql = f"""
-            SELECT 
-                id,
-                model_instance_id,
-                model_fields_id,
-                `data`,
-                CASE
-                    WHEN `data` = %s THEN 100.0
-                    WHEN `data` COLLATE {collation} LIKE %s THEN 80.0
-                    WHEN `data` COLLATE {collation} LIKE %s THEN 80.0
-                    WHEN ({like_clause}) THEN 70.0
-                    ELSE MATCH(`data`) AGAINST(%s {match_mode})
-                END AS relevance,
-                CASE WHEN `data` = %s THEN 1 ELSE 0 END AS is_exact_match
-            FROM model_field_meta
-            WHERE model_instance_id IN ({instance_placeholders})
-                AND model_fields_id IN ({field_placeholders})
-                AND `data` IS NOT NULL
-                AND `data` <> ''
-                AND (
-                    `data` = %s
-                    OR `data` COLLATE {collation} LIKE %s
-                    OR `data` COLLATE {collation} LIKE %s
-                    OR ({like_clause})
-                    OR MATCH(`data`) AGAINST(%s {match_mode}) > 0.7
-                )
-            ORDER BY is_exact_match DESC, relevance DESC
-            LIMIT {cls.MAX_RESULTS}
-        """
-
-        # 构建参数列表
-        params = [
-            # CASE 语句参数
-            query,              # 精确匹配
-            f'{exact_query}%',  # 前缀匹配
-            f'%{exact_query}',  # 后缀匹配
-        ] + like_params + [     # LIKE 变体匹配
-            search_query,       # FULLTEXT
-            query,              # is_exact_match
-        ] + instance_id_strs + field_id_strs + [
-            # WHERE 条件参数
-            query,              # 精确匹配
-            f'{exact_query}%',  # 前缀匹配
-            f'%{exact_query}',  # 后缀匹配
-        ] + like_params + [     # LIKE 变体匹配
-            search_query,       # FULLTEXT
-            threshold
-        ]
-
-        try:
-            with connection.cursor() as cursor:
-                cursor.execute(sql, params)
-                columns = [col[0] for col in cursor.description]
-                raw_results = [dict(zip(columns, row)) for row in cursor.fetchall()]
-
-            results = UUIDFormatter.convert_rows(
-                raw_results,
-                uuid_fields=['id', 'model_instance_id', 'model_fields_id']
-            )
-            logger.debug(f'Hybrid search returned {len(results)} results')
-            return results
-        except Exception as e:
-            logger.warning(f'Hybrid search failed: {e}, falling back to LIKE search')
-            return cls._fallback_like_search(
-                search_variants, instance_id_strs, field_id_strs
+        results = []
+        enum_dicts = {}
+        iterator = iter(rows)
+        while len(results) < cls.MAX_RESULTS:
+            chunk = list(islice(iterator, FIELD_META_BATCH_SIZE))
+            if not chunk:
+                break
+            ref_names = load_ref_names(
+                data for _, _, field_id, data in chunk
+                if fields_by_id[str(field_id)].type == FieldType.MODEL_REF
             )
-
-    @staticmethod
-    def _fallback_like_search(search_variants: set, instance_ids: list, field_ids: list) -> list:
-        """
-        FULLTEXT 失败时的 LIKE 回退搜索
-        """
-        from django.db.models import Q
-
-        if not instance_ids or not field_ids:
-            return []
-
-        q_filter = Q()
-        for variant in search_variants:
-            if variant and variant.strip():
-                q_filter |= Q(data__contains=variant)
-
-        if not q_filter:
-            return []
-
-        results = ModelFieldMeta.objects.filter(
-            model_instance_id__in=instance_ids,
-            model_fields_id__in=field_ids,
-            data__isnull=False
-        ).exclude(
-            data__exact=''
-        ).filter(
-            q_filter
-        ).values(
-            'id', 'model_instance_id', 'model_fields_id', 'data'
-        )[:5000]
-
-        # 添加默认的 relevance 字段
-        return [
-            {**item, 'relevance': 0.5}
-            for item in results
-        ]
+            for meta_id, instance_id, field_id, data in chunk:
+                field = fields_by_id[str(field_id)]
+                enum_dict = None
+                if field.type == FieldType.ENUM and field.validation_rule_id:
+                    if field.validation_rule_id not in enum_dicts:
+                        enum_dicts[field.validation_rule_id] = ValidationRules.get_enum_dict(field.validation_rule_id)
+                    enum_dict = enum_dicts[field.validation_rule_id]
+                display_value = get_display_value(field, data, enum_dict, ref_names)
+                relevance = cls._match_relevance(query, pattern, case_sensitive, data, display_value)
+                if not relevance:
+                    continue
+                results.append({
+                    'id': str(meta_id),
+                    'model_instance_id': str(instance_id),
+                    'model_fields_id': str(field_id),
+                    'data': data,
+                    'display_value': display_value,
+                    'relevance': relevance,
+                })
+        return results[:cls.MAX_RESULTS]
 
     @classmethod
-    def _merge_field_matches(cls, instance_matches: dict, meta_results: list, fields_by_id: dict, enum_cache: dict, ref_instance_cache: dict, search_variants: set, threshold: float, regexp: bool = False):
+    def _merge_field_matches(cls, instance_matches: dict, meta_results: list, fields_by_id: dict, query: str, threshold: float, regexp: bool = False):
         """
         将字段匹配结果合并到 instance_matches 中
         """
         for meta in meta_results:
-            inst_id = str(meta['model_instance_id'])
-            field_id = str(meta['model_fields_id'])
+            inst_id = meta['model_instance_id']
+            field_id = meta['model_fields_id']
             raw_data = meta['data']
             relevance = float(meta.get('relevance', 0))
 
@@ -2323,23 +2697,10 @@ class ModelFieldMetaSearchService:
                 logger.debug(f'Field ID {field_id} not found during merge, skipping.')
                 continue
 
-            # 获取显示值
-            display_value = cls._get_display_value(
-                raw_data, field, enum_cache, ref_instance_cache
-            )
-
             if regexp:
-                score = Levenshtein.ratio(next(iter(search_variants)), raw_data)
+                score = Levenshtein.ratio(query, raw_data)
             else:
-                # 计算分数
-                if relevance >= 100:
-                    score = 1.0
-                elif relevance >= 80:
-                    score = 0.95
-                elif relevance >= 70:
-                    score = 0.85
-                elif relevance > 0:
-                    score = cls._calculate_similarity(search_variants, raw_data, display_value)
+                score = cls._score(relevance)
 
             if score < threshold:
                 continue
@@ -2350,10 +2711,10 @@ class ModelFieldMetaSearchService:
                 'field_id': field_id,
                 'field_type': field.type,
                 'value': raw_data,
-                'display_value': display_value,
+                'display_value': meta['display_value'],
                 'score': round(score, 3),
                 'relevance': round(relevance, 3),
-                'is_exact': relevance >= 100
+                'is_exact': relevance >= cls.RELEVANCE_EXACT
             }
 
             if inst_id in instance_matches:
@@ -2366,117 +2727,6 @@ class ModelFieldMetaSearchService:
                     'max_score': score
                 }
 
-    @staticmethod
-    def _build_conversion_cache(fields_qs) -> tuple:
-        """构建枚举和引用的双向映射缓存"""
-        enum_cache = {}
-        ref_instance_cache = {}
-        ref_model_ids = set()
-
-        for field in fields_qs:
-            field_id = str(field.id)
-
-            if field.type == FieldType.ENUM and field.validation_rule_id:
-                enum_dict = ValidationRules.get_enum_dict(field.validation_rule_id)
-                enum_cache[field_id] = {
-                    'key_to_label': enum_dict,
-                    'label_to_key': {v: k for k, v in enum_dict.items()}
-                }
-            elif field.type == FieldType.MODEL_REF and field.ref_model_id:
-                ref_model_ids.add(field.ref_model_id)
-
-        # 批量获取所有引用模型的实例
-        if ref_model_ids:
-            ref_instances = ModelInstance.objects.filter(
-                model_id__in=ref_model_ids
-            ).values('id', 'instance_name')
-
-            for inst in ref_instances:
-                inst_id = str(inst['id'])
-                inst_name = inst['instance_name']
-                ref_instance_cache[inst_id] = inst_name
-                # 反向映射：名称 -> ID
-                # if inst_name not in ref_instance_cache:
-                #     ref_instance_cache[inst_name] = inst_id
-
-        return enum_cache, ref_instance_cache
-
-    @staticmethod
-    def _build_search_variants(query: str, enum_cache: dict, ref_instance_cache: dict, case_sensitive: bool = False) -> set:
-        """
-        构建搜索变体集合
-        包含原始查询、枚举转换、实例名称/ID转换
-        """
-        variants = {query}
-
-        if not case_sensitive:
-            variants.add(query.lower())
-            variants.add(query.upper())
-        else:
-            variants.add(query)
-
-        search_key = query if case_sensitive else query.lower()
-
-        # 枚举 key/value 互转
-        for field_id, cache in enum_cache.items():
-            for key, label in cache['key_to_label'].items():
-                if search_key == (key if case_sensitive else key.lower()):
-                    variants.add(label)
-                if search_key == (label if case_sensitive else label.lower()):
-                    variants.add(key)
-
-        # 搜索实例
-        for key, value in ref_instance_cache.items():
-            if search_key in (value if case_sensitive else value.lower()):
-                variants.add(value)
-                variants.add(key)
-
-        return variants
-
-    @staticmethod
-    def _get_display_value(raw_data, field, enum_cache, ref_instance_cache) -> str:
-        """获取字段的显示值"""
-        if not raw_data:
-            return ''
-
-        field_id = str(field.id).replace('-', '')
-
-        if field.type == FieldType.ENUM:
-            cache = enum_cache.get(field_id, {})
-            return cache.get('key_to_label', {}).get(raw_data, raw_data)
-
-        elif field.type == FieldType.MODEL_REF:
-            return ref_instance_cache.get(raw_data, raw_data)
-
-        elif field.type == FieldType.BOOLEAN:
-            if isinstance(raw_data, bool):
-                return '是' if raw_data else '否'
-            if isinstance(raw_data, str):
-                return '是' if raw_data.lower() in ('true', '1', 'yes') else '否'
-            return str(raw_data)
-
-        return str(raw_data)
-
-    @staticmethod
-    def _calculate_similarity(search_variants: set, raw_data: str, display_value: str) -> float:
-        """计算字符串相似度"""
-        if not raw_data and not display_value:
-            return 0.0
-
-        max_score = 0.0
-        targets = [raw_data, display_value]
-
-        for variant in search_variants:
-
-            for target in targets:
-                if not target:
-                    continue
-
-                score = Levenshtein.ratio(variant, target)
-                max_score = max(max_score, score)
-
-        return max_score
-
     @staticmethod
     def _build_results(instance_matches: dict, models_map: dict) -> list:
         """构建最终结果列表"""
@@ -2513,13 +2763,15 @@ class ModelFieldMetaSearchService:
         results.sort(key=lambda x: -x['max_score'])
         return results
 
-    @staticmethod
+    @classmethod
     @require_valid_user
-    def search_instances_by_name(query: str, user: UserInfo, model_ids: list = None, limit: int = 50) -> list:
+    def search_instances_by_name(cls, query: str, user: UserInfo, model_ids: list = None, limit: int = 50) -> list:
         """
         按实例名称搜索
         """
-        from django_mysql.models.functions import Match
+        query = (query or '').strip()
+        if not query:
+            return []
 
         pm = PermissionManager(user)
 
@@ -2528,19 +2780,16 @@ class ModelFieldMetaSearchService:
         if model_ids:
             queryset = queryset.filter(model_id__in=model_ids)
 
-        # 构建布尔搜索查询
-        safe_query = query.replace('+', '\\+').replace('-', '\\-')
-        search_query = f'{safe_query}*'
-
-        results = queryset.annotate(
-            relevance=Match('instance_name', search_query, mode=Match.BOOLEAN)
-        ).filter(
-            relevance__gt=0
-        ).order_by('-relevance').values(
-            'id', 'instance_name', 'model_id'
-        )[:limit]
+        planner = SearchQueryPlanner(queryset, model_ids=model_ids or None, limit=cls.MAX_RESULTS)
+        instance_ids = [instance_id for instance_id, _ in planner.candidates(query)]
 
-        return list(results)
+        matches = []
+        for inst in ModelInstance.objects.filter(id__in=instance_ids).values('id', 'instance_name', 'model_id'):
+            relevance = cls._match_relevance(query, None, False, inst['instance_name'])
+            if relevance:
+                matches.append((relevance, inst))
+        matches.sort(key=lambda item: (-item[0], len(item[1]['instance_name'])))
+        return [inst for _, inst in matches[:limit]]
 
 
 class RelationDefinitionService:
@@ -2628,6 +2877,13 @@ class TopologyEdge:
     target_visible: bool
 
 
+@dataclass
+class BulkRelationResult:
+    """批量创建关系结果，results 与输入逐项对应"""
+    created: List['Relations']
+    results: List[dict]
+
+
 @dataclass
 class TopologyResult:
     """拓扑查询结果"""
@@ -2707,15 +2963,21 @@ class RelationsService:
 
     @staticmethod
     def _would_create_cycle(source_id: str, target_id: str, relation_id: str) -> bool:
-        """检查添加关系是否会创建环"""
+        """
+        检查添加关系是否会创建环：target 沿同一关系定义的边能否到达 source
+        有向无环是关系定义的约束，只检查同一关系定义的边，与 _find_cycle_edges 一致
+        """
         from .models import Relations
 
+        if supports_recursive_cte():
+            return RelationCteTraversal().is_reachable(target_id, source_id, relation_ids=[relation_id])
+
         # 使用BFS检查从target到source是否存在路径
         visited = set()
-        queue = [str(target_id)]
+        queue = deque([str(target_id)])
 
         while queue:
-            current = queue.pop(0)
+            current = queue.popleft()
             if current == str(source_id):
                 return True
 
@@ -2723,11 +2985,10 @@ class RelationsService:
                 continue
             visited.add(current)
 
-            # 获取当前节点的所有出边目标
-            next_nodes = Relations.objects.get_connected_instances(
-                current,
-                direction='forward'
-            )
+            # 获取当前节点同一关系定义的出边目标
+            next_nodes = Relations.objects.filter(
+                source_instance_id=current, relation_id=relation_id
+            ).values_list('target_instance_id', flat=True)
 
             queue.extend(str(n) for n in next_nodes if str(n) not in visited)
 
@@ -2735,22 +2996,216 @@ class RelationsService:
 
     @classmethod
     @require_valid_user
-    def bulk_create_relations(cls, relations_data: list, user: UserInfo) -> list:
-        """批量创建关系"""
-
+    def bulk_create_relations(cls, relations_data: list, user: UserInfo) -> BulkRelationResult:
+        """
+        批量创建关系
+        实例、权限、关系定义及模型约束一次性预加载后逐项校验，
+        有向无环关系按关系定义对“已有 + 新增”边做一次拓扑排序检查环，
+        通过校验的关系以 bulk_create(ignore_conflicts=True) 写入，实际写入的关系批量记录审计日志
+        """
         username = user.username
-        created_relations = []
-
-        for data in relations_data:
-            try:
-                relation = cls.create_relation(data, user)
-                created_relations.append(relation)
-            except (ValidationError, PermissionDenied) as e:
-                logger.warning(f"Failed to create relation: {e}")
+        results = [{'index': i, 'status': 'failed', 'id': None, 'error': None} for i in range(len(relations_data))]
+
+        def fail(i, message):
+            results[i]['error'] = message
+
+        # 解析输入
+        items = {}
+        for i, data in enumerate(relations_data):
+            source_id = cls._parse_uuid(data.get('source_instance'))
+            target_id = cls._parse_uuid(data.get('target_instance'))
+            relation_id = cls._parse_uuid(data.get('relation'))
+            if not (source_id and target_id and relation_id):
+                fail(i, "source_instance, target_instance and relation must be valid UUIDs.")
                 continue
+            items[i] = (source_id, target_id, relation_id)
+
+        instance_ids = {node_id for source_id, target_id, _ in items.values() for node_id in (source_id, target_id)}
+        relation_def_ids = {relation_id for _, _, relation_id in items.values()}
+
+        # 预加载实例模型、可见实例、关系定义及模型约束
+        instance_models = {}
+        visible_ids = set()
+        pm = PermissionManager(user)
+        for chunk in cls._chunks(instance_ids):
+            instance_models.update(
+                (str(instance_id), str(model_id))
+                for instance_id, model_id in ModelInstance.objects.filter(id__in=chunk).values_list('id', 'model_id')
+            )
+            visible_ids.update(
+                str(instance_id)
+                for instance_id in pm.get_queryset(ModelInstance).filter(id__in=chunk).values_list('id', flat=True)
+            )
+
+        relation_defs = {
+            str(relation_def.id): relation_def
+            for relation_def in RelationDefinition.objects.filter(id__in=relation_def_ids)
+        }
+        allowed_models = {}
+        for field_name in ('source_model', 'target_model'):
+            through = RelationDefinition._meta.get_field(field_name).remote_field.through
+            allowed = allowed_models[field_name] = defaultdict(set)
+            for relation_id, model_id in through.objects.filter(
+                relationdefinition_id__in=relation_defs
+            ).values_list('relationdefinition_id', 'models_id'):
+                allowed[str(relation_id)].add(str(model_id))
+
+        existing = set()
+        for chunk in cls._chunks({source_id for source_id, _, _ in items.values()}):
+            existing.update(
+                (str(source_id), str(target_id), str(relation_id))
+                for source_id, target_id, relation_id in Relations.objects.filter(
+                    source_instance_id__in=chunk, relation_id__in=relation_defs
+                ).values_list('source_instance_id', 'target_instance_id', 'relation_id')
+            )
+
+        # 逐项校验（与 create_relation 的校验顺序一致）
+        candidates = {}
+        for i, key in items.items():
+            source_id, target_id, relation_id = key
+            relation_def = relation_defs.get(relation_id)
+            if relation_def is None:
+                fail(i, f"Relation definition {relation_id} does not exist.")
+            elif key in existing:
+                fail(i, "This relation already exists for the given source, target, and relation type.")
+            elif source_id not in instance_models:
+                fail(i, f"Source instance {source_id} does not exist.")
+            elif target_id not in instance_models:
+                fail(i, f"Target instance {target_id} does not exist.")
+            elif source_id not in visible_ids and target_id not in visible_ids:
+                fail(i, "No permission to create this relation.")
+            elif (allowed_models['source_model'][relation_id]
+                  and instance_models[source_id] not in allowed_models['source_model'][relation_id]):
+                fail(i, "Source instance model is not allowed for this relation type.")
+            elif (allowed_models['target_model'][relation_id]
+                  and instance_models[target_id] not in allowed_models['target_model'][relation_id]):
+                fail(i, "Target instance model is not allowed for this relation type.")
+            else:
+                existing.add(key)
+                candidates[i] = key
+
+        # 有向无环约束：每个关系定义一次拓扑排序
+        dag_edges = defaultdict(list)
+        for i, (source_id, target_id, relation_id) in candidates.items():
+            if relation_defs[relation_id].topology_type == 'daggered':
+                dag_edges[relation_id].append((i, source_id, target_id))
+        for relation_id, new_edges in dag_edges.items():
+            for i in cls._find_cycle_edges(relation_id, new_edges):
+                fail(i, "This relation would create a cycle, which is not allowed for DAG topology.")
+                del candidates[i]
+
+        to_create = {
+            i: Relations(
+                source_instance_id=source_id,
+                target_instance_id=target_id,
+                relation_id=relation_id,
+                source_attributes=relations_data[i].get('source_attributes', {}),
+                target_attributes=relations_data[i].get('target_attributes', {}),
+                relation_attributes=relations_data[i].get('relation_attributes', {}),
+                create_user=username,
+                update_user=username
+            )
+            for i, (source_id, target_id, relation_id) in candidates.items()
+        }
+
+        created = []
+        with transaction.atomic():
+            Relations.objects.bulk_create(
+                to_create.values(), batch_size=RELATION_BATCH_SIZE, ignore_conflicts=True
+            )
+            # ignore_conflicts 不回填写入结果，并发写入的重复关系需要回查确认
+            # 同时取回两端实例及关系定义，供审计快照使用
+            inserted = {}
+            for chunk in cls._chunks([relation.id for relation in to_create.values()]):
+                inserted.update(
+                    (relation.id, relation) for relation in Relations.objects.filter(id__in=chunk).select_related(
+                        'source_instance__model', 'target_instance__model', 'relation'
+                    ).prefetch_related('relation__source_model', 'relation__target_model')
+                )
+
+            for i, relation in to_create.items():
+                if relation.id in inserted:
+                    results[i].update(status='created', id=str(relation.id))
+                    created.append(inserted[relation.id])
+                else:
+                    fail(i, "This relation already exists for the given source, target, and relation type.")
+
+            # bulk_create 不触发 post_save，需手动写入审计日志及关系索引的变更日志
+            bulk_creation_audit.send(sender=Relations, instances=created)
+            publish_relation_changes_on_commit(relation_upsert(relation) for relation in created)
+
+        logger.info(
+            f"User {username} bulk created {len(created)} relations, "
+            f"{len(relations_data) - len(created)} failed"
+        )
+        return BulkRelationResult(created=created, results=results)
+
+    @staticmethod
+    def _parse_uuid(value):
+        try:
+            return str(uuid.UUID(str(value)))
+        except (TypeError, ValueError, AttributeError):
+            return None
+
+    @staticmethod
+    def _chunks(values):
+        values = list(values)
+        for start in range(0, len(values), RELATION_BATCH_SIZE):
+            yield values[start:start + RELATION_BATCH_SIZE]
+
+    @staticmethod
+    def _find_cycle_edges(relation_id: str, new_edges: list) -> list:
+        """
+        对关系定义的已有边与新增边 [(序号, 源ID, 目标ID)] 做拓扑排序，返回会成环的新增边序号
+        拓扑排序后剩余的节点才可能位于环上，仅对两端都在剩余节点中的新增边按输入顺序逐条检查，
+        与逐条创建时“先到先得”的结果一致
+        """
+        adjacency = defaultdict(list)
+        in_degree = defaultdict(int)
+        existing_edges = [
+            (str(source_id), str(target_id))
+            for source_id, target_id in Relations.objects.filter(relation_id=relation_id).values_list(
+                'source_instance_id', 'target_instance_id'
+            ).order_by().iterator(chunk_size=RELATION_BATCH_SIZE)
+        ]
+        for source_id, target_id in existing_edges + [(source_id, target_id) for _, source_id, target_id in new_edges]:
+            adjacency[source_id].append(target_id)
+            in_degree[target_id] += 1
+            in_degree.setdefault(source_id, 0)
+
+        queue = deque(node for node, degree in in_degree.items() if degree == 0)
+        while queue:
+            node = queue.popleft()
+            for target_id in adjacency[node]:
+                in_degree[target_id] -= 1
+                if in_degree[target_id] == 0:
+                    queue.append(target_id)
+        remaining = {node for node, degree in in_degree.items() if degree > 0}
+        if not remaining:
+            return []
+
+        # 剩余子图中按输入顺序逐条加入新增边，目标能到达源则成环
+        residual = defaultdict(list)
+        for source_id, target_id in existing_edges:
+            if source_id in remaining and target_id in remaining:
+                residual[source_id].append(target_id)
 
-        logger.info(f"User {username} bulk created {len(created_relations)} relations")
-        return created_relations
+        rejected = []
+        for i, source_id, target_id in new_edges:
+            if source_id not in remaining or target_id not in remaining:
+                continue
+            visited = {target_id}
+            stack = [target_id]
+            while stack and source_id not in visited:
+                for next_id in residual[stack.pop()]:
+                    if next_id not in visited:
+                        visited.add(next_id)
+                        stack.append(next_id)
+            if source_id in visited:
+                rejected.append(i)
+            else:
+                residual[source_id].append(target_id)
+        return rejected
 
     @staticmethod
     @require_valid_user
@@ -2813,7 +3268,11 @@ class RelationsService:
 
         G = nx.DiGraph()
 
-        if mode == 'path':
+        if relation_graph_enabled():
+            all_relations, all_node_ids = cls._traverse_relation_graph(
+                start_node_ids, end_node_ids, depth, direction, mode
+            )
+        elif mode == 'path':
             all_relations, all_node_ids = cls._build_path_graph(
                 start_node_ids, end_node_ids, depth
             )
@@ -2828,17 +3287,18 @@ class RelationsService:
         else:
             all_relations, all_node_ids = [], set()
 
-        visible_instances = pm.get_queryset(ModelInstance).filter(
-            id__in=all_node_ids
-        ).in_bulk()
-        visible_instance_ids = set(str(id) for id in visible_instances.keys())
+        visible_instances = {
+            str(pk): instance
+            for pk, instance in pm.get_queryset(ModelInstance).filter(id__in=all_node_ids).in_bulk().items()
+        }
+        visible_instance_ids = set(visible_instances)
 
         nodes = []
         node_map = {}
 
         for node_id in all_node_ids:
             node_id_str = str(node_id)
-            instance = visible_instances.get(node_id) if node_id in visible_instances else None
+            instance = visible_instances.get(node_id_str)
 
             if instance:
                 node = TopologyNode(
@@ -2887,11 +3347,38 @@ class RelationsService:
             restricted_node_count=restricted_count
         )
 
+    @staticmethod
+    def _traverse_relation_graph(start_node_ids: List[str], end_node_ids: List[str], depth: int,
+                                 direction: str, mode: str):
+        """在进程内关系索引上遍历，只读取结果中的关系"""
+        from .models import Relations
+
+        with relation_graph() as graph:
+            if mode == 'path':
+                relation_ids, all_node_ids = graph.path(start_node_ids, end_node_ids or [], depth)
+            elif mode == 'blast':
+                relation_ids, all_node_ids = graph.blast(start_node_ids, depth, direction)
+            elif mode == 'neighbor':
+                relation_ids, all_node_ids = graph.neighbor(start_node_ids, direction)
+            else:
+                return [], set()
+
+        all_relations = []
+        relation_ids = list(relation_ids)
+        for start in range(0, len(relation_ids), RELATION_BATCH_SIZE):
+            all_relations.extend(Relations.objects.filter(
+                id__in=relation_ids[start:start + RELATION_BATCH_SIZE]
+            ).select_related('source_instance', 'target_instance', 'relation'))
+        return all_relations, all_node_ids
+
     @staticmethod
     def _build_path_graph(start_node_ids: List[str], end_node_ids: List[str], depth: int):
         """构建路径查询图"""
         from .models import Relations
 
+        if supports_recursive_cte():
+            return RelationCteTraversal().topology_edges(list(start_node_ids) + list(end_node_ids), depth + 1)
+
         all_relations = []
         all_node_ids = set(start_node_ids + end_node_ids)
         visited = set()
@@ -2930,6 +3417,9 @@ class RelationsService:
         """构建邻居查询图"""
         from .models import Relations
 
+        if supports_recursive_cte():
+            return RelationCteTraversal().topology_edges(start_node_ids, 1, direction)
+
         all_relations = []
         all_node_ids = set(start_node_ids)
 
@@ -2941,7 +3431,7 @@ class RelationsService:
                 q_filter |= Q(target_instance_id=start_node)
 
             relations = Relations.objects.filter(q_filter).select_related(
-                'source_instance', 'target_instance', 'relation'
+                'source_instance__model', 'target_instance__model', 'relation'
             )
 
             for rel in relations:
@@ -9,7 +9,7 @@ from django.db.models.signals import post_save, post_delete, pre_save, pre_delet
 from rest_framework.exceptions import PermissionDenied, ValidationError
 from django.core.cache import cache
 from cacheops import invalidate_model
-from django.db import transaction
+from django.db import transaction, connections, DEFAULT_DB_ALIAS
 from django.db.utils import OperationalError
 
 
@@ -17,10 +17,22 @@ from node_mg.utils import sys_config
 from audit.context import audit_context
 from mapi.system_user import SYSTEM_USER
 from .config import BUILT_IN_MODELS, BUILT_IN_RELATION_DEFINITION, BUILT_IN_VALIDATION_RULES
-from .constants import ValidationType
+from .constants import FieldType, ValidationType, FIELD_META_DATA_INDEX, FIELD_META_DATA_INDEX_PREFIX
+from .converters import ConverterFactory
 from .message import instance_group_relation_updated
 from .models import *
 from .services import ModelsService, ModelFieldPreferenceService
+from .projection import get_projection_table, drop_projection_table
+from . import group_counters, scope_versions
+from .relation_graph import publish_relation_changes_on_commit, relation_upsert, relation_remove
+from vuedjango.request_cache import invalidate_request_cache
+from .schema_cache import bump_schema_version
+from .search_index import (
+    sync_field_values_on_commit,
+    sync_fields_on_commit,
+    sync_instance_names_on_commit,
+    delete_instances_on_commit,
+)
 logger = logging.getLogger(__name__)
 
 
@@ -46,6 +58,7 @@ def create_field_meta_for_instances(sender, instance, created, **kwargs):
                     model_instance=model_instance,
                     model_fields=instance,
                     data=field_value,
+                    **ConverterFactory.get_typed_values(instance.type, field_value),
                     create_user='system',
                     update_user='system'
                 )
@@ -353,6 +366,41 @@ def initialize_cmdb(sender, **kwargs):
             logger.error(f"Error during CMDB initialization: {traceback.format_exc()}")
 
 
+@receiver(post_migrate)
+def ensure_field_meta_data_index(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    创建 ModelFieldMeta 的 (model_fields_id, data 前缀) 复合索引，使动态字段的等值过滤走索引。
+    - MySQL 的 TEXT 列只能建立前缀索引，Django 的 Meta.indexes 无法表达，因此在迁移后单独创建
+    - PostgreSQL 对完整 TEXT 值建立 B-tree 索引时，超过约 2.7KB 的值无法写入，
+      改为 left(data, N) 表达式索引，InstanceFieldFilter 的等值条件附带相同的前缀条件以匹配该索引
+    - 其他数据库不创建
+    """
+    if sender.name != 'cmdb':
+        return
+    connection = connections[using]
+    if connection.vendor not in ('mysql', 'postgresql'):
+        return
+    table = ModelFieldMeta._meta.db_table
+    try:
+        with connection.cursor() as cursor:
+            if table not in connection.introspection.table_names(cursor):
+                return
+            constraints = connection.introspection.get_constraints(cursor, table)
+            if FIELD_META_DATA_INDEX in constraints:
+                return
+            qn = connection.ops.quote_name
+            if connection.vendor == 'mysql':
+                data_column = f'{qn("data")}({FIELD_META_DATA_INDEX_PREFIX})'
+            else:
+                data_column = f'(left({qn("data")}, {FIELD_META_DATA_INDEX_PREFIX}))'
+            cursor.execute(
+                f'CREATE INDEX {qn(FIELD_META_DATA_INDEX)} ON {qn(table)} ({qn("model_fields_id")}, {data_column})'
+            )
+        logger.info(f"Created index {FIELD_META_DATA_INDEX} on {table}")
+    except Exception as e:
+        logger.error(f"Error creating index {FIELD_META_DATA_INDEX}: {str(e)}")
+
+
 @receiver(post_save, sender=ModelFieldMeta)
 def update_instance_name_on_field_change(sender, instance, created, **kwargs):
     """当字段值更新时，自动更新实例名称"""
@@ -407,26 +455,10 @@ def cache_old_path(sender, instance, **kwargs):
 @receiver(post_save, sender=ModelInstanceGroup)
 def update_descendant_paths(sender, instance, created, **kwargs):
     """
-    当一个 ModelInstanceGroup 的 path 发生变化时，
-    异步或在独立事务中递归更新其所有后代分组的 path。
+    后代分组的 path 及层级由 ModelInstanceGroup.save 基于闭包表在同一事务内改写，
+    这里仅清理子分组缓存
     """
     ModelInstanceGroup.objects.clear_children_cache()
-    if created:
-        return
-    if getattr(instance, '_skip_signal', False) or kwargs.get('_skip_path_update', False):
-        return
-    print(instance.path)
-    old_path = getattr(instance, '_old_path', None)
-    new_path = instance.path
-    print(instance._old_path)
-    # 只有在 path 确实发生变化时才执行更新
-    if old_path != new_path:
-        # logger.debug(f"Path for group '{instance.label}' changed from '{old_path}' to '{new_path}'. Triggering descendant path update.")
-
-        def do_update():
-            instance.update_child_path()
-
-        transaction.on_commit(do_update)
 
 
 @receiver(pre_delete, sender=ModelFields)
@@ -465,6 +497,134 @@ def check_field_dependencies(sender, instance, **kwargs):
         })
 
 
+@receiver(post_save, sender=ModelFields)
+def mark_projection_stale_on_field_save(sender, instance, created, **kwargs):
+    """字段新增或名称、类型变更后宽表列结构失效，需要重建"""
+    if created:
+        ModelProjection.objects.mark_stale(instance.model_id)
+        return
+    projection = ModelProjection.objects.filter(model_id=instance.model_id, stale=False).first()
+    if not projection:
+        return
+    for col in projection.columns or []:
+        if col.get('field_id') == str(instance.id):
+            if col.get('name') != instance.name or col.get('type') != instance.type:
+                ModelProjection.objects.mark_stale(instance.model_id)
+            return
+
+
+@receiver(post_delete, sender=ModelFields)
+def mark_projection_stale_on_field_delete(sender, instance, **kwargs):
+    ModelProjection.objects.mark_stale(instance.model_id, field_id=instance.id)
+
+
+@receiver([post_save, post_delete], sender=ModelFields)
+def invalidate_field_request_cache(sender, instance, **kwargs):
+    """字段变更后当前请求内缓存的有权限字段失效"""
+    invalidate_request_cache('permitted_fields')
+
+
+@receiver([post_save, post_delete], sender=Models)
+@receiver([post_save, post_delete], sender=ModelFields)
+@receiver([post_save, post_delete], sender=ValidationRules)
+@receiver([post_save, post_delete], sender=UniqueConstraint)
+def bump_schema_version_on_change(sender, instance, **kwargs):
+    """模型定义变化后各进程的定义缓存失效"""
+    bump_schema_version()
+
+
+@receiver(post_delete, sender=ModelInstance)
+def delete_projection_row(sender, instance, **kwargs):
+    """实例删除时同步删除宽表中的对应行"""
+    projection = get_projection_table(instance.model_id)
+    if projection:
+        projection.delete_instances([instance.id])
+
+
+@receiver(post_save, sender=ModelInstanceGroup)
+def bump_scope_version_on_group_save(sender, instance, created, update_fields=None, **kwargs):
+    """分组新建或移动后，授权了其祖先分组的数据范围的编译结果失效"""
+    scope_versions.group_saved(instance, created, update_fields)
+
+
+@receiver(pre_delete, sender=ModelInstanceGroup)
+def bump_scope_version_on_group_delete(sender, instance, **kwargs):
+    scope_versions.group_deleting(instance)
+
+
+@receiver([post_save, post_delete], sender=ModelInstanceGroupRelation)
+def bump_scope_version_on_relation_change(sender, instance, **kwargs):
+    """实例分组关系变化后，授权了相关分组（含祖先）或实例的数据范围的编译结果失效"""
+    scope_versions.groups_changed_on_commit(
+        [instance.group_id, getattr(instance, '_old_group_id', None)], [instance.instance_id]
+    )
+
+
+@receiver(pre_save, sender=ModelInstanceGroupRelation)
+def cache_old_relation_group(sender, instance, update_fields=None, **kwargs):
+    """关系变更分组前记录原分组，用于更新分组计数"""
+    if instance._state.adding or (update_fields is not None and 'group' not in update_fields):
+        return
+    instance._old_group_id = sender.objects.filter(pk=instance.pk).values_list('group_id', flat=True).first()
+
+
+@receiver(post_save, sender=ModelInstanceGroupRelation)
+def update_group_counters_on_save(sender, instance, created, **kwargs):
+    group_counters.relation_saved(instance, created, getattr(instance, '_old_group_id', None))
+
+
+@receiver(pre_delete, sender=ModelInstanceGroupRelation)
+def capture_group_counters_on_delete(sender, instance, **kwargs):
+    group_counters.capture_relation_delete(instance)
+
+
+@receiver(post_delete, sender=ModelInstanceGroupRelation)
+def update_group_counters_on_delete(sender, instance, **kwargs):
+    group_counters.relation_deleted(instance)
+
+
+@receiver(post_save, sender=Relations)
+def sync_relation_graph(sender, instance, **kwargs):
+    """关系变更在事务提交后写入关系索引的变更日志"""
+    publish_relation_changes_on_commit([relation_upsert(instance)])
+
+
+@receiver(post_delete, sender=Relations)
+def remove_relation_graph_edge(sender, instance, **kwargs):
+    publish_relation_changes_on_commit([relation_remove(instance.id)])
+
+
+@receiver(pre_delete, sender=Models)
+def drop_projection_on_model_delete(sender, instance, **kwargs):
+    """模型删除后清理宽表，DDL 放在事务提交后执行，避免 MySQL 隐式提交"""
+    projection = ModelProjection.objects.filter(model=instance).first()
+    if not projection:
+        return
+    table_name, columns = projection.table_name, projection.columns
+    transaction.on_commit(lambda: drop_projection_table(table_name, columns))
+
+
+@receiver(post_save, sender=ModelInstance)
+def sync_instance_name_search_index(sender, instance, update_fields=None, **kwargs):
+    """实例名称的搜索索引在事务提交后同步，名称未变化时不会重写"""
+    if update_fields is not None and 'instance_name' not in update_fields:
+        return
+    sync_instance_names_on_commit([instance.id])
+    invalidate_request_cache('ref_names')
+
+
+@receiver(post_delete, sender=ModelInstance)
+def delete_instance_search_index(sender, instance, **kwargs):
+    delete_instances_on_commit([instance.id])
+    invalidate_request_cache('ref_names')
+
+
+@receiver(post_save, sender=ModelFieldMeta)
+def sync_field_meta_search_index(sender, instance, **kwargs):
+    """单条保存的字段值，批量写入由 ModelFieldMetaWriter.flush 同步"""
+    sync_field_values_on_commit([(instance.model_instance_id, instance.model_fields_id)])
+
+
 @receiver(post_save, sender=ValidationRules)
 def on_validation_rule_save(sender, instance, **kwargs):
     if instance.type == ValidationType.ENUM:
@@ -477,6 +637,17 @@ def on_validation_rule_delete(sender, instance, **kwargs):
         ValidationRules.clear_specific_enum_cache(instance.id)
 
 
+@receiver(post_save, sender=ValidationRules)
+def sync_enum_search_index(sender, instance, created, **kwargs):
+    """枚举标签变更后重建使用该规则的字段的搜索索引"""
+    if created or instance.type != ValidationType.ENUM:
+        return
+    field_ids = ModelFields.objects.filter(
+        validation_rule=instance, type=FieldType.ENUM
+    ).values_list('id', flat=True)
+    sync_fields_on_commit(list(field_ids))
+
+
 # 信跨应用传递信号给节点管理
 # 模型
 model_signal = Signal(providing_args=["instance", "action"])
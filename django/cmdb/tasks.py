@@ -4,40 +4,56 @@ CMDB异步任务模块
 """
 
 import io
+import os
+import time
 import uuid
 import logging
+import tempfile
 import traceback
+from collections import Counter, defaultdict
+from itertools import islice
 
 from celery import shared_task
+from django.conf import settings
 from django.core.cache import cache
 from django.db import transaction
 from rest_framework.exceptions import ValidationError
 
 from mapi.models import UserInfo
+from access.manager import PermissionManager
 from .models import *
 from .services import *
 from .serializers import ModelInstanceSerializer
 from .excel import ExcelHandler
-from .utils.name_generator import generate_instance_name
+from .constants import FieldType
+from .utils.name_generator import get_template_field_info, render_instance_name
 from audit.context import audit_context
 
 logger = logging.getLogger(__name__)
 
 
+# 每批处理的导入行数，批内字段值统一写入，进度按批次更新
+IMPORT_CHUNK_SIZE = 500
+# 模板变更后每批重命名的实例数
+RENAME_CHUNK_SIZE = 1000
+# 重命名进度写入缓存的最小间隔（秒）
+PROGRESS_UPDATE_INTERVAL = 1.0
+
+
 @shared_task(bind=True)
-def process_import_data(self, excel_data: dict, model_id: str, userid: str, _audit_context: dict):
+def process_import_data(self, file_path: str, model_id: str, userid: str, _audit_context: dict):
     """
     通过表格导入数据创建或更新模型实例的异步任务。
-    使用序列化器进行校验，服务层执行创建/更新。
+    上传文件由视图落盘后传入路径，以只读模式流式读取，按 IMPORT_CHUNK_SIZE 行分批处理：
+    每批一次加载引用/已存在实例、一次唯一性约束校验，字段值在批次结束时批量写入。
+    任务结束后删除上传文件。
     """
     task_id = self.request.id
     cache_key = f'import_task_{task_id}'
 
-    user = UserInfo.objects.get(id=userid)
-
     results = {
         'status': 'processing',
-        'total': len(excel_data.get('instances', [])),
+        'total': 0,
         'progress': 0,
         'created': 0,
         'updated': 0,
@@ -50,143 +66,42 @@ def process_import_data(self, excel_data: dict, model_id: str, userid: str, _aud
 
     error_data = []
     processed_names = set()
+    excel_handler = ExcelHandler()
 
     try:
+        user = UserInfo.objects.get(id=userid)
         model = Models.objects.get(id=model_id)
-        instances_data = excel_data.get('instances', [])
-
-        if not instances_data:
-            results['status'] = 'completed'
-            results['progress'] = 100
-            cache.set(cache_key, results, timeout=600)
-            return results
-
-        import_context = ModelInstanceService.build_import_context(model, instances_data)
-        logger.info(f"Starting import of {len(instances_data)} instances for model {model.name}")
-
-        for idx, instance_data in enumerate(instances_data):
-            instance_name = instance_data.get('instance_name', '')
-            using_template = instance_data.get('using_template', None)
-
-            # 跳过重复
-            if instance_name and instance_name in processed_names:
-                results['skipped'] += 1
-                _update_progress(results, cache_key)
-                continue
-            if instance_name:
-                processed_names.add(instance_name)
-
-            # 跳过无名称
-            if not instance_name:
-                results['skipped'] += 1
-                _update_progress(results, cache_key)
-                continue
-
-            try:
-                raw_fields = {
-                    k: v for k, v in instance_data.get('fields', {}).items()
-                    if v not in (None, '')
-                }
-                processed_fields = ModelInstanceService.preprocess_import_fields(raw_fields, import_context)
-
-                existing_instance = import_context['existing_instances'].get(instance_name)
-                is_update = existing_instance is not None
-
-                serializer_data = {
-                    'model': model_id,
-                    'instance_name': instance_name,
-                    'fields': processed_fields,
-                    'input_mode': 'import',
-                    'using_template': using_template
-                }
-                logger.debug(f'Processing instance: {serializer_data}')
-
-                if is_update:
-                    if using_template is None:
-                        serializer_data['using_template'] = existing_instance.using_template
-                    serializer = ModelInstanceSerializer(
-                        instance=existing_instance,
-                        data=serializer_data,
-                        partial=True,
-                        context=import_context
-                    )
-                else:
-                    if using_template is None:
-                        serializer_data['using_template'] = True
-                    serializer = ModelInstanceSerializer(
-                        data=serializer_data,
-                        context=import_context
-                    )
-
-                serializer.is_valid(raise_exception=True)
-                validated_data = serializer.validated_data
-
-                with audit_context(**_audit_context):
-                    if is_update:
-                        logger.debug(f"Updating existing instance '{instance_name}'")
-                        ModelInstanceService.validate_fields_for_import_update(
-                            model=model,
-                            input_fields=raw_fields,
-                            user=user,
-                            import_context=import_context
-                        )
-                        logger.debug(f"Validated fields for update of instance '{instance_name}'")
-                        ModelInstanceService.update_instance(
-                            instance=existing_instance,
-                            validated_data=validated_data,
-                            user=user,
-                            from_excel=True
-                        )
-                        results['updated'] += 1
-                    else:
-                        # 获取空闲池
-                        unassigned_group = import_context.get('unassigned_group')
-                        group_ids = [unassigned_group.id] if unassigned_group else None
-                        filled_fields = ModelInstanceService.prepare_fields_for_import_creation(
-                            model=model,
-                            input_fields=processed_fields,
-                            user=user,
-                            import_context=import_context
-                        )
-                        validated_data['fields'] = filled_fields
-                        with transaction.atomic():
-                            instance = ModelInstanceService.create_instance(
-                                validated_data=validated_data,
-                                user=user,
-                                instance_group_ids=group_ids,
-                                from_excel=True
-                            )
-                            ModelInstanceService.backfill_field_values(
-                                instance=instance,
-                                fields_data=filled_fields,
-                                from_excel=True
-                            )
-                        results['created'] += 1
-
-            except ValidationError as e:
-                error_msg = str(e.detail) if hasattr(e, 'detail') else str(e)
-                results['failed'] += 1
-                results['errors'].append(f"Row {idx + 1} '{instance_name}': {error_msg}")
-                error_data.append({
-                    'instance_name': instance_name,
-                    'fields': instance_data.get('fields'),
-                    'error': error_msg
-                })
-            except Exception as e:
-                logger.error(f"Error importing instance '{instance_name}': {traceback.format_exc()}")
-                results['failed'] += 1
-                results['errors'].append(f"Row {idx + 1} '{instance_name}': {str(e)}")
-                error_data.append({
-                    'instance_name': instance_name,
-                    'using_template': using_template,
-                    'fields': instance_data.get('fields'),
-                    'error': str(e)
-                })
+        header = excel_handler.read_import_header(file_path, model_id)
+        results['total'] = header['estimated_rows']
+        cache.set(cache_key, results, timeout=600)
 
+        import_context = ModelInstanceService.build_import_context(model, [])
+        logger.info(f"Starting import of about {results['total']} instances for model {model.name}")
+
+        # 整个导入过程共享字段定义及枚举/引用映射，字段值延迟到批次结束时统一写入
+        user_writer = ModelFieldMetaWriter.for_user(model, user.username, from_excel=True, deferred=True)
+        system_writer = ModelFieldMetaWriter.for_system(model, from_excel=True, deferred=True)
+
+        rows_read = 0
+        for chunk in excel_handler.iter_data_chunks(
+            file_path, model_id, header['field_mapping'], chunk_size=IMPORT_CHUNK_SIZE
+        ):
+            counts, chunk_errors, chunk_error_data = _import_chunk(
+                chunk, rows_read, model, user, import_context,
+                user_writer, system_writer, processed_names, _audit_context
+            )
+            rows_read += len(chunk)
+            for key, value in counts.items():
+                results[key] += value
+            results['errors'].extend(chunk_errors)
+            error_data.extend(chunk_error_data)
+            # 表头记录的行数可能不准确，以实际读取的行数为准
+            results['total'] = max(results['total'], rows_read)
             _update_progress(results, cache_key)
 
+        results['total'] = rows_read
         if error_data:
-            _generate_error_report(model_id, excel_data, error_data, results)
+            _generate_error_report(model_id, header, error_data, results)
 
         results['status'] = 'completed'
         results['progress'] = 100
@@ -207,25 +122,200 @@ def process_import_data(self, excel_data: dict, model_id: str, userid: str, _aud
         results['status'] = 'failed'
         results['errors'].append(f"Fatal error: {str(e)}")
         cache.set(cache_key, results, timeout=600)
+    finally:
+        if file_path and os.path.exists(file_path):
+            os.remove(file_path)
 
     return results
 
 
+def _import_chunk(chunk: list, row_offset: int, model: Models, user: UserInfo, import_context: dict,
+                  user_writer: ModelFieldMetaWriter, system_writer: ModelFieldMetaWriter,
+                  processed_names: set, _audit_context: dict):
+    """
+    处理一批导入数据
+    1. 逐行预处理并经序列化器校验，不写库；已存在但不在用户数据范围内的实例记为失败
+    2. 整批校验唯一性约束
+    3. 在同一事务内逐行创建/更新实例（每行一个保存点），字段值在批次结束时批量写入
+    :return: (计数, 错误信息列表, 错误行数据列表)
+    """
+    counts = {'created': 0, 'updated': 0, 'skipped': 0, 'failed': 0}
+    errors = []
+    error_data = []
+
+    def record_failure(idx, instance_data, error_msg):
+        counts['failed'] += 1
+        errors.append(f"Row {row_offset + idx + 1} '{instance_data.get('instance_name', '')}': {error_msg}")
+        error_data.append({
+            'instance_name': instance_data.get('instance_name', ''),
+            'using_template': instance_data.get('using_template', None),
+            'fields': instance_data.get('fields'),
+            'error': error_msg
+        })
+
+    ModelInstanceService.load_import_chunk_context(import_context, model, chunk, user=user)
+
+    prepared = []
+    for idx, instance_data in enumerate(chunk):
+        instance_name = instance_data.get('instance_name', '')
+        using_template = instance_data.get('using_template', None)
+
+        # 跳过重复
+        if instance_name and instance_name in processed_names:
+            counts['skipped'] += 1
+            continue
+        if instance_name:
+            processed_names.add(instance_name)
+
+        # 跳过无名称
+        if not instance_name:
+            counts['skipped'] += 1
+            continue
+
+        # 已存在但不在数据范围内的实例不更新
+        if instance_name in import_context['forbidden_instance_names']:
+            record_failure(idx, instance_data, 'Instance exists but is outside your data scope')
+            continue
+
+        try:
+            raw_fields = {
+                k: v for k, v in instance_data.get('fields', {}).items()
+                if v not in (None, '')
+            }
+            processed_fields = ModelInstanceService.preprocess_import_fields(raw_fields, import_context)
+
+            existing_instance = import_context['existing_instances'].get(instance_name)
+
+            serializer_data = {
+                'model': str(model.id),
+                'instance_name': instance_name,
+                'fields': processed_fields,
+                'input_mode': 'import',
+                'using_template': using_template
+            }
+            logger.debug(f'Processing instance: {serializer_data}')
+
+            if existing_instance is not None:
+                if using_template is None:
+                    serializer_data['using_template'] = existing_instance.using_template
+                serializer = ModelInstanceSerializer(
+                    instance=existing_instance,
+                    data=serializer_data,
+                    partial=True,
+                    context=import_context
+                )
+            else:
+                if using_template is None:
+                    serializer_data['using_template'] = True
+                serializer = ModelInstanceSerializer(
+                    data=serializer_data,
+                    context=import_context
+                )
+
+            serializer.is_valid(raise_exception=True)
+            validated_data = serializer.validated_data
+
+            if existing_instance is not None:
+                ModelInstanceService.validate_fields_for_import_update(
+                    model=model,
+                    input_fields=raw_fields,
+                    user=user,
+                    import_context=import_context
+                )
+            else:
+                validated_data['fields'] = ModelInstanceService.prepare_fields_for_import_creation(
+                    model=model,
+                    input_fields=processed_fields,
+                    user=user,
+                    import_context=import_context
+                )
+            prepared.append((idx, instance_data, existing_instance, validated_data))
+
+        except ValidationError as e:
+            record_failure(idx, instance_data, str(e.detail) if hasattr(e, 'detail') else str(e))
+        except Exception as e:
+            logger.error(f"Error importing instance '{instance_name}': {traceback.format_exc()}")
+            record_failure(idx, instance_data, str(e))
+
+    conflicts = ModelInstanceService.find_import_unique_conflicts(
+        model,
+        [(idx, existing, validated_data.get('fields', {})) for idx, _, existing, validated_data in prepared],
+        system_writer
+    )
+
+    persisted = []
+    try:
+        with audit_context(**_audit_context), transaction.atomic():
+            unassigned_group = import_context.get('unassigned_group')
+            group_ids = [unassigned_group.id] if unassigned_group else None
+
+            for idx, instance_data, existing_instance, validated_data in prepared:
+                if idx in conflicts:
+                    record_failure(idx, instance_data, str(ValidationError({'unique_constraint': conflicts[idx]}).detail))
+                    continue
+
+                user_marker, system_marker = user_writer.mark(), system_writer.mark()
+                try:
+                    with transaction.atomic():
+                        if existing_instance is not None:
+                            logger.debug(f"Updating existing instance '{instance_data['instance_name']}'")
+                            ModelInstanceService.update_instance(
+                                instance=existing_instance,
+                                validated_data=validated_data,
+                                user=user,
+                                from_excel=True,
+                                field_writer=user_writer
+                            )
+                        else:
+                            # 新建实例放入空闲池，未提供的字段已补全，以系统用户写入
+                            ModelInstanceService.create_instance(
+                                validated_data=validated_data,
+                                user=user,
+                                instance_group_ids=group_ids,
+                                from_excel=True,
+                                field_writer=system_writer
+                            )
+                    persisted.append((idx, instance_data, existing_instance is not None))
+                except Exception as e:
+                    user_writer.rollback(user_marker)
+                    system_writer.rollback(system_marker)
+                    if isinstance(e, ValidationError):
+                        record_failure(idx, instance_data, str(e.detail))
+                    else:
+                        logger.error(f"Error importing instance '{instance_data['instance_name']}': {traceback.format_exc()}")
+                        record_failure(idx, instance_data, str(e))
+
+            user_writer.flush()
+            system_writer.flush()
+    except Exception as e:
+        # 批量写入失败时整批回滚，已处理的行全部记为失败
+        logger.error(f"Error persisting import chunk at row {row_offset + 1}: {traceback.format_exc()}")
+        user_writer.rollback(frozenset())
+        system_writer.rollback(frozenset())
+        for idx, instance_data, _ in persisted:
+            record_failure(idx, instance_data, str(e))
+        return counts, errors, error_data
+
+    for _, _, is_update in persisted:
+        counts['updated' if is_update else 'created'] += 1
+    return counts, errors, error_data
+
+
 def _update_progress(results: dict, cache_key: str):
     """更新进度到缓存"""
     processed = results['created'] + results['updated'] + results['skipped'] + results['failed']
-    results['progress'] = int(processed * 100 / results['total']) if results['total'] > 0 else 100
+    results['progress'] = min(int(processed * 100 / results['total']), 100) if results['total'] > 0 else 100
     cache.set(cache_key, results, timeout=600)
 
 
-def _generate_error_report(model_id: str, excel_data: dict, error_data: list, results: dict):
+def _generate_error_report(model_id: str, header: dict, error_data: list, results: dict):
     """生成错误报告文件"""
     try:
         excel_handler = ExcelHandler()
         error_wb = excel_handler.generate_error_export(
             model_id,
-            excel_data.get('headers', []),
-            excel_data.get('header_rows', []),
+            header.get('headers', []),
+            header.get('header_rows', []),
             error_data
         )
         output = io.BytesIO()
@@ -239,8 +329,152 @@ def _generate_error_report(model_id: str, excel_data: dict, error_data: list, re
         logger.error(f"Error generating error report: {str(e)}")
 
 
+# 异步导出文件在磁盘及缓存中的保留时间（秒）
+EXPORT_FILE_TIMEOUT = 3600
+
+
+def get_export_dir() -> str:
+    """异步导出文件的存放目录"""
+    return getattr(settings, 'CMDB_EXPORT_DIR', os.path.join(tempfile.gettempdir(), 'cmdb_export'))
+
+
+def write_instances_export(output, model: Models, export_context: dict, instance_chunks, file_format: str = 'xlsx') -> int:
+    """
+    将实例数据按格式流式写入二进制文件对象
+    :param instance_chunks: 实例批次迭代器，见 ModelInstanceService.iter_instance_chunks
+    :return: 写入的数据行数
+    """
+    rows = ModelInstanceService.iter_export_rows(model, instance_chunks, export_context)
+    if file_format == 'csv':
+        # 带 BOM，Excel 直接打开时可正确识别中文
+        text_output = io.TextIOWrapper(output, encoding='utf-8-sig', newline='')
+        try:
+            return ExcelHandler.write_csv_export(text_output, export_context['fields'], rows)
+        finally:
+            text_output.flush()
+            text_output.detach()
+    return ExcelHandler.write_data_export(
+        output,
+        str(model.id),
+        export_context['fields'],
+        rows,
+        enum_data=export_context['enum_data'],
+        ref_data=export_context['ref_data']
+    )
+
+
+def _cleanup_export_dir(export_dir: str):
+    """清理超过保留时间的导出文件"""
+    expire_before = time.time() - EXPORT_FILE_TIMEOUT
+    for entry in os.scandir(export_dir):
+        try:
+            if entry.is_file() and entry.stat().st_mtime < expire_before:
+                os.remove(entry.path)
+        except OSError:
+            logger.warning(f"Failed to remove expired export file: {entry.path}")
+
+
+@shared_task(bind=True)
+def process_export_data(self, ids_file: str, model_id: str, userid: str, restricted_fields: list = None,
+                        file_format: str = 'xlsx'):
+    """
+    异步导出实例数据。
+    待导出的实例ID由视图按查询顺序逐行写入 ids_file，任务按 EXPORT_CHUNK_SIZE 分批读取并流式写入导出文件，
+    进度按批次更新，完成后通过 file_key 下载。
+    """
+    cache_key = f'export_task_{self.request.id}'
+    results = {
+        # 进度及导出文件只对发起导出的用户可见
+        'user_id': str(userid),
+        'status': 'processing',
+        'total': 0,
+        'progress': 0,
+        'exported': 0,
+        'errors': [],
+        'file_key': None
+    }
+    cache.set(cache_key, results, timeout=600)
+
+    try:
+        user = UserInfo.objects.get(id=userid)
+        model = Models.objects.get(id=model_id)
+        with open(ids_file, encoding='utf-8') as f:
+            results['total'] = sum(1 for _ in f)
+        cache.set(cache_key, results, timeout=600)
+
+        export_context = ModelInstanceService.prepare_export_context(
+            model,
+            PermissionManager(user).get_queryset(ModelFields).filter(model=model),
+            user,
+            restricted_fields
+        )
+        if not export_context['fields']:
+            raise ValueError('No fields available for export')
+
+        def instance_chunks():
+            with open(ids_file, encoding='utf-8') as f:
+                while True:
+                    ids = [line.strip() for line in islice(f, EXPORT_CHUNK_SIZE) if line.strip()]
+                    if not ids:
+                        break
+                    names = {
+                        str(instance_id): instance_name
+                        for instance_id, instance_name in ModelInstance.objects.filter(
+                            id__in=ids
+                        ).values_list('id', 'instance_name')
+                    }
+                    yield [(instance_id, names[instance_id]) for instance_id in ids if instance_id in names]
+                    # 上一批写入完成后才会请求下一批，此时更新进度
+                    results['exported'] += len(ids)
+                    results['progress'] = min(int(results['exported'] * 100 / results['total']), 99)
+                    cache.set(cache_key, results, timeout=600)
+
+        export_dir = get_export_dir()
+        os.makedirs(export_dir, exist_ok=True)
+        _cleanup_export_dir(export_dir)
+
+        file_id = uuid.uuid4()
+        file_path = os.path.join(export_dir, f'{file_id}.{file_format}')
+        with open(file_path, 'wb') as output:
+            exported = write_instances_export(output, model, export_context, instance_chunks(), file_format)
+
+        file_key = f'export_file_{file_id}'
+        cache.set(file_key, {
+            'user_id': str(userid),
+            'path': file_path,
+            'filename': f'{model.name}_data.{file_format}'
+        }, timeout=EXPORT_FILE_TIMEOUT)
+
+        results.update({
+            'status': 'completed',
+            'progress': 100,
+            'exported': exported,
+            'file_key': file_key
+        })
+        cache.set(cache_key, results, timeout=600)
+        logger.info(f"Export completed for model {model.name}: {exported} instances")
+
+    except Exception as e:
+        logger.error(f"Error in export task: {traceback.format_exc()}")
+        results['status'] = 'failed'
+        results['errors'].append(str(e))
+        cache.set(cache_key, results, timeout=600)
+    finally:
+        if os.path.exists(ids_file):
+            os.remove(ids_file)
+
+    return results
+
+
 @shared_task(bind=True)
 def update_instance_names_for_model_template_change(self, model_id, old_template, new_template, context):
+    """
+    实例名称模板变更后按新模板重命名使用模板的实例。
+    模板字段值通过一次流式查询按实例聚合，名称在内存中生成；按重命名完成后的名称计数检测冲突，
+    链式重命名按依赖顺序分批、环经临时名称写入（见 _plan_rename_batches）。
+    变更按 RENAME_CHUNK_SIZE 分批 bulk_update，每批一次批量审计，
+    进度至多每 PROGRESS_UPDATE_INTERVAL 秒写入一次缓存。
+    """
     logger.info(f"Starting update of instance_name for model {model_id}")
     cache_key = f'rename_task_{self.request.id}'
     logger.info(f"Cache key for task {self.request.id}: {cache_key}")
@@ -258,95 +492,54 @@ def update_instance_names_for_model_template_change(self, model_id, old_template
         model = Models.objects.get(id=model_id)
 
         # 只处理使用模板的实例
-        instances = ModelInstance.objects.filter(
-            model=model,
-            using_template=True
+        instances = list(
+            ModelInstance.objects.filter(model=model, using_template=True)
+            .order_by('id').values_list('id', 'instance_name')
         )
-
-        result_dict['total'] = instances.count()
+        result_dict['total'] = len(instances)
         cache.set(cache_key, result_dict, timeout=600)
 
-        if not instances.exists():
+        if not instances:
             logger.info(f"No instances using template for model {model.name}")
             result_dict['status'] = 'completed'
             result_dict['progress'] = 100
             cache.set(cache_key, result_dict, timeout=600)
-            return
-
-        logger.info(f"Found {instances.count()} instances to update for model {model.name}")
-        # logger.debug(f'Audit context passed to task: {context}')
-        # 收集所有需要更改的实例和新名称，在提交事务前进行唯一性检查
-        name_updates = []
-        name_conflicts = []
-
-        template_fields = ModelFields.objects.filter(id__in=new_template).values_list('id', 'name')
-        template_fields = {str(f[0]): f[1] for f in template_fields}
-        template_fields = [template_fields[str(id)] for id in new_template]
-
-        # 计算所有新名称并检查冲突
-        for instance in instances:
-            percent = (result_dict['updated'] + result_dict['skipped'] +
-                       result_dict['conflict'] + result_dict['failed']) * 100 // result_dict['total']
-            result_dict['progress'] = percent
-            cache.set(cache_key, result_dict, timeout=600)
-
-            # 获取实例的所有字段值
-            field_values = {}
-            field_metas = ModelFieldMeta.objects.filter(
-                model_instance=instance,
-                model_fields__id__in=new_template
-            ).select_related('model_fields')
-
-            for meta in field_metas:
-                field_values[meta.model_fields.name] = meta.data
-
-            # 生成新名称
-            new_name = generate_instance_name(field_values, new_template, template_fields)
-
-            # 如果无法生成名称，跳过
-            if not new_name:
-                logger.warning(f"Cannot generate name for instance {instance.id} - missing values for template fields")
-                result_dict['skipped'] += 1
-                continue
-
-            # 检查这个新名称是否已存在或和本次更新中的其他实例冲突
-            if ModelInstance.objects.filter(
-                model=model,
-                instance_name=new_name
-            ).exclude(id=instance.id).exists() or new_name in [update[1] for update in name_updates]:
-                name_conflicts.append((instance.id, new_name))
-                result_dict['conflict'] += 1
-                continue
-
-            # 名称有变化且无冲突
-            if new_name != instance.instance_name:
-                with audit_context(**context):
-                    try:
-                        instance = ModelInstance.objects.get(id=instance.id)
-                        instance.instance_name = new_name
-                        instance.save(update_fields=['instance_name', 'update_time'])
-                        result_dict['updated'] += 1
-                    except Exception as e:
-                        logger.error(f"Error updating instance {instance.id}: {str(e)}")
-                        result_dict['failed'] += 1
-            else:
-                result_dict['skipped'] += 1
-
-        # 如果有冲突，记录日志但继续处理无冲突的部分
-        if name_conflicts:
-            conflict_details = ", ".join([f"{instance_id}:{name}" for instance_id, name in name_conflicts])
-            result_dict['conflict_details'] = name_conflicts
-            logger.warning(f"Name conflicts detected for {len(name_conflicts)} instances: {conflict_details}")
+            return result_dict
+
+        logger.info(f"Found {len(instances)} instances to update for model {model.name}")
+        renames = _compute_template_renames(model, instances, new_template, result_dict)
+
+        progress = _RenameProgress(result_dict, cache_key)
+        progress.update()
+        parked, batches = _plan_rename_batches(instances, renames)
+        with audit_context(**context):
+            if parked:
+                ModelInstanceService.park_instance_names(list(parked))
+            for chunk in batches:
+                try:
+                    updated = ModelInstanceService.bulk_rename_instances(chunk, original_names=parked)
+                    result_dict['updated'] += updated
+                    # 计算名称后被删除的实例
+                    result_dict['skipped'] += len(chunk) - updated
+                except Exception as e:
+                    logger.error(f"Error renaming {len(chunk)} instances of model {model.name}: {str(e)}")
+                    result_dict['failed'] += len(chunk)
+                    stuck = [str(instance_id) for instance_id in chunk if instance_id in parked]
+                    if stuck:
+                        logger.error(f"Instances left with temporary names: {', '.join(stuck)}")
+                progress.update()
+
+        if result_dict['conflict_details']:
+            conflict_details = ", ".join(f"{instance_id}:{name}" for instance_id, name in result_dict['conflict_details'])
+            logger.warning(f"Name conflicts detected for {result_dict['conflict']} instances: {conflict_details}")
+            if not renames:
+                logger.error(f"All instances for model {model.name} have name conflicts after template change")
 
         logger.info(f"Successfully updated {result_dict['updated']} instances for model {model.name}")
 
         result_dict['progress'] = 100
         result_dict['status'] = 'completed'
         cache.set(cache_key, result_dict, timeout=600)
-
-        if name_conflicts and not name_updates:
-            logger.error(f"All instances for model {model.name} have name conflicts after template change")
-
         return result_dict
 
     except Models.DoesNotExist:
@@ -355,3 +548,163 @@ def update_instance_names_for_model_template_change(self, model_id, old_template
     except Exception as e:
         logger.error(f"Error updating instance names for model {model_id}: {str(e)}")
         return None
+
+
+def _plan_rename_batches(instances: list, renames: list) -> tuple:
+    """
+    将重命名拆分为不超过 RENAME_CHUNK_SIZE 的有序批次，返回 (暂存实例 {instance_id: 原名称}, 批次列表)。
+    新名称是另一实例旧名称时（A→B 同时 B→C），后者须先于或与前者同批重命名。每个实例至多被一个实例
+    依赖，重命名之间只构成互不相交的链和环：
+    - 链从末端（新名称未被占用）倒序排列，任意位置切分后前面的批次都已让出后面批次需要的名称
+    - 不超过批大小的环放在同一批内，由 bulk_rename_instances 经临时名称两阶段写入
+    - 超过批大小的环先将其中一个实例暂存为临时名称，环即变为以该实例结尾的链
+    """
+    old_names = dict(instances)
+    holder_by_name = {old_names[instance_id]: instance_id for instance_id, _ in renames}
+    new_names = dict(renames)
+    # 需要先让出名称的实例
+    successor = {instance_id: holder_by_name.get(new_name) for instance_id, new_name in renames}
+    predecessor = {succ: instance_id for instance_id, succ in successor.items() if succ is not None}
+
+    units = []
+    visited = set()
+    for instance_id, _ in renames:
+        if successor[instance_id] is not None:
+            continue
+        path = [instance_id]
+        while path[-1] in predecessor:
+            path.append(predecessor[path[-1]])
+        visited.update(path)
+        units.append((path, False))
+
+    parked = {}
+    for instance_id, _ in renames:
+        if instance_id in visited:
+            continue
+        cycle = [instance_id]
+        while successor[cycle[-1]] != instance_id:
+            cycle.append(successor[cycle[-1]])
+        visited.update(cycle)
+        if len(cycle) <= RENAME_CHUNK_SIZE:
+            units.append((cycle, True))
+            continue
+        # 暂存环首实例后，以其原名称为目标的实例可以先行，环首实例最后改为最终名称
+        parked[instance_id] = old_names[instance_id]
+        units.append((cycle[:0:-1] + [instance_id], False))
+
+    batches = []
+    batch = {}
+    for members, atomic in units:
+        if atomic and len(batch) + len(members) > RENAME_CHUNK_SIZE:
+            batches.append(batch)
+            batch = {}
+        for instance_id in members:
+            if not atomic and len(batch) >= RENAME_CHUNK_SIZE:
+                batches.append(batch)
+                batch = {}
+            batch[instance_id] = new_names[instance_id]
+    if batch:
+        batches.append(batch)
+    return parked, batches
+
+
+class _RenameProgress:
+    """按时间间隔节流的进度写入"""
+
+    def __init__(self, results: dict, cache_key: str):
+        self.results = results
+        self.cache_key = cache_key
+        self.last_update = None
+
+    def update(self):
+        now = time.monotonic()
+        if self.last_update is not None and now - self.last_update < PROGRESS_UPDATE_INTERVAL:
+            return
+        self.last_update = now
+        results = self.results
+        processed = results['updated'] + results['skipped'] + results['conflict'] + results['failed']
+        results['progress'] = min(processed * 100 // results['total'], 100) if results['total'] else 100
+        cache.set(self.cache_key, results, timeout=600)
+
+
+def _compute_template_renames(model: Models, instances: list, template: list, results: dict) -> list:
+    """
+    在内存中按新模板生成实例名称，返回需要重命名的 [(instance_id, new_name)]。
+    无法生成名称或名称未变化的计入 skipped，名称冲突的计入 conflict。
+    """
+    template_field_info = get_template_field_info(template)
+    field_names = {
+        str(field_id): name
+        for field_id, name in ModelFields.objects.filter(id__in=template).values_list('id', 'name')
+    }
+    ref_field_ids = {
+        str(field_id) for field_id in ModelFields.objects.filter(
+            id__in=template, type=FieldType.MODEL_REF
+        ).values_list('id', flat=True)
+    }
+
+    # 一次流式查询聚合所有模板字段值
+    field_values = defaultdict(dict)
+    ref_ids = set()
+    rows = ModelFieldMeta.objects.filter(
+        model=model,
+        model_fields_id__in=list(field_names),
+        model_instance__using_template=True,
+    ).values_list('model_instance_id', 'model_fields_id', 'data').iterator(chunk_size=RENAME_CHUNK_SIZE)
+    for instance_id, field_id, data in rows:
+        field_values[instance_id][field_names[str(field_id)]] = data
+        if data and str(field_id) in ref_field_ids:
+            ref_ids.add(data)
+    ref_instance_names = ModelInstance.objects.get_instance_names_by_instance_ids(list(ref_ids))
+
+    candidates = []
+    for instance_id, old_name in instances:
+        new_name = render_instance_name(field_values.get(instance_id, {}), template_field_info, ref_instance_names)
+
+        # 如果无法生成名称，跳过
+        if not new_name:
+            logger.warning(f"Cannot generate name for instance {instance_id} - missing values for template fields")
+            results['skipped'] += 1
+            continue
+
+        if new_name == old_name:
+            results['skipped'] += 1
+            continue
+
+        candidates.append((instance_id, old_name, new_name))
+
+    # 模型下不参与重命名的实例名称计数
+    fixed_counts = Counter(
+        ModelInstance.objects.filter(model=model).values_list('instance_name', flat=True).iterator(
+            chunk_size=RENAME_CHUNK_SIZE
+        )
+    )
+    fixed_counts.subtract(old_name for _, old_name, _ in candidates)
+
+    # 按重命名完成后的名称检测冲突：冲突的实例保留原名，放弃重命名会让其原名重新被占用，
+    # 因此反复检测直到没有新的冲突；链式重命名（A→B 同时 B→C）及互换名称不视为冲突
+    rejected = set()
+    while True:
+        name_counts = fixed_counts.copy()
+        name_counts.update(old_name for instance_id, old_name, _ in candidates if instance_id in rejected)
+        renames = []
+        new_conflicts = False
+        for instance_id, old_name, new_name in candidates:
+            if instance_id in rejected:
+                continue
+            # 同名时按实例ID顺序，先处理的实例获得名称
+            if name_counts[new_name] > 0:
+                rejected.add(instance_id)
+                new_conflicts = True
+                continue
+            name_counts[new_name] += 1
+            renames.append((instance_id, new_name))
+        if not new_conflicts:
+            break
+
+    for instance_id, _, new_name in candidates:
+        if instance_id in rejected:
+            results['conflict_details'].append((str(instance_id), new_name))
+            results['conflict'] += 1
+
+    return renames
@@ -0,0 +1,99 @@
+import os
+import shutil
+import tempfile
+
+from datetime import datetime
+
+from django.contrib.contenttypes.models import ContentType
+from django.test import override_settings
+
+from audit.archive import archive_expired_logs, get_retention_days, iter_archived_logs
+from audit.integrity import verify_chain
+from audit.models import AuditArchive, AuditLog, FieldAuditDetail
+from audit.writer import make_record, write_records
+from mapi.models import sysConfigParams
+
+from cmdb.models import Models
+from cmdb.tests import CmdbAPITestCase
+
+
+class AuditArchiveTestCase(CmdbAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.archive_dir, ignore_errors=True)
+        self.model = Models.objects.create(name='ArchiveServer', verbose_name='归档服务器')
+        self.content_type = ContentType.objects.get_for_model(Models)
+
+    def _log(self, timestamp, comment):
+        log = AuditLog.objects.create(
+            content_type=self.content_type, object_id=str(self.model.id), action='UPDATE',
+            changed_fields={'verbose_name': ['a', 'b']}, comment=comment, timestamp=timestamp,
+        )
+        FieldAuditDetail.objects.create(audit_log=log, name='env', old_value='dev', new_value='prod')
+        return log
+
+    def test_archive_expired_months(self):
+        old_jan = self._log(datetime(2024, 1, 5, 10), 'jan-1')
+        self._log(datetime(2024, 1, 20, 10), 'jan-2')
+        self._log(datetime(2024, 2, 3, 10), 'feb')
+        # 保留期所在月份未满，不归档
+        recent = self._log(datetime(2024, 3, 2, 10), 'mar')
+        reverted = AuditLog.objects.create(
+            content_type=self.content_type, object_id=str(self.model.id), action='UPDATE',
+            is_reverted=True, reverted_from=old_jan, timestamp=datetime(2024, 3, 20, 10),
+        )
+
+        results = archive_expired_logs(
+            retention_days=10, archive_dir=self.archive_dir, now=datetime(2024, 3, 25, 12)
+        )
+
+        # 被在线回退日志引用的 jan-1 留在线上
+        self.assertEqual([(r['month'], r['count']) for r in results], [('2024-01', 1), ('2024-02', 1)])
+        self.assertEqual(
+            set(AuditLog.objects.values_list('id', flat=True)), {old_jan.id, recent.id, reverted.id}
+        )
+        self.assertEqual(FieldAuditDetail.objects.count(), 2)
+
+        archives = AuditArchive.objects.order_by('month')
+        self.assertEqual([(a.month, a.record_count) for a in archives], [('2024-01', 1), ('2024-02', 1)])
+        for archive in archives:
+            self.assertTrue(os.path.exists(os.path.join(self.archive_dir, archive.file_name)))
+
+        records = list(iter_archived_logs(self.content_type.id, str(self.model.id), archive_dir=self.archive_dir))
+        self.assertEqual([r['comment'] for r in records], ['jan-2', 'feb'])
+        self.assertEqual(records[0]['details'][0]['new_value'], 'prod')
+        self.assertEqual(list(iter_archived_logs(self.content_type.id, 'missing', archive_dir=self.archive_dir)), [])
+
+    @override_settings(AUDIT_RETENTION_DAYS=90)
+    def test_retention_from_system_params(self):
+        sysConfigParams.objects.filter(param_name='audit_retention_days').delete()
+        self.assertEqual(get_retention_days(), 90)
+
+        sysConfigParams.objects.create(param_name='audit_retention_days', param_value='0', param_type='int')
+        self.assertEqual(get_retention_days(), 0)
+        self._log(datetime(2020, 1, 1), 'old')
+        self.assertEqual(archive_expired_logs(archive_dir=self.archive_dir), [])
+        self.assertEqual(AuditLog.objects.count(), 1)
+
+    def test_archived_sequences_are_not_chain_gaps(self):
+        timestamps = [datetime(2024, 1, 5), datetime(2024, 1, 6), datetime(2024, 2, 3), datetime(2024, 3, 2),
+                      datetime(2024, 3, 3)]
+        write_records([
+            make_record(self.model, 'UPDATE', {'verbose_name': ['a', str(i)]}, timestamp=timestamp)
+            for i, timestamp in enumerate(timestamps)
+        ])
+
+        archive_expired_logs(retention_days=10, archive_dir=self.archive_dir, now=datetime(2024, 3, 25, 12))
+        archives = AuditArchive.objects.order_by('month')
+        self.assertEqual([(a.first_sequence, a.last_sequence) for a in archives], [(1, 2), (3, 3)])
+
+        # 序号 1-3 已归档，在线日志 4、5 经归档区间衔接
+        result = verify_chain(full=True)
+        self.assertTrue(result['valid'], result['issues'])
+
+        # 未归档的日志被删除仍视为空缺
+        AuditLog.objects.filter(sequence=4).delete()
+        result = verify_chain(full=True)
+        self.assertEqual([(issue['sequence'], issue['type']) for issue in result['issues']], [(5, 'gap')])
@@ -0,0 +1,69 @@
+from django.db.models.signals import post_save, pre_save
+
+from audit.context import audit_context
+from audit.integrity import verify_chain
+from audit.models import AuditCheckpoint, AuditLog
+from audit.signals import capture_old_state, log_changes
+
+from cmdb.models import Models
+from cmdb.tests import CmdbAPITestCase
+
+
+class AuditIntegrityTestCase(CmdbAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        pre_save.connect(capture_old_state)
+        post_save.connect(log_changes)
+        self.model = Models.objects.create(name='ChainServer', verbose_name='链服务器')
+        for name in ('链服务器A', '链服务器B', '链服务器C'):
+            with audit_context(request_id='chain-req', correlation_id='chain-req', operator='testadmin'):
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.model.verbose_name = name
+                    self.model.save()
+
+    def tearDown(self):
+        post_save.disconnect(log_changes)
+        pre_save.disconnect(capture_old_state)
+        super().tearDown()
+
+    def test_chain_is_verified_incrementally(self):
+        logs = list(AuditLog.objects.filter(sequence__isnull=False).order_by('sequence'))
+        self.assertEqual([log.sequence for log in logs], [1, 2, 3])
+        self.assertEqual(logs[1].prev_hash, logs[0].integrity_hash)
+
+        result = verify_chain()
+        self.assertTrue(result['valid'])
+        self.assertEqual(result['verified'], 3)
+        self.assertEqual(AuditCheckpoint.objects.get().sequence, 3)
+
+        # 检查点之后没有新日志时不再重复校验
+        result = verify_chain()
+        self.assertTrue(result['valid'])
+        self.assertEqual(result['verified'], 0)
+
+        result = verify_chain(full=True, workers=2, chunk_size=1)
+        self.assertTrue(result['valid'])
+        self.assertEqual(result['verified'], 3)
+
+    def test_tampering_and_truncation_are_detected(self):
+        AuditLog.objects.filter(sequence=2).update(comment='篡改')
+        result = verify_chain()
+        self.assertFalse(result['valid'])
+        self.assertEqual([(i['sequence'], i['type']) for i in result['issues']], [(2, 'tampered')])
+        # 只为问题之前的分区更新检查点，问题所在分区不前移
+        self.assertFalse(AuditCheckpoint.objects.exists())
+
+        AuditLog.objects.filter(sequence=2).delete()
+        AuditLog.objects.filter(sequence=3).delete()
+        result = verify_chain(full=True)
+        self.assertEqual([(i['sequence'], i['type']) for i in result['issues']], [(2, 'truncated')])
+
+    def test_integrity_api(self):
+        response = self.client.post('/api/v1/audit/logs/integrity/', {'full': 'true'}, format='json')
+        self.assertEqual(response.status_code, 202)
+
+        response = self.client.get('/api/v1/audit/logs/integrity/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['last_result']['valid'])
+        self.assertEqual(response.data['checkpoints'][0]['sequence'], 3)
@@ -0,0 +1,96 @@
+from datetime import timedelta
+
+from django.contrib.contenttypes.models import ContentType
+from django.utils import timezone
+
+from audit.models import AuditLog, FieldAuditDetail
+from audit.restoration import AuditConflict, RollbackManager
+
+from cmdb.models import Models, ModelFieldGroups, ModelFields, ModelInstance, ModelFieldMeta
+from cmdb.tests import CmdbAPITestCase
+
+
+class AuditRollbackTestCase(CmdbAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.model = Models.objects.create(name='RollbackServer', verbose_name='回退服务器')
+        field_group = ModelFieldGroups.objects.create(name='basic', verbose_name='基本信息', model=self.model)
+        self.field_env = ModelFields.objects.create(
+            model=self.model, model_field_group=field_group, name='env', verbose_name='环境',
+            type='string', order=1, required=False,
+        )
+        self.content_type = ContentType.objects.get_for_model(ModelInstance)
+        self.instances = []
+        for name in ('rb-001', 'rb-002'):
+            instance = ModelInstance.objects.create(model=self.model, instance_name=f'{name}-new')
+            ModelFieldMeta.objects.create(
+                model=self.model, model_instance=instance, model_fields=self.field_env, data='prod'
+            )
+            self.instances.append(instance)
+        now = timezone.now() - timedelta(minutes=5)
+        # 同一批次中先改环境、后改名称，回退到最早的旧值
+        for index, instance in enumerate(self.instances):
+            self._log(instance, 'batch-req', now, {}, ('env', 'dev', 'test'))
+            self._log(instance, 'batch-req', now + timedelta(seconds=1),
+                      {'instance_name': [f'rb-00{index + 1}', f'rb-00{index + 1}-new']}, ('env', 'test', 'prod'))
+
+    def _log(self, instance, correlation_id, timestamp, changed_fields, detail=None):
+        log = AuditLog.objects.create(
+            content_type=self.content_type, object_id=str(instance.id), action='UPDATE',
+            changed_fields=changed_fields, correlation_id=correlation_id, timestamp=timestamp,
+        )
+        if detail:
+            name, old_value, new_value = detail
+            FieldAuditDetail.objects.create(audit_log=log, name=name, old_value=old_value, new_value=new_value)
+        return log
+
+    def _env(self, instance):
+        return ModelFieldMeta.objects.get(model_instance=instance, model_fields=self.field_env).data
+
+    def test_batch_rollback_restores_earliest_state(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            result = RollbackManager('batch-req').execute()
+
+        self.assertEqual(len(result['success']), 4)
+        self.assertEqual(result['failure'], [])
+        for index, instance in enumerate(self.instances):
+            instance.refresh_from_db()
+            self.assertEqual(instance.instance_name, f'rb-00{index + 1}')
+            self.assertEqual(self._env(instance), 'dev')
+
+        # 每个对象一条回退日志，指向批次中最早的日志
+        reverted = AuditLog.objects.filter(is_reverted=True).select_related('reverted_from')
+        self.assertEqual(len(reverted), 2)
+        for log in reverted:
+            self.assertEqual(log.reverted_from.changed_fields, {})
+            self.assertEqual(list(log.details.values_list('old_value', 'new_value')), [('prod', 'dev')])
+
+    def test_batch_rollback_reports_name_conflicts_per_object(self):
+        ModelInstance.objects.create(model=self.model, instance_name='rb-001')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            result = RollbackManager('batch-req').execute()
+
+        self.assertEqual(len(result['success']), 2)
+        self.assertEqual(len(result['failure']), 2)
+        self.instances[0].refresh_from_db()
+        self.assertEqual(self.instances[0].instance_name, 'rb-001-new')
+        self.assertEqual(self._env(self.instances[0]), 'prod')
+        self.assertEqual(self._env(self.instances[1]), 'dev')
+
+    def test_dry_run_reports_conflicts(self):
+        self._log(self.instances[1], 'later-req', timezone.now(), {}, ('env', 'prod', 'uat'))
+
+        result = RollbackManager('batch-req').execute(dry_run=True)
+        self.assertEqual((result['logs'], result['objects']), (4, 2))
+        self.assertEqual([c['object_id'] for c in result['conflicts']], [str(self.instances[1].id)])
+
+        with self.assertRaises(AuditConflict):
+            RollbackManager('batch-req').execute()
+
+        response = self.client.post(
+            '/api/v1/audit/logs/rollback/', {'correlation_id': 'batch-req', 'dry_run': True}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['state']['conflicts']), 1)
@@ -0,0 +1,143 @@
+import json
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.contrib.contenttypes.models import ContentType
+from django.utils import timezone
+
+from audit.models import AuditLog, FieldAuditDetail
+from audit.timeline import reconstruct_state
+
+from cmdb.models import Models, ModelFieldGroups, ModelFields, ModelInstance, ModelFieldMeta
+from cmdb.constants import FieldType
+from cmdb.tests import CmdbAPITestCase
+from cmdb.utils import password_handler
+
+
+class AuditTimelineTestCase(CmdbAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.model = Models.objects.create(name='TimelineServer', verbose_name='时间线服务器')
+        field_group = ModelFieldGroups.objects.create(name='basic', verbose_name='基本信息', model=self.model)
+        self.field_env = ModelFields.objects.create(
+            model=self.model, model_field_group=field_group, name='env', verbose_name='环境',
+            type='string', order=1, required=False,
+        )
+        self.instance = ModelInstance.objects.create(model=self.model, instance_name='tl-003')
+        ModelFieldMeta.objects.create(
+            model=self.model, model_instance=self.instance, model_fields=self.field_env, data='prod'
+        )
+        self.instance_id = str(self.instance.id)
+        self.content_type = ContentType.objects.get_for_model(ModelInstance)
+        self.start = timezone.now() - timedelta(hours=1)
+        self._log('CREATE', 0, {'instance_name': [None, 'tl-001']}, (None, 'dev'))
+        self._log('UPDATE', 10, {}, ('dev', 'test'))
+        self._log('UPDATE', 20, {'instance_name': ['tl-001', 'tl-002']}, None)
+        self._log('UPDATE', 30, {'instance_name': ['tl-002', 'tl-003']}, ('test', 'prod'))
+
+    def _log(self, action, minutes, changed_fields, values):
+        log = AuditLog.objects.create(
+            content_type=self.content_type, object_id=self.instance_id, action=action,
+            changed_fields=changed_fields, timestamp=self.start + timedelta(minutes=minutes),
+        )
+        if values:
+            FieldAuditDetail.objects.create(audit_log=log, name='env', old_value=values[0], new_value=values[1])
+        return log
+
+    def _state(self, minutes):
+        return reconstruct_state(ModelInstance, self.instance_id, self.start + timedelta(minutes=minutes))
+
+    def test_reconstruct_from_nearest_snapshot(self):
+        # 创建之前对象不存在
+        self.assertFalse(self._state(-5)['exists'])
+
+        state = self._state(5)
+        self.assertEqual((state['source'], state['replayed']), ('create', 1))
+        self.assertEqual((state['fields']['instance_name'], state['dynamic']['env']), ('tl-001', 'dev'))
+
+        # 距离当前状态更近时从当前状态倒序撤销
+        state = self._state(25)
+        self.assertEqual((state['source'], state['replayed']), ('current', 1))
+        self.assertTrue(state['exists'])
+        self.assertEqual((state['fields']['instance_name'], state['dynamic']['env']), ('tl-002', 'test'))
+
+        state = self._state(15)
+        self.assertEqual(state['source'], 'create')
+        self.assertEqual((state['fields']['instance_name'], state['dynamic']['env']), ('tl-001', 'test'))
+
+    def test_reconstruct_deleted_object(self):
+        AuditLog.objects.filter(action='CREATE').delete()
+        self._log('DELETE', 40, {'instance_name': ['tl-003', None]}, ('prod', None))
+        self.instance.delete()
+
+        state = self._state(25)
+        self.assertEqual((state['source'], state['replayed']), ('delete', 1))
+        self.assertEqual((state['fields']['instance_name'], state['dynamic']['env']), ('tl-002', 'test'))
+        self.assertFalse(self._state(45)['exists'])
+
+    def test_timeline_api_pages_in_time_order(self):
+        params = {'target_type': 'model_instance', 'object_id': str(self.instance.id), 'page_size': 3}
+        response = self.client.get('/api/v1/audit/logs/timeline/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([log['action'] for log in response.data['results']], ['CREATE', 'UPDATE', 'UPDATE'])
+        self.assertEqual(response.data['results'][1]['details'][0]['new_value'], 'test')
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertIsNone(response.data['next'])
+
+        response = self.client.get('/api/v1/audit/logs/state/', {
+            'target_type': 'model_instance', 'object_id': str(self.instance.id),
+            'at': (self.start + timedelta(minutes=25)).isoformat(),
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['dynamic']['env'], 'test')
+
+        response = self.client.get('/api/v1/audit/logs/state/', {'target_type': 'model_instance'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_state_api_masks_passwords_and_rejects_invalid_id(self):
+        field_pwd = ModelFields.objects.create(
+            model=self.model, model_field_group=self.field_env.model_field_group, name='pwd',
+            verbose_name='密码', type=FieldType.PASSWORD, order=2, required=False,
+        )
+        ModelFieldMeta.objects.create(
+            model=self.model, model_instance=self.instance, model_fields=field_pwd,
+            data=password_handler.encrypt('secret'),
+        )
+        params = {
+            'target_type': 'model_instance', 'object_id': str(self.instance.id),
+            'at': (self.start + timedelta(minutes=45)).isoformat(),
+        }
+        with patch('audit.views.has_password_permission', return_value=False):
+            response = self.client.get('/api/v1/audit/logs/state/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data['dynamic']['pwd']), {'password': '******'})
+
+        with patch('audit.views.has_password_permission', return_value=True):
+            response = self.client.get('/api/v1/audit/logs/state/', params)
+        self.assertEqual(json.loads(response.data['dynamic']['pwd']), {'password': 'secret'})
+
+        response = self.client.get('/api/v1/audit/logs/state/', {**params, 'object_id': 'not-a-uuid'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_timeline_and_state_apply_data_scope(self):
+        params = {
+            'target_type': 'model_instance', 'object_id': str(self.instance.id),
+            'at': (self.start + timedelta(minutes=25)).isoformat(),
+        }
+        hidden = patch('access.manager.PermissionManager.get_queryset', side_effect=lambda model: model.objects.none())
+        with hidden, patch('access.manager.PermissionManager.has_full_access', return_value=True):
+            for endpoint in ('timeline', 'state'):
+                response = self.client.get(f'/api/v1/audit/logs/{endpoint}/', params)
+                self.assertEqual(response.status_code, 404)
+
+        # 已删除的对象仅数据权限不做过滤的用户可以查看
+        ModelInstance.objects.filter(pk=self.instance.pk).delete()
+        self._log('DELETE', 40, {'instance_name': ['tl-003', None]}, None)
+        for full_access, expected in ((False, 404), (True, 200)):
+            with patch('access.manager.PermissionManager.has_full_access', return_value=full_access):
+                for endpoint in ('timeline', 'state'):
+                    response = self.client.get(f'/api/v1/audit/logs/{endpoint}/', params)
+                    self.assertEqual(response.status_code, expected)
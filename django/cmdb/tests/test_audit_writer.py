@@ -0,0 +1,199 @@
+import json
+from itertools import count
+from unittest.mock import patch
+
+from django.db.models.signals import post_save, pre_save
+from django.test import override_settings
+
+from audit.context import audit_context
+from audit.models import AuditLog, FieldAuditDetail
+from audit.restoration import RollbackManager
+from audit.signals import capture_old_state, log_changes
+from audit.tasks import flush_audit_records
+from audit.writer import AUDIT_DEAD_LETTER_KEY, AUDIT_QUEUE_KEY, ensure_flushed, replay_dead_letters, write_records
+
+from cmdb.models import Models, ModelFieldGroups, ModelFields, ModelInstance, ModelFieldMeta
+from cmdb.tests import CmdbAPITestCase
+
+
+class MemoryAuditQueue:
+    """测试用的内存队列，与 RedisAuditQueue 接口一致"""
+
+    def __init__(self):
+        self.items = []
+        self.processing = []
+
+    def __len__(self):
+        return len(self.items)
+
+    def pending_count(self):
+        return len(self.items) + len(self.processing)
+
+    def push(self, payloads):
+        self.items[:0] = reversed(payloads)
+
+    def pop_batch(self, size):
+        batch = list(reversed(self.items[-size:]))
+        del self.items[-size:]
+        self.processing.extend(batch)
+        return batch
+
+    def ack(self, payloads):
+        for payload in payloads:
+            self.processing.remove(payload)
+
+    def recover(self):
+        count = len(self.processing)
+        self.items.extend(reversed(self.processing))
+        self.processing = []
+        return count
+
+
+class AuditWriterTestCase(CmdbAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.model = Models.objects.create(name='AuditServer', verbose_name='审计服务器')
+        field_group = ModelFieldGroups.objects.create(name='basic', verbose_name='基本信息', model=self.model)
+        self.field_env = ModelFields.objects.create(
+            model=self.model, model_field_group=field_group, name='env', verbose_name='环境',
+            type='string', order=1, required=False,
+        )
+        self.instance = ModelInstance.objects.create(model=self.model, instance_name='audit-001')
+        ModelFieldMeta.objects.create(
+            model=self.model, model_instance=self.instance, model_fields=self.field_env, data='dev'
+        )
+        pre_save.connect(capture_old_state)
+        post_save.connect(log_changes)
+        self.queue = MemoryAuditQueue()
+        self.dead_letters = MemoryAuditQueue()
+        queues = {AUDIT_QUEUE_KEY: self.queue, AUDIT_DEAD_LETTER_KEY: self.dead_letters}
+        self._queue_patcher = patch('audit.writer.get_audit_queue', side_effect=lambda key=AUDIT_QUEUE_KEY: queues[key])
+        self._queue_patcher.start()
+
+    def tearDown(self):
+        self._queue_patcher.stop()
+        post_save.disconnect(log_changes)
+        pre_save.disconnect(capture_old_state)
+        super().tearDown()
+
+    def _update_env(self, value, correlation_id):
+        with audit_context(request_id=correlation_id, correlation_id=correlation_id, operator='testadmin'):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.instance.save()
+                ModelFieldMeta.objects.filter(model_instance=self.instance).update(data=value)
+
+    def test_sync_write_diffs_dynamic_fields(self):
+        self._update_env('prod', 'writer-req')
+
+        log = AuditLog.objects.get(correlation_id='writer-req')
+        self.assertEqual(log.action, 'UPDATE')
+        self.assertEqual(log.operator, 'testadmin')
+        self.assertEqual(
+            list(FieldAuditDetail.objects.filter(audit_log=log).values_list('name', 'old_value', 'new_value')),
+            [('env', 'dev', 'prod')]
+        )
+
+        # 静态、动态字段均无变化时不记录
+        self._update_env('prod', 'writer-noop')
+        self.assertFalse(AuditLog.objects.filter(correlation_id='writer-noop').exists())
+
+    @override_settings(AUDIT_WRITER_MODE='async')
+    def test_async_records_are_flushed_in_batches(self):
+        with patch('audit.writer._schedule_flush') as schedule_flush:
+            with audit_context(request_id='async-req', correlation_id='async-req', operator='testadmin'):
+                for name in ('审计服务器A', '审计服务器B'):
+                    with self.captureOnCommitCallbacks(execute=True):
+                        self.model.verbose_name = name
+                        self.model.save()
+            # 同一审计上下文内的记录一次提交
+            schedule_flush.assert_called_once()
+
+        self.assertEqual(len(self.queue), 2)
+        self.assertFalse(AuditLog.objects.filter(correlation_id='async-req').exists())
+
+        self.assertEqual(flush_audit_records(), 2)
+        self.assertEqual(len(self.queue), 0)
+        logs = AuditLog.objects.filter(correlation_id='async-req').order_by('timestamp')
+        self.assertEqual(
+            [log.changed_fields['verbose_name'][1] for log in logs],
+            ['审计服务器A', '审计服务器B']
+        )
+
+    @override_settings(AUDIT_WRITER_MODE='async', AUDIT_QUEUE_MAX_LENGTH=0)
+    def test_full_queue_falls_back_to_sync_write(self):
+        with patch('audit.writer._schedule_flush') as schedule_flush:
+            with audit_context(request_id='full-req', correlation_id='full-req', operator='testadmin'):
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.model.verbose_name = '审计服务器C'
+                    self.model.save()
+            schedule_flush.assert_not_called()
+
+        self.assertEqual(len(self.queue), 0)
+        self.assertTrue(AuditLog.objects.filter(correlation_id='full-req').exists())
+
+    def _save_model_async(self, correlation_id, names):
+        with patch('audit.writer._schedule_flush'):
+            with audit_context(request_id=correlation_id, correlation_id=correlation_id, operator='testadmin'):
+                for name in names:
+                    with self.captureOnCommitCallbacks(execute=True):
+                        self.model.verbose_name = name
+                        self.model.save()
+
+    @override_settings(AUDIT_WRITER_MODE='async')
+    def test_unacknowledged_batch_is_recovered(self):
+        self._save_model_async('crash-req', ('审计服务器D', '审计服务器E'))
+
+        # 写入方取出批次并写入后、确认前退出
+        payloads = self.queue.pop_batch(1)
+        write_records([json.loads(payload) for payload in payloads])
+        self.assertEqual(self.queue.pending_count(), 2)
+
+        # 下一次写入先恢复处理中的记录，已写入的记录跳过
+        self.assertEqual(flush_audit_records(), 1)
+        self.assertEqual(self.queue.pending_count(), 0)
+        self.assertEqual(AuditLog.objects.filter(correlation_id='crash-req').count(), 2)
+
+    @override_settings(AUDIT_WRITER_MODE='async')
+    def test_rollback_flushes_queue_before_checking_conflicts(self):
+        with override_settings(AUDIT_WRITER_MODE='sync'):
+            self._update_env('prod', 'rollback-req')
+        with patch('audit.writer._schedule_flush'):
+            self._update_env('test', 'newer-req')
+        self.assertFalse(AuditLog.objects.filter(correlation_id='newer-req').exists())
+
+        result = RollbackManager('rollback-req').execute(dry_run=True)
+        self.assertEqual([item['object_id'] for item in result['conflicts']], [str(self.instance.id)])
+        self.assertEqual(self.queue.pending_count(), 0)
+
+    @override_settings(AUDIT_WRITER_MODE='async')
+    def test_ensure_flushed_stops_before_deadline(self):
+        self._save_model_async('deadline-req', ('审计服务器F', '审计服务器G', '审计服务器H'))
+
+        # 每次读取时钟前进 1 秒，第一批耗时 1 秒，截止前只来得及写入一批
+        with patch('audit.writer.AUDIT_WRITE_BATCH_SIZE', 1), \
+                patch('audit.writer.time.monotonic', side_effect=count()):
+            self.assertFalse(ensure_flushed(timeout=5))
+        self.assertEqual(AuditLog.objects.filter(correlation_id='deadline-req').count(), 1)
+        self.assertEqual(self.queue.pending_count(), 2)
+
+    @override_settings(AUDIT_WRITER_MODE='async')
+    def test_dead_letters_are_replayed(self):
+        self._save_model_async('dead-req', ('审计服务器I', '审计服务器J'))
+        with patch('audit.writer.write_records', side_effect=RuntimeError('database unavailable')):
+            self.assertEqual(flush_audit_records(), 0)
+        self.assertEqual((self.queue.pending_count(), len(self.dead_letters)), (0, 2))
+
+        # 批次失败时逐条重放，仍失败的记录留在死信队列
+        def write_or_fail(records):
+            if any(record['changed_fields']['verbose_name'][1] == '审计服务器J' for record in records):
+                raise RuntimeError('bad record')
+            write_records(records)
+
+        with patch('audit.writer.write_records', side_effect=write_or_fail):
+            self.assertEqual(replay_dead_letters(), {'replayed': 1, 'failed': 1})
+        self.assertEqual(self.dead_letters.pending_count(), 1)
+
+        self.assertEqual(replay_dead_letters(), {'replayed': 1, 'failed': 0})
+        self.assertEqual(self.dead_letters.pending_count(), 0)
+        self.assertEqual(AuditLog.objects.filter(correlation_id='dead-req').count(), 2)
@@ -0,0 +1,153 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+
+from audit.context import audit_context
+from audit.models import AuditLog
+from cmdb.models import Models, ModelInstance, RelationDefinition, Relations
+from cmdb.relation_graph import relation_graph, reset_relation_graph
+from cmdb.services import RelationsService
+from cmdb.tests import CmdbAPITestCase
+
+
+class BulkCreateRelationsTestCase(CmdbAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        reset_relation_graph()
+        self.addCleanup(reset_relation_graph)
+        self.app_model = Models.objects.create(
+            name='BulkApp', verbose_name='应用', create_user='admin', update_user='admin'
+        )
+        self.db_model = Models.objects.create(
+            name='BulkDb', verbose_name='数据库', create_user='admin', update_user='admin'
+        )
+        self.depends = RelationDefinition.objects.create(
+            name='bulk_depends',
+            forward_verb='依赖',
+            reverse_verb='被依赖',
+            topology_type='daggered',
+            create_user='admin',
+            update_user='admin',
+        )
+        self.uses = RelationDefinition.objects.create(
+            name='bulk_uses',
+            forward_verb='使用',
+            reverse_verb='被使用',
+            topology_type='directed',
+            create_user='admin',
+            update_user='admin',
+        )
+        self.uses.target_model.add(self.db_model)
+        self.apps = [
+            ModelInstance.objects.create(
+                model=self.app_model, instance_name=f'app-{i}', create_user='admin', update_user='admin'
+            )
+            for i in range(5)
+        ]
+        self.db = ModelInstance.objects.create(
+            model=self.db_model, instance_name='db-0', create_user='admin', update_user='admin'
+        )
+        # 已有 app-0 -> app-1
+        Relations.objects.create(
+            source_instance=self.apps[0], target_instance=self.apps[1], relation=self.depends
+        )
+
+    def _item(self, source, target, relation):
+        return {'source_instance': str(source.id), 'target_instance': str(target.id), 'relation': str(relation.id)}
+
+    def _bulk_create(self, items):
+        with self.captureOnCommitCallbacks(execute=True):
+            return RelationsService.bulk_create_relations(items, user=self.admin_user)
+
+    def test_per_item_results(self):
+        a = self.apps
+        result = self._bulk_create([
+            self._item(a[1], a[2], self.depends),   # 0 创建
+            self._item(a[2], a[3], self.depends),   # 1 创建
+            self._item(a[3], a[0], self.depends),   # 2 与已有边及本批边成环
+            self._item(a[3], a[4], self.depends),   # 3 创建
+            self._item(a[0], a[1], self.depends),   # 4 已存在
+            self._item(a[1], a[2], self.depends),   # 5 本批重复
+            self._item(a[0], self.db, self.uses),   # 6 创建
+            self._item(a[0], a[1], self.uses),      # 7 目标模型不允许
+            {'source_instance': 'bad', 'target_instance': str(a[0].id), 'relation': str(self.uses.id)},
+            self._item(a[4], a[4], self.depends),   # 9 自环
+        ])
+
+        self.assertEqual(
+            [item['status'] for item in result.results],
+            ['created', 'created', 'failed', 'created', 'failed', 'failed', 'created', 'failed', 'failed', 'failed'],
+        )
+        self.assertIn('cycle', result.results[2]['error'])
+        self.assertIn('already exists', result.results[4]['error'])
+        self.assertIn('already exists', result.results[5]['error'])
+        self.assertIn('not allowed', result.results[7]['error'])
+        self.assertIn('cycle', result.results[9]['error'])
+        self.assertEqual(len(result.created), 4)
+        self.assertEqual(Relations.objects.count(), 5)
+        self.assertEqual({item['id'] for item in result.results if item['id']},
+                         {str(relation.id) for relation in result.created})
+
+        # bulk_create 不触发信号，关系索引通过变更日志追读新增的边
+        with relation_graph() as graph:
+            _, nodes = graph.blast([str(a[0].id)], 5, 'forward')
+        self.assertEqual(nodes, {str(instance.id) for instance in a} | {str(self.db.id)})
+
+    def test_query_count_does_not_grow_with_batch(self):
+        instances = [
+            ModelInstance.objects.create(
+                model=self.app_model, instance_name=f'chain-{i}', create_user='admin', update_user='admin'
+            )
+            for i in range(60)
+        ]
+        items = [self._item(instances[i], instances[i + 1], self.depends) for i in range(59)]
+        items.append(self._item(instances[-1], instances[0], self.depends))
+
+        with CaptureQueriesContext(connection) as ctx:
+            result = self._bulk_create(items)
+
+        self.assertEqual(len(result.created), 59)
+        self.assertEqual(result.results[-1]['status'], 'failed')
+        # 包含提交后同步写入审计日志的固定查询
+        self.assertLess(len(ctx.captured_queries), 25)
+
+    def test_bulk_create_endpoint(self):
+        response = self.client.post(
+            reverse('relations-bulk-create'),
+            {'relations': [self._item(self.apps[1], self.apps[2], self.depends),
+                           self._item(self.apps[1], self.apps[0], self.depends)]},
+            format='json',
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created_count'], 1)
+        self.assertEqual([item['status'] for item in response.data['results']], ['created', 'failed'])
+
+    def test_bulk_created_relations_are_audited(self):
+        a = self.apps
+        with audit_context(request_id='bulk-request', correlation_id='bulk-request', operator='testadmin'):
+            result = self._bulk_create([
+                self._item(a[1], a[2], self.depends),
+                self._item(a[0], a[1], self.depends),   # 已存在，不记录
+            ])
+
+        logs = AuditLog.objects.filter(content_type__model='relations')
+        self.assertEqual(
+            list(logs.values_list('object_id', 'action', 'operator')),
+            [(str(result.created[0].id), AuditLog.Action.CREATE, 'testadmin')]
+        )
+        self.assertEqual(logs[0].changed_fields['target_instance'][1]['id'], str(a[2].id))
+
+    def test_cycle_rule_matches_single_create(self):
+        # 有向无环只约束同一关系定义：已有 depends 边 app-0 -> app-1 不与其他关系定义的边构成环
+        a = self.apps
+        other = RelationDefinition.objects.create(
+            name='bulk_contains', forward_verb='包含', reverse_verb='属于', topology_type='daggered',
+        )
+        self.assertFalse(RelationsService._would_create_cycle(str(a[1].id), str(a[0].id), str(other.id)))
+        self.assertTrue(RelationsService._would_create_cycle(str(a[1].id), str(a[0].id), str(self.depends.id)))
+
+        result = self._bulk_create([self._item(a[1], a[0], other), self._item(a[1], a[0], self.depends)])
+        self.assertEqual([item['status'] for item in result.results], ['created', 'failed'])
+        self.assertTrue(RelationsService._would_create_cycle(str(a[0].id), str(a[1].id), str(other.id)))
@@ -0,0 +1,123 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from audit.context import audit_context
+from audit.models import AuditLog, FieldAuditDetail
+
+from cmdb.models import Models, ModelFieldGroups, ModelFields, ModelInstance, ModelFieldMeta
+from cmdb.services import ModelInstanceService
+from cmdb.tests import CmdbAPITestCase
+
+
+class BulkUpdateInstancesTestCase(CmdbAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.model = Models.objects.create(
+            name="BulkServer",
+            verbose_name="批量服务器",
+            create_user="admin",
+            update_user="admin",
+        )
+        self.field_group = ModelFieldGroups.objects.create(
+            name="basic",
+            verbose_name="基本信息",
+            model=self.model,
+            create_user="admin",
+            update_user="admin",
+        )
+        self.field_env = ModelFields.objects.create(
+            model=self.model,
+            model_field_group=self.field_group,
+            name="env",
+            verbose_name="环境",
+            type="string",
+            order=1,
+            required=False,
+            create_user="admin",
+            update_user="admin",
+        )
+        self.field_ip = ModelFields.objects.create(
+            model=self.model,
+            model_field_group=self.field_group,
+            name="ip",
+            verbose_name="IP地址",
+            type="string",
+            order=2,
+            required=False,
+            create_user="admin",
+            update_user="admin",
+        )
+        self.model.instance_name_template = [str(self.field_env.id), str(self.field_ip.id)]
+        self.model.save()
+
+    def _create_instances(self, count, prefix):
+        instances = []
+        for i in range(count):
+            instance = ModelInstance.objects.create(
+                model=self.model,
+                instance_name=f"{prefix}-{i:03d}",
+                using_template=True,
+                create_user="admin",
+                update_user="admin",
+            )
+            for field, data in ((self.field_env, "dev"), (self.field_ip, f"10.{len(prefix)}.0.{i}")):
+                ModelFieldMeta.objects.create(
+                    model=self.model,
+                    model_instance=instance,
+                    model_fields=field,
+                    data=data,
+                    create_user="admin",
+                    update_user="admin",
+                )
+            instances.append(instance)
+        return ModelInstance.objects.filter(id__in=[inst.id for inst in instances])
+
+    def _count_bulk_update_queries(self, queryset):
+        with CaptureQueriesContext(connection) as ctx:
+            ModelInstanceService.bulk_update_instances(
+                instances_qs=queryset,
+                validated_fields={'env': 'prod'},
+                user=self.admin_user,
+                using_template=True,
+            )
+        return len(ctx.captured_queries)
+
+    def test_query_count_is_constant_in_number_of_instances(self):
+        small = self._count_bulk_update_queries(self._create_instances(3, "small"))
+        large = self._count_bulk_update_queries(self._create_instances(30, "largebatch"))
+        self.assertEqual(small, large)
+
+    def test_updates_values_and_regenerates_names(self):
+        queryset = self._create_instances(3, "srv")
+        updated = ModelInstanceService.bulk_update_instances(
+            instances_qs=queryset,
+            validated_fields={'env': 'prod'},
+            user=self.admin_user,
+            using_template=True,
+        )
+        self.assertEqual(updated, 3)
+        self.assertEqual(
+            ModelFieldMeta.objects.filter(model_fields=self.field_env, data='prod').count(), 3
+        )
+        names = sorted(queryset.values_list('instance_name', flat=True))
+        self.assertEqual(names, ["prod - 10.3.0.0", "prod - 10.3.0.1", "prod - 10.3.0.2"])
+        self.assertTrue(all(u == 'testadmin' for u in queryset.values_list('update_user', flat=True)))
+
+    def test_emits_one_audit_log_per_instance(self):
+        queryset = self._create_instances(2, "aud")
+        with audit_context(request_id='bulk-req', correlation_id='bulk-req', operator='testadmin'):
+            with self.captureOnCommitCallbacks(execute=True):
+                ModelInstanceService.bulk_update_instances(
+                    instances_qs=queryset,
+                    validated_fields={'env': 'prod'},
+                    user=self.admin_user,
+                    using_template=True,
+                )
+
+        logs = AuditLog.objects.filter(correlation_id='bulk-req')
+        self.assertEqual(logs.count(), 2)
+        for log in logs:
+            self.assertIn('instance_name', log.changed_fields)
+        details = FieldAuditDetail.objects.filter(audit_log__in=logs)
+        self.assertEqual(sorted(details.values_list('old_value', 'new_value')), [('dev', 'prod'), ('dev', 'prod')])
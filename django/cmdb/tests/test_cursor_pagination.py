@@ -0,0 +1,79 @@
+from datetime import timedelta
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from cmdb.models import Models, ModelFieldGroups, ModelFields, ModelFieldMeta, ModelInstance
+from cmdb.tests import CmdbAPITestCase
+
+
+class CursorPaginationTestCase(CmdbAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.model = Models.objects.create(name='CursorServer', verbose_name='游标服务器')
+        now = timezone.now()
+        for i in range(7):
+            instance = ModelInstance.objects.create(model=self.model, instance_name=f'cursor-{i}')
+            # 每两个实例创建时间相同，验证按 id 决定顺序
+            ModelInstance.objects.filter(id=instance.id).update(create_time=now - timedelta(minutes=i // 2))
+        self.expected = list(
+            ModelInstance.objects.filter(model=self.model).order_by('-create_time', '-id').values_list('id', flat=True)
+        )
+        self.url = reverse('modelinstance-list')
+
+    def _get(self, url, params=None):
+        response = self.client.get(url, params, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_walks_pages_without_count(self):
+        params = {'model': str(self.model.id), 'cursor': '', 'page_size': 3}
+        with CaptureQueriesContext(connection) as ctx:
+            data = self._get(self.url, params)
+        self.assertNotIn('count', data)
+        self.assertFalse([q for q in ctx.captured_queries if 'COUNT(' in q['sql']])
+        self.assertIsNone(data['previous'])
+
+        pages = [data]
+        while data['next']:
+            data = self._get(data['next'])
+            pages.append(data)
+        ids = [row['id'] for page in pages for row in page['results']]
+        self.assertEqual([len(page['results']) for page in pages], [3, 3, 1])
+        self.assertEqual(ids, [str(i) for i in self.expected])
+
+        previous = self._get(pages[-1]['previous'])
+        self.assertEqual([row['id'] for row in previous['results']], ids[3:6])
+        self.assertIsNotNone(previous['next'])
+
+    def test_approximate_count_and_invalid_cursor(self):
+        data = self._get(self.url, {'model': str(self.model.id), 'cursor': '', 'count': 'approx'})
+        self.assertEqual(data['count'], 7)
+        self.assertTrue(data['count_is_approximate'])
+
+        response = self.client.get(self.url, {'model': str(self.model.id), 'cursor': 'bogus'}, format='json')
+        self.assertEqual(response.status_code, 404)
+
+        # 未传 cursor 时仍为页码分页
+        data = self._get(self.url, {'model': str(self.model.id), 'page_size': 3})
+        self.assertEqual(data['count'], 7)
+
+    def test_count_is_a_field_filter_without_cursor(self):
+        group = ModelFieldGroups.objects.create(name='basic', verbose_name='基本信息', model=self.model)
+        field = ModelFields.objects.create(
+            model=self.model, model_field_group=group, name='count', verbose_name='数量',
+            type='string', order=1, required=False,
+        )
+        instance = ModelInstance.objects.get(id=self.expected[0])
+        ModelFieldMeta.objects.create(model=self.model, model_instance=instance, model_fields=field, data='approx')
+
+        # 页码分页时 count 是同名动态字段的过滤条件
+        data = self._get(self.url, {'model': str(self.model.id), 'count': 'approx'})
+        self.assertEqual([row['id'] for row in data['results']], [str(instance.id)])
+
+        # 游标分页时 count 为分页参数
+        data = self._get(self.url, {'model': str(self.model.id), 'cursor': '', 'count': 'approx'})
+        self.assertEqual(data['count'], 7)
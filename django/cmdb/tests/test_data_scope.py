@@ -0,0 +1,138 @@
+from unittest.mock import patch
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from access.manager import PermissionManager
+from access.models import DataScope, PermissionTarget
+from access.tools import SCOPE_TARGET_VERSION_KEY
+# 权限处理器仅在服务进程启动时注册，测试中手动导入
+import cmdb.permission_handlers  # noqa: F401
+from cmdb.models import Models, ModelInstance, ModelInstanceGroup, ModelInstanceGroupRelation
+from cmdb.tests import CmdbAPITestCase
+from mapi.models import UserInfo
+from node_mg.models import ModelConfig
+
+# CmdbAPITestCase 会 mock PermissionManager.get_queryset，这里保留真实实现
+REAL_GET_QUERYSET = PermissionManager.get_queryset
+
+
+class CompiledDataScopeTestCase(CmdbAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = UserInfo.objects.create(
+            username='scopeuser',
+            password='dummy_encrypted',
+            password_salt='testsalt',
+            status=True,
+            built_in=False,
+        )
+        self.model = Models.objects.create(name='ScopeServer', verbose_name='权限服务器')
+        ModelConfig.objects.create(model=self.model, is_manage=False)
+        self.root_group = ModelInstanceGroup.objects.create(
+            label='所有', model=self.model, parent=None, level=1, order=1, built_in=True
+        )
+        self.group = ModelInstanceGroup.objects.create(
+            label='授权分组', model=self.model, parent=self.root_group, level=2, order=1
+        )
+        self.child_group = ModelInstanceGroup.objects.create(
+            label='子分组', model=self.model, parent=self.group, level=3, order=1
+        )
+        self.other_group = ModelInstanceGroup.objects.create(
+            label='其他分组', model=self.model, parent=self.root_group, level=2, order=2
+        )
+        self.visible = self._create_instance('scope-visible', self.child_group)
+        self.hidden = self._create_instance('scope-hidden', self.other_group)
+        self.own = ModelInstance.objects.create(
+            model=self.model, instance_name='scope-own', create_user='scopeuser'
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            scope = DataScope.objects.create(user=self.user, scope_type=DataScope.ScopeType.FILTER)
+            PermissionTarget.objects.create(
+                scope=scope,
+                content_type=ContentType.objects.get_for_model(ModelInstanceGroup),
+                object_id=str(self.group.id),
+            )
+
+    def _create_instance(self, name, group):
+        instance = ModelInstance.objects.create(model=self.model, instance_name=name, create_user='admin')
+        ModelInstanceGroupRelation.objects.create(instance=instance, group=group)
+        return instance
+
+    def _group_version(self, group):
+        return cache.get(SCOPE_TARGET_VERSION_KEY.format(model_key='cmdb.modelinstancegroup', object_id=group.id))
+
+    def _visible_names(self):
+        with patch.object(PermissionManager, 'get_queryset', REAL_GET_QUERYSET):
+            queryset = PermissionManager(self.user).get_queryset(ModelInstance)
+            return set(queryset.values_list('instance_name', flat=True))
+
+    def test_visible_ids_are_compiled_once(self):
+        self.assertEqual(self._visible_names(), {'scope-visible', 'scope-own'})
+
+        # 编译结果命中缓存后不再查询分组及分组关系
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self._visible_names(), {'scope-visible', 'scope-own'})
+        sql = '\n'.join(q['sql'] for q in ctx.captured_queries)
+        self.assertNotIn('model_instance_group', sql)
+
+        # 同一管理器内按模型复用条件
+        with patch('access.manager.get_scope_query', return_value=None) as mocked:
+            pm = PermissionManager(self.user)
+            with patch.object(PermissionManager, 'get_queryset', REAL_GET_QUERYSET):
+                pm.get_queryset(ModelInstance)
+                pm.get_queryset(ModelInstance.objects.filter(model=self.model))
+        self.assertEqual(mocked.call_count, 1)
+
+    def test_group_changes_invalidate_compiled_ids(self):
+        self.assertEqual(self._visible_names(), {'scope-visible', 'scope-own'})
+        group_version = self._group_version(self.group)
+
+        # 授权分组之外的关系变化不影响编译结果
+        other = ModelInstance.objects.create(model=self.model, instance_name='scope-hidden-2', create_user='admin')
+        with self.captureOnCommitCallbacks(execute=True):
+            ModelInstanceGroupRelation.objects.create(instance=other, group=self.other_group)
+        self.assertEqual(self._group_version(self.group), group_version)
+
+        # 实例移入授权分组的子分组，授权分组（祖先）的版本递增
+        with self.captureOnCommitCallbacks(execute=True):
+            ModelInstanceGroupRelation.objects.filter(instance=self.hidden).delete()
+            ModelInstanceGroupRelation.objects.create(instance=self.hidden, group=self.child_group)
+        self.assertNotEqual(self._group_version(self.group), group_version)
+        self.assertEqual(self._visible_names(), {'scope-visible', 'scope-hidden', 'scope-own'})
+
+        # 分组移动到授权分组下，其中的实例随之可见
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other_group.parent = self.group
+            self.other_group.save()
+        self.assertEqual(
+            self._visible_names(), {'scope-visible', 'scope-hidden', 'scope-hidden-2', 'scope-own'}
+        )
+
+        # 新建的实例通过 create_user 条件实时可见，无需失效编译结果
+        ModelInstance.objects.create(model=self.model, instance_name='scope-own-2', create_user='scopeuser')
+        self.assertIn('scope-own-2', self._visible_names())
+
+    def test_large_scope_uses_subquery(self):
+        # 可见ID超过阈值时不内联 IN 列表，回退为分组关系子查询
+        with patch('access.tools.COMPILED_SCOPE_MAX_IDS', 0):
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(self._visible_names(), {'scope-visible', 'scope-own'})
+        sql = ctx.captured_queries[-1]['sql']
+        self.assertIn('model_instance_group_relation', sql)
+        self.assertNotIn(self.visible.id.hex, sql)
+
+    def test_scope_rule_changes_invalidate_compiled_ids(self):
+        self.assertEqual(self._visible_names(), {'scope-visible', 'scope-own'})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            PermissionTarget.objects.create(
+                scope=DataScope.objects.get(user=self.user),
+                content_type=ContentType.objects.get_for_model(ModelInstance),
+                object_id=str(self.hidden.id),
+            )
+        self.assertEqual(self._visible_names(), {'scope-visible', 'scope-hidden', 'scope-own'})
@@ -0,0 +1,132 @@
+import csv
+import io
+import tempfile
+from unittest.mock import patch
+
+from django.urls import reverse
+from openpyxl import load_workbook
+from rest_framework import status
+
+from mapi.models import UserInfo
+
+from cmdb.models import Models, ModelFieldGroups, ModelFields, ModelInstance
+from cmdb.services import ModelInstanceService
+
+from cmdb.tests import CmdbAPITestCase
+
+
+class StreamingExportTestCase(CmdbAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.model = Models.objects.create(
+            name="ExportServer",
+            verbose_name="导出服务器",
+            create_user="admin",
+            update_user="admin",
+        )
+        self.field_group = ModelFieldGroups.objects.create(
+            name="basic",
+            verbose_name="基本信息",
+            model=self.model,
+            create_user="admin",
+            update_user="admin",
+        )
+        self.field_ip = ModelFields.objects.create(
+            model=self.model,
+            model_field_group=self.field_group,
+            name="ip",
+            verbose_name="IP地址",
+            type="string",
+            order=1,
+            required=False,
+            create_user="admin",
+            update_user="admin",
+        )
+        self.field_managed = ModelFields.objects.create(
+            model=self.model,
+            model_field_group=self.field_group,
+            name="managed",
+            verbose_name="纳管",
+            type="boolean",
+            order=2,
+            required=False,
+            create_user="admin",
+            update_user="admin",
+        )
+        for i in range(5):
+            instance = ModelInstance.objects.create(
+                model=self.model,
+                instance_name=f"export-{i}",
+                create_user="admin",
+                update_user="admin",
+            )
+            ModelInstanceService._save_field_values(
+                instance, {'ip': f'10.0.0.{i}', 'managed': i % 2 == 0}, 'admin'
+            )
+
+    def _export(self, **data):
+        url = reverse('modelinstance-list') + 'export_data/'
+        response = self.client.post(url, {'model': str(self.model.id), **data}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, b''.join(response.streaming_content)
+
+    def test_export_rows_are_streamed_in_chunks(self):
+        instances = ModelInstance.objects.filter(model=self.model).order_by('instance_name')
+        export_context = ModelInstanceService.prepare_export_context(
+            self.model, ModelFields.objects.filter(model=self.model), self.admin_user
+        )
+        chunks = list(ModelInstanceService.iter_instance_chunks(instances, chunk_size=2))
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+
+        rows = list(ModelInstanceService.iter_export_rows(self.model, iter(chunks), export_context))
+        self.assertEqual(rows[0], {'instance_name': 'export-0', 'fields': {'ip': '10.0.0.0', 'managed': 'TRUE'}})
+        self.assertEqual([row['instance_name'] for row in rows], [f'export-{i}' for i in range(5)])
+
+    def test_export_xlsx_matches_import_template(self):
+        response, content = self._export(fields=['ip'])
+        self.assertIn('ExportServer_data.xlsx', response['Content-Disposition'])
+
+        wb = load_workbook(io.BytesIO(content))
+        rows = list(wb['配置数据'].iter_rows(min_row=4, values_only=True))
+        self.assertEqual(sorted(rows), [(f'export-{i}', None, f'10.0.0.{i}') for i in range(5)])
+        self.assertEqual(wb['校验表']['A1'].value, str(self.model.id))
+
+    def test_export_csv(self):
+        response, content = self._export(format='csv')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.reader(io.StringIO(content.decode('utf-8-sig'))))
+        self.assertEqual(rows[0], ['instance_name', 'ip', 'managed'])
+        self.assertIn(['export-1', '10.0.0.1', 'FALSE'], rows)
+        self.assertEqual(len(rows), 6)
+
+    @patch('cmdb.views.celery_manager.check_heartbeat', return_value=True)
+    def test_async_export_exposes_download_key(self, _):
+        export_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(export_dir.cleanup)
+        settings_override = self.settings(CMDB_EXPORT_DIR=export_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        url = reverse('modelinstance-list')
+        response = self.client.post(url + 'export_data_async/', {'model': str(self.model.id)}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        result = self.client.get(url + 'export_status/', {'cache_key': response.data['cache_key']}).data
+        self.assertEqual(result['status'], 'completed')
+        self.assertEqual((result['total'], result['exported']), (5, 5))
+
+        download = self.client.post(url + 'download_export/', {'file_key': result['file_key']}, format='json')
+        self.assertEqual(download.status_code, status.HTTP_200_OK)
+        wb = load_workbook(io.BytesIO(b''.join(download.streaming_content)))
+        self.assertEqual(len(list(wb['配置数据'].iter_rows(min_row=4))), 5)
+
+        # 其他用户无法查询进度或下载
+        other = UserInfo.objects.create(
+            username='otheruser', password='dummy_encrypted', password_salt='testsalt', status=True, built_in=False,
+        )
+        self.client.force_authenticate(user=other)
+        response = self.client.get(url + 'export_status/', {'cache_key': response.data['cache_key']})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        download = self.client.post(url + 'download_export/', {'file_key': result['file_key']}, format='json')
+        self.assertEqual(download.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,126 @@
+from unittest.mock import patch
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from cmdb.models import Models, ModelFieldGroups, ModelFields, ModelInstance, ModelFieldMeta
+from cmdb.services import ModelInstanceService, ModelFieldMetaWriter
+from cmdb.tests import CmdbAPITestCase
+
+
+class ModelFieldMetaWriterTestCase(CmdbAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.model = Models.objects.create(
+            name="WriterServer",
+            verbose_name="写入器服务器",
+            create_user="admin",
+            update_user="admin",
+        )
+        self.ref_model = Models.objects.create(
+            name="WriterRack",
+            verbose_name="机柜",
+            create_user="admin",
+            update_user="admin",
+        )
+        self.field_group = ModelFieldGroups.objects.create(
+            name="basic",
+            verbose_name="基本信息",
+            model=self.model,
+            create_user="admin",
+            update_user="admin",
+        )
+        self.int_fields = [
+            ModelFields.objects.create(
+                model=self.model,
+                model_field_group=self.field_group,
+                name=f"metric_{i}",
+                verbose_name=f"指标{i}",
+                type="integer",
+                order=i,
+                required=False,
+                create_user="admin",
+                update_user="admin",
+            )
+            for i in range(12)
+        ]
+        self.ref_field = ModelFields.objects.create(
+            model=self.model,
+            model_field_group=self.field_group,
+            name="rack",
+            verbose_name="机柜",
+            type="model_ref",
+            ref_model=self.ref_model,
+            order=20,
+            required=False,
+            create_user="admin",
+            update_user="admin",
+        )
+        self.rack = ModelInstance.objects.create(
+            model=self.ref_model,
+            instance_name="rack-01",
+            create_user="admin",
+            update_user="admin",
+        )
+        self.instances = [
+            ModelInstance.objects.create(
+                model=self.model,
+                instance_name=f"writer-{i:03d}",
+                create_user="admin",
+                update_user="admin",
+            )
+            for i in range(3)
+        ]
+
+    def _count_save_queries(self, instance, fields_data):
+        with CaptureQueriesContext(connection) as ctx:
+            ModelInstanceService._save_field_values(instance, fields_data, 'admin')
+        return len(ctx.captured_queries)
+
+    def test_query_count_does_not_grow_with_field_count(self):
+        few = self._count_save_queries(self.instances[0], {'metric_0': 1, 'metric_1': 2})
+        many = self._count_save_queries(
+            self.instances[1], {f.name: idx for idx, f in enumerate(self.int_fields)}
+        )
+        self.assertEqual(few, many)
+
+        # 更新已有值同样是固定次数的查询
+        update = self._count_save_queries(
+            self.instances[1], {f.name: idx + 100 for idx, f in enumerate(self.int_fields)}
+        )
+        self.assertLessEqual(update, many + 1)
+
+    def test_update_overwrites_existing_rows(self):
+        instance = self.instances[0]
+        ModelInstanceService._save_field_values(instance, {'metric_0': 1}, 'admin')
+        ModelInstanceService._save_field_values(instance, {'metric_0': 42}, 'other')
+
+        metas = ModelFieldMeta.objects.filter(model_instance=instance, model_fields=self.int_fields[0])
+        self.assertEqual(metas.count(), 1)
+        meta = metas.get()
+        self.assertEqual(meta.data, '42')
+        self.assertEqual(meta.num_value, 42)
+        self.assertEqual(meta.update_user, 'other')
+
+    def test_shared_writer_loads_ref_map_once(self):
+        writer = ModelFieldMetaWriter.for_user(self.model, 'admin')
+        with patch.object(
+            ModelInstance.objects.__class__, 'get_instance_names_by_models',
+            return_value={str(self.rack.id): self.rack.instance_name},
+        ) as mocked:
+            for instance in self.instances:
+                ModelInstanceService._save_field_values(
+                    instance, {'rack': str(self.rack.id)}, 'admin', writer=writer
+                )
+        self.assertEqual(mocked.call_count, 1)
+        self.assertEqual(
+            ModelFieldMeta.objects.filter(model_fields=self.ref_field, data=str(self.rack.id)).count(), 3
+        )
+
+    def test_failed_conversion_leaves_nothing_pending(self):
+        writer = ModelFieldMetaWriter.for_user(self.model, 'admin')
+        with self.assertRaises(ValueError):
+            writer.add(self.instances[0], {'metric_0': 1, 'metric_1': 'not-a-number'})
+        self.assertEqual(writer.flush(), 0)
+        self.assertFalse(ModelFieldMeta.objects.filter(model_instance=self.instances[0]).exists())
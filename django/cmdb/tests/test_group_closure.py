@@ -0,0 +1,93 @@
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+
+from audit.context import audit_context
+
+from cmdb.filters import ModelInstanceFilter
+from cmdb.models import Models, ModelInstance, ModelInstanceGroup, ModelInstanceGroupClosure, ModelInstanceGroupRelation
+from cmdb.tests import CmdbAPITestCase
+from node_mg.models import ModelConfig
+
+
+class GroupClosureTestCase(CmdbAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.model = Models.objects.create(name='ClosureServer', verbose_name='闭包服务器')
+        ModelConfig.objects.create(model=self.model, is_manage=False)
+        self.root = ModelInstanceGroup.objects.create(
+            label='所有', model=self.model, parent=None, level=1, order=1, built_in=True
+        )
+        # 所有 -> a -> b -> c，所有 -> x
+        self.a = self._group('a', self.root)
+        self.b = self._group('b', self.a)
+        self.c = self._group('c', self.b)
+        self.x = self._group('x', self.root)
+
+    def _group(self, label, parent):
+        return ModelInstanceGroup.objects.create(
+            label=label, model=self.model, parent=parent, level=parent.level + 1, order=1
+        )
+
+    def _closure(self):
+        return set(ModelInstanceGroupClosure.objects.filter(
+            descendant__model=self.model
+        ).values_list('ancestor__label', 'descendant__label', 'depth'))
+
+    def _expected_closure(self):
+        rows = set()
+        for group in ModelInstanceGroup.objects.filter(model=self.model):
+            node, depth = group, 0
+            while node:
+                rows.add((node.label, group.label, depth))
+                node, depth = node.parent, depth + 1
+        return rows
+
+    def test_closure_is_maintained_on_create(self):
+        self.assertEqual(self._closure(), self._expected_closure())
+        self.assertEqual(
+            ModelInstanceGroup.objects.get_all_children_ids([self.a.id]), {str(self.b.id), str(self.c.id)}
+        )
+
+    def test_move_rewrites_subtree_in_place(self):
+        response = self.client.patch(
+            reverse('modelinstancegroup-detail', args=[self.b.id]), {'parent': str(self.x.id)}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.c.refresh_from_db()
+        self.assertEqual((self.c.path, self.c.level), ('所有/x/b/c', 4))
+        self.assertEqual(self._closure(), self._expected_closure())
+
+        # 重命名只改写后代 path 前缀
+        self.x.label = 'y'
+        with CaptureQueriesContext(connection) as ctx:
+            self.x.save()
+        updates = [q for q in ctx.captured_queries if q['sql'].startswith('UPDATE "model_instance_group"')]
+        self.assertEqual(len(updates), 2)
+        self.c.refresh_from_db()
+        self.assertEqual(self.c.path, '所有/y/b/c')
+
+    def test_filter_and_delete(self):
+        instance = ModelInstance.objects.create(model=self.model, instance_name='closure-1')
+        ModelInstanceGroupRelation.objects.create(instance=instance, group=self.c)
+
+        with CaptureQueriesContext(connection) as ctx:
+            queryset = ModelInstanceFilter(
+                {'model_instance_group': str(self.a.id)}, queryset=ModelInstance.objects.all()
+            ).qs
+            self.assertEqual(list(queryset), [instance])
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+        with audit_context(request_id='closure-req', correlation_id='closure-req', operator='testadmin'):
+            ModelInstanceGroupRelation.objects.filter(instance=instance).delete()
+            self.c.delete()
+        self.assertEqual(self._closure(), self._expected_closure())
+
+    def test_rebuild_command(self):
+        ModelInstanceGroupClosure.objects.all().delete()
+        call_command('rebuild_group_closure', self.model.name, stdout=open('/dev/null', 'w'))
+        self.assertEqual(self._closure(), self._expected_closure())
@@ -0,0 +1,104 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from audit.context import audit_context
+
+from cmdb.group_counters import reconcile_group_counters, relations_created
+from cmdb.models import Models, ModelInstance, ModelInstanceGroup, ModelInstanceGroupCounter, ModelInstanceGroupRelation
+from cmdb.services import ModelInstanceGroupService
+from cmdb.tests import CmdbAPITestCase
+
+
+class GroupCounterTestCase(CmdbAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.model = Models.objects.create(name='CounterServer', verbose_name='计数服务器')
+        self.root = ModelInstanceGroup.objects.create(
+            label='所有', model=self.model, parent=None, level=1, order=1, built_in=True
+        )
+        # 所有 -> a -> (b, c)，所有 -> x
+        self.a = self._group('a', self.root)
+        self.b = self._group('b', self.a)
+        self.c = self._group('c', self.a)
+        self.x = self._group('x', self.root)
+        self.i1 = ModelInstance.objects.create(model=self.model, instance_name='counter-1')
+        self.i2 = ModelInstance.objects.create(model=self.model, instance_name='counter-2')
+        reconcile_group_counters(self.model.id)
+
+    def _group(self, label, parent):
+        return ModelInstanceGroup.objects.create(
+            label=label, model=self.model, parent=parent, level=parent.level + 1, order=1
+        )
+
+    def _relate(self, instance, group):
+        return ModelInstanceGroupRelation.objects.create(instance=instance, group=group)
+
+    def _counters(self):
+        return {
+            label: (direct, total)
+            for label, direct, total in ModelInstanceGroupCounter.objects.filter(
+                group__model=self.model
+            ).values_list('group__label', 'direct_count', 'total_count')
+        }
+
+    def assertCountersConsistent(self, expected_totals):
+        counters = self._counters()
+        self.assertEqual({label: total for label, (_, total) in counters.items()}, expected_totals)
+        reconcile_group_counters(self.model.id)
+        self.assertEqual(self._counters(), counters)
+
+    def test_relation_changes_update_counters(self):
+        self._relate(self.i1, self.b)
+        self._relate(self.i1, self.c)
+        relation = self._relate(self.i2, self.x)
+        self.assertCountersConsistent({'所有': 2, 'a': 1, 'b': 1, 'c': 1, 'x': 1})
+
+        relation.group = self.b
+        relation.save(update_fields=['group', 'update_time'])
+        self.assertCountersConsistent({'所有': 2, 'a': 2, 'b': 2, 'c': 1, 'x': 0})
+
+        # 同一实例的多条关系一起删除时祖先只减一次
+        with audit_context(request_id='counter-req', correlation_id='counter-req', operator='testadmin'):
+            ModelInstanceGroupRelation.objects.filter(instance=self.i1).delete()
+        self.assertCountersConsistent({'所有': 1, 'a': 1, 'b': 1, 'c': 0, 'x': 0})
+
+        relations_created(ModelInstanceGroupRelation.objects.bulk_create([
+            ModelInstanceGroupRelation(instance=self.i1, group=self.c),
+            ModelInstanceGroupRelation(instance=self.i1, group=self.x),
+        ]))
+        self.assertCountersConsistent({'所有': 2, 'a': 2, 'b': 1, 'c': 1, 'x': 1})
+
+        with audit_context(request_id='counter-req', correlation_id='counter-req', operator='testadmin'):
+            self.i1.delete()
+        self.assertCountersConsistent({'所有': 1, 'a': 1, 'b': 1, 'c': 0, 'x': 0})
+
+    def test_group_move_recounts_ancestors(self):
+        self._relate(self.i1, self.b)
+        self._relate(self.i2, self.x)
+
+        self.b.parent = self.x
+        self.b.level = 3
+        self.b.save()
+        self.assertCountersConsistent({'所有': 2, 'a': 0, 'b': 1, 'c': 0, 'x': 2})
+
+    def test_tree_counts(self):
+        self._relate(self.i1, self.b)
+        self._relate(self.i1, self.c)
+        self._relate(self.i2, self.x)
+        nodes = list(ModelInstanceGroup.objects.filter(model=self.model))
+        expected = {self.root.id: 2, self.a.id: 1, self.b.id: 1, self.c.id: 1, self.x.id: 1}
+
+        with CaptureQueriesContext(connection) as ctx:
+            counts = ModelInstanceGroupService._calculate_instance_counts(
+                nodes, ModelInstance.objects.all(), unrestricted=True
+            )
+        self.assertEqual(counts, expected)
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+        # 数据权限受限时按可见实例聚合
+        counts = ModelInstanceGroupService._calculate_instance_counts(
+            nodes, ModelInstance.objects.filter(id=self.i1.id)
+        )
+        self.assertEqual(counts, {**{group_id: 0 for group_id in expected}, self.root.id: 1,
+                                  self.a.id: 1, self.b.id: 1, self.c.id: 1})
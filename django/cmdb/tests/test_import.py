@@ -0,0 +1,177 @@
+import os
+import tempfile
+from unittest.mock import patch
+
+from audit.context import audit_context
+
+from cmdb.excel import ExcelHandler
+from cmdb.models import (
+    Models, ModelFieldGroups, ModelFields, ModelInstance, ModelInstanceGroup, ModelFieldMeta, UniqueConstraint
+)
+from cmdb.services import ModelInstanceService
+from cmdb.tasks import process_import_data
+from cmdb.tests import CmdbAPITestCase
+
+
+class StreamingImportTestCase(CmdbAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.model = Models.objects.create(
+            name="ImportServer",
+            verbose_name="导入服务器",
+            create_user="admin",
+            update_user="admin",
+        )
+        self.field_group = ModelFieldGroups.objects.create(
+            name="basic",
+            verbose_name="基本信息",
+            model=self.model,
+            create_user="admin",
+            update_user="admin",
+        )
+        self.field_env = ModelFields.objects.create(
+            model=self.model,
+            model_field_group=self.field_group,
+            name="env",
+            verbose_name="环境",
+            type="string",
+            order=1,
+            required=False,
+            create_user="admin",
+            update_user="admin",
+        )
+        self.field_ip = ModelFields.objects.create(
+            model=self.model,
+            model_field_group=self.field_group,
+            name="ip",
+            verbose_name="IP地址",
+            type="string",
+            order=2,
+            required=False,
+            create_user="admin",
+            update_user="admin",
+        )
+        root_group = ModelInstanceGroup.objects.create(
+            label="所有",
+            model=self.model,
+            parent=None,
+            level=1,
+            built_in=True,
+            create_user="admin",
+            update_user="admin",
+        )
+        ModelInstanceGroup.objects.create(
+            label="空闲池",
+            model=self.model,
+            parent=root_group,
+            level=2,
+            built_in=True,
+            create_user="admin",
+            update_user="admin",
+        )
+        UniqueConstraint.objects.create(
+            model=self.model,
+            fields=[str(self.field_ip.id)],
+            validate_null=False,
+            create_user="admin",
+            update_user="admin",
+        )
+        self.existing = ModelInstance.objects.create(
+            model=self.model,
+            instance_name="imp-existing",
+            create_user="admin",
+            update_user="admin",
+        )
+        ModelInstanceService._save_field_values(self.existing, {'env': 'dev', 'ip': '10.0.0.1'}, 'admin')
+
+    def _write_workbook(self, rows):
+        wb = ExcelHandler.generate_data_export_with_template(
+            str(self.model.id), [self.field_env, self.field_ip], rows, enum_data={}, ref_data={}
+        )
+        fd, path = tempfile.mkstemp(suffix='.xlsx')
+        os.close(fd)
+        wb.save(path)
+        self.addCleanup(lambda: os.path.exists(path) and os.remove(path))
+        return path
+
+    def _run_import(self, path):
+        ctx = {'request_id': 'import-req', 'correlation_id': 'import-req', 'operator': 'testadmin'}
+        with audit_context(**ctx):
+            return process_import_data.apply(
+                args=(path, str(self.model.id), str(self.admin_user.id), ctx)
+            ).get()
+
+    def test_iter_data_chunks_streams_rows_in_chunks(self):
+        path = self._write_workbook([
+            {'instance_name': f'chunk-{i}', 'fields': {'env': 'dev', 'ip': f'10.1.0.{i}'}}
+            for i in range(5)
+        ])
+        handler = ExcelHandler()
+        header = handler.read_import_header(path, str(self.model.id))
+        self.assertEqual(header['headers'], ['env', 'ip'])
+        self.assertEqual(header['estimated_rows'], 5)
+
+        chunks = list(handler.iter_data_chunks(path, str(self.model.id), header['field_mapping'], chunk_size=2))
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+        self.assertEqual(chunks[2][0], {
+            'instance_name': 'chunk-4', 'using_template': None, 'fields': {'env': 'dev', 'ip': '10.1.0.4'}
+        })
+
+    @patch('cmdb.tasks.IMPORT_CHUNK_SIZE', 2)
+    def test_import_creates_updates_and_reports_unique_conflicts(self):
+        path = self._write_workbook([
+            {'instance_name': 'imp-001', 'fields': {'env': 'dev', 'ip': '10.0.0.2'}},
+            {'instance_name': 'imp-002', 'fields': {'env': 'dev', 'ip': '10.0.0.1'}},
+            {'instance_name': 'imp-existing', 'fields': {'env': 'prod', 'ip': '10.0.0.9'}},
+            {'instance_name': 'imp-003', 'fields': {'env': 'dev', 'ip': '10.0.0.2'}},
+            {'instance_name': 'imp-004', 'fields': {'env': 'dev', 'ip': '10.0.0.4'}},
+            {'instance_name': 'imp-005', 'fields': {'env': 'dev', 'ip': '10.0.0.4'}},
+            {'instance_name': 'imp-001', 'fields': {'env': 'dev', 'ip': '10.0.0.7'}},
+        ])
+
+        results = self._run_import(path)
+
+        self.assertEqual(results['status'], 'completed')
+        self.assertEqual(results['progress'], 100)
+        self.assertEqual(results['total'], 7)
+        self.assertEqual(
+            (results['created'], results['updated'], results['skipped'], results['failed']), (2, 1, 1, 3)
+        )
+        self.assertEqual(len(results['errors']), 3)
+        self.assertTrue(all('Unique constraint violation' in error for error in results['errors']))
+        self.assertIsNotNone(results['error_file_key'])
+        self.assertFalse(os.path.exists(path))
+
+        names = set(ModelInstance.objects.filter(model=self.model).values_list('instance_name', flat=True))
+        self.assertEqual(names, {'imp-existing', 'imp-001', 'imp-004'})
+        self.assertEqual(
+            dict(ModelFieldMeta.objects.filter(model_instance=self.existing).values_list('model_fields__name', 'data')),
+            {'env': 'prod', 'ip': '10.0.0.9'}
+        )
+        created = ModelInstance.objects.get(model=self.model, instance_name='imp-004')
+        self.assertEqual(
+            dict(ModelFieldMeta.objects.filter(model_instance=created).values_list('model_fields__name', 'data')),
+            {'env': 'dev', 'ip': '10.0.0.4'}
+        )
+
+    def test_import_does_not_update_instances_outside_data_scope(self):
+        path = self._write_workbook([
+            {'instance_name': 'imp-existing', 'fields': {'env': 'prod'}},
+            {'instance_name': 'imp-006', 'fields': {'env': 'dev'}},
+        ])
+        # 已存在的实例不在用户数据范围内
+        with patch(
+            'access.manager.PermissionManager.get_queryset',
+            side_effect=lambda model_or_qs: (
+                model_or_qs.objects.exclude(pk=self.existing.pk) if model_or_qs is ModelInstance
+                else model_or_qs.objects.all()
+            )
+        ):
+            results = self._run_import(path)
+
+        self.assertEqual((results['created'], results['updated'], results['failed']), (1, 0, 1))
+        self.assertIn('outside your data scope', results['errors'][0])
+        self.assertEqual(
+            ModelFieldMeta.objects.get(model_instance=self.existing, model_fields=self.field_env).data, 'dev'
+        )
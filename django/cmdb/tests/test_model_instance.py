@@ -254,6 +254,38 @@ class ModelInstanceViewSetTestCase(CmdbAPITestCase):
         for item in response.data['results']:
             self.assertEqual(str(item['model']), str(self.model.id))
 
+    # ------------------------------------------------------------------
+    # 6.1 filter by multiple dynamic fields
+    # ------------------------------------------------------------------
+    def _list_instance_names(self, params):
+        url = reverse('modelinstance-list')
+        response = self.client.get(url, {'model': str(self.model.id), **params}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return sorted(item['instance_name'] for item in response.data['results'])
+
+    def test_filter_by_multiple_dynamic_fields(self):
+        """Each dynamic predicate is bound to its own field and predicates are ANDed."""
+        self.assertEqual(
+            self._list_instance_names({'ip': '10.0.0.1', 'cpu': '4'}), ['server-001']
+        )
+        self.assertEqual(self._list_instance_names({'ip': '10.0.0.1', 'cpu': '8'}), [])
+        self.assertEqual(
+            self._list_instance_names({'ip': 'like:10.0.0', 'cpu': 'in:8,16'}), ['server-002']
+        )
+
+    def test_filter_dynamic_field_negation_and_null(self):
+        """not: and null predicates are evaluated per field."""
+        self.assertEqual(self._list_instance_names({'cpu': 'not:4'}), ['server-002'])
+        self.assertEqual(self._list_instance_names({'ip': 'null'}), [])
+        self.assertEqual(
+            self._list_instance_names({'ip': 'not:null'}), ['server-001', 'server-002']
+        )
+
+    def test_filter_unknown_dynamic_field_returns_nothing(self):
+        """Unknown or hidden fields must not widen the filter to all instances."""
+        self.assertEqual(self._list_instance_names({'no_such_field': 'x'}), [])
+        self.assertEqual(self._list_instance_names({'no_such_field': 'x', 'cpu': '4'}), [])
+
     # ------------------------------------------------------------------
     # 7. search by instance_name
     # ------------------------------------------------------------------
@@ -0,0 +1,83 @@
+from django.core.cache import cache
+
+from cmdb.models import Models, ModelFieldGroups, ModelFields, ModelInstance, ModelFieldMeta
+from cmdb.tests import CmdbAPITestCase
+from node_mg.models import ModelConfig, Nodes
+from node_mg.utils.node_sync import NODE_SYNC_WATERMARK_KEY, sync_nodes
+
+
+class NodeSyncTestCase(CmdbAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.delete(NODE_SYNC_WATERMARK_KEY)
+        self.model = Models.objects.create(name='SyncHosts', verbose_name='同步主机')
+        ModelConfig.objects.create(model=self.model, is_manage=True)
+        field_group = ModelFieldGroups.objects.create(name='basic', verbose_name='基本信息', model=self.model)
+        self.field_ip = ModelFields.objects.create(
+            model=self.model, model_field_group=field_group, name='ip', verbose_name='IP',
+            type='string', order=1, required=False,
+        )
+        self.instances = {}
+        for name, ip in (('host-1', '10.0.0.1'), ('host-2', '10.0.0.2'), ('host-3', 'invalid')):
+            instance = ModelInstance.objects.create(
+                model=self.model, instance_name=name, create_user='admin', update_user='admin'
+            )
+            ModelFieldMeta.objects.create(
+                model=self.model, model_instance=instance, model_fields=self.field_ip, data=ip
+            )
+            self.instances[name] = instance
+
+        # 未纳管的模型不同步
+        unmanaged = Models.objects.create(name='SyncOther', verbose_name='未纳管')
+        ModelConfig.objects.create(model=unmanaged, is_manage=False)
+        ModelFields.objects.create(
+            model=unmanaged, name='ip', verbose_name='IP', type='string', order=1, required=False
+        )
+
+    def test_full_sync_diffs_existing_nodes(self):
+        # 已有节点：IP 过期、重复节点、IP 无效的实例
+        Nodes.objects.create(model=self.model, model_instance=self.instances['host-1'], ip_address='10.9.9.9',
+                             create_user='admin', update_user='admin')
+        for _ in range(2):
+            Nodes.objects.create(model=self.model, model_instance=self.instances['host-2'], ip_address='10.0.0.2',
+                                 create_user='admin', update_user='admin')
+        Nodes.objects.create(model=self.model, model_instance=self.instances['host-3'], ip_address='10.0.0.3',
+                             create_user='admin', update_user='admin')
+
+        report = sync_nodes()
+
+        self.assertEqual(report['mode'], 'full')
+        model_report = report['models'][str(self.model.id)]
+        self.assertEqual(
+            (model_report['created'], model_report['updated'], model_report['deleted']), (0, 1, 1)
+        )
+        # IP 无效的实例记为失败，已有节点保持不变
+        self.assertEqual(model_report['failed'], ['host-3'])
+        self.assertEqual(
+            sorted(Nodes.objects.values_list('model_instance__instance_name', 'ip_address')),
+            [('host-1', '10.0.0.1'), ('host-2', '10.0.0.2'), ('host-3', '10.0.0.3')]
+        )
+
+        # 显式指定时才删除
+        report = sync_nodes(delete_invalid=True)
+        self.assertEqual(report['totals']['deleted'], 1)
+        self.assertFalse(Nodes.objects.filter(model_instance=self.instances['host-3']).exists())
+
+    def test_incremental_sync_only_touches_changed_instances(self):
+        report = sync_nodes(incremental=True)
+        self.assertEqual(report['mode'], 'full')
+        self.assertEqual(report['totals']['created'], 2)
+
+        report = sync_nodes(incremental=True)
+        self.assertEqual(report['mode'], 'incremental')
+        self.assertEqual(report['totals']['unchanged'] + report['totals']['updated'], 0)
+
+        meta = ModelFieldMeta.objects.get(model_instance=self.instances['host-1'])
+        meta.data = '10.0.0.11'
+        meta.save()
+        report = sync_nodes(incremental=True)
+        self.assertEqual(report['totals']['updated'], 1)
+        self.assertEqual(
+            Nodes.objects.get(model_instance=self.instances['host-1']).ip_address, '10.0.0.11'
+        )
@@ -0,0 +1,191 @@
+from unittest.mock import patch
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+
+from audit.context import audit_context
+
+from cmdb.models import (
+    Models, ModelFieldGroups, ModelFields,
+    ModelInstance, ModelFieldMeta, ModelProjection,
+)
+from cmdb import projection as projection_module
+from cmdb.projection import rebuild_projection, drop_projection, get_projection_table
+from cmdb.services import ModelFieldMetaWriter, ModelInstanceService
+from cmdb.tests import CmdbAPITestCase
+
+
+class ModelProjectionTestCase(CmdbAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.model = Models.objects.create(
+            name="ProjServer",
+            verbose_name="宽表服务器",
+            create_user="admin",
+            update_user="admin",
+        )
+        self.field_group = ModelFieldGroups.objects.create(
+            name="basic",
+            verbose_name="基本信息",
+            model=self.model,
+            create_user="admin",
+            update_user="admin",
+        )
+        self.field_os = ModelFields.objects.create(
+            model=self.model,
+            model_field_group=self.field_group,
+            name="os",
+            verbose_name="操作系统",
+            type="string",
+            order=1,
+            required=False,
+            create_user="admin",
+            update_user="admin",
+        )
+        self.field_cpu = ModelFields.objects.create(
+            model=self.model,
+            model_field_group=self.field_group,
+            name="cpu",
+            verbose_name="CPU",
+            type="integer",
+            order=2,
+            required=False,
+            create_user="admin",
+            update_user="admin",
+        )
+        self.instances = {}
+        for name, os_name, cpu in [
+            ("proj-001", "linux", "8"),
+            ("proj-002", "linux", "16"),
+            ("proj-003", "windows", "16"),
+        ]:
+            instance = ModelInstance.objects.create(
+                model=self.model,
+                instance_name=name,
+                create_user="admin",
+                update_user="admin",
+            )
+            for field, data in ((self.field_os, os_name), (self.field_cpu, cpu)):
+                ModelFieldMeta.objects.create(
+                    model=self.model,
+                    model_instance=instance,
+                    model_fields=field,
+                    data=data,
+                    create_user="admin",
+                    update_user="admin",
+                )
+            self.instances[name] = instance
+
+        rebuild_projection(self.model)
+
+    def tearDown(self):
+        drop_projection(self.model)
+        super().tearDown()
+
+    def _list_names(self, params):
+        url = reverse('modelinstance-list')
+        response = self.client.get(url, {'model': str(self.model.id), **params}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return sorted(item['instance_name'] for item in response.data['results'])
+
+    def test_rebuild_populates_rows(self):
+        projection = get_projection_table(self.model.id)
+        self.assertIsNotNone(projection)
+        rows = projection.get_rows(ModelInstance.objects.filter(model=self.model).values('id'))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[str(self.instances["proj-002"].id)], {'os': 'linux', 'cpu': 16})
+
+    def test_multi_field_filter_uses_projection(self):
+        self.assertEqual(self._list_names({'os': 'linux', 'cpu': '16'}), ["proj-002"])
+        self.assertEqual(self._list_names({'os': 'not:linux'}), ["proj-003"])
+        self.assertEqual(self._list_names({'cpu': 'in:8,16', 'os': 'like:lin'}), ["proj-001", "proj-002"])
+        self.assertEqual(self._list_names({'cpu': 'gt:8', 'os': 'linux'}), ["proj-002"])
+        self.assertEqual(self._list_names({'cpu': 'between:10,20'}), ["proj-002", "proj-003"])
+
+    def test_save_field_values_syncs_projection(self):
+        instance = self.instances["proj-001"]
+        ModelInstanceService._save_field_values(instance, {'os': 'windows', 'cpu': 32}, 'admin')
+        self.assertEqual(self._list_names({'os': 'windows'}), ["proj-001", "proj-003"])
+        self.assertEqual(self._list_names({'cpu': '32'}), ["proj-001"])
+
+    def test_instance_delete_removes_row(self):
+        instance = self.instances["proj-003"]
+        with audit_context(request_id='test-request', correlation_id='test-request', operator='testadmin'):
+            instance.delete()
+        projection = get_projection_table(self.model.id)
+        self.assertFalse(projection.objects.filter(instance_id=instance.id).exists())
+
+    def test_field_creation_marks_projection_stale(self):
+        ModelFields.objects.create(
+            model=self.model,
+            model_field_group=self.field_group,
+            name="memory",
+            verbose_name="内存",
+            type="integer",
+            order=3,
+            required=False,
+            create_user="admin",
+            update_user="admin",
+        )
+        self.assertTrue(ModelProjection.objects.get(model=self.model).stale)
+        self.assertIsNone(get_projection_table(self.model.id))
+
+        rebuild_projection(self.model)
+        projection = get_projection_table(self.model.id)
+        self.assertEqual(len(projection.columns), 3)
+
+    def test_long_values_are_not_truncated_in_filters_and_export(self):
+        instance = self.instances["proj-001"]
+        long_value = 'x' * 300 + 'tail-marker'
+        ModelInstanceService._save_field_values(instance, {'os': long_value}, 'admin')
+
+        # 匹配位置超出宽表列宽时回退到 ModelFieldMeta
+        self.assertEqual(self._list_names({'os': 'like:tail-marker'}), ["proj-001"])
+
+        result = ModelInstanceService.export_instances_data(
+            self.model, ModelInstance.objects.filter(pk=instance.pk),
+            ModelFields.objects.filter(model=self.model), self.admin_user, []
+        )
+        self.assertEqual(result['instances_data'][0]['fields']['os'], long_value)
+        self.assertEqual(result['instances_data'][0]['fields']['cpu'], '8')
+
+    def test_flush_syncs_projection_in_bulk(self):
+        projection = get_projection_table(self.model.id)
+        writer = ModelFieldMetaWriter.for_system(self.model)
+        for instance in self.instances.values():
+            writer.add(instance, {'cpu': 64})
+        with CaptureQueriesContext(connection) as queries:
+            writer.flush()
+
+        table = projection.projection.table_name
+        self.assertEqual(len([q for q in queries.captured_queries if table in q['sql']]), 2)
+        self.assertEqual(self._list_names({'cpu': '64'}), ["proj-001", "proj-002", "proj-003"])
+
+    def test_writes_during_rebuild_reach_new_table(self):
+        build_rows = projection_module._build_rows
+        state = {}
+
+        def build_and_write(*args):
+            rows = build_rows(*args)
+            if not state:
+                # 本批回填读取之后的写入：修改、新建及删除实例
+                state['new'] = ModelInstance.objects.create(model=self.model, instance_name="proj-004")
+                ModelFieldMeta.objects.create(
+                    model=self.model, model_instance=state['new'], model_fields=self.field_os, data='bsd'
+                )
+                ModelInstanceService._save_field_values(self.instances["proj-001"], {'cpu': 64}, 'admin')
+                with audit_context(request_id='test-request', correlation_id='test-request', operator='testadmin'):
+                    self.instances["proj-003"].delete()
+            return rows
+
+        with patch('cmdb.projection._build_rows', side_effect=build_and_write):
+            rebuild_projection(self.model)
+
+        rows = get_projection_table(self.model.id).get_rows(ModelInstance.objects.values('id'))
+        self.assertNotIn(str(self.instances["proj-003"].id), rows)
+        self.assertEqual(rows[str(self.instances["proj-001"].id)]['cpu'], 64)
+        self.assertEqual(rows[str(state['new'].id)]['os'], 'bsd')
+        self.assertEqual(self._list_names({'os': 'bsd'}), ["proj-004"])
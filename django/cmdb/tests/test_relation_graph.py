@@ -0,0 +1,176 @@
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from audit.context import audit_context
+
+from cmdb.models import Models, ModelInstance, RelationDefinition, Relations
+from cmdb import relation_graph as relation_graph_module
+from cmdb.relation_graph import (
+    RELATION_GRAPH_CHANGE_KEY,
+    RELATION_GRAPH_SEQ_KEY,
+    RelationGraphIndex,
+    publish_relation_changes,
+    relation_graph,
+    relation_remove,
+    relation_upsert,
+    reset_relation_graph,
+)
+from cmdb.services import RelationsService
+from cmdb.tests import CmdbAPITestCase
+
+
+class RelationGraphIndexTestCase(CmdbAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        reset_relation_graph()
+        self.addCleanup(reset_relation_graph)
+        self.model = Models.objects.create(
+            name='GraphNode',
+            verbose_name='拓扑节点',
+            create_user='admin',
+            update_user='admin',
+        )
+        self.depends = RelationDefinition.objects.create(
+            name='graph_depends',
+            forward_verb='依赖',
+            reverse_verb='被依赖',
+            topology_type='daggered',
+            create_user='admin',
+            update_user='admin',
+        )
+        self.connects = RelationDefinition.objects.create(
+            name='graph_connects',
+            forward_verb='连接',
+            reverse_verb='被连接',
+            topology_type='directed',
+            create_user='admin',
+            update_user='admin',
+        )
+        self.nodes = {
+            name: ModelInstance.objects.create(
+                model=self.model, instance_name=name, create_user='admin', update_user='admin'
+            )
+            for name in ('a', 'b', 'c', 'd', 'e')
+        }
+        # a -> b -> c -> d（依赖），e -> b（连接）
+        with self.captureOnCommitCallbacks(execute=True):
+            for source, target, relation_def in (
+                ('a', 'b', self.depends), ('b', 'c', self.depends),
+                ('c', 'd', self.depends), ('e', 'b', self.connects),
+            ):
+                self._relate(source, target, relation_def)
+
+    def _relate(self, source, target, relation_def):
+        return Relations.objects.create(
+            source_instance=self.nodes[source],
+            target_instance=self.nodes[target],
+            relation=relation_def,
+            create_user='admin',
+            update_user='admin',
+        )
+
+    def _names(self, node_ids):
+        by_id = {str(instance.id): name for name, instance in self.nodes.items()}
+        return {by_id[str(node_id)] for node_id in node_ids}
+
+    def _topology(self, start, **kwargs):
+        result = RelationsService.get_topology(
+            user=self.admin_user, start_node_ids=[str(self.nodes[name].id) for name in start], **kwargs
+        )
+        return {node.instance_name for node in result.nodes}, result
+
+    def test_traversal_modes(self):
+        with relation_graph() as graph:
+            _, nodes = graph.blast([str(self.nodes['a'].id)], 2, 'forward')
+            self.assertEqual(self._names(nodes), {'a', 'b', 'c'})
+            _, nodes = graph.blast([str(self.nodes['b'].id)], 1, 'reverse')
+            self.assertEqual(self._names(nodes), {'a', 'b', 'e'})
+            relation_ids, nodes = graph.neighbor([str(self.nodes['c'].id)])
+            self.assertEqual(self._names(nodes), {'b', 'c', 'd'})
+            self.assertEqual(len(relation_ids), 2)
+            self.assertEqual(
+                self._names(graph.successors(self.nodes['b'].id, [self.depends.id])), {'c'}
+            )
+
+    def test_topology_hydrates_only_the_result(self):
+        with CaptureQueriesContext(connection) as ctx:
+            names, result = self._topology(['a'], depth=5, direction='forward', mode='blast')
+
+        self.assertEqual(names, {'a', 'b', 'c', 'd'})
+        self.assertEqual(len(result.edges), 3)
+        self.assertEqual(result.visible_node_count, 4)
+        relation_queries = [q for q in ctx.captured_queries if 'FROM "relations"' in q['sql']]
+        # 构建索引一次，读取结果关系一次
+        self.assertEqual(len(relation_queries), 2)
+
+        with CaptureQueriesContext(connection) as ctx:
+            names, _ = self._topology(['a'], end_node_ids=[str(self.nodes['d'].id)], depth=1, mode='path')
+        self.assertEqual(names, {'a', 'b', 'c', 'd', 'e'})
+        self.assertEqual(len([q for q in ctx.captured_queries if 'FROM "relations"' in q['sql']]), 1)
+
+    def test_changes_are_tailed_without_rebuild(self):
+        self._topology(['a'], depth=1, mode='neighbor')
+
+        with patch.object(RelationGraphIndex, 'build', wraps=RelationGraphIndex.build) as build:
+            with self.captureOnCommitCallbacks(execute=True):
+                relation = self._relate('d', 'e', self.connects)
+            names, _ = self._topology(['d'], depth=1, direction='forward', mode='blast')
+            self.assertEqual(names, {'d', 'e'})
+
+            with audit_context(request_id='graph-req', correlation_id='graph-req', operator='testadmin'):
+                with self.captureOnCommitCallbacks(execute=True):
+                    relation.delete()
+            names, _ = self._topology(['d'], depth=1, direction='forward', mode='blast')
+            self.assertEqual(names, {'d'})
+
+        build.assert_not_called()
+
+    def test_apply_is_idempotent_and_compacts(self):
+        index = RelationGraphIndex.build()
+        relation = Relations.objects.filter(relation=self.connects).first()
+        index.apply([relation_upsert(relation), relation_upsert(relation)])
+        index.apply([relation_remove(Relations.objects.get(source_instance=self.nodes['c']).id)])
+
+        with patch('cmdb.relation_graph.RELATION_GRAPH_REBUILD_MIN_DELTA', 0):
+            index.apply([])
+        self.assertEqual(len(index.edge_ids), 3)
+        self.assertFalse(index.removed)
+        _, nodes = index.blast([str(self.nodes['e'].id)], 3, 'forward')
+        self.assertEqual(self._names(nodes), {'e', 'b', 'c'})
+
+    def test_missing_change_log_triggers_rebuild(self):
+        self._topology(['a'], depth=1, mode='neighbor')
+        # 模拟变更日志已过期：序号前进但日志缺失
+        publish_relation_changes([relation_remove(Relations.objects.first().id)])
+        cache.delete(RELATION_GRAPH_CHANGE_KEY.format(seq=cache.get(RELATION_GRAPH_SEQ_KEY)))
+
+        with patch.object(RelationGraphIndex, 'build', wraps=RelationGraphIndex.build) as build:
+            self._topology(['a'], depth=1, mode='neighbor')
+        build.assert_called_once()
+
+    def test_failed_publish_invalidates_other_processes(self):
+        with relation_graph() as graph:
+            stale = graph
+        relation = Relations.objects.first()
+
+        # 缓存暂时不可用：变更日志及纪元均写入失败
+        with patch('cmdb.relation_graph.cache.incr', side_effect=ConnectionError('cache down')), \
+                patch('cmdb.relation_graph.cache.set', side_effect=ConnectionError('cache down')):
+            publish_relation_changes([relation_remove(relation.id)])
+        self.assertTrue(relation_graph_module._invalidation_pending)
+
+        # 其他进程仍持有旧索引，下次查询前重试更换纪元后重建
+        relation_graph_module._graph = stale
+        with relation_graph() as graph:
+            self.assertIsNot(graph, stale)
+        self.assertFalse(relation_graph_module._invalidation_pending)
+
+        relation_graph_module._graph = stale
+        with patch.object(RelationGraphIndex, 'build', wraps=RelationGraphIndex.build) as build:
+            with relation_graph() as graph:
+                self.assertIsNot(graph, stale)
+        build.assert_called_once()
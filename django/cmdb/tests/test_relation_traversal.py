@@ -0,0 +1,81 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from cmdb.models import Models, ModelInstance, RelationDefinition, Relations
+from cmdb.relation_traversal import RelationCteTraversal
+from cmdb.services import RelationsService
+from cmdb.tests import CmdbAPITestCase
+
+
+class RelationCteTraversalTestCase(CmdbAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.model = Models.objects.create(
+            name='CteNode',
+            verbose_name='遍历节点',
+            create_user='admin',
+            update_user='admin',
+        )
+        self.relation_def = RelationDefinition.objects.create(
+            name='cte_depends',
+            forward_verb='依赖',
+            reverse_verb='被依赖',
+            topology_type='directed',
+            create_user='admin',
+            update_user='admin',
+        )
+        self.nodes = [
+            ModelInstance.objects.create(
+                model=self.model, instance_name=f'node-{i:02d}', create_user='admin', update_user='admin'
+            )
+            for i in range(30)
+        ]
+        # 0 -> 1 -> ... -> 29 的长链，外加 5 -> 2 的环、7 -> 20 的捷径
+        edges = [(i, i + 1) for i in range(29)] + [(5, 2), (7, 20)]
+        for source, target in edges:
+            Relations.objects.create(
+                source_instance=self.nodes[source],
+                target_instance=self.nodes[target],
+                relation=self.relation_def,
+                create_user='admin',
+                update_user='admin',
+            )
+
+    def _ids(self, *indexes):
+        return [str(self.nodes[i].id) for i in indexes]
+
+    def _bfs(self, start_ids, depth, direction):
+        """逐层 BFS 的参考结果"""
+        with self.settings(CMDB_RELATION_CTE=False):
+            relations, node_ids = Relations.objects.get_topology_edges(start_ids, depth, direction)
+        return {str(rel.id) for rel in relations}, node_ids
+
+    def test_topology_matches_level_by_level_bfs(self):
+        traversal = RelationCteTraversal()
+        for start, depth, direction in (
+            ((0,), 3, 'forward'), ((20,), 2, 'reverse'), ((3,), 4, 'both'), ((2, 29), 2, 'both'),
+        ):
+            with CaptureQueriesContext(connection) as ctx:
+                relations, node_ids = traversal.topology_edges(self._ids(*start), depth, direction)
+            self.assertEqual(len(ctx.captured_queries), 2)
+            self.assertEqual(({str(rel.id) for rel in relations}, node_ids),
+                             self._bfs(self._ids(*start), depth, direction))
+
+    def test_cycle_check_is_a_single_query(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertTrue(RelationsService._would_create_cycle(*self._ids(29, 0), self.relation_def.id))
+            self.assertFalse(RelationsService._would_create_cycle(*self._ids(0, 29), self.relation_def.id))
+        self.assertEqual(len(ctx.captured_queries), 2)
+
+        with self.settings(CMDB_RELATION_CTE=False):
+            self.assertTrue(RelationsService._would_create_cycle(*self._ids(29, 0), self.relation_def.id))
+
+    def test_reachability_respects_relation_filter(self):
+        traversal = RelationCteTraversal()
+        self.assertTrue(traversal.is_reachable(*self._ids(0, 29), relation_ids=[self.relation_def.id]))
+        self.assertFalse(traversal.is_reachable(*self._ids(29, 0)))
+        other = RelationDefinition.objects.create(
+            name='cte_other', forward_verb='a', reverse_verb='b', topology_type='directed'
+        )
+        self.assertFalse(traversal.is_reachable(*self._ids(0, 29), relation_ids=[other.id]))
@@ -0,0 +1,162 @@
+from unittest.mock import patch
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from audit.models import AuditLog
+
+from cmdb.models import Models, ModelFieldGroups, ModelFields, ModelInstance, ModelFieldMeta
+from cmdb.services import ModelInstanceService
+from cmdb.tasks import update_instance_names_for_model_template_change
+from cmdb.tests import CmdbAPITestCase
+
+
+class TemplateRenameTaskTestCase(CmdbAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.model = Models.objects.create(
+            name="RenameServer",
+            verbose_name="重命名服务器",
+            create_user="admin",
+            update_user="admin",
+        )
+        self.field_group = ModelFieldGroups.objects.create(
+            name="basic",
+            verbose_name="基本信息",
+            model=self.model,
+            create_user="admin",
+            update_user="admin",
+        )
+        self.field_hostname = ModelFields.objects.create(
+            model=self.model,
+            model_field_group=self.field_group,
+            name="hostname",
+            verbose_name="主机名",
+            type="string",
+            order=1,
+            required=False,
+            create_user="admin",
+            update_user="admin",
+        )
+        self.template = [str(self.field_hostname.id)]
+        self.model.instance_name_template = self.template
+        self.model.save()
+        self.context = {'request_id': 'rename-req', 'correlation_id': 'rename-req', 'operator': 'testadmin'}
+
+    def _create_instance(self, name, hostname=None, using_template=True):
+        instance = ModelInstance.objects.create(
+            model=self.model,
+            instance_name=name,
+            using_template=using_template,
+            create_user="admin",
+            update_user="admin",
+        )
+        if hostname is not None:
+            ModelFieldMeta.objects.create(
+                model=self.model,
+                model_instance=instance,
+                model_fields=self.field_hostname,
+                data=hostname,
+                create_user="admin",
+                update_user="admin",
+            )
+        return instance
+
+    def _run_task(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return update_instance_names_for_model_template_change.apply(
+                args=(str(self.model.id), [], self.template, self.context)
+            ).get()
+
+    def test_renames_and_detects_conflicts(self):
+        # 同名时按实例ID顺序，先处理的实例获得名称
+        renamed, in_batch_conflict = sorted(
+            [self._create_instance('old-1', 'web'), self._create_instance('old-2', 'web')],
+            key=lambda instance: instance.id,
+        )
+        self._create_instance('db', 'db')
+        self._create_instance('old-4')
+        self._create_instance('cache', using_template=False)
+        existing_conflict = self._create_instance('old-6', 'cache')
+
+        result = self._run_task()
+
+        self.assertEqual(result['status'], 'completed')
+        self.assertEqual(
+            {key: result[key] for key in ('total', 'updated', 'skipped', 'conflict', 'failed')},
+            {'total': 5, 'updated': 1, 'skipped': 2, 'conflict': 2, 'failed': 0},
+        )
+        self.assertEqual(
+            sorted(result['conflict_details']),
+            sorted([(str(in_batch_conflict.id), 'web'), (str(existing_conflict.id), 'cache')]),
+        )
+        self.assertEqual(ModelInstance.objects.get(id=renamed.id).instance_name, 'web')
+
+        log = AuditLog.objects.get(correlation_id='rename-req')
+        self.assertEqual(log.object_id, str(renamed.id))
+        self.assertEqual(log.changed_fields, {'instance_name': [renamed.instance_name, 'web']})
+
+    def test_names_are_computed_from_one_field_value_query(self):
+        for i in range(20):
+            self._create_instance(f'old-{i}', f'host-{i:02d}')
+
+        with CaptureQueriesContext(connection) as ctx:
+            result = self._run_task()
+
+        self.assertEqual(result['updated'], 20)
+        meta_queries = [q for q in ctx.captured_queries if 'FROM "model_field_meta"' in q['sql']]
+        self.assertEqual(len(meta_queries), 1)
+        self.assertEqual(
+            sorted(ModelInstance.objects.filter(model=self.model).values_list('instance_name', flat=True)),
+            [f'host-{i:02d}' for i in range(20)],
+        )
+
+    def test_chained_and_swapped_renames(self):
+        # A→B 同时 B→C，以及两个实例互换名称，均不视为冲突
+        chain_head = self._create_instance('name-a', 'name-b')
+        chain_tail = self._create_instance('name-b', 'name-c')
+        swap_left = self._create_instance('swap-1', 'swap-2')
+        swap_right = self._create_instance('swap-2', 'swap-1')
+        # 放弃重命名的实例保留原名，以其原名为目标的实例同样冲突
+        blocked = self._create_instance('name-d', 'name-e')
+        self._create_instance('name-e', using_template=False)
+        waiting = self._create_instance('name-f', 'name-d')
+
+        result = self._run_task()
+
+        self.assertEqual((result['updated'], result['conflict'], result['failed']), (4, 2, 0))
+        self.assertEqual(
+            sorted(result['conflict_details']),
+            sorted([(str(blocked.id), 'name-e'), (str(waiting.id), 'name-d')]),
+        )
+        names = dict(ModelInstance.objects.filter(model=self.model).values_list('id', 'instance_name'))
+        self.assertEqual(names[chain_head.id], 'name-b')
+        self.assertEqual(names[chain_tail.id], 'name-c')
+        self.assertEqual(names[swap_left.id], 'swap-2')
+        self.assertEqual(names[swap_right.id], 'swap-1')
+        self.assertEqual(names[waiting.id], 'name-f')
+
+    @patch('cmdb.tasks.RENAME_CHUNK_SIZE', 2)
+    def test_long_chains_and_cycles_are_split_into_batches(self):
+        # 链 c1→c2→c3→c4→c5（c5 未被占用）及环 r1→r2→r3→r1，均长于批大小
+        chain = [self._create_instance(f'c{i}', f'c{i + 1}') for i in range(1, 5)]
+        cycle = [self._create_instance(f'r{i}', f'r{i % 3 + 1}') for i in range(1, 4)]
+
+        with patch('cmdb.services.ModelInstanceService.bulk_rename_instances',
+                   wraps=ModelInstanceService.bulk_rename_instances) as bulk_rename:
+            result = self._run_task()
+
+        self.assertEqual((result['updated'], result['conflict'], result['failed']), (7, 0, 0))
+        self.assertTrue(all(len(call.args[0]) <= 2 for call in bulk_rename.call_args_list))
+        names = dict(ModelInstance.objects.filter(model=self.model).values_list('id', 'instance_name'))
+        self.assertEqual([names[instance.id] for instance in chain], ['c2', 'c3', 'c4', 'c5'])
+        self.assertEqual([names[instance.id] for instance in cycle], ['r2', 'r3', 'r1'])
+
+        # 暂存为临时名称的实例按原名称记录审计
+        changes = {
+            log.object_id: log.changed_fields['instance_name']
+            for log in AuditLog.objects.filter(correlation_id='rename-req')
+        }
+        self.assertEqual(changes[str(cycle[0].id)], ['r1', 'r2'])
+        self.assertEqual(len(changes), 7)
@@ -0,0 +1,81 @@
+import json
+
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from cmdb.models import Models, ModelFieldGroups, ModelFields, ModelInstance, ValidationRules
+from cmdb.tests import CmdbAPITestCase
+from vuedjango.request_cache import get_request_cache, request_cache_scope
+
+
+class RequestCacheTestCase(CmdbAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.model = Models.objects.create(name='CacheServer', verbose_name='缓存服务器')
+        self.field_group = ModelFieldGroups.objects.create(name='basic', verbose_name='基本信息', model=self.model)
+        self.rule = ValidationRules.objects.create(
+            name='cache_status', verbose_name='状态', field_type='enum', type='enum',
+            rule=json.dumps({'up': '运行', 'down': '停止'}),
+        )
+        self.status_field = ModelFields.objects.create(
+            model=self.model, model_field_group=self.field_group, name='status',
+            verbose_name='状态', type='enum', validation_rule=self.rule, order=1, required=False,
+        )
+        self.instances = [
+            ModelInstance.objects.create(model=self.model, instance_name=f'cache-{i}') for i in range(3)
+        ]
+
+    def _queries(self, ctx, table):
+        return [q for q in ctx.captured_queries if f'FROM "{table}"' in q['sql']]
+
+    def test_reads_are_shared_within_scope(self):
+        ids = [str(instance.id) for instance in self.instances]
+        with request_cache_scope() as request_cache:
+            with CaptureQueriesContext(connection) as ctx:
+                for _ in range(3):
+                    ModelFields.objects.get_all_fields_for_model(str(self.model.id))
+                ModelInstance.objects.get_instance_names_by_instance_ids(ids[:2])
+                names = ModelInstance.objects.get_instance_names_by_instance_ids(ids)
+            self.assertEqual(len(self._queries(ctx, 'model_fields')), 1)
+            # 第二次只查询缺失的实例
+            instance_queries = self._queries(ctx, 'model_instance')
+            self.assertEqual(len(instance_queries), 2)
+            self.assertNotIn(ids[0].replace('-', ''), instance_queries[1]['sql'])
+            self.assertEqual(names, {str(instance.id): instance.instance_name for instance in self.instances})
+            self.assertEqual((request_cache.hits, request_cache.misses), (4, 4))
+
+            # 写操作使缓存失效
+            self.instances[0].instance_name = 'renamed'
+            self.instances[0].save()
+            self.assertEqual(ModelInstance.objects.get_instance_names_by_instance_ids(ids[:1]), {ids[0]: 'renamed'})
+            ModelFields.objects.create(
+                model=self.model, model_field_group=self.field_group, name='ip',
+                verbose_name='IP', type='string', order=2, required=False,
+            )
+            self.assertIn('ip', ModelFields.objects.get_all_fields_for_model(str(self.model.id)))
+
+        self.assertIsNone(get_request_cache())
+        with CaptureQueriesContext(connection) as ctx:
+            ModelFields.objects.get_all_fields_for_model(str(self.model.id))
+            ModelFields.objects.get_all_fields_for_model(str(self.model.id))
+        self.assertEqual(len(self._queries(ctx, 'model_fields')), 2)
+
+    def test_enum_dict_is_cached_per_scope(self):
+        with request_cache_scope():
+            self.assertEqual(ValidationRules.get_enum_dict(self.rule.id), {'up': '运行', 'down': '停止'})
+            self.rule.rule = json.dumps({'up': '在线'})
+            self.rule.save()
+            self.assertEqual(ValidationRules.get_enum_dict(self.rule.id), {'up': '在线'})
+            with CaptureQueriesContext(connection) as ctx:
+                ValidationRules.get_enum_dict(self.rule.id)
+            self.assertEqual(len(ctx.captured_queries), 0)
+
+    @override_settings(DEBUG=True)
+    def test_debug_headers(self):
+        response = self.client.get(reverse('modelinstance-detail', args=[self.instances[0].id]), format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(int(response['X-Request-Cache-Misses']), 0)
+        self.assertIn('X-Request-Cache-Hits', response)
@@ -0,0 +1,71 @@
+import json
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from cmdb import schema_cache
+from cmdb.models import Models, ModelFieldGroups, ModelFields, ValidationRules
+from cmdb.schema_cache import SCHEMA_VERSION_KEY
+from cmdb.tests import CmdbAPITestCase
+from vuedjango.request_cache import request_cache_scope
+
+
+class SchemaCacheTestCase(CmdbAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        schema_cache.clear_schema_cache()
+        self.addCleanup(schema_cache.clear_schema_cache)
+        # 模拟定义已提交
+        with self.captureOnCommitCallbacks(execute=True):
+            self.model = Models.objects.create(name='SchemaServer', verbose_name='定义服务器')
+            field_group = ModelFieldGroups.objects.create(name='basic', verbose_name='基本信息', model=self.model)
+            self.rule = ValidationRules.objects.create(
+                name='schema_status', verbose_name='状态', field_type='enum', type='enum',
+                rule=json.dumps({'up': '运行'}),
+            )
+            self.field = ModelFields.objects.create(
+                model=self.model, model_field_group=field_group, name='status', verbose_name='状态',
+                type='enum', validation_rule=self.rule, order=1, required=False,
+            )
+
+    def _fields(self):
+        with request_cache_scope():
+            return ModelFields.objects.get_all_fields_for_model(str(self.model.id))
+
+    def test_definitions_are_served_from_process_memory(self):
+        self.assertEqual(list(self._fields()), ['status'])
+        self.assertEqual(ValidationRules.get_enum_dict(self.rule.id), {'up': '运行'})
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(list(self._fields()), ['status'])
+            self.assertEqual(ValidationRules.get_enum_dict(self.rule.id), {'up': '运行'})
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+        # 其他进程修改定义后递增版本号
+        ModelFields.objects.filter(id=self.field.id).update(name='state')
+        cache.incr(SCHEMA_VERSION_KEY)
+        self.assertEqual(list(self._fields()), ['state'])
+
+    def test_uncommitted_changes_bypass_process_cache(self):
+        self._fields()
+        try:
+            with transaction.atomic():
+                self.field.name = 'rolled_back'
+                self.field.save()
+                self.assertEqual(list(self._fields()), ['rolled_back'])
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertEqual(list(self._fields()), ['status'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.field.name = 'state'
+            self.field.save()
+            self.assertEqual(list(self._fields()), ['state'])
+        # 提交后重新使用进程缓存
+        self.assertEqual(list(self._fields()), ['state'])
+        with CaptureQueriesContext(connection) as ctx:
+            self._fields()
+        self.assertEqual(len(ctx.captured_queries), 0)
@@ -0,0 +1,161 @@
+import json
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from audit.context import audit_context
+
+from cmdb.models import Models, ModelFieldGroups, ModelFields, ModelInstance, SearchToken, ValidationRules
+from cmdb.search_index import build_tokens, extract_regexp_literals
+from cmdb.services import ModelInstanceService, ModelFieldMetaSearchService
+from cmdb.tests import CmdbAPITestCase
+
+
+class SearchIndexTestCase(CmdbAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.model = Models.objects.create(
+            name="SearchServer",
+            verbose_name="搜索服务器",
+            create_user="admin",
+            update_user="admin",
+        )
+        self.rack_model = Models.objects.create(
+            name="SearchRack",
+            verbose_name="机柜",
+            create_user="admin",
+            update_user="admin",
+        )
+        self.field_group = ModelFieldGroups.objects.create(
+            name="basic",
+            verbose_name="基本信息",
+            model=self.model,
+            create_user="admin",
+            update_user="admin",
+        )
+        self.env_rule = ValidationRules.objects.create(
+            name="search_env",
+            verbose_name="环境",
+            field_type="enum",
+            type="enum",
+            rule=json.dumps({'prod': '生产', 'dev': '开发'}),
+            create_user="admin",
+            update_user="admin",
+        )
+        field_defs = [
+            ("ip", "string", {}),
+            ("env", "enum", {'validation_rule': self.env_rule}),
+            ("rack", "model_ref", {'ref_model': self.rack_model}),
+            ("secret", "password", {}),
+        ]
+        for order, (name, field_type, extra) in enumerate(field_defs, start=1):
+            ModelFields.objects.create(
+                model=self.model,
+                model_field_group=self.field_group,
+                name=name,
+                verbose_name=name,
+                type=field_type,
+                order=order,
+                required=False,
+                create_user="admin",
+                update_user="admin",
+                **extra,
+            )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.rack = ModelInstance.objects.create(
+                model=self.rack_model,
+                instance_name="rack-shanghai-01",
+                create_user="admin",
+                update_user="admin",
+            )
+            self.web = self._create_server("Web-Server-01", ip='10.0.0.1', env='prod')
+            self.db = self._create_server("db-server-02", ip='10.0.0.12', env='dev')
+
+    def _create_server(self, name, **fields_data):
+        instance = ModelInstance.objects.create(
+            model=self.model,
+            instance_name=name,
+            create_user="admin",
+            update_user="admin",
+        )
+        ModelInstanceService._save_field_values(
+            instance, {'rack': str(self.rack.id), 'secret': 'topsecret', **fields_data}, 'admin'
+        )
+        return instance
+
+    def _search(self, query, **kwargs):
+        result = ModelFieldMetaSearchService.search(query=query, user=self.admin_user, **kwargs)
+        return {item['instance_name']: item for item in result['results']}
+
+    def test_tokens(self):
+        self.assertEqual(build_tokens('AbCd'), {'abc', 'bcd', 'cd', 'd'})
+        self.assertEqual(extract_regexp_literals(r'^10\.0\.(0|1)\.\d+$'), ['10.0.', '.'])
+
+    def test_search_matches_names_and_display_values(self):
+        results = self._search('10.0.0.1')
+        self.assertEqual(set(results), {'Web-Server-01', 'db-server-02'})
+        self.assertTrue(results['Web-Server-01']['matches'][0]['is_exact'])
+
+        # 枚举标签、引用实例名称
+        self.assertEqual(set(self._search('生产')), {'Web-Server-01'})
+        match = self._search('shanghai')['db-server-02']['matches'][0]
+        self.assertEqual((match['field_name'], match['display_value']), ('rack', 'rack-shanghai-01'))
+
+        # 短于 n-gram 的查询按前缀命中；密码字段不参与索引
+        self.assertEqual(set(self._search('db', quick=True)), {'db-server-02'})
+        self.assertEqual(self._search('topsecret'), {})
+        self.assertFalse(SearchToken.objects.filter(token='top').exists())
+
+    def test_case_sensitive_and_regexp(self):
+        self.assertEqual(set(self._search('web-server')), {'Web-Server-01'})
+        self.assertEqual(self._search('web-server', case_sensitive=True), {})
+        self.assertEqual(set(self._search(r'^10\.0\.0\.1\d$', regexp=True)), {'db-server-02'})
+        # 不含字面量的正则回退为逐行校验
+        results = self._search(r'^\D+-0\d$', regexp=True, quick=True, model_ids=[self.model.id])
+        self.assertEqual(set(results), {'Web-Server-01', 'db-server-02'})
+
+    def test_permission_scope_is_a_subquery(self):
+        def visible(model_or_qs):
+            queryset = model_or_qs if hasattr(model_or_qs, 'filter') else model_or_qs.objects.all()
+            if queryset.model is ModelInstance:
+                queryset = queryset.exclude(id=self.db.id)
+            return queryset
+
+        with patch('access.manager.PermissionManager.get_queryset', side_effect=visible):
+            with CaptureQueriesContext(connection) as ctx:
+                results = self._search('server')
+
+        self.assertEqual(set(results), {'Web-Server-01'})
+        posting_sql = [q['sql'] for q in ctx.captured_queries if 'search_token' in q['sql'] and 'HAVING' in q['sql']]
+        self.assertEqual(len(posting_sql), 1)
+        # 可见实例以子查询关联，而不是展开的ID列表
+        self.assertIn('"instance_id" IN (SELECT', posting_sql[0])
+
+    def test_incremental_sync_on_rename_and_delete(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.rack.instance_name = 'rack-beijing-07'
+            self.rack.save()
+        self.assertEqual(self._search('shanghai'), {})
+        self.assertEqual(set(self._search('beijing')), {'rack-beijing-07', 'Web-Server-01', 'db-server-02'})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ModelInstanceService._save_field_values(self.web, {'env': 'dev'}, 'admin')
+        self.assertEqual(self._search('生产'), {})
+
+        with audit_context(request_id='search-req', correlation_id='search-req', operator='testadmin'):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.db.delete()
+        self.assertFalse(SearchToken.objects.filter(instance_id=self.db.id).exists())
+
+    def test_rebuild_command(self):
+        SearchToken.objects.all().delete()
+        self.assertEqual(self._search('shanghai'), {})
+
+        out = StringIO()
+        call_command('rebuild_search_index', self.model.name, stdout=out)
+        self.assertIn('indexed 2 instances', out.getvalue())
+        self.assertEqual(set(self._search('shanghai')), {'Web-Server-01', 'db-server-02'})
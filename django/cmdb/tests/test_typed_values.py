@@ -0,0 +1,117 @@
+from io import StringIO
+from datetime import datetime
+
+from django.core.management import call_command
+from django.urls import reverse
+from rest_framework import status
+
+from cmdb.converters import parse_datetime_value
+from cmdb.models import Models, ModelFieldGroups, ModelFields, ModelInstance, ModelFieldMeta
+from cmdb.services import ModelInstanceService
+from cmdb.tests import CmdbAPITestCase
+
+
+class TypedValueFilterTestCase(CmdbAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.model = Models.objects.create(
+            name="TypedServer",
+            verbose_name="类型化服务器",
+            create_user="admin",
+            update_user="admin",
+        )
+        self.field_group = ModelFieldGroups.objects.create(
+            name="basic",
+            verbose_name="基本信息",
+            model=self.model,
+            create_user="admin",
+            update_user="admin",
+        )
+        self.fields = {}
+        for order, (name, field_type) in enumerate([
+            ("cpu_cores", "integer"),
+            ("load", "float"),
+            ("purchase_date", "date"),
+            ("managed", "boolean"),
+        ], start=1):
+            self.fields[name] = ModelFields.objects.create(
+                model=self.model,
+                model_field_group=self.field_group,
+                name=name,
+                verbose_name=name,
+                type=field_type,
+                order=order,
+                required=False,
+                create_user="admin",
+                update_user="admin",
+            )
+
+        self.instances = {}
+        for name, cores, load, purchase_date, managed in [
+            ("typed-001", 8, 0.5, "2023-06-01", True),
+            ("typed-002", 16, 1.25, "2023-12-31", False),
+            ("typed-003", 64, 3.0, "2024-03-15", True),
+        ]:
+            instance = ModelInstance.objects.create(
+                model=self.model,
+                instance_name=name,
+                create_user="admin",
+                update_user="admin",
+            )
+            ModelInstanceService._save_field_values(instance, {
+                'cpu_cores': cores,
+                'load': load,
+                'purchase_date': purchase_date,
+                'managed': managed,
+            }, 'admin')
+            self.instances[name] = instance
+
+    def _list_names(self, params):
+        url = reverse('modelinstance-list')
+        response = self.client.get(url, {'model': str(self.model.id), **params}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return sorted(item['instance_name'] for item in response.data['results'])
+
+    def test_save_populates_typed_columns(self):
+        instance = self.instances["typed-002"]
+        meta = {
+            m.model_fields.name: m
+            for m in ModelFieldMeta.objects.filter(model_instance=instance).select_related('model_fields')
+        }
+        self.assertEqual(meta['cpu_cores'].num_value, 16)
+        self.assertEqual(meta['load'].num_value, 1.25)
+        self.assertEqual(meta['purchase_date'].dt_value, datetime(2023, 12, 31))
+        self.assertIs(meta['managed'].bool_value, False)
+        self.assertIsNone(meta['cpu_cores'].dt_value)
+
+    def test_numeric_range_filters(self):
+        self.assertEqual(self._list_names({'cpu_cores': 'gte:16'}), ["typed-002", "typed-003"])
+        self.assertEqual(self._list_names({'cpu_cores': 'gt:16'}), ["typed-003"])
+        self.assertEqual(self._list_names({'cpu_cores': 'between:8,16'}), ["typed-001", "typed-002"])
+        self.assertEqual(self._list_names({'load': 'lt:1.25'}), ["typed-001"])
+        self.assertEqual(self._list_names({'cpu_cores': 'not:lte:8'}), ["typed-002", "typed-003"])
+
+    def test_date_range_filter_compares_dates_not_strings(self):
+        self.assertEqual(self._list_names({'purchase_date': 'lt:2024-01-01'}), ["typed-001", "typed-002"])
+        self.assertEqual(
+            self._list_names({'purchase_date': 'between:2023-12-01,2024-12-31', 'managed': 'True'}),
+            ["typed-003"]
+        )
+
+    def test_invalid_range_operand_returns_400(self):
+        url = reverse('modelinstance-list')
+        response = self.client.get(url, {'model': str(self.model.id), 'cpu_cores': 'gt:abc'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_backfill_command_repopulates_typed_columns(self):
+        ModelFieldMeta.objects.filter(model=self.model).update(num_value=None, dt_value=None, bool_value=None)
+        self.assertEqual(self._list_names({'cpu_cores': 'gte:16'}), [])
+
+        call_command('backfill_typed_values', self.model.name, stdout=StringIO())
+        self.assertEqual(self._list_names({'cpu_cores': 'gte:16'}), ["typed-002", "typed-003"])
+
+    def test_aware_datetimes_are_stored_as_local_naive(self):
+        # Asia/Shanghai 为 UTC+8
+        self.assertEqual(parse_datetime_value('2024-01-01T00:00:00+00:00'), datetime(2024, 1, 1, 8, 0))
+        self.assertEqual(parse_datetime_value('2024-01-01T08:00:00+08:00'), datetime(2024, 1, 1, 8, 0))
@@ -0,0 +1,110 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.exceptions import ValidationError
+
+from cmdb.models import Models, ModelFieldGroups, ModelFields, ModelInstance, UniqueConstraint
+from cmdb.services import ModelInstanceService, UniqueConstraintIndex
+from cmdb.tests import CmdbAPITestCase
+
+
+class UniqueConstraintIndexTestCase(CmdbAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.model = Models.objects.create(
+            name="UniqueServer",
+            verbose_name="唯一性服务器",
+            create_user="admin",
+            update_user="admin",
+        )
+        self.field_group = ModelFieldGroups.objects.create(
+            name="basic",
+            verbose_name="基本信息",
+            model=self.model,
+            create_user="admin",
+            update_user="admin",
+        )
+        self.fields = {
+            name: ModelFields.objects.create(
+                model=self.model,
+                model_field_group=self.field_group,
+                name=name,
+                verbose_name=name,
+                type="string",
+                order=order,
+                required=False,
+                create_user="admin",
+                update_user="admin",
+            )
+            for order, name in enumerate(["env", "ip", "rack"], start=1)
+        }
+        UniqueConstraint.objects.create(
+            model=self.model,
+            fields=[str(self.fields["env"].id), str(self.fields["ip"].id)],
+            validate_null=False,
+            create_user="admin",
+            update_user="admin",
+        )
+        self.instances = []
+        for i in range(3):
+            instance = ModelInstance.objects.create(
+                model=self.model,
+                instance_name=f"uniq-{i}",
+                create_user="admin",
+                update_user="admin",
+            )
+            ModelInstanceService._save_field_values(
+                instance, {'env': 'dev', 'ip': f'10.0.0.{i}', 'rack': 'r1'}, 'admin'
+            )
+            self.instances.append(instance)
+
+    def _values(self, **kwargs):
+        return {str(self.fields[name].id): value for name, value in kwargs.items()}
+
+    def test_check_detects_database_and_in_batch_duplicates(self):
+        index = UniqueConstraintIndex.for_model(self.model)
+        with CaptureQueriesContext(connection) as ctx:
+            conflicts = index.check([
+                ('a', None, self._values(env='dev', ip='10.0.0.1')),
+                ('b', None, self._values(env='prod', ip='10.0.0.1')),
+                ('c', None, self._values(env='prod', ip='10.0.0.1')),
+                ('d', None, self._values(env='prod', ip=None)),
+                ('e', None, self._values(env='prod', ip=None)),
+            ])
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(set(conflicts), {'a', 'c'})
+        self.assertEqual(conflicts['a'], 'Unique constraint violation: env=dev, ip=10.0.0.1')
+
+    def test_rows_updating_existing_instances_are_compared_in_batch(self):
+        first, second = self.instances[0], self.instances[1]
+        index = UniqueConstraintIndex.for_model(self.model)
+        # 两个实例互换IP，库中旧值不构成冲突
+        conflicts = index.check([
+            (1, first.id, self._values(env='dev', ip='10.0.0.1')),
+            (2, second.id, self._values(env='dev', ip='10.0.0.0')),
+        ])
+        self.assertEqual(conflicts, {})
+
+    def test_single_instance_validation(self):
+        instance = self.instances[0]
+        # 仅修改非约束字段时沿用已存储的值，不与自身冲突
+        ModelInstanceService.validate_unique_constraints(self.model, {'rack': 'r2'}, instance)
+        with self.assertRaises(ValidationError):
+            ModelInstanceService.validate_unique_constraints(self.model, {'ip': '10.0.0.2'}, instance)
+        with self.assertRaises(ValidationError):
+            ModelInstanceService.validate_unique_constraints(self.model, {'env': 'dev', 'ip': '10.0.0.2'}, None)
+
+    def test_bulk_update_rejects_values_duplicated_across_instances(self):
+        queryset = ModelInstance.objects.filter(id__in=[inst.id for inst in self.instances[:2]])
+        with self.assertRaises(ValidationError):
+            ModelInstanceService.bulk_update_instances(
+                instances_qs=queryset,
+                validated_fields={'ip': '10.9.9.9'},
+                user=self.admin_user,
+            )
+        updated = ModelInstanceService.bulk_update_instances(
+            instances_qs=queryset,
+            validated_fields={'env': 'prod'},
+            user=self.admin_user,
+        )
+        self.assertEqual(updated, 2)
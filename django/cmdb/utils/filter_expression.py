@@ -0,0 +1,62 @@
+"""
+实例动态字段过滤表达式解析模块
+将查询参数中的 `like:` / `in:` / `regex:` / `not:` 以及 `gt:` / `gte:` / `lt:` / `lte:` / `between:`
+等前缀语法解析为结构化的表达式，
+供宽表投影与 ModelFieldMeta 两种过滤实现共用。
+"""
+
+from typing import List, NamedTuple, Optional
+
+# 比较运算前缀，between 的操作数为 "下限,上限"（闭区间）
+RANGE_OPERATORS = ('gt', 'gte', 'lt', 'lte', 'between')
+
+
+class FilterExpression(NamedTuple):
+    """
+    单个字段的过滤表达式
+    - op: eq / null / like / in / regex / gt / gte / lt / lte / between
+    - values: 操作数列表，between 为 [下限, 上限]，in 为多个元素，null 为空列表，其余仅一个元素
+    - negated: 是否为 not: 反选
+    """
+    op: str
+    values: List[str]
+    negated: bool = False
+
+    @property
+    def value(self):
+        return self.values[0] if self.values else None
+
+    @property
+    def is_range(self):
+        return self.op in RANGE_OPERATORS
+
+
+def parse_filter_expression(raw_value) -> Optional[FilterExpression]:
+    """
+    解析单个过滤参数值，非字符串参数返回 None（与原有过滤逻辑保持一致，直接忽略）
+    """
+    if not isinstance(raw_value, str):
+        return None
+
+    negated = False
+    value = raw_value
+    if value.startswith('not:'):
+        negated = True
+        value = value[4:]
+
+    if value.startswith('like:'):
+        return FilterExpression('like', [value[5:]], negated)
+    if value.startswith('in:'):
+        return FilterExpression('in', value[3:].split(','), negated)
+    if value.startswith('regex:'):
+        return FilterExpression('regex', [value[6:]], negated)
+    for op in RANGE_OPERATORS:
+        prefix = f'{op}:'
+        if value.startswith(prefix):
+            operand = value[len(prefix):]
+            if op == 'between':
+                return FilterExpression(op, [v.strip() for v in operand.split(',', 1)], negated)
+            return FilterExpression(op, [operand.strip()], negated)
+    if value == 'null':
+        return FilterExpression('null', [], negated)
+    return FilterExpression('eq', [value], negated)
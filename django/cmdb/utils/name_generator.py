@@ -8,42 +8,46 @@ logger = logging.getLogger(__name__)
 def generate_instance_name(field_values, template_field_ids, template_field_names=None):
     if not template_field_ids and not template_field_names:
         return None
+    template_field_info = get_template_field_info(template_field_ids, template_field_names)
+    return render_instance_name(field_values, template_field_info)
 
-    MAX_FIELD_VALUE_LENGTH = 30  # 每个字段值的最大长度
-    MAX_INSTANCE_NAME_LENGTH = 100  # 实例名称的最大总长度
+
+def get_template_field_info(template_field_ids, template_field_names=None):
+    """
+    按模板字段ID顺序加载字段名称、类型及枚举规则，批量生成名称时只需加载一次
+    """
+    if not template_field_ids:
+        return []
 
     if not template_field_names:
         template_fields = ModelFields.objects.filter(
             id__in=template_field_ids
         ).prefetch_related('validation_rule__rule').values('id', 'name', 'type', 'validation_rule__rule')
-        field_id_to_info = {
-            str(f['id']): {
-                'name': f['name'],
-                'type': f['type'],
-                'validation_rule': f['validation_rule__rule']
-            } for f in template_fields
-        }
-        template_field_info = [
-            field_id_to_info[str(id)]
-            for id in template_field_ids
-            if str(id) in field_id_to_info
-        ]
     else:
         template_fields = ModelFields.objects.filter(
             name__in=template_field_names
         ).prefetch_related('validation_rule__rule').values('id', 'name', 'type', 'validation_rule__rule')
-        field_id_to_info = {
-            str(f['id']): {
-                'name': f['name'],
-                'type': f['type'],
-                'validation_rule': f['validation_rule__rule']
-            } for f in template_fields
-        }
-        template_field_info = [
-            field_id_to_info[str(id)]
-            for id in template_field_ids
-            if str(id) in field_id_to_info
-        ]
+    field_id_to_info = {
+        str(f['id']): {
+            'name': f['name'],
+            'type': f['type'],
+            'validation_rule': f['validation_rule__rule']
+        } for f in template_fields
+    }
+    return [
+        field_id_to_info[str(id)]
+        for id in template_field_ids
+        if str(id) in field_id_to_info
+    ]
+
+
+def render_instance_name(field_values, template_field_info, ref_instance_names=None):
+    """
+    根据已加载的模板字段信息生成实例名称
+    :param ref_instance_names: {instance_id: instance_name}，提供时引用字段不再逐个查询
+    """
+    MAX_FIELD_VALUE_LENGTH = 30  # 每个字段值的最大长度
+    MAX_INSTANCE_NAME_LENGTH = 100  # 实例名称的最大总长度
 
     parts = []
     for field_info in template_field_info:
@@ -57,7 +61,6 @@ def generate_instance_name(field_values, template_field_ids, template_field_name
         value = field_values.get(field_name)
         if value is not None and value != '':
             display_value = value
-
             try:
                 if field_type == 'enum' and value and validation_rule:
                     try:
@@ -68,9 +71,13 @@ def generate_instance_name(field_values, template_field_ids, template_field_name
 
                 elif field_type == 'model_ref' and value:
                     try:
-                        ref_instance = ModelInstance.objects.filter(id=value).first()
-                        if ref_instance and ref_instance.instance_name:
-                            display_value = ref_instance.instance_name
+                        if ref_instance_names is not None:
+                            ref_name = ref_instance_names.get(str(value))
+                        else:
+                            ref_instance = ModelInstance.objects.filter(id=value).first()
+                            ref_name = ref_instance.instance_name if ref_instance else None
+                        if ref_name:
+                            display_value = ref_name
                     except Exception as e:
                         logger.warning(f"Error processing model_ref field '{field_name}': {str(e)}")
             except Exception as e:
@@ -4,6 +4,7 @@ import uuid
 import traceback
 import re
 import io
+import os
 import tempfile
 import networkx as nx
 
@@ -15,10 +16,9 @@ from rest_framework.metadata import BaseMetadata
 from rest_framework.renderers import BaseRenderer, JSONRenderer
 from rest_framework.decorators import action
 from rest_framework.exceptions import ValidationError, PermissionDenied
-from rest_framework.pagination import PageNumberPagination
 from cacheops import cached_as, invalidate_model
 from django.core.cache import cache
-from django.http import StreamingHttpResponse
+from django.http import StreamingHttpResponse, FileResponse
 from django.core.exceptions import ImproperlyConfigured
 from django.db import transaction
 from django.db.models import Q
@@ -27,13 +27,19 @@ from celery.result import AsyncResult
 
 
 from .utils import password_handler, celery_manager
+from .utils.filter_expression import parse_filter_expression
 from .excel import ExcelHandler
 from .constants import FieldMapping, FieldType, limit_field_names
-from .tasks import process_import_data, update_instance_names_for_model_template_change
+from .tasks import (
+    process_import_data, process_export_data, update_instance_names_for_model_template_change,
+    write_instances_export, get_export_dir
+)
 from .filters import *
 from .models import *
 from .serializers import *
 from .services import *
+from .projection import get_projection_table
+from vuedjango.pagination import KeysetPagination
 from .message import bulk_creation_audit
 from .schemas import *
 from audit.context import audit_context
@@ -43,7 +49,8 @@ from access.manager import PermissionManager
 logger = logging.getLogger(__name__)
 
 
-class StandardResultsSetPagination(PageNumberPagination):
+class StandardResultsSetPagination(KeysetPagination):
+    """视图声明 keyset_ordering 后支持 ?cursor= 游标分页"""
     page_size = settings.REST_FRAMEWORK.get('PAGE_SIZE', 20)
     page_size_query_param = 'page_size'
     max_page_size = 1000
@@ -506,6 +513,12 @@ class UniqueConstraintViewSet(CmdbBaseViewSet):
         return super().perform_destroy(instance)
 
 
+EXPORT_CONTENT_TYPES = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv',
+}
+
+
 class BinaryFileRenderer(BaseRenderer):
     media_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
     format = 'xlsx'
@@ -524,6 +537,7 @@ class ModelInstanceViewSet(CmdbBaseViewSet):
     serializer_class = ModelInstanceSerializer
     filterset_class = ModelInstanceFilter
     ordering_fields = ['create_time', 'update_time']
+    keyset_ordering = ('-create_time', '-id')
     search_fields = ['model', 'instance_name', 'create_user', 'update_user']
 
     def _get_serializer_context_for_instances(self, instances):
@@ -555,11 +569,9 @@ class ModelInstanceViewSet(CmdbBaseViewSet):
     def _apply_filters(self, queryset, model, filter_params):
         model_id = model
         params = filter_params.copy()
-        query = Q()
 
         if model_id:
             queryset = queryset.filter(model_id=model_id)
-            query &= Q(model_id=model_id)
             logger.debug(f"Filtered by model ID: {model_id}")
 
         standard_fields = {}
@@ -576,58 +588,61 @@ class ModelInstanceViewSet(CmdbBaseViewSet):
             filterset = ModelInstanceFilter(standard_fields, queryset=queryset)
             queryset = filterset.qs
 
-        # 过滤动态字段
+        expressions = self._parse_dynamic_filters(filter_params)
+        if not expressions:
+            return queryset
+
+        # 已启用宽表时直接在宽表上过滤，存在无法在宽表上表达的条件时回退
+        projected_queryset = self._apply_projection_filters(queryset, model_id, expressions)
+        if projected_queryset is not None:
+            return projected_queryset
+
+        # 过滤动态字段：每个字段条件独立编译为 EXISTS 子查询
+        pm = PermissionManager(user=self.request.user)
+        field_filter = InstanceFieldFilter.for_model(
+            pm.get_queryset(ModelFieldMeta),
+            pm.get_queryset(ModelFields),
+            model_id=model_id
+        )
+        return field_filter.apply(queryset, expressions)
+
+    @staticmethod
+    def _parse_dynamic_filters(filter_params) -> dict:
+        """解析动态字段过滤参数，忽略特殊参数及实例自身字段"""
+        ignored_fields = set(limit_field_names) | set(ModelInstanceFilter.Meta.fields)
+        # 游标分页参数只在使用游标分页时忽略，否则可能是同名的动态字段
+        pagination = StandardResultsSetPagination
+        if pagination.cursor_query_param in filter_params:
+            ignored_fields.update((pagination.cursor_query_param, pagination.count_query_param))
+        expressions = {}
         for field_name, field_value in filter_params.items():
-            # 忽略特殊参数
-            if field_name in limit_field_names:
+            if field_name in ignored_fields:
                 continue
+            expression = parse_filter_expression(field_value)
+            if expression is not None:
+                expressions[field_name] = expression
+        return expressions
 
-            try:
-                if isinstance(field_value, str):
-                    if field_value.startswith('like:'):
-                        value = field_value[5:]
-                        query &= Q(data__icontains=value)
-                    elif field_value.startswith('in:'):
-                        values = field_value[3:].split(',')
-                        query &= Q(data__in=values)
-                    elif field_value.startswith('regex:'):
-                        pattern = field_value[6:]
-                        query &= Q(data__regex=pattern)
-                    elif field_value.startswith('not:'):
-                        # 反选匹配
-                        value = field_value[4:]
-                        if value.startswith('like:'):
-                            v = value[5:]
-                            query &= ~Q(data__icontains=v)
-                        elif value.startswith('in:'):
-                            v = value[3:].split(',')
-                            query &= ~Q(data__in=v)
-                        elif value.startswith('regex:'):
-                            pattern = value[6:]
-                            query &= ~Q(data__regex=pattern)
-                        else:
-                            if value == 'null':
-                                query &= ~Q(data__isnull=True)
-                            else:
-                                query &= ~Q(data=value)
-                    else:
-                        if field_value == 'null':
-                            query &= Q(data__isnull=True)
-                        else:
-                            query &= Q(data=field_value)
-
-            except ModelFields.DoesNotExist:
-                logger.warning(f"Field not found: {field_name}")
-                continue
-            except Exception as e:
-                logger.error(f"Error processing field {field_name}: {traceback.format_exc()}")
-                continue
+    def _apply_projection_filters(self, queryset, model_id, expressions):
+        """
+        在模型宽表上应用动态字段过滤
+        :return: 过滤后的查询集；未启用宽表或条件无法在宽表上表达时返回 None
+        """
+        if not model_id:
+            return None
+        projection = get_projection_table(model_id)
+        if not projection:
+            return None
 
+        # 仅允许过滤当前用户可见的字段
         pm = PermissionManager(user=self.request.user)
-        field_values_qs = pm.get_queryset(ModelFieldMeta).filter(query)
-        instance_ids = field_values_qs.values_list('model_instance_id', flat=True)
-        queryset = queryset.filter(id__in=instance_ids)
-        return queryset
+        visible_field_names = set(
+            pm.get_queryset(ModelFields).filter(model_id=model_id).values_list('name', flat=True)
+        )
+        if not set(expressions).issubset(visible_field_names):
+            return None
+
+        return projection.filter_instances(queryset, expressions)
 
     # @cached_as(ModelInstance, timeout=600)
     def get_queryset(self):
@@ -776,7 +791,7 @@ class ModelInstanceViewSet(CmdbBaseViewSet):
         }, status=status.HTTP_200_OK)
 
     def get_renderers(self):
-        if self.action in ['export_template', 'export_data', 'download_error_records']:
+        if self.action in ['export_template', 'export_data', 'download_error_records', 'download_export']:
             return [BinaryFileRenderer()]
         return [JSONRenderer()]
 
@@ -826,91 +841,174 @@ class ModelInstanceViewSet(CmdbBaseViewSet):
             logger.error(f"Error exporting template: {str(e)}")
             raise ValidationError({'detail': f'Failed to export template: {str(e)}'})
 
-    @action(detail=False, methods=['post'])
-    def export_data(self, request):
+    def _get_export_queryset(self, request):
         """
-        导出实例数据。
-        导出格式与导入模板一致，包含枚举/引用的锁定 sheet。
+        解析导出请求参数
+        :return: (model, 实例查询集, 字段查询集, 限制导出的字段名列表)
         """
-        try:
-            instance_ids = request.data.get('instances', [])
-            model_id = request.data.get('model')
-            filter_by_params = request.data.get('all', False)
-            params = request.data.get('params', {})
-            group_id = request.data.get('group')
-            restricted_fields = request.data.get('fields', [])
+        instance_ids = request.data.get('instances', [])
+        model_id = request.data.get('model')
+        filter_by_params = request.data.get('all', False)
+        params = request.data.get('params', {})
+        group_id = request.data.get('group')
+        restricted_fields = request.data.get('fields', [])
 
-            if not model_id:
-                raise ValidationError({'detail': 'Model ID is required'})
+        if not model_id:
+            raise ValidationError({'detail': 'Model ID is required'})
 
-            pm = PermissionManager(user=self.request.user)
-            model = pm.get_queryset(Models).get(id=model_id)
+        pm = PermissionManager(user=self.request.user)
+        model = pm.get_queryset(Models).get(id=model_id)
 
-            # 构建实例查询集
-            instances = self.get_queryset().filter(model_id=model_id)
+        # 构建实例查询集
+        instances = self.get_queryset().filter(model_id=model_id)
 
-            if group_id:
-                params['model_instance_group'] = group_id
+        if group_id:
+            params['model_instance_group'] = group_id
 
-            if filter_by_params and params:
-                instances = self._apply_filters(instances, model_id, params)
-            elif instance_ids:
-                instances = instances.filter(id__in=instance_ids)
+        if filter_by_params and params:
+            instances = self._apply_filters(instances, model_id, params)
+        elif instance_ids:
+            instances = instances.filter(id__in=instance_ids)
 
-            if not instances.exists():
-                raise ValidationError("No instances found with the provided criteria.")
+        if not instances.exists():
+            raise ValidationError("No instances found with the provided criteria.")
 
-            # 获取字段查询集
-            fields_qs = pm.get_queryset(ModelFields).filter(model=model)
+        # 获取字段查询集
+        fields_qs = pm.get_queryset(ModelFields).filter(model=model)
+        return model, instances, fields_qs, restricted_fields or None
 
-            # 调用服务层导出数据
-            export_result = ModelInstanceService.export_instances_data(
-                model=model,
-                instances_qs=instances,
-                fields_qs=fields_qs,
-                user=self.request.user,
-                restricted_field_names=restricted_fields if restricted_fields else None
-            )
+    @staticmethod
+    def _get_export_format(request) -> str:
+        file_format = request.data.get('format') or 'xlsx'
+        if file_format not in EXPORT_CONTENT_TYPES:
+            raise ValidationError({'format': f'Unsupported export format: {file_format}'})
+        return file_format
 
-            if not export_result['fields']:
-                raise ValidationError({'detail': 'No fields available for export'})
+    @action(detail=False, methods=['post'])
+    def export_data(self, request):
+        """
+        导出实例数据。
+        导出格式与导入模板一致，包含枚举/引用的锁定 sheet；format=csv 时导出 CSV。
+        实例按批读取并流式写入临时文件后以文件响应返回，数据量较大时使用 export_data_async。
+        """
+        try:
+            model, instances, fields_qs, restricted_fields = self._get_export_queryset(request)
+            file_format = self._get_export_format(request)
 
-            # 生成 Excel 文件（复用模板格式）
-            excel_handler = ExcelHandler()
-            workbook = excel_handler.generate_data_export_with_template(
-                model_id=model_id,
-                fields=export_result['fields'],
-                instances_data=export_result['instances_data'],
-                enum_data=export_result['enum_data'],
-                ref_data=export_result['ref_data']
+            export_context = ModelInstanceService.prepare_export_context(
+                model, fields_qs, self.request.user, restricted_fields
             )
+            if not export_context['fields']:
+                raise ValidationError({'detail': 'No fields available for export'})
 
-            excel_file = io.BytesIO()
-            workbook.save(excel_file)
-            excel_file.seek(0)
+            export_file = tempfile.TemporaryFile()
+            try:
+                exported = write_instances_export(
+                    export_file,
+                    model,
+                    export_context,
+                    ModelInstanceService.iter_instance_chunks(instances),
+                    file_format
+                )
+                export_file.seek(0)
+            except Exception:
+                export_file.close()
+                raise
 
-            headers = {
-                'Content-Disposition': f'attachment; filename="{model.name}_data.xlsx"'
-            }
+            logger.info(f"Data exported successfully for model: {model.name}, instances: {exported}")
 
-            logger.info(
-                f"Data exported successfully for model: {model.name}, instances: {len(export_result['instances_data'])}")
-
-            return Response(
-                {
-                    'filename': f"{model.name}_data.xlsx",
-                    'file_content': excel_file.getvalue()
-                },
-                status=status.HTTP_200_OK,
-                headers=headers
-            )
+            # 响应结束时关闭并删除临时文件
+            response = FileResponse(export_file, content_type=EXPORT_CONTENT_TYPES[file_format])
+            response['Content-Disposition'] = f'attachment; filename="{model.name}_data.{file_format}"'
+            return response
 
         except Models.DoesNotExist:
-            raise ValidationError({'detail': f'Model {model_id} not found'})
+            raise ValidationError({'detail': f'Model {request.data.get("model")} not found'})
         except Exception as e:
             logger.error(f"Error exporting data: {traceback.format_exc()}")
             raise ValidationError({'detail': f'Failed to export data: {str(e)}'})
 
+    @action(detail=False, methods=['post'])
+    def export_data_async(self, request):
+        """
+        异步导出实例数据，参数同 export_data。
+        实例ID按查询顺序写入文件后交给异步任务，通过 export_status 查询进度，完成后以 file_key 调用 download_export 下载。
+        """
+        model, instances, fields_qs, restricted_fields = self._get_export_queryset(request)
+        file_format = self._get_export_format(request)
+
+        if not celery_manager.check_heartbeat():
+            raise ValidationError({'detail': 'Celery worker is not available'})
+
+        export_dir = get_export_dir()
+        os.makedirs(export_dir, exist_ok=True)
+        with tempfile.NamedTemporaryFile(mode='w', encoding='utf-8', delete=False, suffix='.ids', dir=export_dir) as f:
+            for instance_id in instances.values_list('id', flat=True).iterator(chunk_size=EXPORT_CHUNK_SIZE):
+                f.write(f'{instance_id}\n')
+            ids_path = f.name
+
+        try:
+            task = process_export_data.delay(
+                ids_path,
+                str(model.id),
+                str(request.user.id),
+                restricted_fields,
+                file_format
+            )
+        except Exception:
+            os.remove(ids_path)
+            raise
+
+        cache_key = f'export_task_{task.id}'
+        if cache.get(cache_key) is None:
+            cache.set(cache_key, {
+                'user_id': str(request.user.id),
+                'status': 'pending',
+                'total': 0,
+                'progress': 0,
+                'exported': 0,
+                'errors': [],
+                'file_key': None
+            }, timeout=600)
+        return Response({'cache_key': cache_key}, status=status.HTTP_200_OK)
+
+    def _get_own_export_entry(self, key, prefix):
+        """读取当前用户发起的导出任务缓存，键前缀不符或属于其他用户时视为不存在"""
+        if not key.startswith(prefix):
+            return None
+        entry = cache.get(key)
+        if not entry or entry.get('user_id') != str(self.request.user.id):
+            return None
+        return entry
+
+    @action(detail=False, methods=['get'])
+    def export_status(self, request):
+        cache_key = request.query_params.get('cache_key')
+        if not cache_key:
+            raise ValidationError({'detail': 'Missing cache key'})
+        result = self._get_own_export_entry(cache_key, 'export_task_')
+        if not result:
+            raise ValidationError({'detail': 'Cache key not found'})
+        result = {key: value for key, value in result.items() if key != 'user_id'}
+        return Response(result, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'])
+    def download_export(self, request):
+        file_key = request.data.get('file_key')
+        if not file_key:
+            raise ValidationError({'detail': 'Missing export file key'})
+        export_file = self._get_own_export_entry(file_key, 'export_file_')
+        if not export_file or not os.path.exists(export_file['path']):
+            raise ValidationError({'detail': 'Export file not found'})
+
+        file_format = os.path.splitext(export_file['path'])[1].lstrip('.')
+        response = FileResponse(
+            open(export_file['path'], 'rb'),
+            content_type=EXPORT_CONTENT_TYPES.get(file_format, 'application/octet-stream')
+        )
+        response['Content-Disposition'] = f'attachment; filename="{export_file["filename"]}"'
+        return response
+
     @action(detail=False, methods=['post'])
     def import_data(self, request):
         file = request.FILES.get('file')
@@ -921,19 +1019,21 @@ class ModelInstanceViewSet(CmdbBaseViewSet):
 
         results = {'cache_key': None}
 
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx') as temp:
+        # 上传文件落盘后仅将路径交给异步任务，由任务流式读取并在结束后删除
+        import_dir = getattr(settings, 'CMDB_IMPORT_DIR', os.path.join(tempfile.gettempdir(), 'cmdb_import'))
+        os.makedirs(import_dir, exist_ok=True)
+        with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx', dir=import_dir) as temp:
             for chunk in file.chunks():
                 temp.write(chunk)
             temp_path = temp.name
-        logger.info(f"Temp file created: {temp_path}")
+        logger.info(f"Import file stored: {temp_path}")
 
+        dispatched = False
         try:
             excel_handler = ExcelHandler()
-            excel_data = excel_handler.load_data(temp_path, model_id)
-            if excel_data['status'] == 'failed':
-                raise ValidationError({'detail': f'Failed to load Excel data: {excel_data["errors"][-1]}'})
+            header = excel_handler.read_import_header(temp_path, model_id)
 
-            headers = excel_data.get('headers', [])
+            headers = header.get('headers', [])
             pm = PermissionManager(user=request.user)
             model = pm.get_queryset(Models).get(id=model_id)
 
@@ -942,25 +1042,12 @@ class ModelInstanceViewSet(CmdbBaseViewSet):
 
             warning_msg = ''
 
-            # 检查实例权限
-            discarded_instance_names = []
-            instance_names_query = pm.get_queryset(ModelInstance).filter(
-                model=model).values_list('instance_name', flat=True)
-            for instance_name in excel_data.get('instance_names', []):
-                if ModelInstance.objects.check_instance_name_exists(model_id, instance_name) and instance_name not in instance_names_query:
-                    logger.warning(f'Discarding instance name without permission: {instance_name}...')
-                    discarded_instance_names.append(instance_name)
-            if discarded_instance_names:
-                warning_msg = f'Discarded instance names without permission: {", ".join(discarded_instance_names)}'
-
             # 检查是否有未知字段
             fields_query = pm.get_queryset(ModelFields).filter(model=model).values_list('name', flat=True)
             unknown_fields = set(headers) - set(fields_query)
             if unknown_fields:
                 logger.warning(f'Discarding unknown fields in import: {unknown_fields}...')
-                if warning_msg:
-                    warning_msg += '; '
-                warning_msg += f'Unknown fields in Excel: {", ".join(unknown_fields)}'
+                warning_msg = f'Unknown fields in Excel: {", ".join(unknown_fields)}'
 
             if not celery_manager.check_heartbeat():
                 raise ValidationError({'detail': 'Celery worker is not available'})
@@ -968,16 +1055,17 @@ class ModelInstanceViewSet(CmdbBaseViewSet):
             audit_ctx = self.get_audit_context()
             logger.debug(f'Audit context for import: {audit_ctx}')
             task = process_import_data.delay(
-                excel_data,
+                temp_path,
                 model_id,
                 str(request.user.id),
                 audit_ctx
             )
+            dispatched = True
 
             cache_key = f'import_task_{task.id}'
             cache_results = {
                 'status': 'pending',
-                'total': len(excel_data.get('instances', [])),
+                'total': header.get('estimated_rows', 0),
                 'progress': 0,
                 'created': 0,
                 'updated': 0,
@@ -999,8 +1087,7 @@ class ModelInstanceViewSet(CmdbBaseViewSet):
             logger.error(f"Error loading Excel data: {traceback.format_exc()}")
             raise ValidationError({'detail': f'Failed to load Excel data: {str(e)}'})
         finally:
-            import os
-            if os.path.exists(temp_path):
+            if not dispatched and os.path.exists(temp_path):
                 os.remove(temp_path)
 
     @action(detail=False, methods=['post'])
@@ -1051,7 +1138,7 @@ class ModelInstanceViewSet(CmdbBaseViewSet):
 
             audit_context = self.get_audit_context()
             task = process_import_data.delay(
-                excel_data,
+                temp_path,
                 model_id,
                 request_context,
                 audit_context
@@ -1208,11 +1295,11 @@ class ModelInstanceViewSet(CmdbBaseViewSet):
         """
         全文检索实例数据
 
-        使用 MySQL FULLTEXT 索引进行高效搜索，支持：
+        基于 n-gram 倒排索引（SearchToken）搜索，支持：
         - 跨模型搜索
-        - 枚举 key/value 自动转换
-        - 引用字段 instance_name/instance_id 自动转换
-        - 中文分词（ngram）
+        - 枚举字段按 key 或标签匹配
+        - 引用字段按被引用实例名称匹配
+        - 正则表达式、区分大小写
 
         请求体:
         {
@@ -1220,7 +1307,8 @@ class ModelInstanceViewSet(CmdbBaseViewSet):
             "models": ["model_id1", "model_id2"],  // 可选，限定搜索模型
             "limit": 100,  // 可选，默认100，最大500
             "threshold": 0.0,  // 可选，相似度阈值，默认0
-            "search_mode": "boolean"  // 可选：natural/boolean/expansion
+            "regexp": false,  // 可选，是否为正则表达式
+            "case_sensitive": false  // 可选，是否区分大小写
         }
         """
         query = request.data.get('query', '')
@@ -1568,6 +1656,7 @@ class RelationsViewSet(CmdbBaseViewSet):
     ).order_by('-create_time')
     serializer_class = RelationsSerializer
     filterset_class = RelationsFilter
+    keyset_ordering = ('-create_time', '-id')
     search_fields = [
         'source_instance__instance_name',
         'target_instance__instance_name',
@@ -1620,13 +1709,14 @@ class RelationsViewSet(CmdbBaseViewSet):
             )
 
         try:
-            created_relations = RelationsService.bulk_create_relations(
+            result = RelationsService.bulk_create_relations(
                 relations_data=relations_to_create,
                 user=user
             )
             return Response({
-                "created_count": len(created_relations),
-                "relations": self.get_serializer(created_relations, many=True).data
+                "created_count": len(result.created),
+                "relations": self.get_serializer(result.created, many=True).data,
+                "results": result.results
             }, status=status.HTTP_201_CREATED)
         except Exception as e:
             logger.error(f"Error creating relations: {e}", exc_info=True)
@@ -1647,14 +1737,15 @@ class RelationsViewSet(CmdbBaseViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        created_relations = RelationsService.bulk_create_relations(
+        result = RelationsService.bulk_create_relations(
             relations_data=relations_data,
             user=self.request.user
         )
 
         return Response({
-            "created_count": len(created_relations),
-            "relations": self.get_serializer(created_relations, many=True).data
+            "created_count": len(result.created),
+            "relations": self.get_serializer(result.created, many=True).data,
+            "results": result.results
         }, status=status.HTTP_201_CREATED)
 
     @action(detail=False, methods=['post'])
@@ -115,4 +115,12 @@ INIT_CONFIG = [
         "system": "node_mg",
         "description": "单位秒,0表示不过期",
     },
+    {
+        "verbose_name": "审计日志保留天数",
+        "param_name": "audit_retention_days",
+        "param_type": "int",
+        "param_value": 365,
+        "system": "audit",
+        "description": "超过保留天数的审计日志按月归档为压缩文件并从在线表删除,0表示不归档",
+    },
 ]
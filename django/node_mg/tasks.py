@@ -5,10 +5,7 @@ from celery.result import AsyncResult
 from .models import Nodes, NodeTasks, Proxy, ModelConfig
 from cmdb.public_services import PublicModelInstanceService
 from cmdb.models import (
-    Models,
-    ModelFields,
     ModelInstance,
-    ModelFieldMeta,
     ModelInstanceGroupRelation
 )
 import os
@@ -21,6 +18,7 @@ from .utils.zabbix import ZabbixAPI
 from .utils import sys_config
 from .utils.commFunc import compare_interfaces
 from .utils.cmdb_tools import update_asset_info, node_inventory, nodes_inventory
+from .utils.node_sync import sync_nodes
 
 logger = logging.getLogger(__name__)
 
@@ -58,94 +56,30 @@ def aggregate_results(results):
 
 
 @shared_task(bind=True)
-def sync_node_mg(self, model_id=None):
+def sync_node_mg(self, model_id=None, incremental=False, delete_invalid=False):
     """
     同步节点管理信息的 Celery 任务
 
-    该函数会遍历符合条件的模型实例，提取其中 IP 地址字段，并在 Nodes 表中创建或更新对应的节点记录。
+    一次查询取出纳管模型实例的 IP 地址，与 Nodes 表按批比较后批量创建、更新或删除节点记录，
+    详见 node_mg.utils.node_sync。
 
     Args:
         self: Celery 任务对象自身
         model_id (int, optional): 指定要同步的模型 ID，如果不提供则同步所有符合条件的模型
+        incremental (bool, optional): 只同步上次同步之后有更新的实例
+        delete_invalid (bool, optional): 删除没有 IP 或 IP 无效的实例的已有节点，默认保留并记为失败
 
     Returns:
-        str: 同步操作结果信息，格式为"同步成功"
+        dict: 同步报告，包含按模型统计的创建、更新、删除、未变化及失败实例
 
     Raises:
         Exception: 当发生异常时会自动重试，延迟60秒后重新执行任务
     """
     try:
-        from django.db import transaction
-        # 获取所有包含 IP 字段的模型
-        modelFieldHasIp = [i.model.id for i in ModelFields.objects.filter(name="ip")]
-        # sync_model_list = [ i.id for i in Models.objects.filter(name__in=['hosts']) ]
-        # 筛选出管理状态为 True 且包含 IP 字段的模型
-        sync_model_list = [i.id for i in ModelConfig.objects.filter(is_manage=True) if i.id in modelFieldHasIp]
-        if model_id:
-            models_to_process = Models.objects.filter(id=model_id)
-        else:
-            models_to_process = Models.objects.filter(id__in=sync_model_list)
-
-        total_node_create_counter = 0
-        total_node_update_counter = 0
-        total_fail_count = 0
-
-        # 按每个model单独处理
-        for model in models_to_process:
-            logger.info(f"开始处理模型: {model.name} ({model.id})")
-            node_create_counter = 0
-            node_update_counter = 0
-            fail_instance = []
-
-            # 获取该model下的所有实例
-            all_instance = ModelInstance.objects.filter(model=model)
-            for _instance in all_instance:
-                try:
-                    # 获取当前实例的所有字段元数据
-                    field_values = ModelFieldMeta.objects.filter(
-                        model_instance=_instance
-                    ).select_related('model_fields')
-                    ip_field = None
-                    for field in field_values:
-                        if field.model_fields.name == 'ip':
-                            ip_field = field.data
-                            break
-                    if not ip_field:
-                        fail_instance.append(_instance.instance_name)
-                        continue
-                    # 缓存IP字段值，避免重复查询
-                    ip_value = ip_field
-                except Exception as e:
-                    fail_instance.append(_instance.instance_name)
-                    continue
-                # 创建或更新节点记录
-                with transaction.atomic():
-                    node_obj, node_created = Nodes.objects.update_or_create(
-                        model_instance=_instance,
-                        defaults={
-                            "ip_address": ip_value,
-                            "model": _instance.model,
-                            "create_user": _instance.create_user,
-                            "update_user": _instance.update_user
-                        }
-                    )
-                    if node_created:
-                        node_create_counter += 1
-                    else:
-                        node_update_counter += 1
-
-            logger.info(
-                f"模型 {model.name} 处理完成: 创建[{node_create_counter}],更新[{node_update_counter}]失败[{len(fail_instance)}],失败实例[{','.join(fail_instance)}]")
-            total_node_create_counter += node_create_counter
-            total_node_update_counter += node_update_counter
-            total_fail_count += len(fail_instance)
-
-        logger.info(
-            f"全部模型处理完成: 总创建[{total_node_create_counter}],总更新[{total_node_update_counter}]总失败[{total_fail_count}]")
+        return sync_nodes(model_id=model_id, incremental=incremental, delete_invalid=delete_invalid)
     except Exception as exc:
         # 发生异常时自动重试，延迟60秒
         raise self.retry(exc=exc, countdown=60)
-    return f"同步成功"
 
 
 @shared_task(bind=True, max_retries=3)
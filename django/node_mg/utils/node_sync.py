@@ -0,0 +1,175 @@
+"""
+节点批量同步模块
+将纳管模型实例的 IP 字段同步到 Nodes 表，供 sync_node_mg 任务使用。
+
+- 一次查询取出所有纳管模型（ModelConfig.is_manage 且包含 ip 字段）实例的 (实例ID, 模型ID, IP)，
+  按批与已有节点在内存中比较，以 bulk_create / bulk_update / delete 落库，每批一个事务
+- 没有 IP 或 IP 无效的实例记为失败，其已有节点保持不变，仅在显式指定 delete_invalid 时删除
+- 同一实例的重复节点只保留最早创建的一个
+- 增量模式只处理上次同步水位之后实例或其 IP 字段有更新的实例，没有水位时退化为全量同步
+- 只维护 Nodes 记录，不触发 Ansible / Zabbix 任务
+"""
+
+import ipaddress
+import logging
+
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from cmdb.models import ModelFieldMeta, ModelFields, ModelInstance
+from mapi.system_user import SYSTEM_USER
+
+from ..models import Nodes
+
+logger = logging.getLogger(__name__)
+
+IP_FIELD_NAME = 'ip'
+NODE_SYNC_BATCH_SIZE = 1000
+# 增量同步水位
+NODE_SYNC_WATERMARK_KEY = 'node_mg_sync_watermark'
+
+
+def get_sync_model_ids(model_id=None) -> list:
+    """需要同步的模型：指定模型，或纳管且包含 IP 字段的全部模型"""
+    fields = ModelFields.objects.filter(name=IP_FIELD_NAME)
+    if model_id:
+        fields = fields.filter(model_id=model_id)
+    else:
+        fields = fields.filter(model__model_config__is_manage=True)
+    return list(fields.values_list('model_id', flat=True).distinct())
+
+
+def _normalize_ip(value):
+    if not value:
+        return None
+    try:
+        return str(ipaddress.ip_address(str(value).strip()))
+    except ValueError:
+        return None
+
+
+def _iter_instance_ips(model_ids, since=None):
+    """按批返回实例的 (实例ID, 模型ID, 实例名称, IP, 创建用户, 更新用户)"""
+    ip_meta = ModelFieldMeta.objects.filter(
+        model_instance_id=OuterRef('pk'), model_fields__name=IP_FIELD_NAME
+    )
+    queryset = ModelInstance.objects.filter(model_id__in=model_ids)
+    if since is not None:
+        queryset = queryset.filter(
+            Q(update_time__gt=since) | Exists(ip_meta.filter(update_time__gt=since))
+        )
+    rows = queryset.annotate(ip=Subquery(ip_meta.values('data')[:1])).order_by('id').values_list(
+        'id', 'model_id', 'instance_name', 'ip', 'create_user', 'update_user'
+    )
+
+    batch = []
+    for row in rows.iterator(chunk_size=NODE_SYNC_BATCH_SIZE):
+        batch.append(row)
+        if len(batch) >= NODE_SYNC_BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _new_model_report():
+    return {'created': 0, 'updated': 0, 'deleted': 0, 'unchanged': 0, 'failed': []}
+
+
+def _sync_batch(rows, report, now, delete_invalid=False):
+    existing = defaultdict(list)
+    for node in Nodes.objects.filter(model_instance_id__in=[row[0] for row in rows]).order_by('create_time', 'id'):
+        existing[node.model_instance_id].append(node)
+
+    to_create = []
+    to_update = []
+    to_delete = []
+    for instance_id, model_id, instance_name, raw_ip, create_user, update_user in rows:
+        model_report = report[str(model_id)]
+        nodes = existing.get(instance_id, [])
+        ip = _normalize_ip(raw_ip)
+        if ip is None:
+            model_report['failed'].append(instance_name)
+            if delete_invalid:
+                to_delete.extend(node.id for node in nodes)
+                model_report['deleted'] += len(nodes)
+            continue
+
+        update_user = update_user or SYSTEM_USER.username
+        if not nodes:
+            to_create.append(Nodes(
+                model_id=model_id,
+                model_instance_id=instance_id,
+                ip_address=ip,
+                create_user=create_user or SYSTEM_USER.username,
+                update_user=update_user,
+            ))
+            model_report['created'] += 1
+            continue
+
+        node, duplicates = nodes[0], nodes[1:]
+        to_delete.extend(duplicate.id for duplicate in duplicates)
+        model_report['deleted'] += len(duplicates)
+        if (node.ip_address, node.model_id, node.update_user) == (ip, model_id, update_user):
+            model_report['unchanged'] += 1
+            continue
+        node.ip_address = ip
+        node.model_id = model_id
+        node.update_user = update_user
+        node.update_time = now
+        to_update.append(node)
+        model_report['updated'] += 1
+
+    with transaction.atomic():
+        if to_delete:
+            Nodes.objects.filter(id__in=to_delete).delete()
+        if to_update:
+            Nodes.objects.bulk_update(to_update, ['ip_address', 'model', 'update_user', 'update_time'])
+        if to_create:
+            Nodes.objects.bulk_create(to_create)
+
+
+def sync_nodes(model_id=None, incremental=False, delete_invalid=False) -> dict:
+    """
+    同步节点
+    :param model_id: 只同步指定模型
+    :param incremental: 只同步上次水位之后有更新的实例
+    :param delete_invalid: 删除没有 IP 或 IP 无效的实例的已有节点，默认保留
+    :return: 同步报告，按模型统计创建、更新、删除、未变化及失败的实例
+    """
+    started_at = timezone.now()
+    since = cache.get(NODE_SYNC_WATERMARK_KEY) if incremental else None
+    mode = 'incremental' if since is not None else 'full'
+
+    model_ids = get_sync_model_ids(model_id)
+    report = defaultdict(_new_model_report, {str(model): _new_model_report() for model in model_ids})
+    if model_ids:
+        for rows in _iter_instance_ips(model_ids, since=since):
+            _sync_batch(rows, report, started_at, delete_invalid=delete_invalid)
+
+    # 只有全部模型参与的同步才推进水位
+    if model_id is None:
+        cache.set(NODE_SYNC_WATERMARK_KEY, started_at, timeout=None)
+
+    totals = _new_model_report()
+    totals['failed'] = 0
+    for model_report in report.values():
+        for key in ('created', 'updated', 'deleted', 'unchanged'):
+            totals[key] += model_report[key]
+        totals['failed'] += len(model_report['failed'])
+
+    logger.info(
+        f"节点同步完成[{mode}]: 创建[{totals['created']}],更新[{totals['updated']}],删除[{totals['deleted']}],"
+        f"未变化[{totals['unchanged']}],失败[{totals['failed']}]"
+    )
+    return {
+        'mode': mode,
+        'since': since.isoformat() if since else None,
+        'watermark': started_at.isoformat(),
+        'totals': totals,
+        'models': dict(report),
+    }
@@ -5,7 +5,8 @@ import sys
 import time
 import logging
 from celery import Celery
-from celery.signals import setup_logging
+from celery.schedules import crontab
+from celery.signals import setup_logging, task_postrun, task_prerun
 from datetime import timedelta
 
 logger = logging.getLogger(__name__)
@@ -28,6 +29,18 @@ def config_loggers(*args, **kwargs):
     dictConfig(settings.LOGGING)
 
 
+@task_prerun.connect
+def open_task_request_cache(*args, **kwargs):
+    from .request_cache import task_request_cache_prerun
+    task_request_cache_prerun(**kwargs)
+
+
+@task_postrun.connect
+def close_task_request_cache(*args, **kwargs):
+    from .request_cache import task_request_cache_postrun
+    task_request_cache_postrun(**kwargs)
+
+
 app.config_from_object('django.conf:settings', namespace='CELERY')
 
 app.autodiscover_tasks()
@@ -36,7 +49,24 @@ is_migrating = any(arg in ['migrate', 'makemigrations'] for arg in sys.argv)
 
 if not is_migrating:
 
-    beat_schedule = {}
+    beat_schedule = {
+        # 增量同步纳管模型实例的节点信息
+        'sync-node-mg-incremental': {
+            'task': 'node_mg.tasks.sync_node_mg',
+            'schedule': timedelta(minutes=10),
+            'kwargs': {'incremental': True},
+        },
+        # 每天凌晨增量校验审计哈希链
+        'verify-audit-chain': {
+            'task': 'audit.tasks.verify_audit_chain',
+            'schedule': crontab(hour=2, minute=0),
+        },
+        # 每天凌晨归档超过保留期的审计日志
+        'archive-expired-audit-logs': {
+            'task': 'audit.tasks.archive_expired_audit_logs',
+            'schedule': crontab(hour=3, minute=0),
+        },
+    }
     # if sys_config.is_zabbix_sync_enabled():
     #     # 只在启用同步时添加 Zabbix 相关任务
     #     beat_schedule.update({
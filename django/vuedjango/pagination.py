@@ -0,0 +1,211 @@
+"""
+分页模块
+在页码分页的基础上提供可选的游标（keyset）分页，供数据量大的列表接口使用。
+
+- 请求携带 cursor 参数时（首页传空值 ?cursor=）按视图的 keyset_ordering（如 -create_time, -id）
+  以 WHERE (create_time, id) < (上一页末行) 取下一页，不执行 COUNT(*)，深分页也不产生大 OFFSET
+- 游标分页固定按 keyset_ordering 排序，忽略 ordering 参数；未声明 keyset_ordering 的视图仍使用页码分页；
+  keyset_only 的分页类始终使用游标分页，不传 cursor 时返回首页
+- 游标分页默认不返回总数，传 count=approx 时返回近似总数：无过滤条件时读取数据库表统计信息，
+  否则返回短期缓存的精确计数
+"""
+
+import hashlib
+import json
+import logging
+
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+logger = logging.getLogger(__name__)
+
+# 近似总数的缓存时间
+APPROXIMATE_COUNT_TIMEOUT = 60
+
+
+def _table_estimate(model, using):
+    """数据库统计信息中的表行数，不支持的数据库返回 None"""
+    connection = connections[using]
+    table = model._meta.db_table
+    if connection.vendor == 'postgresql':
+        sql = 'SELECT reltuples::bigint FROM pg_class WHERE relname = %s'
+    elif connection.vendor == 'mysql':
+        sql = 'SELECT TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s'
+    else:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [table])
+        row = cursor.fetchone()
+    # PostgreSQL 未 ANALYZE 的表为 -1
+    if not row or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+def approximate_count(queryset) -> int:
+    """查询集的近似总数"""
+    if not queryset.query.where:
+        try:
+            estimate = _table_estimate(queryset.model, queryset.db)
+        except Exception as e:
+            logger.warning(f'Failed to read table statistics for {queryset.model._meta.db_table}: {e}')
+            estimate = None
+        if estimate is not None:
+            return estimate
+
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except EmptyResultSet:
+        return 0
+    cache_key = 'approx_count_' + hashlib.md5(f'{sql}{params!r}'.encode('utf-8')).hexdigest()
+    count = cache.get(cache_key)
+    if count is None:
+        count = queryset.count()
+        cache.set(cache_key, count, APPROXIMATE_COUNT_TIMEOUT)
+    return count
+
+
+class KeysetPagination(PageNumberPagination):
+    """
+    页码分页 + 可选的游标分页
+    视图通过 keyset_ordering 声明游标排序字段，末位字段必须唯一（通常为 -id）
+    """
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    keyset_ordering = None
+    # 始终使用游标分页，不传 cursor 时返回首页
+    keyset_only = False
+    invalid_cursor_message = 'Invalid cursor'
+
+    def _get_keyset_ordering(self, view):
+        return getattr(view, 'keyset_ordering', None) or self.keyset_ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        ordering = self._get_keyset_ordering(view)
+        use_keyset = self.keyset_only or self.cursor_query_param in request.query_params
+        if not ordering or not use_keyset:
+            self.keyset = False
+            return super().paginate_queryset(queryset, request, view)
+
+        self.keyset = True
+        self.request = request
+        self.ordering = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+        self.base_url = remove_query_param(request.build_absolute_uri(), self.page_query_param)
+        self.page_size = self.get_page_size(request)
+        position, reverse = self._decode_cursor(queryset.model, request.query_params.get(self.cursor_query_param))
+
+        self.count = None
+        if request.query_params.get(self.count_query_param) == 'approx':
+            self.count = approximate_count(queryset.order_by())
+
+        # 向前翻页时按相反顺序取数，再反转
+        order_by = [f"{'-' if desc != reverse else ''}{name}" for name, desc in self.ordering]
+        queryset = queryset.order_by(*order_by)
+        if position is not None:
+            queryset = queryset.filter(self._after(position, reverse))
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        if reverse:
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.first_row, self.last_row = (rows[0], rows[-1]) if rows else (None, None)
+        return rows
+
+    def _after(self, position, reverse):
+        """排序在 position 之后的行：(a, b) < (x, y) 展开为 a < x OR (a = x AND b < y)"""
+        condition = Q()
+        equal = Q()
+        for (name, desc), value in zip(self.ordering, position):
+            lookup = 'lt' if desc != reverse else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def _decode_cursor(self, model, encoded):
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            values = payload['p']
+            if len(values) != len(self.ordering):
+                raise ValueError
+            position = [
+                model._meta.get_field(name).to_python(value)
+                for (name, _), value in zip(self.ordering, values)
+            ]
+            return position, bool(payload.get('r'))
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def _encode_cursor(self, row, reverse):
+        values = []
+        for name, _ in self.ordering:
+            value = getattr(row, name)
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else str(value))
+        payload = {'p': values}
+        if reverse:
+            payload['r'] = 1
+        encoded = urlsafe_b64encode(json.dumps(payload).encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+        if not self.has_next or self.last_row is None:
+            return None
+        return self._encode_cursor(self.last_row, reverse=False)
+
+    def get_previous_link(self):
+        if not self.keyset:
+            return super().get_previous_link()
+        if not self.has_previous or self.first_row is None:
+            return None
+        return self._encode_cursor(self.first_row, reverse=True)
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        response = OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+        ])
+        if self.count is not None:
+            response['count'] = self.count
+            response['count_is_approximate'] = True
+        response['results'] = data
+        return Response(response)
+
+    def get_schema_operation_parameters(self, view):
+        parameters = super().get_schema_operation_parameters(view)
+        if self._get_keyset_ordering(view):
+            parameters += [
+                {
+                    'name': self.cursor_query_param,
+                    'required': False,
+                    'in': 'query',
+                    'description': '游标分页：首页传空值，之后使用响应中的 next/previous 链接',
+                    'schema': {'type': 'string'},
+                },
+                {
+                    'name': self.count_query_param,
+                    'required': False,
+                    'in': 'query',
+                    'description': '游标分页时传 approx 返回近似总数',
+                    'schema': {'type': 'string', 'enum': ['approx']},
+                },
+            ]
+        return parameters
@@ -0,0 +1,158 @@
+"""
+请求级缓存模块
+在一次 HTTP 请求或一次 Celery 任务内缓存字段配置、枚举字典、引用实例名称、数据权限条件等数据，
+同一请求中的视图、序列化器、服务层及校验器共享，避免重复查询数据库/Redis。
+
+- 基于 ContextVar，线程、协程之间互相隔离；不在请求/任务范围内时不缓存，直接调用加载函数
+- 请求/任务结束时整体丢弃；请求内的写操作通过 invalidate_request_cache() 按命名空间失效
+- DEBUG 模式下通过响应头 X-Request-Cache-Hits / X-Request-Cache-Misses 返回命中/未命中次数
+
+使用方式：
+    enum_dict = request_cached('enum_dict', rule_id, lambda: load(rule_id))
+"""
+
+import logging
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class RequestCache:
+    """按命名空间存放的缓存数据及命中统计"""
+
+    def __init__(self):
+        self.namespaces: Dict[str, dict] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_load(self, namespace: str, key, loader: Callable[[], Any]):
+        store = self.namespaces.setdefault(namespace, {})
+        value = store.get(key, _MISSING)
+        if value is _MISSING:
+            self.misses += 1
+            value = store[key] = loader()
+        else:
+            self.hits += 1
+        return value
+
+    def get_many(self, namespace: str, keys: Iterable, loader: Callable[[list], dict]) -> dict:
+        """
+        批量读取，只为缺失的键调用一次 loader
+        loader 未返回的键记为不存在，同一请求内不再重复查询
+        """
+        store = self.namespaces.setdefault(namespace, {})
+        keys = list(dict.fromkeys(keys))
+        missing = [key for key in keys if key not in store]
+        self.hits += len(keys) - len(missing)
+        if missing:
+            self.misses += len(missing)
+            loaded = loader(missing)
+            for key in missing:
+                store[key] = loaded.get(key, _MISSING)
+        return {key: store[key] for key in keys if store[key] is not _MISSING}
+
+    def invalidate(self, namespace: Optional[str] = None):
+        if namespace is None:
+            self.namespaces.clear()
+        else:
+            self.namespaces.pop(namespace, None)
+
+
+_request_cache_var: ContextVar[Optional[RequestCache]] = ContextVar('request_cache', default=None)
+
+
+def get_request_cache() -> Optional[RequestCache]:
+    """当前请求/任务的缓存，不在范围内时返回 None"""
+    return _request_cache_var.get()
+
+
+def request_cached(namespace: str, key, loader: Callable[[], Any]):
+    """读取请求级缓存，未命中时调用 loader 并缓存结果"""
+    request_cache = _request_cache_var.get()
+    if request_cache is None:
+        return loader()
+    return request_cache.get_or_load(namespace, key, loader)
+
+
+def request_cached_many(namespace: str, keys: Iterable, loader: Callable[[list], dict]) -> dict:
+    """批量读取请求级缓存，loader 接收缺失的键列表并返回 {键: 值}"""
+    request_cache = _request_cache_var.get()
+    if request_cache is None:
+        keys = list(keys)
+        return loader(keys) if keys else {}
+    return request_cache.get_many(namespace, keys, loader)
+
+
+def invalidate_request_cache(namespace: Optional[str] = None):
+    """失效当前请求/任务中的缓存，namespace 为空时全部失效"""
+    request_cache = _request_cache_var.get()
+    if request_cache is not None:
+        request_cache.invalidate(namespace)
+
+
+def open_request_cache():
+    """
+    开启缓存范围，返回用于 close_request_cache 的 token
+    已处于范围内时（如 eager 模式下请求中执行的任务）沿用外层缓存，返回 None
+    """
+    if _request_cache_var.get() is not None:
+        return None
+    return _request_cache_var.set(RequestCache())
+
+
+def close_request_cache(token):
+    if token is not None:
+        _request_cache_var.reset(token)
+
+
+@contextmanager
+def request_cache_scope():
+    """
+    在代码块内开启请求级缓存：
+        with request_cache_scope() as request_cache:
+            ...
+    """
+    token = open_request_cache()
+    try:
+        yield _request_cache_var.get()
+    finally:
+        close_request_cache(token)
+
+
+class RequestCacheMiddleware:
+    """为每个请求开启请求级缓存，DEBUG 模式下在响应头中返回命中统计"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with request_cache_scope() as request_cache:
+            response = self.get_response(request)
+            if settings.DEBUG:
+                response['X-Request-Cache-Hits'] = str(request_cache.hits)
+                response['X-Request-Cache-Misses'] = str(request_cache.misses)
+        return response
+
+
+# ---- Celery 任务 ----
+
+_task_tokens = {}
+
+
+def task_request_cache_prerun(task_id=None, **kwargs):
+    _task_tokens[task_id] = open_request_cache()
+
+
+def task_request_cache_postrun(task_id=None, **kwargs):
+    request_cache = _request_cache_var.get()
+    token = _task_tokens.pop(task_id, None)
+    if token is not None and request_cache is not None:
+        logger.debug(f'Task {task_id} request cache: hits={request_cache.hits}, misses={request_cache.misses}')
+    close_request_cache(token)
@@ -77,6 +77,7 @@ MIDDLEWARE = [
     # 'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'access.middleware.CacheopsUserContextMiddleware',
+    'vuedjango.request_cache.RequestCacheMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -194,6 +195,16 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'Asia/Shanghai'
 
+# 审计日志写入：async 写入 Redis 队列由 Celery 任务批量落库，sync 在事务提交后直接批量写入
+AUDIT_WRITER_MODE = os.environ.get('AUDIT_WRITER_MODE', 'async')
+# 审计队列积压超过该长度时改为同步写入
+AUDIT_QUEUE_MAX_LENGTH = 100000
+# 提交记录后延迟写入的秒数，用于合并多个请求的记录
+AUDIT_FLUSH_DELAY = 1
+# 审计日志默认保留天数（系统参数 audit_retention_days 未配置时使用）及归档文件目录
+AUDIT_RETENTION_DAYS = 365
+AUDIT_ARCHIVE_DIR = os.environ.get('AUDIT_ARCHIVE_DIR', os.path.join(BASE_DIR, 'audit_archive'))
+
 AUTH_USER_INFO_MODEL = 'mapi.UserInfo'
 AUTH_USER_GROUP_MODEL = 'mapi.UserGroup'
 AUTH_ROLE_MODEL = 'mapi.Role'
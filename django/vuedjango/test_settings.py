@@ -38,6 +38,9 @@ MIDDLEWARE = [  # noqa: F405
 CELERY_TASK_ALWAYS_EAGER = True
 CELERY_TASK_EAGER_PROPAGATES = True
 
+# 审计日志同步写入
+AUDIT_WRITER_MODE = 'sync'
+
 # 禁用 CMDB 初始化信号（避免创建内置数据与测试数据冲突）
 SILENCED_SYSTEM_CHECKS = ['*']
 